@@ -0,0 +1,100 @@
+"""
+⏱️ BENCHMARK: SIMILITUD DE CONTEXTOS VECTORIZADA VS RECORRIDO POR PARES
+=====================================================================
+
+Episodios sintéticos con contextos de 3 a 8 claves tomadas de un
+vocabulario de 30 (task_type, tool, language... con valores repetidos y
+algún valor único). Para cada tamaño se mide:
+- store: almacenar todos los episodios (incluye calcular sus características)
+- similar: latencia media de find_similar_episodes(limit=5)
+- coincidencia: consultas cuyo top-5 tiene las mismas similitudes exactas
+  que el recorrido anterior
+
+"anterior" reproduce find_similar_episodes antes de la matriz de
+características: _calculate_context_similarity contra cada episodio y
+ordenación completa.
+
+Uso (desde backend/):
+    python -m benchmarks.bench_episodic_similarity [--sizes 1000,10000,100000] [--queries 50]
+"""
+
+import argparse
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.memory.episodic_memory_store import Episode, EpisodicMemoryStore  # noqa: E402
+
+KEYS = [f"key_{i}" for i in range(27)] + ['task_type', 'tool', 'language']
+BASE = datetime(2024, 1, 1)
+LIMIT = 5
+
+
+def make_context(rng, number):
+    context = {key: f"v{rng.randrange(6)}" for key in rng.sample(KEYS, rng.randint(3, 8))}
+    if rng.random() < 0.3:
+        context['task_id'] = f"task-{number}"
+    return context
+
+
+def make_episodes(size, seed=0):
+    rng = random.Random(seed)
+    return [
+        Episode(id=f"ep-{i}", title=f"episodio {i}", description="", context=make_context(rng, i),
+                actions=[], outcomes=[], timestamp=BASE + timedelta(seconds=i), importance=rng.randint(1, 5))
+        for i in range(size)
+    ]
+
+
+def legacy_find_similar(store, context, limit=LIMIT):
+    """find_similar_episodes anterior: similitud por pares contra todos los episodios"""
+    scored = []
+    for episode in store.episodes.values():
+        score = store._calculate_context_similarity(context, episode.context)
+        if score > 0.3:
+            scored.append((episode, score))
+    scored.sort(key=lambda x: x[1], reverse=True)
+    return [episode for episode, _ in scored[:limit]]
+
+
+def timed(fn):
+    started = time.perf_counter()
+    fn()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='1000,10000,100000')
+    parser.add_argument('--queries', type=int, default=50)
+    args = parser.parse_args()
+
+    for size in (int(value) for value in args.sizes.split(',')):
+        episodes = make_episodes(size)
+        rng = random.Random(1)
+        queries = [make_context(rng, -1) for _ in range(args.queries)]
+        store = EpisodicMemoryStore(max_episodes=size)
+        store_seconds = timed(lambda: [store.store_episode(episode) for episode in episodes])
+        print(f"\n{size:,} episodios  (store {store_seconds:.2f} s, {store._context_features.get_stats()})")
+
+        legacy = timed(lambda: [legacy_find_similar(store, query) for query in queries]) / len(queries)
+        vectorized = timed(lambda: [store.find_similar_episodes(query, LIMIT) for query in queries]) / len(queries)
+
+        def scores(found, query):
+            return [round(store._calculate_context_similarity(query, episode.context), 9) for episode in found]
+
+        same = sum(
+            1 for query in queries
+            if scores(store.find_similar_episodes(query, LIMIT), query) == scores(legacy_find_similar(store, query), query)
+        )
+        print(f"  {'anterior (por pares)':<22} similar {legacy * 1000:9.3f} ms")
+        print(f"  {'matriz de contextos':<22} similar {vectorized * 1000:9.3f} ms  "
+              f"x{legacy / vectorized:6.1f}  coincidencia {same}/{len(queries)}")
+
+
+if __name__ == '__main__':
+    main()
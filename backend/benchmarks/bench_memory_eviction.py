@@ -0,0 +1,136 @@
+"""
+⏱️ BENCHMARK: DESALOJO POR MONTÍCULO VS RECORRIDO CON min()
+==========================================================
+
+Rotación a plena capacidad: se llena cada almacén hasta su límite y se
+miden N inserciones más (cada una desaloja un elemento), intercalando
+actualizaciones de confianza/efectividad como hace el agente:
+- hechos de SemanticMemoryStore (max_facts configurado: 50000)
+- episodios de EpisodicMemoryStore
+- procedimientos de ProceduralMemoryStore (con 5 condiciones de contexto)
+
+"anterior" reproduce los métodos de desalojo previos a los montículos:
+min() sobre todo el almacén y, en procedimientos, el recorrido de todas las
+listas de procedure_index.
+
+Uso (desde backend/):
+    python -m benchmarks.bench_memory_eviction [--capacity 50000] [--churn 2000]
+"""
+
+import argparse
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.memory.episodic_memory_store import Episode, EpisodicMemoryStore  # noqa: E402
+from src.memory.procedural_memory_store import Procedure, ProceduralMemoryStore  # noqa: E402
+from src.memory.semantic_memory_store import SemanticFact, SemanticMemoryStore  # noqa: E402
+
+BASE = datetime(2024, 1, 1)
+
+
+class LegacySemanticStore(SemanticMemoryStore):
+    def _remove_least_confident_fact(self):
+        if not self.facts:
+            return
+        fact_id, fact = min(self.facts.items(), key=lambda x: x[1].confidence)
+        del self.facts[fact_id]
+        self.fact_index[fact.subject].discard(fact_id)
+
+
+class LegacyEpisodicStore(EpisodicMemoryStore):
+    def _find_least_important_episode(self):
+        if not self.episodes:
+            return None
+        return min(self.episodes.items(), key=lambda x: (x[1].importance, x[1].timestamp))[0]
+
+
+class LegacyProceduralStore(ProceduralMemoryStore):
+    def _remove_least_effective_procedure(self):
+        if not self.procedures:
+            return
+        procedure_id = min(self.procedures.items(), key=lambda x: x[1].effectiveness_score)[0]
+        del self.procedures[procedure_id]
+        for index_list in self.procedure_index.values():
+            index_list.pop(procedure_id, None)  # Recorrido de todo procedure_index, como antes
+
+
+def make_fact(rng, number):
+    return SemanticFact(id=f"fact-{number}", subject=f"s{rng.randrange(5000)}", predicate="rel",
+                        object=f"o{number}", context={}, confidence=rng.random())
+
+
+def make_episode(rng, number):
+    return Episode(id=f"ep-{number}", title=f"episodio {number}", description="", context={'n': number % 50},
+                   actions=[], outcomes=[], timestamp=BASE + timedelta(seconds=number),
+                   success=rng.random() < 0.8, importance=rng.randint(1, 5))
+
+
+def make_procedure(rng, number):
+    conditions = {f"k{i}": rng.randrange(100) for i in range(5)}
+    return Procedure(id=f"proc-{number}", name="p", description="", steps=[],
+                     context_conditions=conditions, effectiveness_score=rng.random())
+
+
+def churn(store, make, insert, update, capacity, count):
+    """Llena el almacén y mide `count` inserciones con desalojo (una actualización cada 4)"""
+    rng = random.Random(0)
+    for number in range(capacity):
+        insert(store, make(rng, number))
+    started = time.perf_counter()
+    for number in range(capacity, capacity + count):
+        insert(store, make(rng, number))
+        if number % 4 == 0:
+            update(store, rng, number)
+    return time.perf_counter() - started
+
+
+def update_fact(store, rng, number):
+    store.update_fact_confidence(f"fact-{rng.randrange(number)}", rng.uniform(-0.2, 0.2))
+
+
+def update_episode(store, rng, number):
+    episode = store.retrieve_episode(f"ep-{rng.randrange(number)}")
+    if episode is not None:
+        episode.importance = rng.randint(1, 5)
+        store.reindex_episode(episode.id)
+
+
+def update_procedure(store, rng, number):
+    store.update_procedure_effectiveness(f"proc-{rng.randrange(number)}", rng.random() < 0.7, rng.uniform(1, 120))
+
+
+CASES = [
+    ('hechos', SemanticMemoryStore, LegacySemanticStore, 'max_facts', make_fact,
+     lambda store, item: store.store_fact(item), update_fact),
+    ('episodios', EpisodicMemoryStore, LegacyEpisodicStore, 'max_episodes', make_episode,
+     lambda store, item: store.store_episode(item), update_episode),
+    ('procedimientos', ProceduralMemoryStore, LegacyProceduralStore, 'max_procedures', make_procedure,
+     lambda store, item: store.store_procedure(item), update_procedure),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--capacity', type=int, default=50000)
+    parser.add_argument('--churn', type=int, default=2000)
+    parser.add_argument('--legacy-churn', type=int, default=200,
+                        help='inserciones medidas con el desalojo anterior (cada una recorre el almacén)')
+    args = parser.parse_args()
+
+    print(f"capacidad {args.capacity:,}")
+    for name, store_cls, legacy_cls, option, make, insert, update in CASES:
+        legacy = churn(legacy_cls(**{option: args.capacity}), make, insert, update,
+                       args.capacity, args.legacy_churn) / args.legacy_churn
+        current = churn(store_cls(**{option: args.capacity}), make, insert, update,
+                        args.capacity, args.churn) / args.churn
+        print(f"  {name:<15} anterior {legacy * 1e6:10.1f} µs/inserción   "
+              f"montículo {current * 1e6:8.1f} µs/inserción   x{legacy / current:7.1f}")
+
+
+if __name__ == '__main__':
+    main()
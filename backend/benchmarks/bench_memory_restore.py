@@ -0,0 +1,116 @@
+"""
+⏱️ BENCHMARK: PERSISTENCIA Y ARRANQUE DE LOS ALMACENES DE MEMORIA
+================================================================
+
+Episodios sintéticos parecidos a los de chat (from_chat_interaction: consulta,
+respuesta, herramientas y contexto con task_id) en un fichero SQLite
+temporal. Para cada tamaño se mide:
+- store: almacenar todos los episodios sin persistencia y con ella (cada
+  alta añade una fila al log de cambios)
+- compact: plegar el log en records y guardar la instantánea
+- snapshot: arranque de un proceso nuevo desde la instantánea
+- records: arranque reconstruyendo desde records (instantánea ausente o de
+  otro SNAPSHOT_FORMAT)
+- sync: aplicar en otro worker 1.000 episodios registrados por el primero
+
+Uso (desde backend/):
+    python -m benchmarks.bench_memory_restore [--sizes 20000,50000]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.memory.episodic_memory_store import Episode, EpisodicMemoryStore  # noqa: E402
+from src.memory.memory_persistence import MemoryPersistence  # noqa: E402
+from src.memory.procedural_memory_store import ProceduralMemoryStore  # noqa: E402
+from src.memory.semantic_memory_store import SemanticMemoryStore  # noqa: E402
+from src.memory.working_memory_store import WorkingMemoryStore  # noqa: E402
+
+WORDS = ("python archivo servidor error despliegue base datos consulta api docker prueba "
+         "navegador búsqueda informe tabla gráfico usuario sesión memoria modelo").split()
+TOOLS = ['shell', 'web_search', 'file_manager', 'browser', 'python']
+SYNCED = 1000
+
+
+def make_episode(rng, number):
+    def sentence(size):
+        return ' '.join(rng.choice(WORDS) for _ in range(size))
+
+    episode = Episode.from_chat_interaction(
+        user_query=sentence(12), agent_response=sentence(60), success=rng.random() < 0.9,
+        context={'task_id': f"task-{number // 5}", 'task_type': rng.choice(['chat', 'code', 'research'])},
+        tools_used=rng.sample(TOOLS, rng.randint(0, 3)), importance=rng.random()
+    )
+    episode.id = f"ep-{number}"
+    return episode
+
+
+def make_stores(size):
+    return {
+        'working': WorkingMemoryStore(),
+        'episodic': EpisodicMemoryStore(max_episodes=size + SYNCED),
+        'semantic': SemanticMemoryStore(),
+        'procedural': ProceduralMemoryStore(),
+    }
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - started, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='20000,50000')
+    args = parser.parse_args()
+
+    for size in (int(value) for value in args.sizes.split(',')):
+        rng = random.Random(0)
+        episodes = [make_episode(rng, number) for number in range(size)]
+        extra = [make_episode(rng, number) for number in range(size, size + SYNCED)]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'memory.sqlite')
+
+            plain = make_stores(size)
+            plain_seconds, _ = timed(lambda: [plain['episodic'].store_episode(episode) for episode in episodes])
+            writer, stores = MemoryPersistence(path), make_stores(size)
+            writer.load(stores)
+            store_seconds, _ = timed(lambda: [stores['episodic'].store_episode(episode) for episode in episodes])
+            compact_seconds, _ = timed(writer.compact)
+            size_mb = os.path.getsize(path) / (1024 * 1024)
+            print(f"\n{size:,} episodios  (fichero {size_mb:.1f} MB)")
+            print(f"  store      sin persistencia {plain_seconds / size * 1e6:7.1f} µs/episodio   "
+                  f"con log {store_seconds / size * 1e6:7.1f} µs/episodio")
+            print(f"  compact    {compact_seconds:7.3f} s")
+
+            reader = MemoryPersistence(path)
+            restored = make_stores(size)
+            snapshot_seconds, loaded = timed(lambda: reader.load(restored))
+            assert len(restored['episodic'].episodes) == size and loaded['sources']['episodic'] == 'snapshot'
+            print(f"  snapshot   {snapshot_seconds:7.3f} s")
+
+            reader._db.execute('DELETE FROM snapshots')
+            rebuilt = make_stores(size)
+            records_seconds, loaded = timed(lambda: reader.load(rebuilt))
+            assert len(rebuilt['episodic'].episodes) == size and loaded['sources']['episodic'] == 'records'
+            print(f"  records    {records_seconds:7.3f} s")
+
+            for episode in extra:
+                stores['episodic'].store_episode(episode)
+            sync_seconds, applied = timed(reader.sync)
+            assert applied == len(extra)
+            print(f"  sync       {sync_seconds * 1000:7.1f} ms ({applied:,} episodios de otro worker)")
+            writer.close()
+            reader.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""
+⏱️ BENCHMARK: EXTRACTOR DE TOOL CALLS VS PARSER REGEX ANTERIOR
+==============================================================
+
+Corpus: los informes reales generados por el agente en backend/reports/
+(respuestas largas en markdown) más variantes con tool calls insertados:
+bloque ```json, JSON suelto, JSON anidado en un plan y JSON truncado.
+
+Uso (desde backend/):
+    python -m benchmarks.bench_tool_call_parser [--repeat 5]
+"""
+
+import argparse
+import json
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.services.tool_call_parser import ToolCallExtractor, parse_tool_calls  # noqa: E402
+
+REPORTS_DIR = Path(__file__).resolve().parent.parent / 'reports'
+
+TOOL_CALL = {'tool_call': {'tool': 'web_search', 'parameters': {'query': 'energías renovables 2025', 'max_results': 5}}}
+NESTED_CALL = {'tool_call': {'tool': 'file_manager', 'parameters': {'action': 'write', 'options': {'encoding': 'utf-8', 'tags': {'a': 1}}}}}
+
+
+def legacy_parse_response(response_text):
+    """Copia de OllamaService._parse_response antes del extractor (4 estrategias regex)"""
+    if not response_text or not isinstance(response_text, str):
+        return {'text': '', 'tool_calls': []}
+
+    tool_calls = []
+    clean_text = response_text
+
+    for match in re.findall(r'```json\s*(\{.*?\})\s*```', response_text, re.DOTALL):
+        try:
+            data = json.loads(match)
+            if 'tool_call' in data:
+                tool_calls.append(data['tool_call'])
+                clean_text = clean_text.replace(f'```json\n{match}\n```', '')
+        except json.JSONDecodeError:
+            continue
+
+    if not tool_calls:
+        for match in re.findall(r'\{[^{}]*"tool_call"[^{}]*\{[^{}]*\}[^{}]*\}', response_text):
+            try:
+                data = json.loads(match)
+                if 'tool_call' in data:
+                    tool_calls.append(data['tool_call'])
+                    clean_text = clean_text.replace(match, '')
+            except json.JSONDecodeError:
+                continue
+
+    if not tool_calls:
+        for potential_json in re.findall(r'\{[^}]*\}', response_text):
+            try:
+                data = json.loads(potential_json.replace("'", '"'))
+                if isinstance(data, dict) and 'tool_call' in data:
+                    tool_calls.append(data['tool_call'])
+                    clean_text = clean_text.replace(potential_json, '')
+                    break
+            except (json.JSONDecodeError, ValueError):
+                continue
+
+    if not tool_calls:
+        tool_pattern = r'"tool_call"\s*:\s*\{[^}]*"tool"\s*:\s*"([^"]+)"[^}]*"parameters"\s*:\s*\{[^}]*\}'
+        for tool_match in re.finditer(tool_pattern, response_text):
+            try:
+                full_match = tool_match.group()
+                tool_name_match = re.search(r'"tool"\s*:\s*"([^"]+)"', full_match)
+                params_match = re.search(r'"parameters"\s*:\s*(\{[^}]*\})', full_match)
+                if tool_name_match:
+                    tool_calls.append({
+                        'tool': tool_name_match.group(1),
+                        'parameters': json.loads(params_match.group(1)) if params_match else {}
+                    })
+                    clean_text = clean_text.replace(tool_match.group(), '')
+            except (json.JSONDecodeError, AttributeError):
+                continue
+
+    clean_text = re.sub(r'```\w*\n?', '', clean_text)
+    clean_text = re.sub(r'\n\s*\n', '\n', clean_text)
+    return {'text': clean_text.strip(), 'tool_calls': tool_calls}
+
+
+def build_corpus():
+    """(nombre, texto, tool calls esperados) para cada documento"""
+    reports = sorted(REPORTS_DIR.glob('*.md'))
+    corpus = []
+    for path in reports:
+        body = path.read_text(encoding='utf-8', errors='ignore')
+        middle = len(body) // 2
+        corpus.append((path.name, body, 0))
+        corpus.append((f'{path.name}+fenced', body[:middle] + '\n```json\n' + json.dumps(TOOL_CALL, indent=2) + '\n```\n' + body[middle:], 1))
+        corpus.append((f'{path.name}+inline', body + '\nAcción: ' + json.dumps(TOOL_CALL), 1))
+        corpus.append((f'{path.name}+nested', body + '\n' + json.dumps({'plan': [NESTED_CALL, TOOL_CALL]}), 2))
+        corpus.append((f'{path.name}+truncated', body + '\n' + json.dumps(TOOL_CALL)[:-2], 1))
+    return corpus
+
+
+def bench(name, parse, corpus, repeat):
+    best = float('inf')
+    found = correct = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        results = [parse(text) for _, text, _ in corpus]
+        best = min(best, time.perf_counter() - started)
+    for (_, _, expected), result in zip(corpus, results):
+        found += len(result['tool_calls'])
+        correct += int(len(result['tool_calls']) == expected)
+    total_kb = sum(len(text) for _, text, _ in corpus) / 1024
+    print(f"{name:<28} {best * 1000:9.1f} ms  {total_kb / best / 1024:8.2f} MB/s  "
+          f"tool calls: {found:4d}  docs correctos: {correct}/{len(corpus)}")
+
+
+def streamed(text, chunk_size=16):
+    extractor = ToolCallExtractor()
+    for i in range(0, len(text), chunk_size):
+        extractor.feed(text[i:i + chunk_size])
+    return extractor.finish()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    corpus = build_corpus()
+    if not corpus:
+        print(f"No hay informes en {REPORTS_DIR}")
+        return
+    size_kb = sum(len(text) for _, text, _ in corpus) / 1024
+    print(f"Corpus: {len(corpus)} documentos, {size_kb:.0f} KB\n")
+
+    bench('regex (anterior)', legacy_parse_response, corpus, args.repeat)
+    bench('extractor (completo)', parse_tool_calls, corpus, args.repeat)
+    bench('extractor (stream 16 chars)', streamed, corpus, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
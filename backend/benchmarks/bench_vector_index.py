@@ -0,0 +1,134 @@
+"""
+⏱️ BENCHMARK: ÍNDICE VECTORIAL CON MAPEO DE IDS VS EMBEDDINGSERVICE ANTERIOR
+==========================================================================
+
+Vectores aleatorios de dimensión 384 (la de all-MiniLM-L6-v2) en lotes de
+1000. Para cada tamaño de corpus se mide:
+- add: inserción de todo el corpus
+- search: latencia media de una consulta top-5 (incluye traducir hits a doc_id)
+- delete: borrado del 1% de los documentos
+
+"anterior" reproduce EmbeddingService antes de VectorIndex: IndexFlatIP, un
+recorrido de document_map por cada hit y borrados que no quitan el vector
+(los hits borrados se descartan tras buscar). Por encima de --legacy-max se
+omite porque cada consulta recorre el corpus entero.
+
+Uso (desde backend/):
+    python -m benchmarks.bench_vector_index [--sizes 10000,100000,1000000] [--dim 384]
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.memory.vector_index import INDEX_FLAT, VectorIndex  # noqa: E402
+
+BATCH = 1000
+TOP_K = 5
+
+
+def make_corpus(size, dimension, seed=0):
+    vectors = np.random.default_rng(seed).normal(size=(size, dimension)).astype(np.float32)
+    faiss.normalize_L2(vectors)
+    return [f"doc-{i}" for i in range(size)], vectors
+
+
+class LegacyIndex:
+    """EmbeddingService anterior: Flat + búsqueda lineal de index_id en document_map"""
+
+    def __init__(self, dimension):
+        self.index = faiss.IndexFlatIP(dimension)
+        self.document_map = {}
+
+    def add(self, doc_ids, vectors):
+        start = self.index.ntotal
+        self.index.add(vectors)
+        for offset, doc_id in enumerate(doc_ids):
+            self.document_map[doc_id] = {'index_id': start + offset}
+
+    def search(self, query, top_k):
+        scores, indices = self.index.search(query.reshape(1, -1), min(top_k, self.index.ntotal))
+        results = []
+        for score, idx in zip(scores[0], indices[0]):
+            found = None
+            for doc_id, doc_data in self.document_map.items():
+                if doc_data['index_id'] == idx:
+                    found = doc_id
+                    break
+            if found:
+                results.append((found, float(score)))
+        return results
+
+    def remove(self, doc_id):
+        self.document_map.pop(doc_id, None)
+
+
+def timed(fn):
+    started = time.perf_counter()
+    fn()
+    return time.perf_counter() - started
+
+
+def bench(name, index, doc_ids, vectors, queries, deletes):
+    def add_all():
+        for start in range(0, len(doc_ids), BATCH):
+            index.add(doc_ids[start:start + BATCH], vectors[start:start + BATCH])
+
+    add_seconds = timed(add_all)
+    search_seconds = timed(lambda: [index.search(query, TOP_K) for query in queries]) / len(queries)
+    delete_seconds = timed(lambda: [index.remove(doc_id) for doc_id in deletes])
+    after_delete = timed(lambda: [index.search(query, TOP_K) for query in queries]) / len(queries)
+
+    mode = getattr(index, 'active_mode', INDEX_FLAT)
+    print(f"  {name:<22} {mode:<5} add {add_seconds:8.2f} s ({len(doc_ids) / add_seconds:9.0f} vec/s)  "
+          f"search {search_seconds * 1000:9.3f} ms  delete {delete_seconds * 1000:9.1f} ms "
+          f"({len(deletes)} docs)  search tras borrar {after_delete * 1000:9.3f} ms")
+
+
+def recall(index, vectors, queries_idx):
+    """Fracción de consultas cuyo vecino exacto (el propio vector) aparece en el top-k"""
+    hits = sum(
+        1 for i in queries_idx
+        if f"doc-{i}" in [doc_id for doc_id, _ in index.search(vectors[i], TOP_K)]
+    )
+    return hits / len(queries_idx)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='10000,100000,1000000')
+    parser.add_argument('--dim', type=int, default=384)
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('--legacy-max', type=int, default=100000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    for size in (int(value) for value in args.sizes.split(',')):
+        doc_ids, vectors = make_corpus(size, args.dim)
+        queries_idx = rng.choice(size, args.queries, replace=False)
+        queries = vectors[queries_idx]
+        deletes = [doc_ids[i] for i in rng.choice(size, max(1, size // 100), replace=False)]
+        print(f"\n{size:,} vectores x {args.dim}")
+
+        if size <= args.legacy_max:
+            bench('anterior (flat+scan)', LegacyIndex(args.dim), doc_ids, vectors, queries, deletes)
+        else:
+            print(f"  {'anterior (flat+scan)':<22} omitido (> --legacy-max)")
+
+        bench('VectorIndex flat', VectorIndex(mode='flat'), doc_ids, vectors, queries, deletes)
+
+        auto = VectorIndex(mode='auto')
+        bench('VectorIndex auto', auto, doc_ids, vectors, queries, deletes)
+        deleted = set(deletes)
+        alive = [i for i in queries_idx if doc_ids[i] not in deleted][:50]
+        print(f"  {'':<22} recall@{TOP_K} auto: {recall(auto, vectors, alive):.2f}  {auto.get_stats()}")
+
+
+if __name__ == '__main__':
+    main()
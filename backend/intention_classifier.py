@@ -14,6 +14,8 @@ import re
 import time
 from datetime import datetime
 
+from src.services.classification_router import ClassificationVote
+
 class IntentionType(Enum):
     """Tipos de intención identificables por el clasificador"""
     CASUAL_CONVERSATION = "casual_conversation"
@@ -124,16 +126,6 @@ ANALIZA EL MENSAJE Y RESPONDE SOLO CON EL JSON:"""
             return cached_result
         
         try:
-            # Seleccionar modelo optimizado para clasificación
-            classification_model = self.model_manager.select_best_model(
-                task_type="analysis",
-                max_cost=0.005  # Usar modelo económico para clasificación
-            )
-            
-            if not classification_model:
-                self.logger.error("No hay modelo disponible para clasificación")
-                return self._create_fallback_result(user_message)
-            
             # Preparar contexto
             tasks_summary = self._format_active_tasks(active_tasks)
             
@@ -144,6 +136,33 @@ ANALIZA EL MENSAJE Y RESPONDE SOLO CON EL JSON:"""
                 active_tasks=tasks_summary
             )
             
+            # Modelo pequeño primero; el gestor escala al grande si la confianza es baja
+            if hasattr(self.model_manager, 'classify'):
+                routed = self.model_manager.classify(
+                    prompt, self._parse_classification_vote, call_site="intention_classifier"
+                )
+                if routed is not None and routed.vote.confidence > 0.5:  # Umbral mínimo
+                    result = routed.vote.payload
+                    self.logger.info(
+                        f"Intención clasificada: {result.intention_type.value} "
+                        f"(confianza: {result.confidence}, modelo: {routed.model})"
+                    )
+                    self._cache_result(cache_key, result)
+                    return result
+                fallback_result = self._create_fallback_result(user_message)
+                self._cache_result(cache_key, fallback_result)
+                return fallback_result
+            
+            # Seleccionar modelo optimizado para clasificación
+            classification_model = self.model_manager.select_best_model(
+                task_type="analysis",
+                max_cost=0.005  # Usar modelo económico para clasificación
+            )
+            
+            if not classification_model:
+                self.logger.error("No hay modelo disponible para clasificación")
+                return self._create_fallback_result(user_message)
+            
             # Realizar clasificación con reintentos
             for attempt in range(self.max_retries + 1):
                 try:
@@ -226,6 +245,13 @@ ANALIZA EL MENSAJE Y RESPONDE SOLO CON EL JSON:"""
         
         return None
     
+    def _parse_classification_vote(self, response: str) -> Optional[ClassificationVote]:
+        """Voto para el router de clasificaciones (etiqueta = tipo de intención)"""
+        result = self._parse_classification_response(response)
+        if result is None:
+            return None
+        return ClassificationVote(label=result.intention_type.value, confidence=result.confidence, payload=result)
+    
     def _format_active_tasks(self, active_tasks: List[Dict]) -> str:
         """Formatea las tareas activas para el contexto"""
         if not active_tasks:
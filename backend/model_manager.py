@@ -4,7 +4,7 @@ Unifica el acceso a modelos de Ollama y OpenRouter
 """
 
 import logging
-from typing import List, Dict, Optional, Any, Union
+from typing import List, Dict, Optional, Any, Tuple, Union
 from enum import Enum
 import json
 import time
@@ -12,6 +12,11 @@ from dataclasses import dataclass
 
 from ollama_service import OllamaService, OllamaModel
 from openrouter_service import OpenRouterService, OpenRouterModel
+from src.services.model_catalog import (
+    PROVIDER_OLLAMA, PROVIDER_OPENROUTER, CatalogEntry,
+    approx_tokens, capability_from_name, capability_names, get_model_catalog, infer_capabilities
+)
+from src.services.classification_router import ParseFn, RoutedClassification, get_classification_router
 
 class ModelProvider(Enum):
     """Proveedores de modelos disponibles"""
@@ -45,101 +50,76 @@ class ModelManager:
         self.ollama_service = OllamaService(ollama_url)
         self.openrouter_service = OpenRouterService(openrouter_api_key)
         
+        # Catálogo compartido: capacidades precalculadas, telemetría y refresco en segundo plano
+        self.catalog = get_model_catalog()
+        self.catalog.register_provider(PROVIDER_OLLAMA, self._fetch_ollama_entries)
+        self.catalog.register_provider(PROVIDER_OPENROUTER, self._fetch_openrouter_entries)
+        self.catalog.start_background_refresh()
+        
         # Estado del gestor
-        self.unified_models: List[UnifiedModel] = []
         self.current_model: Optional[UnifiedModel] = None
         self.last_refresh: Optional[float] = None
+        self._unified_cache: Tuple[int, List[UnifiedModel]] = (-1, [])
         
         # Configuración
         self.auto_fallback = True  # Cambiar automáticamente entre proveedores
         self.prefer_local = True   # Preferir modelos locales cuando sea posible
-        
+    
+    def _fetch_ollama_entries(self) -> List[CatalogEntry]:
+        """Modelos de Ollama para el catálogo"""
+        if not self.ollama_service.is_available():
+            raise ConnectionError("Ollama no disponible")
+        return [
+            CatalogEntry.build(
+                PROVIDER_OLLAMA,
+                model.name,
+                description=f"Modelo local de Ollama: {model.name}",
+                size_mb=round(model.size / (1024 * 1024), 2),
+                cost_per_1k_tokens=0.0  # Modelos locales son gratuitos
+            )
+            for model in self.ollama_service.detect_models()
+        ]
+    
+    def _fetch_openrouter_entries(self) -> List[CatalogEntry]:
+        """Modelos de OpenRouter para el catálogo (sin API key no hay modelos)"""
+        if not self.openrouter_service.api_key:
+            return []
+        self.openrouter_service.fetch_models()
+        return self.openrouter_service.catalog_entries()
+    
     def refresh_models(self) -> bool:
-        """Actualiza la lista de modelos disponibles de todos los proveedores"""
-        self.unified_models = []
-        success = False
-        
-        # Obtener modelos de Ollama
-        if self.ollama_service.is_available():
-            try:
-                ollama_models = self.ollama_service.detect_models()
-                for model in ollama_models:
-                    unified_model = UnifiedModel(
-                        id=f"ollama:{model.name}",
-                        name=model.name,
-                        provider=ModelProvider.OLLAMA,
-                        description=f"Modelo local de Ollama: {model.name}",
-                        size_mb=round(model.size / (1024 * 1024), 2),
-                        cost_per_1k_tokens=0.0,  # Modelos locales son gratuitos
-                        capabilities=self._infer_capabilities(model.name)
-                    )
-                    self.unified_models.append(unified_model)
-                
-                self.logger.info(f"Cargados {len(ollama_models)} modelos de Ollama")
-                success = True
-                
-            except Exception as e:
-                self.logger.error(f"Error al cargar modelos de Ollama: {e}")
-        
-        # Obtener modelos de OpenRouter
-        if self.openrouter_service.is_available() and self.openrouter_service.api_key:
-            try:
-                openrouter_models = self.openrouter_service.fetch_models()
-                for model in openrouter_models:
-                    unified_model = UnifiedModel(
-                        id=f"openrouter:{model.id}",
-                        name=model.name,
-                        provider=ModelProvider.OPENROUTER,
-                        description=model.description,
-                        context_length=model.context_length,
-                        cost_per_1k_tokens=model.pricing.get('prompt', 0.0),
-                        capabilities=self._infer_capabilities(model.name)
-                    )
-                    self.unified_models.append(unified_model)
-                
-                self.logger.info(f"Cargados {len(openrouter_models)} modelos de OpenRouter")
-                success = True
-                
-            except Exception as e:
-                self.logger.error(f"Error al cargar modelos de OpenRouter: {e}")
-        
+        """Actualiza la lista de modelos disponibles de todos los proveedores (en paralelo)"""
+        success = self.catalog.refresh()
         self.last_refresh = time.time()
         self.logger.info(f"Total de modelos unificados: {len(self.unified_models)}")
-        
         return success
     
+    @staticmethod
+    def _to_unified(entry: CatalogEntry) -> UnifiedModel:
+        return UnifiedModel(
+            id=entry.key,
+            name=entry.name,
+            provider=ModelProvider(entry.provider),
+            description=entry.description,
+            context_length=entry.context_length,
+            cost_per_1k_tokens=entry.cost_per_1k_tokens,
+            size_mb=entry.size_mb,
+            capabilities=capability_names(entry.capabilities)
+        )
+    
+    @property
+    def unified_models(self) -> List[UnifiedModel]:
+        """Modelos del catálogo como UnifiedModel (se reconstruyen solo si el catálogo cambia)"""
+        entries = self.catalog.entries()
+        version, models = self._unified_cache
+        if version != self.catalog.version:
+            models = [self._to_unified(entry) for entry in entries]
+            self._unified_cache = (self.catalog.version, models)
+        return models
+    
     def _infer_capabilities(self, model_name: str) -> List[str]:
         """Infiere las capacidades de un modelo basándose en su nombre"""
-        capabilities = []
-        name_lower = model_name.lower()
-        
-        # Capacidades de código
-        if any(keyword in name_lower for keyword in ['code', 'coder', 'coding', 'starcoder', 'codellama']):
-            capabilities.extend(['code_generation', 'code_analysis', 'debugging'])
-        
-        # Capacidades de chat
-        if any(keyword in name_lower for keyword in ['chat', 'instruct', 'assistant']):
-            capabilities.append('conversational')
-        
-        # Capacidades de análisis
-        if any(keyword in name_lower for keyword in ['claude', 'gpt-4', 'gemini']):
-            capabilities.extend(['analysis', 'reasoning', 'research'])
-        
-        # Capacidades multimodales
-        if any(keyword in name_lower for keyword in ['vision', 'multimodal', 'gpt-4v']):
-            capabilities.append('vision')
-        
-        # Capacidades de tamaño
-        if any(keyword in name_lower for keyword in ['large', '70b', '65b', '175b']):
-            capabilities.append('large_context')
-        elif any(keyword in name_lower for keyword in ['small', '7b', '13b', 'tiny']):
-            capabilities.append('efficient')
-        
-        # Capacidades generales por defecto
-        if not capabilities:
-            capabilities.append('general')
-        
-        return capabilities
+        return capability_names(infer_capabilities(model_name))
     
     def get_available_models(self, provider: Optional[ModelProvider] = None) -> List[UnifiedModel]:
         """Obtiene la lista de modelos disponibles, opcionalmente filtrada por proveedor"""
@@ -149,64 +129,51 @@ class ModelManager:
     
     def find_models_by_capability(self, capability: str) -> List[UnifiedModel]:
         """Encuentra modelos que tengan una capacidad específica"""
-        return [
-            model for model in self.unified_models 
-            if capability in model.capabilities
-        ]
+        return [self._to_unified(entry) for entry in self.catalog.find(capability_from_name(capability))]
     
     def select_best_model(self, task_type: str = "general", 
                          max_cost: float = 0.01,
                          prefer_local: Optional[bool] = None) -> Optional[UnifiedModel]:
-        """Selecciona el mejor modelo para una tarea específica"""
+        """
+        Selecciona el modelo adecuado más rápido para una tarea específica
+        
+        Las capacidades vienen precalculadas del catálogo y la rapidez de la
+        telemetría de llamadas reales; el coste desempata.
+        """
         if prefer_local is None:
             prefer_local = self.prefer_local
         
-        # Mapear tipos de tarea a capacidades
-        task_capabilities = {
-            "code": ["code_generation", "code_analysis"],
-            "chat": ["conversational"],
-            "analysis": ["analysis", "reasoning"],
-            "research": ["research", "analysis"],
-            "general": ["general", "conversational"]
-        }
-        
-        required_capabilities = task_capabilities.get(task_type, ["general"])
-        
-        # Encontrar modelos candidatos
-        candidates = []
-        for capability in required_capabilities:
-            candidates.extend(self.find_models_by_capability(capability))
-        
-        # Si no hay candidatos específicos, usar todos los modelos
-        if not candidates:
-            candidates = self.unified_models
-        
-        # Filtrar por costo
-        affordable_candidates = [
-            model for model in candidates 
-            if model.cost_per_1k_tokens <= max_cost
-        ]
-        
-        if not affordable_candidates:
-            affordable_candidates = candidates  # Si ninguno es asequible, usar todos
-        
-        # Aplicar preferencias de selección
-        if prefer_local:
-            # Preferir modelos locales primero
-            local_models = [m for m in affordable_candidates if m.provider == ModelProvider.OLLAMA]
-            if local_models:
-                # Seleccionar el modelo local más grande (mejor calidad)
-                return max(local_models, key=lambda m: m.size_mb)
-            else:
-                # Si no hay modelos locales, usar el más barato de OpenRouter
-                openrouter_models = [m for m in affordable_candidates if m.provider == ModelProvider.OPENROUTER]
-                if openrouter_models:
-                    return min(openrouter_models, key=lambda m: m.cost_per_1k_tokens)
-        else:
-            # Preferir el modelo más barato independientemente del proveedor
-            return min(affordable_candidates, key=lambda m: m.cost_per_1k_tokens)
-        
-        return None
+        entry = self.catalog.select(task_type, max_cost=max_cost, prefer_local=prefer_local)
+        return self._to_unified(entry) if entry is not None else None
+    
+    def classify(self, prompt: str, parse_fn: ParseFn,
+                 call_site: str = "classification",
+                 large_task_type: str = "analysis",
+                 max_cost: float = 0.005,
+                 max_tokens: int = 500,
+                 temperature: float = 0.1) -> Optional[RoutedClassification]:
+        """
+        Clasificación con el modelo pequeño más rápido del catálogo,
+        escalando al mejor modelo de `large_task_type` si la confianza es baja
+        """
+        large_model = self.select_best_model(large_task_type, max_cost=max_cost)
+        if large_model is None:
+            return None
+        # prefer_local elige el local más grande; aquí interesa el más rápido
+        small_entry = None
+        if self.prefer_local:
+            small_entry = self.catalog.select("classification", max_cost=max_cost, provider=PROVIDER_OLLAMA)
+        small_entry = small_entry or self.catalog.select("classification", max_cost=max_cost)
+        
+        def generate(model_id: str) -> Optional[str]:
+            entry = self.catalog.get(model_id)
+            model = self._to_unified(entry) if entry is not None else large_model
+            return self.generate_response(prompt, model=model, max_tokens=max_tokens, temperature=temperature)
+        
+        return get_classification_router().classify(
+            call_site, generate, parse_fn,
+            small_entry.key if small_entry is not None else None, large_model.id
+        )
     
     def load_model(self, model: Union[UnifiedModel, str]) -> bool:
         """Carga un modelo específico"""
@@ -252,6 +219,7 @@ class ModelManager:
             self.logger.error("No hay modelo especificado o cargado")
             return None
         
+        started = time.monotonic()
         try:
             if target_model.provider == ModelProvider.OLLAMA:
                 model_name = target_model.id.replace("ollama:", "")
@@ -260,19 +228,24 @@ class ModelManager:
                     "temperature": temperature,
                     "num_predict": max_tokens
                 }
-                return self.ollama_service.generate_response(
+                response = self.ollama_service.generate_response(
                     prompt, model_name, options=ollama_options
                 )
+                self._record_call(target_model, started, response)
+                return response
                 
             elif target_model.provider == ModelProvider.OPENROUTER:
                 model_id = target_model.id.replace("openrouter:", "")
-                return self.openrouter_service.generate_response(
+                response = self.openrouter_service.generate_response(
                     prompt, model_id, max_tokens=max_tokens, 
                     temperature=temperature, **kwargs
                 )
+                self._record_call(target_model, started, response)
+                return response
                 
         except Exception as e:
             self.logger.error(f"Error al generar respuesta: {e}")
+            self._record_call(target_model, started, None)
             
             # Intentar fallback si está habilitado
             if self.auto_fallback and target_model != self.current_model:
@@ -294,6 +267,7 @@ class ModelManager:
             self.logger.error("No hay modelo especificado o cargado")
             return None
         
+        started = time.monotonic()
         try:
             if target_model.provider == ModelProvider.OLLAMA:
                 model_name = target_model.id.replace("ollama:", "")
@@ -301,19 +275,24 @@ class ModelManager:
                     "temperature": temperature,
                     "num_predict": max_tokens
                 }
-                return self.ollama_service.chat_completion(
+                response = self.ollama_service.chat_completion(
                     messages, model_name, options=ollama_options
                 )
+                self._record_call(target_model, started, response)
+                return response
                 
             elif target_model.provider == ModelProvider.OPENROUTER:
                 model_id = target_model.id.replace("openrouter:", "")
-                return self.openrouter_service.chat_completion(
+                response = self.openrouter_service.chat_completion(
                     messages, model_id, max_tokens=max_tokens,
                     temperature=temperature, **kwargs
                 )
+                self._record_call(target_model, started, response)
+                return response
                 
         except Exception as e:
             self.logger.error(f"Error en chat completion: {e}")
+            self._record_call(target_model, started, None)
             
             # Intentar fallback si está habilitado
             if self.auto_fallback and target_model != self.current_model:
@@ -324,6 +303,13 @@ class ModelManager:
         
         return None
     
+    def _record_call(self, model: UnifiedModel, started: float, response: Optional[str]) -> None:
+        """Telemetría de la llamada para que el catálogo aprenda qué modelos son rápidos"""
+        model_id = model.id.split(":", 1)[1] if ":" in model.id else model.id
+        # Estos servicios solo devuelven texto: los tokens se estiman por su longitud
+        self.catalog.record_call(model.provider.value, model_id, time.monotonic() - started,
+                                 response is not None, output_tokens=approx_tokens(response))
+    
     def get_status(self) -> Dict[str, Any]:
         """Obtiene el estado actual del gestor de modelos"""
         return {
@@ -341,7 +327,8 @@ class ModelManager:
             "settings": {
                 "auto_fallback": self.auto_fallback,
                 "prefer_local": self.prefer_local
-            }
+            },
+            "catalog": self.catalog.get_status()
         }
 
 # Ejemplo de uso
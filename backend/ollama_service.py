@@ -6,10 +6,13 @@ Proporciona integración con modelos de lenguaje locales a través de Ollama
 import requests
 import json
 import logging
+import os
 from typing import List, Dict, Optional, Any
 from dataclasses import dataclass
 import time
 
+from src.services.http_session_pool import get_http_session_pool
+
 @dataclass
 class OllamaModel:
     """Representa un modelo de Ollama disponible"""
@@ -35,7 +38,9 @@ class OllamaService:
             if 'ngrok' in self.base_url:
                 headers['ngrok-skip-browser-warning'] = 'true'
                 
-            response = requests.get(f"{self.base_url}/api/version", timeout=5, headers=headers)
+            response = get_http_session_pool().get(
+                f"{self.base_url}/api/version", read_timeout=5, headers=headers, retry=False
+            )
             return response.status_code == 200
         except requests.exceptions.RequestException as e:
             self.logger.warning(f"Ollama no está disponible: {e}")
@@ -48,7 +53,7 @@ class OllamaService:
             if 'ngrok' in self.base_url:
                 headers['ngrok-skip-browser-warning'] = 'true'
                 
-            response = requests.get(f"{self.base_url}/api/tags", timeout=10, headers=headers)
+            response = get_http_session_pool().get(f"{self.base_url}/api/tags", read_timeout=10, headers=headers)
             response.raise_for_status()
             
             data = response.json()
@@ -75,10 +80,10 @@ class OllamaService:
     def get_model_info(self, model_name: str) -> Optional[Dict[str, Any]]:
         """Obtiene información detallada de un modelo específico"""
         try:
-            response = requests.post(
+            response = get_http_session_pool().post(
                 f"{self.base_url}/api/show",
                 json={"name": model_name},
-                timeout=10
+                read_timeout=10
             )
             response.raise_for_status()
             return response.json()
@@ -101,17 +106,18 @@ class OllamaService:
             if 'ngrok' in self.base_url:
                 headers['ngrok-skip-browser-warning'] = 'true'
             
-            # Cargar el modelo haciendo una solicitud simple
-            response = requests.post(
+            # Prompt vacío: Ollama solo carga el modelo y lo mantiene keep_alive.
+            # Una carga en frío de un modelo grande puede superar los 30s.
+            response = get_http_session_pool().post(
                 f"{self.base_url}/api/generate",
                 json={
                     "model": model_name,
-                    "prompt": "Hello",
+                    "prompt": "",
                     "stream": False,
-                    "options": {"num_predict": 1}
+                    "keep_alive": os.getenv('OLLAMA_KEEP_ALIVE', '30m')
                 },
                 headers=headers,
-                timeout=30
+                read_timeout=float(os.getenv('OLLAMA_LOAD_TIMEOUT', '180'))
             )
             response.raise_for_status()
             
@@ -149,11 +155,11 @@ class OllamaService:
             if 'ngrok' in self.base_url:
                 headers['ngrok-skip-browser-warning'] = 'true'
             
-            response = requests.post(
+            response = get_http_session_pool().post(
                 f"{self.base_url}/api/generate",
                 json=payload,
                 headers=headers,
-                timeout=120
+                read_timeout=120
             )
             response.raise_for_status()
             
@@ -199,10 +205,10 @@ class OllamaService:
             if options:
                 payload["options"] = options
             
-            response = requests.post(
+            response = get_http_session_pool().post(
                 f"{self.base_url}/api/chat",
                 json=payload,
-                timeout=120
+                read_timeout=120
             )
             response.raise_for_status()
             
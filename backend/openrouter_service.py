@@ -11,6 +11,11 @@ from typing import List, Dict, Optional, Any
 from dataclasses import dataclass
 import time
 
+from src.services.http_session_pool import get_http_session_pool
+from src.services.model_catalog import (
+    PROVIDER_OPENROUTER, CatalogEntry, ModelCapability, get_model_catalog, price_per_1k
+)
+
 @dataclass
 class OpenRouterModel:
     """Representa un modelo disponible en OpenRouter"""
@@ -31,6 +36,7 @@ class OpenRouterService:
         self.base_url = base_url
         self.logger = logging.getLogger(__name__)
         self.available_models: List[OpenRouterModel] = []
+        self._catalog_entries: Dict[str, CatalogEntry] = {}
         self.app_name = "Mitosis-Agent"
         self.site_url = "https://github.com/mitosis-agent"
         
@@ -53,10 +59,11 @@ class OpenRouterService:
     def is_available(self) -> bool:
         """Verifica si OpenRouter está disponible"""
         try:
-            response = requests.get(
+            response = get_http_session_pool().get(
                 f"{self.base_url}/models",
                 headers=self._get_headers(),
-                timeout=10
+                read_timeout=10,
+                retry=False
             )
             return response.status_code == 200
         except requests.exceptions.RequestException as e:
@@ -66,10 +73,10 @@ class OpenRouterService:
     def fetch_models(self) -> List[OpenRouterModel]:
         """Obtiene la lista de modelos disponibles en OpenRouter"""
         try:
-            response = requests.get(
+            response = get_http_session_pool().get(
                 f"{self.base_url}/models",
                 headers=self._get_headers(),
-                timeout=15
+                read_timeout=15
             )
             response.raise_for_status()
             
@@ -90,6 +97,19 @@ class OpenRouterService:
                 models.append(model)
             
             self.available_models = models
+            # Capacidades y precios precalculados una vez por modelo
+            self._catalog_entries = {
+                model.id: CatalogEntry.build(
+                    PROVIDER_OPENROUTER,
+                    model.id,
+                    model.name,
+                    description=model.description,
+                    context_length=model.context_length or 0,
+                    cost_per_1k_tokens=price_per_1k(model.pricing.get('prompt'))
+                )
+                for model in models
+            }
+            get_model_catalog().update_provider(PROVIDER_OPENROUTER, self._catalog_entries.values())
             self.logger.info(f"Obtenidos {len(models)} modelos de OpenRouter")
             return models
             
@@ -115,11 +135,11 @@ class OpenRouterService:
                 **kwargs
             }
             
-            response = requests.post(
+            response = get_http_session_pool().post(
                 f"{self.base_url}/chat/completions",
                 headers=self._get_headers(),
                 json=payload,
-                timeout=120
+                read_timeout=120
             )
             response.raise_for_status()
             
@@ -173,11 +193,11 @@ class OpenRouterService:
                 **kwargs
             }
             
-            response = requests.post(
+            response = get_http_session_pool().post(
                 f"{self.base_url}/chat/completions",
                 headers=self._get_headers(),
                 json=payload,
-                timeout=120
+                read_timeout=120
             )
             response.raise_for_status()
             
@@ -210,93 +230,60 @@ class OpenRouterService:
             for model in self.available_models
         ]
     
+    def catalog_entries(self) -> List[CatalogEntry]:
+        """Entradas de catálogo de los modelos obtenidos en el último fetch_models"""
+        return list(self._catalog_entries.values())
+    
     def find_models_by_criteria(self, 
                                max_cost_per_1k_tokens: Optional[float] = None,
                                min_context_length: Optional[int] = None,
                                provider: Optional[str] = None,
-                               architecture_type: Optional[str] = None) -> List[OpenRouterModel]:
-        """Encuentra modelos que cumplan con criterios específicos"""
-        filtered_models = self.available_models.copy()
+                               architecture_type: Optional[str] = None,
+                               capabilities: ModelCapability = ModelCapability.NONE) -> List[OpenRouterModel]:
+        """
+        Encuentra modelos que cumplan con criterios específicos
         
-        if max_cost_per_1k_tokens is not None:
-            filtered_models = [
-                model for model in filtered_models
-                if model.pricing.get('prompt', float('inf')) <= max_cost_per_1k_tokens
-            ]
+        Una sola pasada; coste y capacidades salen de las entradas
+        precalculadas en fetch_models (el precio de la API es por token).
+        """
+        provider = provider.lower() if provider is not None else None
+        architecture_type = architecture_type.lower() if architecture_type is not None else None
+        required = int(capabilities)
         
-        if min_context_length is not None:
-            filtered_models = [
-                model for model in filtered_models
-                if model.context_length >= min_context_length
-            ]
-        
-        if provider is not None:
-            filtered_models = [
-                model for model in filtered_models
-                if provider.lower() in model.top_provider.get('name', '').lower()
-            ]
-        
-        if architecture_type is not None:
-            filtered_models = [
-                model for model in filtered_models
-                if architecture_type.lower() in model.architecture.get('tokenizer', '').lower()
-            ]
+        filtered_models = []
+        for model in self.available_models:
+            entry = self._catalog_entries.get(model.id)
+            if entry is None:
+                continue
+            if max_cost_per_1k_tokens is not None and entry.cost_per_1k_tokens > max_cost_per_1k_tokens:
+                continue
+            if min_context_length is not None and model.context_length < min_context_length:
+                continue
+            if required and not int(entry.capabilities) & required:
+                continue
+            if provider is not None and provider not in model.top_provider.get('name', '').lower():
+                continue
+            if architecture_type is not None and architecture_type not in model.architecture.get('tokenizer', '').lower():
+                continue
+            filtered_models.append(model)
         
         return filtered_models
     
     def select_best_model(self, task_type: str = "general", 
                          budget_per_1k_tokens: float = 0.01) -> Optional[str]:
-        """Selecciona el mejor modelo disponible para un tipo de tarea y presupuesto"""
+        """
+        Selecciona el modelo adecuado más rápido para un tipo de tarea y presupuesto
+        
+        Delega en el catálogo compartido: capacidades precalculadas,
+        contexto mínimo por tipo de tarea y latencia medida en llamadas reales.
+        """
         if not self.available_models:
             return None
         
-        # Criterios de selección por tipo de tarea
-        task_criteria = {
-            "code": {
-                "preferred_names": ["claude", "gpt-4", "codellama", "deepseek"],
-                "min_context": 8000
-            },
-            "chat": {
-                "preferred_names": ["gpt", "claude", "llama", "mistral"],
-                "min_context": 4000
-            },
-            "general": {
-                "preferred_names": ["gpt", "claude", "llama"],
-                "min_context": 4000
-            },
-            "analysis": {
-                "preferred_names": ["claude", "gpt-4", "gemini"],
-                "min_context": 16000
-            }
-        }
-        
-        criteria = task_criteria.get(task_type, task_criteria["general"])
-        
-        # Filtrar por presupuesto y contexto mínimo
-        suitable_models = self.find_models_by_criteria(
-            max_cost_per_1k_tokens=budget_per_1k_tokens,
-            min_context_length=criteria["min_context"]
+        entry = get_model_catalog().select(
+            task_type, max_cost=budget_per_1k_tokens, provider=PROVIDER_OPENROUTER
         )
-        
-        if not suitable_models:
-            # Si no hay modelos dentro del presupuesto, usar todos los disponibles
-            suitable_models = self.available_models
-        
-        # Buscar modelos preferidos
-        for preferred_name in criteria["preferred_names"]:
-            for model in suitable_models:
-                if preferred_name.lower() in model.name.lower():
-                    return model.id
-        
-        # Si no se encuentra ningún modelo preferido, retornar el más barato
-        if suitable_models:
-            cheapest_model = min(
-                suitable_models,
-                key=lambda m: m.pricing.get('prompt', float('inf'))
-            )
-            return cheapest_model.id
-        
-        return None
+        return entry.model_id if entry is not None else None
     
     def get_model_cost_estimate(self, model_id: str, input_tokens: int, 
                                output_tokens: int) -> Optional[float]:
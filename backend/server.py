@@ -8,7 +8,6 @@ import os
 import sys
 import time
 import json
-import asyncio
 import threading
 import traceback
 from datetime import datetime
@@ -206,22 +205,18 @@ def initialize_ollama_queue():
     """
     🚀 INICIALIZAR GESTOR DE COLA DE OLLAMA EN BACKGROUND
     
-    Inicializa el sistema de cola de Ollama en un thread separado
-    para evitar bloquear el inicio de la aplicación Flask.
+    Arranca el despachador persistente (un event loop en un thread de
+    background que posee la cola) para evitar bloquear el inicio de Flask.
     """
     try:
-        from src.services.ollama_queue_manager import initialize_ollama_queue_manager
+        from src.services.ollama_dispatcher import get_ollama_dispatcher
         
         def async_init():
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
             try:
-                loop.run_until_complete(initialize_ollama_queue_manager())
+                get_ollama_dispatcher().start()
                 print("🚦 ✅ Sistema de cola Ollama inicializado exitosamente")
             except Exception as e:
                 print(f"🚦 ❌ Error inicializando cola Ollama: {str(e)}")
-            finally:
-                loop.close()
         
         # Ejecutar en thread separado
         init_thread = threading.Thread(target=async_init, daemon=True)
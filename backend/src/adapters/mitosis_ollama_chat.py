@@ -1,12 +1,18 @@
 """
 Wrapper para integrar OllamaService de Mitosis con browser-use
 Implementa el protocolo BaseChatModel requerido por browser-use
+
+Las llamadas van por la ruta async del servicio (agenerate_raw) hasta la
+cola compartida: no bloquean un thread por paso y, si browser-use aborta
+un paso, la cancelación libera el hueco de la cola. El prompt aplanado
+conserva el mismo prefijo entre pasos para aprovechar la caché KV de Ollama.
 """
 
 import asyncio
 import logging
-from typing import List, Union, Optional, Any, Type
-from dataclasses import dataclass
+import os
+from typing import Dict, List, Union, Optional, Any, Type
+from dataclasses import dataclass, field
 
 # Importaciones de browser-use
 from browser_use.llm.base import BaseChatModel
@@ -25,6 +31,17 @@ except ImportError:
 
 logger = logging.getLogger(__name__)
 
+# Mensajes aplanados en caché por instancia (el system prompt y el historial se repiten en cada paso)
+_MESSAGE_CACHE_SIZE = 256
+
+# Opciones para browser-use (más determinístico); sustituyen a las del modelo
+BROWSER_USE_OPTIONS = {
+    "temperature": 0.3,  # Más determinístico para navegación
+    "top_p": 0.8,
+    "num_predict": 1500,  # Suficiente para respuestas de navegación
+    "stop": ["USER:", "SYSTEM:", "\n\nUSER:", "\n\nSYSTEM:"]
+}
+
 
 @dataclass
 class MitosisOllamaChatModel(BaseChatModel):
@@ -36,19 +53,27 @@ class MitosisOllamaChatModel(BaseChatModel):
     model: str = "llama3.1:8b"
     host: str = "https://66bd0d09b557.ngrok-free.app"
     ollama_service: Optional[OllamaService] = None
+    task_id: str = "browser-use"
+    _message_cache: Dict[Any, str] = field(default_factory=dict, repr=False)
+    _last_prompt: str = field(default="", repr=False)
     
     def __post_init__(self):
         """Inicializar OllamaService después de la creación del dataclass"""
         if self.ollama_service is None:
             self.ollama_service = OllamaService(base_url=self.host)
-        
-        # Configurar el modelo específico en el servicio
-        success = self.ollama_service.set_model(self.model)
-        if not success:
-            logger.warning(f"⚠️ No se pudo configurar el modelo {self.model}, usando por defecto")
+            
+            # Servicio propio: configurar el modelo específico. Con un servicio
+            # compartido el modelo se pasa por llamada para no cambiar el global.
+            success = self.ollama_service.set_model(self.model)
+            if not success:
+                logger.warning(f"⚠️ No se pudo configurar el modelo {self.model}, usando por defecto")
         
         logger.info(f"🤖 MitosisOllamaChatModel inicializado - Model: {self.model}, Host: {self.host}")
         logger.info(f"🧠 Modelo activo en OllamaService: {self.ollama_service.get_current_model()}")
+        
+        # Que el modelo esté cargado antes del primer paso de navegación
+        if hasattr(self.ollama_service, 'preload_model'):
+            self.ollama_service.preload_model(self.model)
 
     @property
     def provider(self) -> str:
@@ -72,31 +97,72 @@ class MitosisOllamaChatModel(BaseChatModel):
         Returns:
             str: Prompt unificado para Ollama
         """
-        prompt_parts = []
-        
-        for message in messages:
-            if isinstance(message, SystemMessage):
-                prompt_parts.append(f"SYSTEM: {message.content}")
-            elif isinstance(message, UserMessage):
-                # Manejar contenido que puede ser texto o lista de contenidos
-                if isinstance(message.content, str):
-                    prompt_parts.append(f"USER: {message.content}")
-                elif isinstance(message.content, list):
-                    # Extraer solo texto, ignorar imágenes por ahora
-                    text_content = []
-                    for content in message.content:
-                        if hasattr(content, 'text'):
-                            text_content.append(content.text)
-                        elif isinstance(content, str):
-                            text_content.append(content)
-                    prompt_parts.append(f"USER: {' '.join(text_content)}")
-            elif isinstance(message, AssistantMessage):
-                prompt_parts.append(f"ASSISTANT: {message.content}")
+        prompt_parts = [part for part in (self._flatten_message(message) for message in messages) if part is not None]
         
         # Agregar prompt final para respuesta del asistente
         prompt_parts.append("ASSISTANT:")
         
         return "\n\n".join(prompt_parts)
+    
+    def _flatten_message(self, message: BaseMessage) -> Optional[str]:
+        """Aplanar un mensaje a 'ROL: texto', con caché para los mensajes de texto"""
+        cache_key = None
+        if isinstance(message.content, str):
+            cache_key = (type(message).__name__, message.content)
+            cached = self._message_cache.get(cache_key)
+            if cached is not None:
+                return cached
+        
+        if isinstance(message, SystemMessage):
+            flattened = f"SYSTEM: {message.content}"
+        elif isinstance(message, UserMessage):
+            # Manejar contenido que puede ser texto o lista de contenidos
+            if isinstance(message.content, str):
+                flattened = f"USER: {message.content}"
+            elif isinstance(message.content, list):
+                # Extraer solo texto, ignorar imágenes por ahora
+                text_content = []
+                for content in message.content:
+                    if hasattr(content, 'text'):
+                        text_content.append(content.text)
+                    elif isinstance(content, str):
+                        text_content.append(content)
+                flattened = f"USER: {' '.join(text_content)}"
+            else:
+                return None
+        elif isinstance(message, AssistantMessage):
+            flattened = f"ASSISTANT: {message.content}"
+        else:
+            return None
+        
+        if cache_key is not None:
+            if len(self._message_cache) >= _MESSAGE_CACHE_SIZE:
+                self._message_cache.clear()
+            self._message_cache[cache_key] = flattened
+        return flattened
+    
+    def _reused_prefix(self, prompt: str) -> str:
+        """Prefijo común con el prompt del paso anterior (lo que Ollama no recalcula)"""
+        previous, self._last_prompt = self._last_prompt, prompt
+        return os.path.commonprefix([previous, prompt]) if previous else ""
+    
+    @staticmethod
+    def _build_usage(messages: List[BaseMessage], response_text: str, cached_prefix: str = ""):
+        """Uso estimado de tokens (por palabras) para browser-use"""
+        from browser_use.llm.views import ChatInvokeUsage
+        
+        prompt_text = "\n".join([msg.content if isinstance(msg.content, str) else str(msg.content) for msg in messages])
+        prompt_tokens = max(1, len(prompt_text.split()))
+        completion_tokens = max(1, len(response_text.split()))
+        
+        return ChatInvokeUsage(
+            prompt_tokens=prompt_tokens,
+            prompt_cached_tokens=len(cached_prefix.split()) or None,
+            prompt_cache_creation_tokens=None, 
+            prompt_image_tokens=None,
+            completion_tokens=completion_tokens,
+            total_tokens=prompt_tokens + completion_tokens
+        )
 
     async def ainvoke(
         self, 
@@ -112,30 +178,25 @@ class MitosisOllamaChatModel(BaseChatModel):
             
         Returns:
             ChatInvokeCompletion: Respuesta del modelo
+        
+        Si browser-use cancela el paso, asyncio.CancelledError se propaga
+        (no es Exception) y el request sale de la cola.
         """
         try:
             logger.info(f"🧠 Procesando {len(messages)} mensajes con {self.model}")
             
             # Convertir mensajes de browser-use a prompt para Ollama
             prompt = self._convert_browser_use_messages_to_prompt(messages)
+            cached_prefix = self._reused_prefix(prompt)
             
-            logger.debug(f"📝 Prompt generado: {prompt[:200]}...")
+            logger.debug(f"📝 Prompt generado: {prompt[:200]}... (prefijo reutilizado: {len(cached_prefix)}/{len(prompt)} caracteres)")
             
-            # Preparar opciones específicas para browser-use (más determinístico)
-            options = {
-                "temperature": 0.3,  # Más determinístico para navegación
-                "top_p": 0.8,
-                "max_tokens": 1500,  # Suficiente para respuestas de navegación
-                "stop": ["USER:", "SYSTEM:", "\n\nUSER:", "\n\nSYSTEM:"]
-            }
-            
-            # Llamar a OllamaService de manera asíncrona (sin pasar model, se usa internamente)
-            response_data = await asyncio.to_thread(
-                self.ollama_service.generate_response,
-                prompt=prompt,
-                context={},
-                use_tools=False,  # Para browser-use, no usar herramientas por ahora
-                task_id="browser-use",
+            # Ruta async hasta la cola compartida (sin thread bloqueado por paso)
+            response_data = await self.ollama_service.agenerate_raw(
+                prompt,
+                model=self.model,
+                options=BROWSER_USE_OPTIONS,
+                task_id=self.task_id,
                 step_id="llm-call"
             )
             
@@ -157,6 +218,8 @@ class MitosisOllamaChatModel(BaseChatModel):
             logger.info(f"✅ Respuesta generada: {len(response_text)} caracteres")
             logger.debug(f"📤 Respuesta: {response_text[:100]}...")
             
+            usage = self._build_usage(messages, response_text, cached_prefix)
+            
             # Si se requiere formato estructurado, intentar parsear
             if output_format:
                 try:
@@ -169,79 +232,11 @@ class MitosisOllamaChatModel(BaseChatModel):
                         json_str = response_text[json_start:json_end].strip()
                         parsed_data = json.loads(json_str)
                         
-                        # Crear usage para respuesta estructurada
-                        from browser_use.llm.views import ChatInvokeUsage
-                        prompt_text = "\n".join([msg.content if isinstance(msg.content, str) else str(msg.content) for msg in messages])
-                        prompt_tokens = max(1, len(prompt_text.split()))
-                        completion_tokens = max(1, len(response_text.split()))
-                        total_tokens = prompt_tokens + completion_tokens
-                        
-                        usage = ChatInvokeUsage(
-                            prompt_tokens=prompt_tokens,
-                            prompt_cached_tokens=None,
-                            prompt_cache_creation_tokens=None, 
-                            prompt_image_tokens=None,
-                            completion_tokens=completion_tokens,
-                            total_tokens=total_tokens
-                        )
-                        
                         return ChatInvokeCompletion(completion=output_format(**parsed_data), usage=usage)
-                    else:
-                        # Fallback: usar respuesta como string
-                        from browser_use.llm.views import ChatInvokeUsage
-                        prompt_text = "\n".join([msg.content if isinstance(msg.content, str) else str(msg.content) for msg in messages])
-                        prompt_tokens = max(1, len(prompt_text.split()))
-                        completion_tokens = max(1, len(response_text.split()))
-                        total_tokens = prompt_tokens + completion_tokens
-                        
-                        usage = ChatInvokeUsage(
-                            prompt_tokens=prompt_tokens,
-                            prompt_cached_tokens=None,
-                            prompt_cache_creation_tokens=None, 
-                            prompt_image_tokens=None,
-                            completion_tokens=completion_tokens,
-                            total_tokens=total_tokens
-                        )
-                        
-                        return ChatInvokeCompletion(completion=response_text, usage=usage)
                 except Exception as e:
                     logger.warning(f"⚠️ No se pudo parsear formato estructurado: {e}")
-                    # Fallback con usage
-                    from browser_use.llm.views import ChatInvokeUsage
-                    prompt_text = "\n".join([msg.content if isinstance(msg.content, str) else str(msg.content) for msg in messages])
-                    prompt_tokens = max(1, len(prompt_text.split()))
-                    completion_tokens = max(1, len(response_text.split()))
-                    total_tokens = prompt_tokens + completion_tokens
-                    
-                    usage = ChatInvokeUsage(
-                        prompt_tokens=prompt_tokens,
-                        prompt_cached_tokens=None,
-                        prompt_cache_creation_tokens=None, 
-                        prompt_image_tokens=None,
-                        completion_tokens=completion_tokens,
-                        total_tokens=total_tokens
-                    )
-                    
-                    return ChatInvokeCompletion(completion=response_text, usage=usage)
-            
-            # Crear objeto de usage con valores estimados
-            from browser_use.llm.views import ChatInvokeUsage
-            
-            # Estimar tokens basado en longitud de texto (aproximación)
-            prompt_text = "\n".join([msg.content if isinstance(msg.content, str) else str(msg.content) for msg in messages])
-            prompt_tokens = max(1, len(prompt_text.split()))
-            completion_tokens = max(1, len(response_text.split()))
-            total_tokens = prompt_tokens + completion_tokens
-            
-            usage = ChatInvokeUsage(
-                prompt_tokens=prompt_tokens,
-                prompt_cached_tokens=None,
-                prompt_cache_creation_tokens=None, 
-                prompt_image_tokens=None,
-                completion_tokens=completion_tokens,
-                total_tokens=total_tokens
-            )
             
+            # Sin formato estructurado (o no parseable): usar respuesta como string
             return ChatInvokeCompletion(completion=response_text, usage=usage)
             
         except Exception as e:
@@ -274,7 +269,8 @@ class MitosisOllamaChatModel(BaseChatModel):
     def create_from_mitosis_config(
         cls, 
         ollama_service: OllamaService, 
-        model: str = "llama3.1:8b"
+        model: str = "llama3.1:8b",
+        task_id: str = "browser-use"
     ) -> "MitosisOllamaChatModel":
         """
         Factory method para crear desde configuración existente de Mitosis
@@ -282,6 +278,7 @@ class MitosisOllamaChatModel(BaseChatModel):
         Args:
             ollama_service: Instancia existente de OllamaService
             model: Modelo a usar
+            task_id: Tarea a la que se atribuyen las llamadas en la cola
             
         Returns:
             MitosisOllamaChatModel: Instancia configurada
@@ -289,5 +286,6 @@ class MitosisOllamaChatModel(BaseChatModel):
         return cls(
             model=model,
             host=ollama_service.base_url,
-            ollama_service=ollama_service
+            ollama_service=ollama_service,
+            task_id=task_id
         )
\ No newline at end of file
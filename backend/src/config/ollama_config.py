@@ -5,7 +5,7 @@ Gestiona toda la configuración de Ollama desde un solo lugar
 import os
 import json
 import logging
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 from pathlib import Path
 
 logger = logging.getLogger(__name__)
@@ -38,7 +38,10 @@ class OllamaConfig:
             "default_model": os.getenv('OLLAMA_DEFAULT_MODEL', 'gpt-oss:20b'),
             "host": os.getenv('OLLAMA_HOST', '277e85fec6fd.ngrok-free.app'),
             "port": int(os.getenv('OLLAMA_PORT', '443')),
-            "timeout": int(os.getenv('OLLAMA_TIMEOUT', '180'))
+            "timeout": int(os.getenv('OLLAMA_TIMEOUT', '180')),
+            # Endpoints adicionales para balanceo (separados por comas)
+            "endpoints": [url.strip() for url in os.getenv('OLLAMA_ENDPOINTS', '').split(',') if url.strip()],
+            "max_concurrent_per_endpoint": int(os.getenv('OLLAMA_MAX_CONCURRENT_PER_ENDPOINT', '2'))
         }
         
         # 2. Configuración RUNTIME (se puede cambiar desde UI)
@@ -106,10 +109,36 @@ class OllamaConfig:
         """Timeout de requests"""
         return self._runtime_config.get('timeout', self._base_config['timeout'])
     
+    @property
+    def endpoints(self) -> List[str]:
+        """
+        Todos los endpoints de Ollama para balanceo de carga
+        
+        El endpoint principal va siempre primero; los adicionales vienen de
+        OLLAMA_ENDPOINTS o de la configuración runtime.
+        """
+        extra = self._runtime_config.get('endpoints', self._base_config['endpoints'])
+        urls = [self.endpoint] + [url for url in extra if url]
+        return list(dict.fromkeys(url.rstrip('/') for url in urls))
+    
+    @endpoints.setter
+    def endpoints(self, value: List[str]):
+        """Establecer endpoints adicionales"""
+        self._runtime_config['endpoints'] = list(value)
+        self._save_runtime_config()
+        logger.info(f"🔄 Ollama endpoints updated to: {value}")
+    
+    @property
+    def max_concurrent_per_endpoint(self) -> int:
+        """Requests simultáneos permitidos en cada endpoint"""
+        return self._runtime_config.get('max_concurrent_per_endpoint', self._base_config['max_concurrent_per_endpoint'])
+    
     def get_full_config(self) -> Dict[str, Any]:
         """Obtener configuración completa"""
         return {
             'endpoint': self.endpoint,
+            'endpoints': self.endpoints,
+            'max_concurrent_per_endpoint': self.max_concurrent_per_endpoint,
             'model': self.model,
             'host': self.host,
             'port': self.port,
@@ -153,6 +182,10 @@ def get_ollama_model() -> str:
     """Función de conveniencia para obtener modelo"""
     return get_ollama_config().model
 
+def get_ollama_endpoints() -> List[str]:
+    """Función de conveniencia para obtener todos los endpoints"""
+    return get_ollama_config().endpoints
+
 def set_ollama_endpoint(endpoint: str):
     """Función de conveniencia para establecer endpoint"""
     get_ollama_config().endpoint = endpoint
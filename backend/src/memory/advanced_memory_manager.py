@@ -8,6 +8,8 @@ import asyncio
 from typing import Dict, List, Any, Optional, Tuple
 from datetime import datetime, timedelta
 import logging
+import os
+import time
 import pandas as pd
 
 from .working_memory_store import WorkingMemoryStore
@@ -16,6 +18,7 @@ from .semantic_memory_store import SemanticMemoryStore, SemanticConcept, Semanti
 from .procedural_memory_store import ProceduralMemoryStore, Procedure, ToolStrategy
 from .semantic_indexer import SemanticIndexer
 from .embedding_service import EmbeddingService
+from .memory_persistence import MemoryPersistence
 from ..utils.task_context import get_current_task_context, log_with_context
 
 logger = logging.getLogger(__name__)
@@ -63,11 +66,47 @@ class AdvancedMemoryManager:
         
         self.semantic_indexer = SemanticIndexer(self.embedding_service)
         
+        # Persistencia de los almacenes (log de cambios SQLite compartido entre workers)
+        self.persistence: Optional[MemoryPersistence] = None
+        if os.getenv('MEMORY_PERSISTENCE', '1').lower() not in ('0', 'false', 'no'):
+            storage_path = self.config.get('memory_storage', os.getenv('MEMORY_STORAGE_PATH', 'memory_data'))
+            try:
+                self.persistence = MemoryPersistence(
+                    os.path.join(storage_path, 'memory.sqlite'),
+                    compact_every=int(os.getenv('MEMORY_COMPACT_EVERY', '5000'))
+                )
+            except Exception as e:
+                logger.error(f"Error abriendo persistencia de memoria en {storage_path}: {e}")
+        self.sync_interval = float(os.getenv('MEMORY_SYNC_INTERVAL', '1.0'))
+        self._last_sync = 0.0
+        self._sync_task: Optional[asyncio.Task] = None
+        self._memory_restored = False
+        
         self.is_initialized = False
         
     async def initialize(self):
         """Inicializa el gestor de memoria"""
         try:
+            # Restaurar los almacenes persistidos (una sola vez)
+            if self.persistence is not None and not self._memory_restored:
+                try:
+                    # Leer y deserializar en un hilo; reemplazar el contenido
+                    # de los almacenes, en el del bucle
+                    restored = await asyncio.to_thread(self.persistence.restore, {
+                        'working': self.working_memory,
+                        'episodic': self.episodic_memory,
+                        'semantic': self.semantic_memory,
+                        'procedural': self.procedural_memory
+                    })
+                    self.persistence.apply(restored)
+                    await asyncio.to_thread(self.persistence.maybe_compact)
+                    self._last_sync = time.monotonic()
+                except Exception as e:
+                    logger.error(f"Error restaurando memoria persistida, se continúa sin persistencia: {e}")
+                    self.persistence.close()
+                    self.persistence = None
+                self._memory_restored = True
+            
             # Inicializar servicios
             await self.embedding_service.initialize()
             await self.semantic_indexer.initialize()
@@ -79,6 +118,32 @@ class AdvancedMemoryManager:
             logger.error(f"Error inicializando AdvancedMemoryManager: {e}")
             raise
     
+    def _sync_memory(self):
+        """Lanza en segundo plano la sincronización con otros workers (como mucho cada sync_interval)"""
+        if self.persistence is None or time.monotonic() - self._last_sync < self.sync_interval:
+            return
+        if self._sync_task is not None and not self._sync_task.done():
+            return
+        self._last_sync = time.monotonic()
+        self._sync_task = asyncio.get_running_loop().create_task(self._sync_in_background())
+
+    async def _sync_in_background(self):
+        """
+        Aplica los cambios de otros workers y compacta el log
+
+        La lectura del log y la compactación van en un hilo; solo la
+        aplicación de los cambios leídos toca los almacenes, en el bucle
+        """
+        persistence = self.persistence
+        try:
+            pending = await asyncio.to_thread(persistence.poll)
+            persistence.apply(pending)
+            await asyncio.to_thread(persistence.maybe_compact)
+        except Exception as e:
+            logger.error(f"Error sincronizando memoria persistida: {e}")
+        finally:
+            self._last_sync = time.monotonic()
+    
     async def store_experience(self, experience: Dict[str, Any]):
         """
         Almacena una experiencia completa en múltiples tipos de memoria
@@ -89,6 +154,7 @@ class AdvancedMemoryManager:
         """
         if not self.is_initialized:
             await self.initialize()
+        self._sync_memory()
             
         try:
             # UPGRADE AI: Obtener contexto de tarea actual
@@ -176,6 +242,7 @@ class AdvancedMemoryManager:
         """
         if not self.is_initialized:
             await self.initialize()
+        self._sync_memory()
             
         try:
             # UPGRADE AI: Obtener task_id actual si no se proporciona
@@ -286,6 +353,7 @@ class AdvancedMemoryManager:
         """
         if not self.is_initialized:
             await self.initialize()
+        self._sync_memory()
             
         try:
             results = []
@@ -421,6 +489,7 @@ class AdvancedMemoryManager:
         """
         if not self.is_initialized:
             await self.initialize()
+        self._sync_memory()
             
         try:
             recommendations = []
@@ -519,6 +588,7 @@ class AdvancedMemoryManager:
         """
         if not self.is_initialized:
             await self.initialize()
+        self._sync_memory()
             
         try:
             # Actualizar efectividad de procedimientos utilizados
@@ -568,6 +638,7 @@ class AdvancedMemoryManager:
         """
         if not self.is_initialized:
             await self.initialize()
+        self._sync_memory()
             
         try:
             stats = {
@@ -581,7 +652,8 @@ class AdvancedMemoryManager:
                 'semantic_memory': self.semantic_memory.get_stats(),
                 'procedural_memory': self.procedural_memory.get_stats(),
                 'semantic_indexer': await self.semantic_indexer.get_document_stats(),
-                'embedding_service': await self.embedding_service.get_stats()
+                'embedding_service': await self.embedding_service.get_stats(),
+                'persistence': self.persistence.get_stats() if self.persistence is not None else None
             }
             
             return stats
@@ -683,47 +755,64 @@ class AdvancedMemoryManager:
         Args:
             experience: Experiencia a indexar
         """
+        await self.index_experiences([experience])
+    
+    async def index_experiences(self, experiences: List[Dict[str, Any]]):
+        """
+        Indexa varias experiencias con una sola pasada por el modelo de embeddings
+        
+        Args:
+            experiences: Experiencias a indexar
+        """
         try:
-            # Crear contenido indexable
-            task_context = experience.get('context', {})
-            execution_steps = experience.get('execution_steps', [])
-            outcomes = experience.get('outcomes', [])
-            
-            content_parts = []
-            
-            # Añadir contexto
-            content_parts.append(f"Tarea: {task_context.get('task_type', 'general')}")
-            if task_context.get('description'):
-                content_parts.append(f"Descripción: {task_context['description']}")
+            timestamp = datetime.now().timestamp()
+            documents = []
+            for position, experience in enumerate(experiences):
+                # Mismo instante para todo el lote: el sufijo evita colisiones de ID
+                doc_id = f"exp_{timestamp}" if position == 0 else f"exp_{timestamp}_{position}"
+                documents.append(self._experience_document(doc_id, experience))
+            await self.semantic_indexer.add_documents(documents)
             
-            # Añadir pasos de ejecución
-            for step in execution_steps:
-                if step.get('tool_name'):
-                    content_parts.append(f"Herramienta: {step['tool_name']}")
-                if step.get('description'):
-                    content_parts.append(f"Acción: {step['description']}")
-            
-            # Añadir resultados
-            for outcome in outcomes:
-                if outcome.get('description'):
-                    content_parts.append(f"Resultado: {outcome['description']}")
-            
-            content = " | ".join(content_parts)
-            
-            # Indexar
-            doc_id = f"exp_{datetime.now().timestamp()}"
-            metadata = {
+        except Exception as e:
+            logger.error(f"Error indexando experiencia: {e}")
+    
+    def _experience_document(self, doc_id: str, experience: Dict[str, Any]) -> Dict[str, Any]:
+        """Documento indexable ({'doc_id', 'content', 'metadata'}) de una experiencia"""
+        # Crear contenido indexable
+        task_context = experience.get('context', {})
+        execution_steps = experience.get('execution_steps', [])
+        outcomes = experience.get('outcomes', [])
+        
+        content_parts = []
+        
+        # Añadir contexto
+        content_parts.append(f"Tarea: {task_context.get('task_type', 'general')}")
+        if task_context.get('description'):
+            content_parts.append(f"Descripción: {task_context['description']}")
+        
+        # Añadir pasos de ejecución
+        for step in execution_steps:
+            if step.get('tool_name'):
+                content_parts.append(f"Herramienta: {step['tool_name']}")
+            if step.get('description'):
+                content_parts.append(f"Acción: {step['description']}")
+        
+        # Añadir resultados
+        for outcome in outcomes:
+            if outcome.get('description'):
+                content_parts.append(f"Resultado: {outcome['description']}")
+        
+        return {
+            'doc_id': doc_id,
+            'content': " | ".join(content_parts),
+            'metadata': {
                 'type': 'experience',
                 'success': experience.get('success', False),
                 'execution_time': experience.get('execution_time', 0),
                 'task_type': task_context.get('task_type', 'general'),
                 'category': 'agent_experience'
             }
-            
-            await self.semantic_indexer.add_document(doc_id, content, metadata)
-            
-        except Exception as e:
-            logger.error(f"Error indexando experiencia: {e}")
+        }
     
     async def index_episode(self, episode):
         """
@@ -732,43 +821,69 @@ class AdvancedMemoryManager:
         Args:
             episode: Episodio a indexar
         """
+        await self.index_episodes([episode])
+    
+    async def index_episodes(self, episodes: List[Any]):
+        """
+        Indexa varios episodios en lote
+        
+        Los embeddings se calculan en una sola llamada al modelo; los
+        episodios ya indexados con el mismo contenido no se recodifican.
+        
+        Args:
+            episodes: Episodios a indexar
+        """
+        documents = []
+        for episode in episodes:
+            try:
+                documents.append(self._episode_document(episode))
+            except Exception as e:
+                logger.error(f"Error indexando episodio {getattr(episode, 'id', '?')}: {e}")
+        
         try:
-            # Crear contenido indexable del episodio
-            content_parts = []
-            
-            # Añadir título y descripción
-            content_parts.append(f"Título: {episode.title}")
-            content_parts.append(f"Descripción: {episode.description}")
+            await self.semantic_indexer.add_documents(documents)
+            logger.debug(f"{len(documents)} episodios indexados semánticamente")
             
-            # Añadir contexto si existe
-            if episode.context:
-                user_message = episode.context.get('user_message', '')
-                agent_response = episode.context.get('agent_response', '')
-                
-                if user_message:
-                    content_parts.append(f"Usuario: {user_message}")
-                if agent_response:
-                    content_parts.append(f"Agente: {agent_response}")
-            
-            # Añadir acciones
-            for action in episode.actions:
-                if action.get('content'):
-                    content_parts.append(f"Acción: {action['content']}")
-            
-            # Añadir resultados
-            for outcome in episode.outcomes:
-                if outcome.get('content'):
-                    content_parts.append(f"Resultado: {outcome['content']}")
-            
-            # Añadir tags
-            if episode.tags:
-                content_parts.append(f"Tags: {', '.join(episode.tags)}")
-            
-            content = " | ".join(content_parts)
-            
-            # Indexar episodio
-            doc_id = f"episode_{episode.id}"
-            metadata = {
+        except Exception as e:
+            logger.error(f"Error indexando episodios: {e}")
+    
+    def _episode_document(self, episode) -> Dict[str, Any]:
+        """Documento indexable ({'doc_id', 'content', 'metadata'}) de un episodio"""
+        # Crear contenido indexable del episodio
+        content_parts = []
+        
+        # Añadir título y descripción
+        content_parts.append(f"Título: {episode.title}")
+        content_parts.append(f"Descripción: {episode.description}")
+        
+        # Añadir contexto si existe
+        if episode.context:
+            user_message = episode.context.get('user_message', '')
+            agent_response = episode.context.get('agent_response', '')
+            
+            if user_message:
+                content_parts.append(f"Usuario: {user_message}")
+            if agent_response:
+                content_parts.append(f"Agente: {agent_response}")
+        
+        # Añadir acciones
+        for action in episode.actions:
+            if action.get('content'):
+                content_parts.append(f"Acción: {action['content']}")
+        
+        # Añadir resultados
+        for outcome in episode.outcomes:
+            if outcome.get('content'):
+                content_parts.append(f"Resultado: {outcome['content']}")
+        
+        # Añadir tags
+        if episode.tags:
+            content_parts.append(f"Tags: {', '.join(episode.tags)}")
+        
+        return {
+            'doc_id': f"episode_{episode.id}",
+            'content': " | ".join(content_parts),
+            'metadata': {
                 'type': 'episode',
                 'episode_id': episode.id,
                 'success': episode.success,
@@ -777,12 +892,7 @@ class AdvancedMemoryManager:
                 'category': 'conversation_episode',
                 'tags': episode.tags
             }
-            
-            await self.semantic_indexer.add_document(doc_id, content, metadata)
-            logger.debug(f"Episodio {episode.id} indexado semánticamente")
-            
-        except Exception as e:
-            logger.error(f"Error indexando episodio {episode.id}: {e}")
+        }
     
     async def _synthesize_context(self, context: Dict[str, Any]) -> str:
         """
@@ -1247,6 +1357,7 @@ class AdvancedMemoryManager:
             
             # 1. Comprimir episodios antiguos
             all_episodes = [ep for ep in self.episodic_memory.episodes.values() if ep.timestamp < threshold_date]
+            compressed_episodes = []
             for episode in all_episodes:
                 if episode.importance < 4:  # Solo comprimir episodios de baja importancia
                     # Comprimir descripción y contexto
@@ -1270,11 +1381,21 @@ class AdvancedMemoryManager:
                         episode.actions = episode.actions[:3]
                     if len(episode.outcomes) > 3:
                         episode.outcomes = episode.outcomes[:3]
+                    self.episodic_memory.reindex_episode(episode.id)
+                    compressed_episodes.append(episode)
                     
                     compressed_size = len(str(episode.description)) + len(str(episode.context))
                     compression_stats['space_saved'] += (original_size - compressed_size)
                     compression_stats['compressed_episodes'] += 1
             
+            # Los que ya estaban en el índice semántico se recodifican en un solo lote
+            indexed_episodes = [
+                episode for episode in compressed_episodes
+                if f"episode_{episode.id}" in self.embedding_service.index
+            ]
+            if indexed_episodes:
+                await self.index_episodes(indexed_episodes)
+            
             # 2. Comprimir conceptos semánticos antiguos
             all_concepts = [concept for concept in self.semantic_memory.concepts.values() 
                           if hasattr(concept, 'created_at') and concept.created_at < threshold_date]
@@ -1287,6 +1408,7 @@ class AdvancedMemoryManager:
                     # Mantener solo atributos esenciales
                     essential_attrs = ['type', 'category', 'importance']
                     concept.attributes = {k: v for k, v in concept.attributes.items() if k in essential_attrs}
+                    self.semantic_memory.store_concept(concept)
                     
                     compressed_size = len(str(concept.description)) + len(str(concept.attributes))
                     compression_stats['space_saved'] += (original_size - compressed_size)
@@ -1305,6 +1427,7 @@ class AdvancedMemoryManager:
                         'original_confidence': fact.confidence,
                         'compressed_at': datetime.now().isoformat()
                     }
+                    self.semantic_memory.store_fact(fact)
                     
                     compressed_size = len(str(fact.context))
                     compression_stats['space_saved'] += (original_size - compressed_size)
@@ -1320,6 +1443,7 @@ class AdvancedMemoryManager:
                     
                     if len(procedure.steps) > 5:
                         procedure.steps = procedure.steps[:5]  # Mantener solo primeros 5 pasos
+                        self.procedural_memory.store_procedure(procedure)
                     
                     compressed_size = len(str(procedure.steps))
                     compression_stats['space_saved'] += (original_size - compressed_size)
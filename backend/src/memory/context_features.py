@@ -0,0 +1,196 @@
+"""
+Matriz de características de contextos
+Cada contexto (dict) se convierte una sola vez, al almacenarlo, en una fila
+de características: una columna por clave y una cubeta de hash por par
+clave=valor. La similitud de una consulta contra todos los contextos se
+obtiene con un único producto matriz-vector en lugar de comparar
+diccionarios uno a uno
+"""
+
+import zlib
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_VALUE_FEATURES = 192
+DEFAULT_KEY_FEATURES = 64
+
+# Holgura para comparar puntuaciones float32 con las exactas
+SCORE_EPSILON = 1e-5
+
+
+class ContextFeatureMatrix:
+    """
+    Filas de características de contextos en una matriz NumPy preasignada
+
+    Reproduce la similitud de EpisodicMemoryStore._calculate_context_similarity:
+    media del Jaccard de las claves y de la fracción de claves comunes con el
+    mismo valor (comparado como str().lower()). El producto da, por fila, el
+    número de claves comunes (exacto: cada clave distinta tiene su columna) y
+    una cota superior de los valores coincidentes (los pares clave=valor se
+    hashean y las colisiones solo suman), así que la puntuación vectorizada
+    nunca queda por debajo de la exacta y sirve para podar candidatos.
+    Las filas liberadas se reutilizan; la matriz dobla sus filas al llenarse
+    y sus columnas de claves cuando aparecen más claves distintas.
+    """
+
+    def __init__(self, value_features: int = DEFAULT_VALUE_FEATURES,
+                 key_features: int = DEFAULT_KEY_FEATURES, initial_rows: int = 1024):
+        """
+        Inicializa la matriz
+
+        Args:
+            value_features: Cubetas de hash para los pares clave=valor
+            key_features: Columnas de claves preasignadas
+            initial_rows: Filas preasignadas
+        """
+        self.value_features = value_features
+        self._matrix = np.zeros((max(1, initial_rows), value_features + key_features), dtype=np.float32)
+        self._key_counts = np.zeros(len(self._matrix), dtype=np.float32)
+        self._key_columns: Dict[str, int] = {}
+        self._row_ids: List[Optional[str]] = []
+        self._rows: Dict[str, int] = {}
+        self._free_rows: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, item_id: str) -> bool:
+        return item_id in self._rows
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Al serializar solo viajan las celdas a 1 de las filas usadas (la
+        # matriz es casi toda ceros); la capacidad se recupera al crecer
+        state = self.__dict__.copy()
+        used = max(1, len(self._row_ids))
+        rows, columns = np.nonzero(self._matrix[:used])
+        state['_matrix'] = ((used, self._matrix.shape[1]), rows.astype(np.int32), columns.astype(np.int32))
+        state['_key_counts'] = self._key_counts[:used].copy()
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        shape, rows, columns = state['_matrix']
+        matrix = np.zeros(shape, dtype=np.float32)
+        matrix[rows, columns] = 1.0
+        self.__dict__.update(state)
+        self._matrix = matrix
+
+    def _value_bucket(self, key: str, value: Any) -> int:
+        pair = f"{key}\0{str(value).lower()}".encode('utf-8', 'surrogatepass')
+        return zlib.crc32(pair) % self.value_features
+
+    def _key_column(self, key: str) -> int:
+        column = self._key_columns.get(key)
+        if column is None:
+            column = self.value_features + len(self._key_columns)
+            if column == self._matrix.shape[1]:
+                self._resize(len(self._matrix), self._matrix.shape[1] + len(self._key_columns))
+            self._key_columns[key] = column
+        return column
+
+    def _resize(self, rows: int, columns: int) -> None:
+        matrix = np.zeros((rows, columns), dtype=np.float32)
+        matrix[:self._matrix.shape[0], :self._matrix.shape[1]] = self._matrix
+        key_counts = np.zeros(rows, dtype=np.float32)
+        key_counts[:len(self._key_counts)] = self._key_counts
+        self._matrix, self._key_counts = matrix, key_counts
+
+    def add(self, item_id: str, context: Optional[Dict[str, Any]]) -> None:
+        """Añade (o reemplaza) la fila de un contexto"""
+        self.remove(item_id)
+        if self._free_rows:
+            row = self._free_rows.pop()
+            self._row_ids[row] = item_id
+        else:
+            row = len(self._row_ids)
+            if row == len(self._matrix):
+                self._resize(row * 2, self._matrix.shape[1])
+            self._row_ids.append(item_id)
+        self._rows[item_id] = row
+
+        if isinstance(context, dict) and context:
+            for key, value in context.items():
+                key = str(key)
+                self._matrix[row, self._key_column(key)] = 1.0
+                self._matrix[row, self._value_bucket(key, value)] = 1.0
+            self._key_counts[row] = len(context)
+
+    def remove(self, item_id: str) -> None:
+        row = self._rows.pop(item_id, None)
+        if row is None:
+            return
+        self._matrix[row] = 0.0
+        self._key_counts[row] = 0.0
+        self._row_ids[row] = None
+        self._free_rows.append(row)
+
+    def clear(self) -> None:
+        self._matrix[:len(self._row_ids)] = 0.0
+        self._key_counts[:] = 0.0
+        self._row_ids.clear()
+        self._rows.clear()
+        self._free_rows.clear()
+
+    def scores(self, context: Dict[str, Any]) -> np.ndarray:
+        """
+        Cota superior de la similitud de un contexto con cada fila
+
+        Returns:
+            Vector con una puntuación (0-1) por fila; las filas libres valen 0
+        """
+        used = len(self._row_ids)
+        if not context or not used:
+            return np.zeros(used, dtype=np.float32)
+
+        # Un solo vector: las claves pesan 1 y los pares clave=valor `weight`,
+        # mayor que cualquier número de claves comunes, así que el producto
+        # codifica ambos conteos como enteros exactos en float32
+        weight = len(context) + 1
+        query = np.zeros(self._matrix.shape[1], dtype=np.float32)
+        for key, value in context.items():
+            key = str(key)
+            column = self._key_columns.get(key)
+            if column is not None:
+                query[column] = 1.0
+            # Pares de la consulta en la misma cubeta: cuentan todos
+            query[self._value_bucket(key, value)] += weight
+        # (cota de valores coincidentes, claves comunes)
+        matches, common = np.divmod(self._matrix[:used] @ query, weight)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            union = len(context) + self._key_counts[:used] - common
+            key_similarity = np.where(common > 0, common / np.maximum(union, 1.0), 0.0)
+            value_similarity = np.where(common > 0, np.minimum(matches, common) / common, 0.0)
+        return (key_similarity + value_similarity) / 2
+
+    def candidates(self, context: Dict[str, Any], threshold: float = 0.0,
+                   batch: int = 32) -> Iterator[Tuple[str, float]]:
+        """
+        Filas con cota superior > `threshold`, de mayor a menor cota
+
+        Se ordenan por tandas (argpartition de tamaño creciente), así que quien
+        deja de consumir tras los primeros resultados no paga el orden completo.
+
+        Yields:
+            (item_id, cota superior de la similitud)
+        """
+        scores = self.scores(context)
+        rows = np.flatnonzero(scores > threshold - SCORE_EPSILON)
+        while len(rows):
+            if len(rows) > batch:
+                split = np.argpartition(-scores[rows], batch)
+                head, rows = rows[split[:batch]], rows[split[batch:]]
+            else:
+                head, rows = rows, rows[:0]
+            for row in head[np.argsort(-scores[head], kind='stable')]:
+                yield self._row_ids[row], float(scores[row])
+            batch *= 4
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            'rows': len(self._rows),
+            'capacity': len(self._matrix),
+            'features': self._matrix.shape[1],
+            'keys': len(self._key_columns),
+            'free_rows': len(self._free_rows)
+        }
@@ -0,0 +1,156 @@
+"""
+Almacén de documentos del índice semántico en SQLite
+Sustituye al pickle único de document_map: cada documento es una fila
+indexada por doc_id, así que arrancar no exige deserializar todo el mapa y
+una búsqueda solo lee las filas de sus resultados
+"""
+
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_SQL_CHUNK = 500
+
+
+class DocumentStore:
+    """
+    Mapa doc_id -> {'content', 'metadata', 'created_at'} persistente
+
+    Expone la parte de la interfaz de dict que usa EmbeddingService (get,
+    in, len, asignación, pop, clear, items); cada escritura se confirma en
+    su propia transacción.
+    """
+
+    def __init__(self, path: str):
+        """
+        Inicializa el almacén
+
+        Args:
+            path: Fichero SQLite (':memory:' para uno volátil)
+        """
+        self.path = path
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            if path != ':memory:':
+                self._db.execute('PRAGMA journal_mode=WAL')
+                self._db.execute('PRAGMA synchronous=NORMAL')
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS documents ('
+                'doc_id TEXT PRIMARY KEY, content TEXT NOT NULL, metadata BLOB, created_at TEXT)'
+            )
+            self._db.commit()
+            self._count = self._db.execute('SELECT COUNT(*) FROM documents').fetchone()[0]
+
+    @staticmethod
+    def _row_to_document(row) -> Dict[str, Any]:
+        content, metadata, created_at = row
+        return {
+            'content': content,
+            'metadata': pickle.loads(metadata) if metadata else {},
+            'created_at': created_at
+        }
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __bool__(self) -> bool:
+        return self._count > 0
+
+    def __contains__(self, doc_id: str) -> bool:
+        with self._lock:
+            return self._db.execute('SELECT 1 FROM documents WHERE doc_id = ?', (doc_id,)).fetchone() is not None
+
+    def get(self, doc_id: str, default: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute(
+                'SELECT content, metadata, created_at FROM documents WHERE doc_id = ?', (doc_id,)
+            ).fetchone()
+        return self._row_to_document(row) if row else default
+
+    def get_many(self, doc_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Documentos existentes entre `doc_ids`, en una consulta por cada 500"""
+        doc_ids = list(doc_ids)
+        found = {}
+        with self._lock:
+            for start in range(0, len(doc_ids), _SQL_CHUNK):
+                chunk = doc_ids[start:start + _SQL_CHUNK]
+                rows = self._db.execute(
+                    'SELECT doc_id, content, metadata, created_at FROM documents '
+                    f"WHERE doc_id IN ({','.join('?' * len(chunk))})",
+                    chunk
+                ).fetchall()
+                for row in rows:
+                    found[row[0]] = self._row_to_document(row[1:])
+        return found
+
+    def __setitem__(self, doc_id: str, document: Dict[str, Any]) -> None:
+        self.put_many({doc_id: document})
+
+    def put_many(self, documents: Dict[str, Dict[str, Any]]) -> None:
+        """Inserta o reemplaza varios documentos en una transacción"""
+        if not documents:
+            return
+        rows = [
+            (doc_id, document['content'],
+             pickle.dumps(document.get('metadata') or {}, protocol=pickle.HIGHEST_PROTOCOL),
+             document.get('created_at'))
+            for doc_id, document in documents.items()
+        ]
+        doc_ids = list(documents)
+        with self._lock:
+            existing = 0
+            for start in range(0, len(doc_ids), _SQL_CHUNK):
+                chunk = doc_ids[start:start + _SQL_CHUNK]
+                existing += self._db.execute(
+                    f"SELECT COUNT(*) FROM documents WHERE doc_id IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchone()[0]
+            with self._db:
+                self._db.executemany('INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?)', rows)
+            self._count += len(rows) - existing
+
+    def pop(self, doc_id: str, default: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        document = self.get(doc_id)
+        if document is None:
+            return default
+        with self._lock:
+            with self._db:
+                deleted = self._db.execute('DELETE FROM documents WHERE doc_id = ?', (doc_id,)).rowcount
+            self._count -= deleted
+        return document
+
+    def __delitem__(self, doc_id: str) -> None:
+        if self.pop(doc_id) is None:
+            raise KeyError(doc_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            with self._db:
+                self._db.execute('DELETE FROM documents')
+            self._count = 0
+
+    def items(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Recorre todos los documentos por páginas (sin cargarlos a la vez en memoria)"""
+        last = None
+        while True:
+            with self._lock:
+                rows = self._db.execute(
+                    'SELECT doc_id, content, metadata, created_at FROM documents '
+                    'WHERE ? IS NULL OR doc_id > ? ORDER BY doc_id LIMIT ?', (last, last, _SQL_CHUNK)
+                ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield row[0], self._row_to_document(row[1:])
+            last = rows[-1][0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,176 @@
+"""
+Caché de embeddings por contenido
+LRU en memoria respaldado por una tabla SQLite en disco. La clave es el hash
+SHA-256 del modelo y el texto, así que reindexar el mismo texto o repetir
+una consulta no vuelve a pasar por el modelo, ni siquiera tras reiniciar
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_SQL_CHUNK = 500
+
+
+def content_hash(text: str, model_name: str = '') -> str:
+    """Hash estable de un texto para un modelo concreto"""
+    digest = hashlib.sha256()
+    digest.update(model_name.encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(text.encode('utf-8'))
+    return digest.hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Caché texto -> embedding en dos niveles
+
+    El nivel en memoria es un LRU acotado a `max_entries`; el de disco
+    (opcional) guarda hasta `max_disk_entries` vectores y, al superarlos,
+    descarta los más antiguos por orden de inserción.
+    """
+
+    def __init__(self, max_entries: int = 10000, disk_path: Optional[str] = None,
+                 max_disk_entries: int = 200000):
+        """
+        Inicializa la caché
+
+        Args:
+            max_entries: Vectores en el LRU de memoria (0 lo desactiva)
+            disk_path: Fichero SQLite del nivel de disco (None = solo memoria)
+            max_disk_entries: Vectores máximos en disco
+        """
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self._memory: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._disk_count = 0  # Cota superior: los reemplazos también suman
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if disk_path:
+            try:
+                os.makedirs(os.path.dirname(disk_path) or '.', exist_ok=True)
+                self._db = sqlite3.connect(disk_path, check_same_thread=False)
+                self._db.execute('PRAGMA journal_mode=WAL')
+                self._db.execute(
+                    'CREATE TABLE IF NOT EXISTS embeddings (hash TEXT PRIMARY KEY, vector BLOB NOT NULL)'
+                )
+                self._db.commit()
+                self._disk_count = self._db.execute('SELECT COUNT(*) FROM embeddings').fetchone()[0]
+            except sqlite3.Error as e:
+                logger.warning(f"Caché de embeddings en disco no disponible ({disk_path}): {e}")
+                self._db = None
+
+    def __len__(self) -> int:
+        return len(self._memory)
+
+    def _remember(self, key: str, vector: np.ndarray) -> None:
+        if self.max_entries <= 0:
+            return
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, np.ndarray]:
+        """
+        Busca varios hashes, primero en memoria y después en disco
+
+        Returns:
+            Diccionario hash -> vector con los encontrados
+        """
+        found: Dict[str, np.ndarray] = {}
+        missing: List[str] = []
+        with self._lock:
+            for key in keys:
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = vector
+                else:
+                    missing.append(key)
+
+            if missing and self._db is not None:
+                try:
+                    for start in range(0, len(missing), _SQL_CHUNK):
+                        chunk = missing[start:start + _SQL_CHUNK]
+                        rows = self._db.execute(
+                            f"SELECT hash, vector FROM embeddings WHERE hash IN ({','.join('?' * len(chunk))})",
+                            chunk
+                        ).fetchall()
+                        for key, blob in rows:
+                            vector = np.frombuffer(blob, dtype=np.float32)
+                            found[key] = vector
+                            self._remember(key, vector)
+                            self.disk_hits += 1
+                except sqlite3.Error as e:
+                    logger.warning(f"Error leyendo la caché de embeddings: {e}")
+
+            self.hits += len(found)
+            self.misses += sum(1 for key in missing if key not in found)
+        return found
+
+    def put_many(self, items: Dict[str, np.ndarray]) -> None:
+        """Guarda vectores en memoria y en disco"""
+        if not items:
+            return
+        with self._lock:
+            vectors = {key: np.asarray(vector, dtype=np.float32) for key, vector in items.items()}
+            for key, vector in vectors.items():
+                self._remember(key, vector)
+            if self._db is None:
+                return
+            try:
+                self._db.executemany(
+                    'INSERT OR REPLACE INTO embeddings (hash, vector) VALUES (?, ?)',
+                    [(key, vector.tobytes()) for key, vector in vectors.items()]
+                )
+                self._disk_count += len(vectors)
+                if self._disk_count > self.max_disk_entries * 1.1:
+                    self._trim_disk()
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Error escribiendo la caché de embeddings: {e}")
+
+    def _trim_disk(self) -> None:
+        """Descartar los vectores más antiguos (con holgura del 10% para no borrar en cada inserción)"""
+        count = self._db.execute('SELECT COUNT(*) FROM embeddings').fetchone()[0]
+        if count > self.max_disk_entries:
+            self._db.execute(
+                'DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY rowid LIMIT ?)',
+                (count - self.max_disk_entries,)
+            )
+            count = self.max_disk_entries
+        self._disk_count = count
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute('DELETE FROM embeddings')
+                self._db.commit()
+                self._disk_count = 0
+
+    def get_stats(self) -> Dict[str, object]:
+        """Aciertos, fallos y tamaño de cada nivel"""
+        lookups = self.hits + self.misses
+        return {
+            'memory_entries': len(self._memory),
+            'max_entries': self.max_entries,
+            'disk_enabled': self._db is not None,
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else None
+        }
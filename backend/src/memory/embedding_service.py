@@ -10,52 +10,159 @@ from sentence_transformers import SentenceTransformer
 import faiss
 import pickle
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import logging
 
+from .document_store import DocumentStore
+from .embedding_cache import EmbeddingCache, content_hash
+from .index_persistence import OP_ADD, OP_CLEAR, OP_REMOVE, IndexJournal, SnapshotStore
+from .vector_index import FAISS_FILE, VectorIndex
+
 logger = logging.getLogger(__name__)
 
+DOCUMENT_MAP_FILE = 'document_map.pkl'  # Formato anterior, se migra a DOCUMENTS_DB_FILE
+DOCUMENTS_DB_FILE = 'documents.sqlite'
+
+
 class EmbeddingService:
-    """Servicio para generar embeddings y realizar búsqueda semántica"""
+    """
+    Servicio para generar embeddings y realizar búsqueda semántica
+
+    La persistencia es write-behind: cada alta o baja se añade al diario
+    (O(1) por documento) y el estado completo se vuelca en un snapshot en
+    segundo plano cada `snapshot_every` operaciones o `snapshot_interval`
+    segundos. Al inicializar se carga el último snapshot y se reproduce el
+    diario posterior.
+
+    El arranque no bloquea: la matriz de vectores se abre con mmap, los
+    documentos viven en SQLite (se leen solo los resultados de cada
+    búsqueda) y el modelo se carga en segundo plano; las peticiones que
+    necesitan codificar algo esperan en cola a que esté listo.
+    """
     
-    def __init__(self, model_name: str = "all-MiniLM-L6-v2", storage_path: str = "embeddings"):
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2", storage_path: str = "embeddings",
+                 index_mode: Optional[str] = None):
         """
         Inicializa el servicio de embeddings
         
         Args:
             model_name: Nombre del modelo SentenceTransformer
             storage_path: Ruta para almacenar índices
+            index_mode: auto, flat, ivf o hnsw (por defecto EMBEDDING_INDEX_MODE o auto)
+
+        EMBEDDING_SNAPSHOT_EVERY y EMBEDDING_SNAPSHOT_INTERVAL fijan cada cuántas
+        operaciones o segundos se toma un snapshot; EMBEDDING_JOURNAL_FSYNC=1 hace
+        fsync de cada registro del diario. EMBEDDING_BATCH_SIZE es el lote de
+        codificación y EMBEDDING_CACHE_SIZE / EMBEDDING_DISK_CACHE configuran la
+        caché de embeddings por contenido. EMBEDDING_MMAP=0 carga la matriz de
+        vectores entera en memoria en lugar de mapearla.
         """
         self.model_name = model_name
         self.storage_path = storage_path
         self.model = None
-        self.index = None
-        self.document_map = {}  # Mapeo de ID a documento
+        self.index_options = {
+            'mode': index_mode or os.getenv('EMBEDDING_INDEX_MODE', 'auto'),
+            'ann_threshold': int(os.getenv('EMBEDDING_ANN_THRESHOLD', '50000'))
+        }
+        self.index = VectorIndex(**self.index_options)
+        self.mmap_vectors = os.getenv('EMBEDDING_MMAP', '1').lower() not in ('0', 'false', 'no')
         self.is_initialized = False
+        self.batch_size = int(os.getenv('EMBEDDING_BATCH_SIZE', '64'))
         
         # Crear directorio de almacenamiento
         os.makedirs(storage_path, exist_ok=True)
         
+        # Mapeo de ID a documento, en SQLite indexado por doc_id
+        self.document_map = DocumentStore(os.path.join(storage_path, DOCUMENTS_DB_FILE))
+        
+        # Carga del modelo en segundo plano
+        self._model_future = None
+        self._model_lock = threading.Lock()
+        self._model_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='embedding_model')
+        self._queued_requests = 0
+        
+        # Caché texto -> embedding (LRU en memoria + SQLite en disco)
+        disk_cache = os.getenv('EMBEDDING_DISK_CACHE', '1').lower() not in ('0', 'false', 'no')
+        self.embedding_cache = EmbeddingCache(
+            max_entries=int(os.getenv('EMBEDDING_CACHE_SIZE', '10000')),
+            disk_path=os.path.join(storage_path, 'embedding_cache.sqlite') if disk_cache else None
+        )
+
+        # Persistencia: diario append-only + snapshots atómicos
+        self.snapshot_every = int(os.getenv('EMBEDDING_SNAPSHOT_EVERY', '2000'))
+        self.snapshot_interval = float(os.getenv('EMBEDDING_SNAPSHOT_INTERVAL', '300'))
+        self.journal = IndexJournal(
+            storage_path, fsync=os.getenv('EMBEDDING_JOURNAL_FSYNC', '').lower() in ('1', 'true', 'yes')
+        )
+        self.snapshots = SnapshotStore(storage_path)
+        self._unsnapshotted_ops = 0
+        self._last_snapshot = time.monotonic()
+        self._snapshot_sequence = 0
+        self._snapshot_future = None
+        self._snapshot_lock = threading.Lock()
+        # Un solo hilo: los snapshots se publican en el orden en que se capturan
+        self._snapshot_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='embedding_snapshot')
+        
     async def initialize(self):
-        """Inicializa el modelo de embeddings"""
+        """
+        Inicializa el servicio sin esperar al modelo
+        
+        El modelo empieza a cargarse en segundo plano y el índice se abre con
+        mmap, así que las búsquedas cuyo embedding ya está en caché responden
+        de inmediato; las demás esperan en cola a que termine la carga.
+        """
+        if self.is_initialized:
+            return
         try:
-            # Cargar modelo en thread pool para evitar bloqueo
-            loop = asyncio.get_event_loop()
-            self.model = await loop.run_in_executor(
-                None, 
-                lambda: SentenceTransformer(self.model_name)
-            )
+            self._start_model_loading()
             
             # Cargar índice existente si existe
             await self._load_index()
             
             self.is_initialized = True
-            logger.info(f"EmbeddingService inicializado con modelo {self.model_name}")
+            logger.info(f"EmbeddingService inicializado (modelo {self.model_name} cargando en segundo plano)")
             
         except Exception as e:
             logger.error(f"Error inicializando EmbeddingService: {e}")
             raise
     
+    def _start_model_loading(self):
+        """Lanza la carga del modelo si no está cargado ni cargándose"""
+        with self._model_lock:
+            if self.model is not None or self._model_future is not None:
+                return
+            started = time.monotonic()
+            
+            def load():
+                model = SentenceTransformer(self.model_name)
+                logger.info(f"Modelo de embeddings {self.model_name} cargado en {time.monotonic() - started:.1f}s")
+                return model
+            
+            self._model_future = self._model_executor.submit(load)
+    
+    async def _get_model(self):
+        """Modelo listo para codificar; si aún se está cargando, la petición espera en cola"""
+        if self.model is not None:
+            return self.model
+        self._start_model_loading()
+        future = self._model_future
+        self._queued_requests += 1
+        try:
+            self.model = await asyncio.wrap_future(future)
+            return self.model
+        except Exception as e:
+            logger.error(f"Error cargando el modelo de embeddings {self.model_name}: {e}")
+            with self._model_lock:
+                # Permitir reintentar en la próxima petición
+                if self._model_future is future:
+                    self._model_future = None
+            raise
+        finally:
+            self._queued_requests -= 1
+    
     async def embed_text(self, text: str) -> np.ndarray:
         """
         Genera embedding para un texto
@@ -66,44 +173,51 @@ class EmbeddingService:
         Returns:
             Array numpy con el embedding
         """
-        if not self.is_initialized:
-            await self.initialize()
-            
-        try:
-            # Generar embedding en thread pool
-            loop = asyncio.get_event_loop()
-            embedding = await loop.run_in_executor(
-                None,
-                lambda: self.model.encode([text])
-            )
-            
-            return embedding[0]
-            
-        except Exception as e:
-            logger.error(f"Error generando embedding: {e}")
-            raise
+        embeddings = await self.embed_batch([text])
+        return embeddings[0]
     
-    async def embed_batch(self, texts: List[str]) -> List[np.ndarray]:
+    async def embed_batch(self, texts: List[str]) -> np.ndarray:
         """
         Genera embeddings para múltiples textos
         
+        Los textos repetidos se codifican una sola vez y los ya vistos salen
+        de la caché; el resto pasa por el modelo en lotes de `batch_size`.
+        
         Args:
             texts: Lista de textos
             
         Returns:
-            Lista de embeddings
+            Matriz (len(texts), d) de embeddings, en el orden de entrada
         """
         if not self.is_initialized:
             await self.initialize()
             
         try:
-            loop = asyncio.get_event_loop()
-            embeddings = await loop.run_in_executor(
-                None,
-                lambda: self.model.encode(texts)
-            )
+            keys = [content_hash(text, self.model_name) for text in texts]
+            vectors = self.embedding_cache.get_many(set(keys))
+            
+            pending: Dict[str, str] = {}
+            for key, text in zip(keys, texts):
+                if key not in vectors:
+                    pending.setdefault(key, text)
+            
+            if pending:
+                model = await self._get_model()
+                
+                # Generar embeddings en thread pool
+                loop = asyncio.get_event_loop()
+                missing_texts = list(pending.values())
+                encoded = await loop.run_in_executor(
+                    None,
+                    lambda: model.encode(missing_texts, batch_size=self.batch_size)
+                )
+                fresh = {key: np.asarray(vector, dtype=np.float32) for key, vector in zip(pending, encoded)}
+                self.embedding_cache.put_many(fresh)
+                vectors.update(fresh)
             
-            return embeddings
+            if not keys:
+                return np.empty((0, self.index.dimension or 0), dtype=np.float32)
+            return np.vstack([vectors[key] for key in keys])
             
         except Exception as e:
             logger.error(f"Error generando embeddings batch: {e}")
@@ -118,41 +232,71 @@ class EmbeddingService:
             content: Contenido del documento
             metadata: Metadatos adicionales
         """
-        if not self.is_initialized:
-            await self.initialize()
-            
         try:
-            # Generar embedding
-            embedding = await self.embed_text(content)
-            
-            # Inicializar índice FAISS si no existe
-            if self.index is None:
-                dimension = embedding.shape[0]
-                self.index = faiss.IndexFlatIP(dimension)  # Inner product para similitud coseno
-                
-            # Normalizar embedding para similitud coseno
-            embedding_norm = embedding / np.linalg.norm(embedding)
-            
-            # Añadir al índice
-            self.index.add(embedding_norm.reshape(1, -1))
-            
-            # Guardar mapeo
-            self.document_map[doc_id] = {
-                'content': content,
-                'metadata': metadata or {},
-                'index_id': self.index.ntotal - 1,
-                'created_at': datetime.now().isoformat()
-            }
-            
-            # Persistir índice
-            await self._save_index()
-            
+            await self.add_documents([{'doc_id': doc_id, 'content': content, 'metadata': metadata}])
             logger.info(f"Documento {doc_id} añadido al índice semántico")
             
         except Exception as e:
             logger.error(f"Error añadiendo documento {doc_id}: {e}")
             raise
     
+    async def add_documents(self, documents: List[Dict[str, Any]]) -> int:
+        """
+        Añade varios documentos con una sola pasada por el modelo
+        
+        Args:
+            documents: Lista de {'doc_id', 'content', 'metadata'}
+            
+        Returns:
+            Número de documentos añadidos o actualizados (los que ya estaban
+            indexados con el mismo contenido y metadatos se omiten)
+        """
+        if not self.is_initialized:
+            await self.initialize()
+        
+        # Un doc_id repetido en el lote: gana la última aparición
+        latest: Dict[str, Dict[str, Any]] = {}
+        for document in documents:
+            latest[document['doc_id']] = document
+        
+        existing = self.document_map.get_many(latest)
+        changed = []
+        for doc_id, document in latest.items():
+            metadata = document.get('metadata') or {}
+            current = existing.get(doc_id)
+            if current is not None and doc_id in self.index and \
+                    current['content'] == document['content'] and current['metadata'] == metadata:
+                continue
+            changed.append((doc_id, document['content'], metadata))
+        
+        if not changed:
+            return 0
+        
+        embeddings = await self.embed_batch([content for _, content, _ in changed])
+        
+        # Añadir al índice (normaliza para similitud coseno y reemplaza si ya existía)
+        doc_ids = [doc_id for doc_id, _, _ in changed]
+        self.index.add(doc_ids, embeddings)
+        
+        created_at = datetime.now().isoformat()
+        stored = {}
+        records = []
+        for (doc_id, content, metadata), embedding in zip(changed, embeddings):
+            document = {
+                'content': content,
+                'metadata': metadata,
+                'created_at': created_at
+            }
+            stored[doc_id] = document
+            records.append({'op': OP_ADD, 'doc_id': doc_id, 'vector': embedding, 'document': document})
+        self.document_map.put_many(stored)
+        
+        # Persistir: registros en el diario; el snapshot llega en segundo plano
+        self._log(*records)
+        
+        logger.debug(f"{len(changed)} documentos añadidos al índice semántico")
+        return len(changed)
+    
     async def search_similar(self, query: str, top_k: int = 5, threshold: float = 0.7) -> List[Dict[str, Any]]:
         """
         Busca documentos similares a la consulta
@@ -168,38 +312,34 @@ class EmbeddingService:
         if not self.is_initialized:
             await self.initialize()
             
-        if self.index is None or self.index.ntotal == 0:
+        if len(self.index) == 0:
             return []
             
         try:
             # Generar embedding de consulta
             query_embedding = await self.embed_text(query)
-            query_embedding_norm = query_embedding / np.linalg.norm(query_embedding)
             
-            # Buscar similares
-            scores, indices = self.index.search(
-                query_embedding_norm.reshape(1, -1), 
-                min(top_k, self.index.ntotal)
-            )
+            # Buscar similares; cada hit trae su doc_id (sin recorrer document_map)
+            hits = []
+            for doc_id, score in self.index.search(query_embedding, top_k):
+                if score < threshold:
+                    break
+                hits.append((doc_id, score))
             
-            # Procesar resultados
+            # Leer solo los documentos de los resultados
+            documents = self.document_map.get_many(doc_id for doc_id, _ in hits)
             results = []
-            for score, idx in zip(scores[0], indices[0]):
-                if score >= threshold:
-                    # Encontrar documento por índice
-                    doc_id = None
-                    for doc_id, doc_data in self.document_map.items():
-                        if doc_data['index_id'] == idx:
-                            break
-                    
-                    if doc_id:
-                        results.append({
-                            'document_id': doc_id,
-                            'content': doc_data['content'],
-                            'metadata': doc_data['metadata'],
-                            'similarity_score': float(score),
-                            'created_at': doc_data['created_at']
-                        })
+            for doc_id, score in hits:
+                doc_data = documents.get(doc_id)
+                if doc_data is None:
+                    continue
+                results.append({
+                    'document_id': doc_id,
+                    'content': doc_data['content'],
+                    'metadata': doc_data['metadata'],
+                    'similarity_score': score,
+                    'created_at': doc_data['created_at']
+                })
             
             return results
             
@@ -214,19 +354,29 @@ class EmbeddingService:
         Args:
             doc_id: ID del documento a eliminar
         """
-        if doc_id in self.document_map:
-            del self.document_map[doc_id]
-            # Nota: FAISS no soporta eliminación directa, 
-            # sería necesario reconstruir el índice
-            await self._save_index()
+        if self.document_map.pop(doc_id) is not None:
+            # Lápida en el índice; el vector se elimina en la próxima compactación
+            self.index.remove(doc_id)
+            self._log({'op': OP_REMOVE, 'doc_id': doc_id})
             logger.info(f"Documento {doc_id} eliminado del índice")
     
     async def clear_index(self):
         """Limpia completamente el índice"""
-        self.index = None
-        self.document_map = {}
+        if not self.is_initialized:
+            await self.initialize()
+        self.index.clear()
+        self.document_map.clear()
+        self._log({'op': OP_CLEAR})
+        # Snapshot inmediato: es trivial y permite descartar todo el diario
         await self._save_index()
         logger.info("Índice semántico limpiado")
+
+    async def flush(self):
+        """Fuerza un snapshot con todo lo pendiente del diario y espera a que se publique"""
+        if self._unsnapshotted_ops:
+            await self._save_index()
+        elif self._snapshot_future is not None:
+            await asyncio.wrap_future(self._snapshot_future)
     
     async def get_stats(self) -> Dict[str, Any]:
         """
@@ -236,45 +386,218 @@ class EmbeddingService:
             Diccionario con estadísticas
         """
         total_docs = len(self.document_map)
-        index_size = self.index.ntotal if self.index else 0
         
         return {
             'total_documents': total_docs,
-            'index_size': index_size,
+            'index_size': len(self.index),
+            'index': self.index.get_stats(),
             'model_name': self.model_name,
             'is_initialized': self.is_initialized,
-            'storage_path': self.storage_path
+            'model_loaded': self.model is not None,
+            'queued_embedding_requests': self._queued_requests,
+            'storage_path': self.storage_path,
+            'embedding_cache': self.embedding_cache.get_stats(),
+            'persistence': {
+                'journal_segment': self.journal.sequence,
+                'unsnapshotted_ops': self._unsnapshotted_ops,
+                'snapshot_sequence': self._snapshot_sequence,
+                'snapshot_running': self._snapshot_future is not None and not self._snapshot_future.done(),
+                'seconds_since_snapshot': round(time.monotonic() - self._last_snapshot, 1)
+            }
         }
     
+    def _log(self, *records: Dict[str, Any]):
+        """Añade operaciones al diario y programa un snapshot si toca"""
+        try:
+            self.journal.append(*records)
+        except Exception as e:
+            logger.error(f"Error escribiendo en el diario del índice: {e}")
+            return
+        self._unsnapshotted_ops += len(records)
+        self._maybe_snapshot()
+    
+    def _maybe_snapshot(self):
+        """Programa un snapshot en segundo plano por volumen o antigüedad del diario"""
+        if not self._unsnapshotted_ops:
+            return
+        if self._snapshot_future is not None and not self._snapshot_future.done():
+            return
+        if self._unsnapshotted_ops >= self.snapshot_every or \
+                time.monotonic() - self._last_snapshot >= self.snapshot_interval:
+            self._snapshot_future = self._start_snapshot()
+    
+    def _start_snapshot(self):
+        """
+        Captura el estado, rota el diario y encola la escritura del snapshot
+        
+        Captura y rotación se hacen sin ceder el control, así que el snapshot
+        contiene exactamente las operaciones de los segmentos anteriores.
+        """
+        state = self.index.snapshot()
+        sequence = self.journal.rotate()
+        self._unsnapshotted_ops = 0
+        self._last_snapshot = time.monotonic()
+        return self._snapshot_executor.submit(self._write_snapshot, sequence, state)
+    
+    def _write_snapshot(self, sequence: int, state: Dict[str, Any]):
+        """
+        Escribe y publica un snapshot del índice (hilo de snapshots)
+        
+        Los documentos no forman parte del snapshot: DocumentStore confirma
+        cada escritura en SQLite y el diario los repite al reproducirse.
+        """
+        vectors = sum(1 for doc_id in state['doc_ids'] if doc_id is not None)
+        started = time.monotonic()
+        try:
+            with self._snapshot_lock:
+                if sequence <= self._snapshot_sequence:
+                    return
+                self.snapshots.write(sequence, lambda directory: VectorIndex.write_snapshot(state, directory),
+                                     {'vectors': vectors})
+                self._snapshot_sequence = sequence
+                self.journal.prune(sequence)
+            logger.info(
+                f"Snapshot del índice semántico {sequence}: {vectors} vectores "
+                f"en {time.monotonic() - started:.2f}s"
+            )
+        except Exception as e:
+            logger.error(f"Error guardando snapshot del índice: {e}")
+    
     async def _save_index(self):
-        """Guarda el índice en disco"""
+        """Toma un snapshot ahora y espera a que se publique"""
         try:
-            if self.index is not None:
-                # Guardar índice FAISS
-                index_path = os.path.join(self.storage_path, 'faiss_index.idx')
-                faiss.write_index(self.index, index_path)
-                
-            # Guardar mapeo de documentos
-            map_path = os.path.join(self.storage_path, 'document_map.pkl')
-            with open(map_path, 'wb') as f:
-                pickle.dump(self.document_map, f)
-                
+            future = self._start_snapshot()
+            self._snapshot_future = future
+            await asyncio.wrap_future(future)
         except Exception as e:
             logger.error(f"Error guardando índice: {e}")
     
     async def _load_index(self):
-        """Carga el índice desde disco"""
+        """Carga el último snapshot (o el formato anterior) y reproduce el diario"""
         try:
-            # Cargar índice FAISS
-            index_path = os.path.join(self.storage_path, 'faiss_index.idx')
-            if os.path.exists(index_path):
-                self.index = faiss.read_index(index_path)
-                
-            # Cargar mapeo de documentos
-            map_path = os.path.join(self.storage_path, 'document_map.pkl')
-            if os.path.exists(map_path):
-                with open(map_path, 'rb') as f:
-                    self.document_map = pickle.load(f)
+            manifest = self.snapshots.current()
+            if manifest is not None:
+                self._load_snapshot(manifest['path'])
+                self._snapshot_sequence = manifest['sequence']
+            else:
+                self._load_legacy()
+            
+            replayed = self._replay_journal(self._snapshot_sequence)
+            self.journal.open(minimum_sequence=self._snapshot_sequence + 1)
+            self._unsnapshotted_ops = replayed
+            if replayed:
+                logger.info(f"Diario del índice semántico reproducido: {replayed} operaciones")
+            if manifest is None and len(self.index):
+                # Publicar el formato nuevo para no repetir la migración en cada arranque
+                self._snapshot_future = self._start_snapshot()
+            else:
+                self._maybe_snapshot()
                     
         except Exception as e:
-            logger.error(f"Error cargando índice: {e}")
\ No newline at end of file
+            logger.error(f"Error cargando índice: {e}")
+    
+    def _load_snapshot(self, path: str):
+        # Snapshots de antes de DocumentStore llevan el mapa en un pickle
+        self._import_document_map(os.path.join(path, DOCUMENT_MAP_FILE))
+        if VectorIndex.exists(path):
+            self.index = VectorIndex.load(path, mmap=self.mmap_vectors, **self.index_options)
+    
+    def _load_legacy(self):
+        """Ficheros en la raíz de storage_path, de antes de los snapshots"""
+        documents = self._read_document_map(os.path.join(self.storage_path, DOCUMENT_MAP_FILE))
+        
+        if VectorIndex.exists(self.storage_path):
+            self.index = VectorIndex.load(self.storage_path, mmap=self.mmap_vectors, **self.index_options)
+        elif documents:
+            self._migrate_legacy_index(documents)
+        
+        if documents and not len(self.document_map):
+            self.document_map.put_many(documents)
+    
+    @staticmethod
+    def _read_document_map(map_path: str) -> Dict[str, Any]:
+        """Pickle del formato anterior, si existe"""
+        if not os.path.exists(map_path):
+            return {}
+        with open(map_path, 'rb') as f:
+            return pickle.load(f)
+    
+    def _import_document_map(self, map_path: str):
+        """Migrar un document_map.pkl a DocumentStore si este aún está vacío"""
+        if len(self.document_map):
+            return
+        documents = self._read_document_map(map_path)
+        if documents:
+            self.document_map.put_many(documents)
+            logger.info(f"{len(documents)} documentos migrados de {DOCUMENT_MAP_FILE} a {DOCUMENTS_DB_FILE}")
+    
+    def _replay_journal(self, from_sequence: int) -> int:
+        """
+        Aplica los registros del diario posteriores al snapshot
+        
+        Las altas consecutivas se insertan en lote; reproducir una operación
+        ya incluida en el índice es inocuo (alta = reemplazo, baja de algo
+        inexistente = nada). Con el índice cargándose en segundo plano
+        (mmap) no se espera a FAISS: las filas reproducidas se le añaden
+        cuando termina la carga.
+        
+        Returns:
+            Número de operaciones reproducidas
+        """
+        batch_ids, batch_vectors, batch_documents = [], [], {}
+        
+        def flush_batch():
+            if batch_ids:
+                self.index.add(batch_ids, np.vstack(batch_vectors))
+                self.document_map.put_many(batch_documents)
+                batch_ids.clear()
+                batch_vectors.clear()
+                batch_documents.clear()
+        
+        replayed = 0
+        for record in self.journal.replay(from_sequence):
+            op = record.get('op')
+            doc_id = record.get('doc_id')
+            if op == OP_ADD:
+                batch_ids.append(doc_id)
+                batch_vectors.append(np.asarray(record['vector'], dtype=np.float32).reshape(1, -1))
+                batch_documents[doc_id] = record['document']
+            elif op == OP_REMOVE:
+                flush_batch()
+                self.document_map.pop(doc_id, None)
+                self.index.remove(doc_id)
+            elif op == OP_CLEAR:
+                batch_ids.clear()
+                batch_vectors.clear()
+                batch_documents.clear()
+                self.document_map.clear()
+                self.index.clear()
+            else:
+                logger.warning(f"Operación desconocida en el diario: {op}")
+                continue
+            replayed += 1
+        flush_batch()
+        return replayed
+    
+    def _migrate_legacy_index(self, documents: Dict[str, Any]):
+        """
+        Convierte el formato anterior (IndexFlatIP + 'index_id' en document_map)
+        
+        Los vectores se recuperan del propio índice plano, así que no hay que
+        volver a calcular embeddings.
+        """
+        index_path = os.path.join(self.storage_path, FAISS_FILE)
+        if not os.path.exists(index_path):
+            return
+        legacy = faiss.read_index(index_path)
+        if legacy.ntotal == 0:
+            return
+        vectors = legacy.reconstruct_n(0, legacy.ntotal)
+        doc_ids, rows = [], []
+        for doc_id, doc_data in documents.items():
+            row = doc_data.pop('index_id', None)
+            if row is not None and 0 <= row < legacy.ntotal:
+                doc_ids.append(doc_id)
+                rows.append(row)
+        self.index = VectorIndex.from_vectors(doc_ids, vectors[rows], **self.index_options)
+        logger.info(f"Índice semántico migrado al formato con mapeo de IDs: {len(doc_ids)} vectores")
@@ -3,12 +3,19 @@ Almacén de memoria episódica
 Gestiona experiencias específicas y eventos temporales
 """
 
-from typing import Dict, List, Any, Optional, Tuple
+from typing import Dict, List, Any, Optional, Set, Tuple
 from datetime import datetime, timedelta
+import bisect
+import heapq
 import json
+from itertools import islice
 import logging
 from dataclasses import dataclass
 
+from .context_features import SCORE_EPSILON, ContextFeatureMatrix
+from .inverted_index import InvertedIndex, tokenize
+from .memory_persistence import locked_write
+
 logger = logging.getLogger(__name__)
 
 @dataclass
@@ -48,6 +55,11 @@ class Episode:
         # Auto-generar timestamp si no se proporciona
         if not self.timestamp:
             self.timestamp = datetime.now()
+
+    def __setstate__(self, state: Dict[str, Any]):
+        # Al deserializar, adoptar el dict tal cual es bastante más rápido que
+        # asignar sus campos uno a uno (lo que pickle hace por defecto)
+        self.__dict__ = state
     
     @classmethod
     def from_chat_interaction(cls, user_query: str, agent_response: str, 
@@ -101,7 +113,25 @@ class Episode:
         )
 
 class EpisodicMemoryStore:
-    """Almacén de memoria episódica para experiencias y eventos"""
+    """
+    Almacén de memoria episódica para experiencias y eventos
+    
+    Además del diccionario de episodios mantiene, al almacenar y eliminar:
+    un índice invertido de título, descripción y tags (ranking BM25), otro
+    de los tokens del contexto, un índice task_id -> episodios, una
+    partición éxito/fallo ordenada por (importancia, fecha) y una matriz de
+    características de los contextos para find_similar_episodes. Las
+    búsquedas solo visitan los episodios candidatos en lugar de recorrerlos
+    todos, y el episodio a desalojar es la cabeza de una de las particiones.
+    Quien modifique un episodio ya almacenado debe llamar a reindex_episode.
+    Con persistencia asociada (MemoryPersistence), cada alta, reindexado y
+    baja se registra en su log.
+    """
+    
+    # Candidatos por resultado pedido cuando la consulta solo tiene palabras comunes
+    COMMON_QUERY_SAMPLE = 20
+    # Similitud mínima de contexto para find_similar_episodes
+    SIMILARITY_THRESHOLD = 0.3
     
     def __init__(self, max_episodes: int = 1000):
         """
@@ -112,8 +142,97 @@ class EpisodicMemoryStore:
         """
         self.max_episodes = max_episodes
         self.episodes: Dict[str, Episode] = {}
-        self.episode_order: List[str] = []  # Orden cronológico
+        self.episode_order: Dict[str, None] = {}  # Orden cronológico (dict ordenado: bajas O(1))
+        
+        # Índices secundarios
+        self._text_index = InvertedIndex()
+        self._context_index = InvertedIndex()
+        self._task_index: Dict[str, Set[str]] = {}
+        self._indexed_tasks: Dict[str, str] = {}  # episodio -> task_id con el que se indexó
+        # éxito -> claves (importancia, fecha, id) ordenadas de menor a mayor
+        self._ranked: Dict[bool, List[Tuple[int, datetime, str]]] = {True: [], False: []}
+        self._ranking_keys: Dict[str, Tuple[bool, Tuple[int, datetime, str]]] = {}
+        self._context_features = ContextFeatureMatrix(initial_rows=min(max_episodes, 4096))
+        self._persistence = None  # MemoryPersistence asociada, si la hay
+    
+    def _persist(self, kind: str, item_id: str, item: Any = None):
+        """Registra un cambio en la persistencia asociada (item None = baja)"""
+        if self._persistence is not None:
+            self._persistence.record(kind, item_id, item)
+        
+    @staticmethod
+    def _task_id_of(episode: Episode) -> Optional[str]:
+        return (episode.context or {}).get('task_id')
+    
+    def _index_episode(self, episode: Episode):
+        """Añade el episodio a los índices secundarios"""
+        text_tokens = tokenize(episode.title) + tokenize(episode.description)
+        for tag in episode.tags:
+            text_tokens.extend(tokenize(tag))
+        self._text_index.add(episode.id, text_tokens)
+        self._context_index.add(
+            episode.id, tokenize(json.dumps(episode.context or {}, default=str, ensure_ascii=False))
+        )
+        self._context_features.add(episode.id, episode.context)
         
+        task_id = self._task_id_of(episode)
+        if task_id is not None:
+            self._task_index.setdefault(task_id, set()).add(episode.id)
+            self._indexed_tasks[episode.id] = task_id
+        
+        success = bool(episode.success)
+        key = (episode.importance, episode.timestamp, episode.id)
+        bisect.insort(self._ranked[success], key)
+        self._ranking_keys[episode.id] = (success, key)
+    
+    def _unindex_episode(self, episode: Episode):
+        """Quita el episodio de los índices secundarios"""
+        self._text_index.remove(episode.id)
+        self._context_index.remove(episode.id)
+        self._context_features.remove(episode.id)
+        
+        task_id = self._indexed_tasks.pop(episode.id, None)
+        task_episodes = self._task_index.get(task_id)
+        if task_episodes is not None:
+            task_episodes.discard(episode.id)
+            if not task_episodes:
+                del self._task_index[task_id]
+        
+        entry = self._ranking_keys.pop(episode.id, None)
+        if entry is not None:
+            success, key = entry
+            ranked = self._ranked[success]
+            position = bisect.bisect_left(ranked, key)
+            if position < len(ranked) and ranked[position] == key:
+                del ranked[position]
+    
+    @locked_write
+    def reindex_episode(self, episode_id: str):
+        """
+        Actualiza los índices de un episodio modificado en memoria
+        
+        Args:
+            episode_id: ID del episodio
+        """
+        episode = self.episodes.get(episode_id)
+        if episode is None:
+            return
+        self._unindex_episode(episode)
+        self._index_episode(episode)
+        self._persist('episodes', episode_id, episode)
+    
+    def _top_ranked(self, count: int) -> List[str]:
+        """IDs de los `count` episodios de mayor (importancia, fecha), éxitos y fallos juntos"""
+        merged = heapq.merge(reversed(self._ranked[True]), reversed(self._ranked[False]), reverse=True)
+        return [key[2] for _, key in zip(range(count), merged)]
+    
+    def _by_ranking(self, episode_ids) -> List[Episode]:
+        """Episodios ordenados por importancia y fecha, de mayor a menor"""
+        keys = [self._ranking_keys[episode_id][1] for episode_id in episode_ids if episode_id in self._ranking_keys]
+        keys.sort(reverse=True)
+        return [self.episodes[key[2]] for key in keys]
+    
+    @locked_write
     def store_episode(self, episode: Episode):
         """
         Almacena un episodio en memoria
@@ -122,16 +241,22 @@ class EpisodicMemoryStore:
             episode: Episodio a almacenar
         """
         try:
-            # Aplicar límite de capacidad
-            if len(self.episodes) >= self.max_episodes:
-                # Eliminar el episodio más antiguo con menor importancia
+            previous = self.episodes.get(episode.id)
+            if previous is not None:
+                # Reemplazo: conserva su posición cronológica
+                self._unindex_episode(previous)
+            elif len(self.episodes) >= self.max_episodes:
+                # Aplicar límite de capacidad: eliminar el episodio más antiguo con menor importancia
                 oldest_id = self._find_least_important_episode()
                 if oldest_id:
                     self._remove_episode(oldest_id)
             
             # Almacenar episodio
             self.episodes[episode.id] = episode
-            self.episode_order.append(episode.id)
+            if previous is None:
+                self.episode_order[episode.id] = None
+            self._index_episode(episode)
+            self._persist('episodes', episode.id, episode)
             
             logger.debug(f"Episodio {episode.id} almacenado en memoria episódica")
             
@@ -161,8 +286,8 @@ class EpisodicMemoryStore:
             Lista de episodios recientes
         """
         try:
-            recent_ids = self.episode_order[-limit:]
-            return [self.episodes[ep_id] for ep_id in reversed(recent_ids) if ep_id in self.episodes]
+            recent_ids = islice(reversed(self.episode_order), max(limit, 0))
+            return [self.episodes[ep_id] for ep_id in recent_ids if ep_id in self.episodes]
             
         except Exception as e:
             logger.error(f"Error obteniendo episodios recientes: {e}")
@@ -182,29 +307,34 @@ class EpisodicMemoryStore:
             Lista de episodios coincidentes
         """
         try:
-            results = []
-            query_lower = query.lower()
-            
-            for episode in self.episodes.values():
-                # UPGRADE AI: Filtrar por task_id si se proporciona
-                if task_id is not None:
-                    episode_task_id = episode.context.get('task_id') if hasattr(episode, 'context') else None
-                    if episode_task_id != task_id:
-                        continue
-                
-                # Buscar en título, descripción y tags
-                if (query_lower in episode.title.lower() or 
-                    query_lower in episode.description.lower() or
-                    any(query_lower in tag.lower() for tag in episode.tags)):
-                    results.append(episode)
-                    
-                    if len(results) >= limit:
-                        break
-            
-            # Ordenar por importancia y fecha
-            results.sort(key=lambda x: (x.importance, x.timestamp), reverse=True)
-            
-            return results
+            # UPGRADE AI: Filtrar por task_id si se proporciona (índice task_id -> episodios)
+            within = None
+            if task_id is not None:
+                within = self._task_index.get(task_id)
+                if not within:
+                    return []
+            
+            tokens = tokenize(query)
+            if not tokens:
+                # Consulta sin palabras: todos los candidatos por importancia y fecha
+                candidates = within if within is not None else self.episodes.keys()
+                return self._by_ranking(candidates)[:limit]
+            
+            # Buscar en título, descripción y tags (BM25; empates por importancia y fecha)
+            if within is None and self._text_index.only_common(tokens):
+                # Solo palabras comunes ("chat"): puntuar primero los episodios más
+                # importantes y recientes; si no bastan, búsqueda completa
+                sample = self._top_ranked(limit * self.COMMON_QUERY_SAMPLE)
+                hits = self._text_index.search(tokens, limit, within=sample)
+                if len(hits) < limit and len(sample) < len(self.episodes):
+                    hits = self._text_index.search(tokens, limit)
+            else:
+                hits = self._text_index.search(tokens, limit, within=within)
+            hits.sort(
+                key=lambda hit: (hit[1], self.episodes[hit[0]].importance, self.episodes[hit[0]].timestamp),
+                reverse=True
+            )
+            return [self.episodes[episode_id] for episode_id, _ in hits]
             
         except Exception as e:
             logger.error(f"Error buscando episodios: {e}")
@@ -222,18 +352,23 @@ class EpisodicMemoryStore:
             Lista de episodios similares
         """
         try:
+            # Candidatos de mayor a menor cota (producto matriz-vector); la
+            # similitud exacta solo se calcula hasta que la cota no supera
+            # la del último de los `limit` mejores
             scored_episodes = []
-            
-            for episode in self.episodes.values():
+            for episode_id, bound in self._context_features.candidates(context, self.SIMILARITY_THRESHOLD):
+                if len(scored_episodes) >= limit and bound < scored_episodes[limit - 1][1] + SCORE_EPSILON:
+                    break
+                episode = self.episodes[episode_id]
                 similarity_score = self._calculate_context_similarity(context, episode.context)
                 
-                if similarity_score > 0.3:  # Umbral de similitud
+                if similarity_score > self.SIMILARITY_THRESHOLD:  # Umbral de similitud
                     scored_episodes.append((episode, similarity_score))
+                    # Ordenar por similitud
+                    scored_episodes.sort(key=lambda x: x[1], reverse=True)
+                    del scored_episodes[limit:]
             
-            # Ordenar por similitud
-            scored_episodes.sort(key=lambda x: x[1], reverse=True)
-            
-            return [episode for episode, _ in scored_episodes[:limit]]
+            return [episode for episode, _ in scored_episodes]
             
         except Exception as e:
             logger.error(f"Error encontrando episodios similares: {e}")
@@ -251,20 +386,25 @@ class EpisodicMemoryStore:
             Lista de episodios exitosos
         """
         try:
-            successful_episodes = [ep for ep in self.episodes.values() if ep.success]
-            
-            if context_keywords:
-                filtered_episodes = []
-                for episode in successful_episodes:
-                    context_str = json.dumps(episode.context).lower()
-                    if any(keyword.lower() in context_str for keyword in context_keywords):
-                        filtered_episodes.append(episode)
-                successful_episodes = filtered_episodes
+            if not context_keywords:
+                # Partición de éxitos ya ordenada por importancia y fecha
+                top_keys = self._ranked[True][-limit:] if limit > 0 else []
+                return [self.episodes[key[2]] for key in reversed(top_keys)]
+            
+            matched: Set[str] = set()
+            for keyword in context_keywords:
+                keyword_tokens = tokenize(keyword)
+                if not keyword_tokens:
+                    matched = set(self.episodes)
+                    break
+                matched |= self._context_index.documents_with_all(keyword_tokens)
             
             # Ordenar por importancia y fecha
-            successful_episodes.sort(key=lambda x: (x.importance, x.timestamp), reverse=True)
-            
-            return successful_episodes[:limit]
+            keys = (
+                self._ranking_keys[episode_id][1] for episode_id in matched
+                if self._ranking_keys[episode_id][0]
+            )
+            return [self.episodes[key[2]] for key in heapq.nlargest(limit, keys)]
             
         except Exception as e:
             logger.error(f"Error obteniendo episodios exitosos: {e}")
@@ -281,7 +421,7 @@ class EpisodicMemoryStore:
             Lista de patrones de fallo
         """
         try:
-            failed_episodes = [ep for ep in self.episodes.values() if not ep.success]
+            failed_episodes = [self.episodes[key[2]] for key in self._ranked[False]]
             
             # Agrupar por patrones comunes
             failure_patterns = {}
@@ -319,6 +459,7 @@ class EpisodicMemoryStore:
             logger.error(f"Error analizando patrones de fallo: {e}")
             return []
     
+    @locked_write
     def clear_old_episodes(self, days_old: int = 30):
         """
         Limpia episodios antiguos
@@ -350,7 +491,7 @@ class EpisodicMemoryStore:
             Diccionario con estadísticas
         """
         total_episodes = len(self.episodes)
-        successful_episodes = sum(1 for ep in self.episodes.values() if ep.success)
+        successful_episodes = len(self._ranked[True])
         
         if total_episodes > 0:
             success_rate = successful_episodes / total_episodes
@@ -422,17 +563,11 @@ class EpisodicMemoryStore:
         Returns:
             ID del episodio menos importante
         """
-        if not self.episodes:
-            return None
-            
-        # Encontrar el episodio con menor importancia y más antiguo
-        least_important = min(
-            self.episodes.items(),
-            key=lambda x: (x[1].importance, x[1].timestamp)
-        )
-        
-        return least_important[0]
+        # Menor (importancia, fecha): cabeza de una de las dos particiones ordenadas
+        heads = [ranked[0] for ranked in self._ranked.values() if ranked]
+        return min(heads)[2] if heads else None
     
+    @locked_write
     def _remove_episode(self, episode_id: str):
         """
         Elimina un episodio específico
@@ -441,7 +576,7 @@ class EpisodicMemoryStore:
             episode_id: ID del episodio a eliminar
         """
         if episode_id in self.episodes:
-            del self.episodes[episode_id]
+            self._unindex_episode(self.episodes.pop(episode_id))
+            self._persist('episodes', episode_id)
             
-        if episode_id in self.episode_order:
-            self.episode_order.remove(episode_id)
\ No newline at end of file
+        self.episode_order.pop(episode_id, None)
\ No newline at end of file
@@ -0,0 +1,82 @@
+"""
+Montículo de desalojo con borrado perezoso
+Mantiene los elementos de un almacén ordenados por su prioridad (confianza,
+efectividad...) para encontrar el de menor prioridad en O(log n) en vez de
+recorrer el almacén con min() en cada inserción a plena capacidad
+"""
+
+import heapq
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+class EvictionHeap:
+    """
+    Montículo de mínimos (prioridad, orden de inserción, versión, id)
+
+    Las bajas y los cambios de prioridad no tocan las entradas existentes:
+    cada push crea una versión nueva y las anteriores se descartan al llegar
+    a la cima. Si la prioridad de un elemento cambió sin pasar por push, su
+    entrada se reinserta con la prioridad actual al llegar a la cima (solo
+    se detectan así las subidas: las bajadas deben notificarse con push).
+    Los empates se resuelven por orden de inserción, como min() sobre el
+    diccionario del almacén. Cuando las entradas obsoletas superan a las
+    vigentes se reconstruye en O(n).
+    """
+
+    def __init__(self, priority: Callable[[Any], Any]):
+        """
+        Inicializa el montículo
+
+        Args:
+            priority: Función elemento -> prioridad (se desaloja la menor)
+        """
+        self.priority = priority
+        self._heap: List[Tuple[Any, int, int, str]] = []
+        self._live: Dict[str, Tuple[int, int]] = {}  # id -> (orden de inserción, versión vigente)
+        self._counter = 0
+
+    def __len__(self) -> int:
+        return len(self._live)
+
+    def push(self, item_id: str, item: Any) -> None:
+        """Registra un alta o un cambio de prioridad"""
+        self._counter += 1
+        order = self._live[item_id][0] if item_id in self._live else self._counter
+        self._live[item_id] = (order, self._counter)
+        heapq.heappush(self._heap, (self.priority(item), order, self._counter, item_id))
+        if len(self._heap) > 2 * len(self._live) + 64:
+            self._heap = [entry for entry in self._heap if self._live.get(entry[3]) == entry[1:3]]
+            heapq.heapify(self._heap)
+
+    def discard(self, item_id: str) -> None:
+        """Registra una baja"""
+        self._live.pop(item_id, None)
+
+    def peek(self, items: Dict[str, Any]) -> Optional[str]:
+        """
+        Id del elemento de menor prioridad
+
+        Args:
+            items: Diccionario id -> elemento del almacén (prioridades actuales)
+
+        Returns:
+            Id a desalojar o None si no hay elementos
+        """
+        heap = self._heap
+        while heap:
+            priority, order, version, item_id = heap[0]
+            item = items.get(item_id)
+            if item is None or self._live.get(item_id) != (order, version):
+                heapq.heappop(heap)
+                continue
+            current = self.priority(item)
+            if current != priority:
+                # Prioridad cambiada fuera de push: reubicar la entrada
+                heapq.heapreplace(heap, (current, order, version, item_id))
+                continue
+            return item_id
+        return None
+
+    def clear(self) -> None:
+        self._heap.clear()
+        self._live.clear()
@@ -0,0 +1,256 @@
+"""
+Persistencia write-behind del índice semántico
+Diario de operaciones en modo append (altas, bajas, limpiezas) y snapshots
+completos escritos en un directorio temporal y publicados con un rename
+atómico. Al arrancar se carga el último snapshot y se reproduce el diario
+posterior, así que una caída solo pierde, como mucho, el registro que se
+estaba escribiendo
+"""
+
+import json
+import logging
+import os
+import pickle
+import re
+import shutil
+import struct
+import threading
+import zlib
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+OP_ADD = 'add'
+OP_REMOVE = 'remove'
+OP_CLEAR = 'clear'
+
+MANIFEST_FILE = 'CURRENT'
+
+_HEADER = struct.Struct('<II')  # longitud, crc32
+_SEGMENT_RE = re.compile(r'^journal-(\d{8})\.log$')
+_SNAPSHOT_RE = re.compile(r'^snapshot-(\d{8})$')
+
+
+def _fsync_dir(directory: str) -> None:
+    """Persistir los renames de un directorio (no disponible en Windows)"""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def atomic_write(path: str, data: bytes) -> None:
+    """Escribir un fichero completo o nada: temporal + fsync + rename"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    _fsync_dir(os.path.dirname(path) or '.')
+
+
+class IndexJournal:
+    """
+    Diario append-only dividido en segmentos numerados
+
+    Cada registro es un pickle precedido de su longitud y su CRC32; al
+    reproducir, un registro truncado o corrupto (escritura interrumpida)
+    marca el final del segmento. Al rotar se abre un segmento nuevo, de modo
+    que un snapshot puede declarar "incluye todo lo anterior al segmento N"
+    y los segmentos viejos se borran sin tocar el activo.
+    """
+
+    def __init__(self, directory: str, fsync: bool = False):
+        """
+        Inicializa el diario
+
+        Args:
+            directory: Directorio de los segmentos
+            fsync: Forzar fsync tras cada registro (sobrevive a cortes de luz, más lento)
+        """
+        self.directory = directory
+        self.fsync = fsync
+        self._file = None
+        self._sequence = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _segment_path(self, sequence: int) -> str:
+        return os.path.join(self.directory, f"journal-{sequence:08d}.log")
+
+    def segments(self) -> List[int]:
+        """Números de segmento existentes, en orden"""
+        found = []
+        for name in os.listdir(self.directory):
+            match = _SEGMENT_RE.match(name)
+            if match:
+                found.append(int(match.group(1)))
+        return sorted(found)
+
+    @property
+    def sequence(self) -> int:
+        return self._sequence
+
+    def open(self, minimum_sequence: int = 1) -> int:
+        """
+        Abre un segmento nuevo posterior a todos los existentes
+
+        Nunca se añade a un segmento antiguo: su cola podría estar truncada.
+
+        Returns:
+            Número del segmento abierto
+        """
+        with self._lock:
+            existing = self.segments()
+            sequence = max([minimum_sequence, self._sequence + 1] + [s + 1 for s in existing])
+            self._switch(sequence)
+            return sequence
+
+    def rotate(self) -> int:
+        """Cierra el segmento activo y abre el siguiente; devuelve su número"""
+        with self._lock:
+            self._switch(self._sequence + 1)
+            return self._sequence
+
+    def _switch(self, sequence: int) -> None:
+        if self._file is not None:
+            self._file.close()
+        self._file = open(self._segment_path(sequence), 'ab')
+        self._sequence = sequence
+
+    def append(self, *records: Dict[str, Any]) -> None:
+        """Añade uno o varios registros al segmento activo con una sola escritura"""
+        frames = []
+        for record in records:
+            payload = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+            frames.append(_HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+        with self._lock:
+            if self._file is None:
+                raise RuntimeError("Diario no abierto")
+            self._file.write(b''.join(frames))
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+
+    def replay(self, from_sequence: int = 0) -> Iterator[Dict[str, Any]]:
+        """Registros de los segmentos >= from_sequence, en orden de escritura"""
+        for sequence in self.segments():
+            if sequence < from_sequence:
+                continue
+            path = self._segment_path(sequence)
+            with open(path, 'rb') as f:
+                while True:
+                    header = f.read(_HEADER.size)
+                    if not header:
+                        break
+                    if len(header) < _HEADER.size:
+                        logger.warning(f"Registro truncado al final de {path}, descartado")
+                        break
+                    length, crc = _HEADER.unpack(header)
+                    payload = f.read(length)
+                    if len(payload) < length or zlib.crc32(payload) != crc:
+                        logger.warning(f"Registro truncado o corrupto en {path}, se ignora el resto del segmento")
+                        break
+                    yield pickle.loads(payload)
+
+    def prune(self, before_sequence: int) -> None:
+        """Borra los segmentos anteriores a `before_sequence` (ya incluidos en un snapshot)"""
+        for sequence in self.segments():
+            if sequence < before_sequence and sequence != self._sequence:
+                try:
+                    os.remove(self._segment_path(sequence))
+                except OSError as e:
+                    logger.warning(f"No se pudo borrar el segmento {sequence} del diario: {e}")
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class SnapshotStore:
+    """
+    Snapshots completos en directorios `snapshot-NNNNNNNN`
+
+    Un snapshot se escribe en `snapshot-N.tmp`, se renombra a su nombre
+    definitivo y después se publica reescribiendo atómicamente el manifiesto
+    CURRENT. Hasta ese último rename el snapshot anterior sigue siendo el
+    vigente, así que una caída a mitad de escritura no deja nada a medias.
+    El número N es el primer segmento del diario que el snapshot NO incluye.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _snapshot_path(self, sequence: int) -> str:
+        return os.path.join(self.directory, f"snapshot-{sequence:08d}")
+
+    def current(self) -> Optional[Dict[str, Any]]:
+        """Manifiesto vigente ({'sequence', 'path'}) o None si no hay snapshot"""
+        manifest_path = os.path.join(self.directory, MANIFEST_FILE)
+        if not os.path.exists(manifest_path):
+            return None
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Manifiesto de snapshot ilegible: {e}")
+            return None
+        path = self._snapshot_path(manifest['sequence'])
+        if not os.path.isdir(path):
+            logger.error(f"El manifiesto apunta a un snapshot inexistente: {path}")
+            return None
+        return {**manifest, 'path': path}
+
+    def write(self, sequence: int, writer, info: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Escribe y publica un snapshot
+
+        Args:
+            sequence: Primer segmento del diario no incluido
+            writer: Función que recibe el directorio temporal y vuelca en él el estado
+            info: Datos extra para el manifiesto
+
+        Returns:
+            Ruta del snapshot publicado
+        """
+        final_path = self._snapshot_path(sequence)
+        tmp_path = f"{final_path}.tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+
+        writer(tmp_path)
+        for name in os.listdir(tmp_path):
+            with open(os.path.join(tmp_path, name), 'rb') as f:
+                os.fsync(f.fileno())
+        _fsync_dir(tmp_path)
+
+        shutil.rmtree(final_path, ignore_errors=True)
+        os.replace(tmp_path, final_path)
+        _fsync_dir(self.directory)
+
+        manifest = {'sequence': sequence, **(info or {})}
+        atomic_write(os.path.join(self.directory, MANIFEST_FILE), json.dumps(manifest).encode('utf-8'))
+        self.prune(keep=sequence)
+        return final_path
+
+    def prune(self, keep: int) -> None:
+        """Borra snapshots anteriores al vigente y temporales abandonados"""
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.startswith('snapshot-') and name.endswith('.tmp'):
+                if name != f"snapshot-{keep:08d}.tmp":
+                    shutil.rmtree(path, ignore_errors=True)
+                continue
+            match = _SNAPSHOT_RE.match(name)
+            if match and int(match.group(1)) < keep:
+                shutil.rmtree(path, ignore_errors=True)
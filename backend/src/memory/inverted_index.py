@@ -0,0 +1,168 @@
+"""
+Índice invertido con ranking BM25
+Mantiene token -> {doc_id: frecuencia} y la longitud de cada documento, de
+modo que una búsqueda solo visita las listas de los tokens de la consulta
+en lugar de recorrer todos los documentos
+"""
+
+import heapq
+import math
+import re
+from collections import Counter
+from typing import Collection, Dict, Iterable, List, Optional, Set, Tuple, Union
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text: str) -> List[str]:
+    """Tokens en minúsculas (secuencias alfanuméricas)"""
+    return _TOKEN_RE.findall(text.lower()) if text else []
+
+
+class InvertedIndex:
+    """
+    Índice invertido incremental
+
+    Las altas y bajas cuestan O(tokens del documento). La búsqueda BM25
+    toma como candidatos los documentos de los tokens poco frecuentes de
+    la consulta; los tokens presentes en más de `common_ratio` de los
+    documentos solo suman puntuación a esos candidatos (su IDF es casi
+    nulo), y únicamente se recorren enteros si la consulta no tiene otros.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75, common_ratio: float = 0.2):
+        """
+        Inicializa el índice
+
+        Args:
+            k1: Saturación de la frecuencia del término (BM25)
+            b: Peso de la normalización por longitud (BM25)
+            common_ratio: Fracción de documentos a partir de la cual un token se considera común
+        """
+        self.k1 = k1
+        self.b = b
+        self.common_ratio = common_ratio
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._lengths: Dict[str, int] = {}
+        # doc_id -> tokens distintos, para las bajas (unidos por '\0' tras deserializar)
+        self._terms: Dict[str, Union[Tuple[str, ...], str]] = {}
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._lengths
+
+    def __getstate__(self) -> Dict[str, object]:
+        # Una tupla por documento es la mayor parte del coste de deserializar
+        # el índice: los tokens viajan unidos en una cadena (si ninguno es
+        # vacío ni contiene '\0') y remove() la separa cuando hace falta
+        state = self.__dict__.copy()
+        if '' not in self._postings and not any('\0' in token for token in self._postings):
+            state['_terms'] = {
+                doc_id: terms if isinstance(terms, str) else '\0'.join(terms)
+                for doc_id, terms in self._terms.items()
+            }
+        return state
+
+    def add(self, doc_id: str, tokens: Iterable[str]) -> None:
+        """Indexa (o reindexa) un documento a partir de sus tokens"""
+        if doc_id in self._lengths:
+            self.remove(doc_id)
+        counts = Counter(tokens)
+        length = sum(counts.values())
+        self._lengths[doc_id] = length
+        self._terms[doc_id] = tuple(counts)
+        self._total_length += length
+        for token, frequency in counts.items():
+            self._postings.setdefault(token, {})[doc_id] = frequency
+
+    def remove(self, doc_id: str) -> None:
+        length = self._lengths.pop(doc_id, None)
+        if length is None:
+            return
+        self._total_length -= length
+        terms = self._terms.pop(doc_id)
+        if isinstance(terms, str):
+            terms = terms.split('\0') if terms else ()
+        for token in terms:
+            posting = self._postings[token]
+            del posting[doc_id]
+            if not posting:
+                del self._postings[token]
+
+    def postings(self, token: str) -> Dict[str, int]:
+        return self._postings.get(token, {})
+
+    def documents_with_all(self, tokens: Iterable[str]) -> Set[str]:
+        """Documentos que contienen todos los tokens (intersección desde la lista más corta)"""
+        lists = sorted((self.postings(token) for token in set(tokens)), key=len)
+        if not lists or not lists[0]:
+            return set()
+        result = set(lists[0])
+        for posting in lists[1:]:
+            result.intersection_update(posting)
+            if not result:
+                break
+        return result
+
+    def only_common(self, tokens: Iterable[str]) -> bool:
+        """La consulta solo tiene tokens comunes (su búsqueda recorrería listas enormes)"""
+        threshold = self.common_ratio * len(self._lengths)
+        frequencies = [len(self._postings[token]) for token in set(tokens) if token in self._postings]
+        return bool(frequencies) and min(frequencies) > threshold
+
+    def _idf(self, document_frequency: int) -> float:
+        count = len(self._lengths)
+        return math.log(1 + (count - document_frequency + 0.5) / (document_frequency + 0.5))
+
+    def search(self, tokens: Iterable[str], limit: int = 10,
+               within: Optional[Collection[str]] = None) -> List[Tuple[str, float]]:
+        """
+        Documentos mejor puntuados por BM25 para la consulta
+
+        Args:
+            tokens: Tokens de la consulta
+            limit: Número máximo de resultados
+            within: Restringir a estos doc_id (p.ej. los de una tarea)
+
+        Returns:
+            Lista de (doc_id, score) de mayor a menor
+        """
+        terms = [token for token in set(tokens) if token in self._postings]
+        if not terms or limit <= 0:
+            return []
+
+        common_threshold = self.common_ratio * len(self._lengths)
+        rare = [token for token in terms if len(self._postings[token]) <= common_threshold]
+        seeds = rare or [min(terms, key=lambda token: len(self._postings[token]))]
+
+        seed_size = sum(len(self._postings[token]) for token in seeds)
+        if within is not None and len(within) < seed_size:
+            # Filtro más selectivo que la consulta: recorrer el filtro
+            postings = [self._postings[token] for token in terms]
+            candidates = {doc_id for doc_id in within if any(doc_id in posting for posting in postings)}
+        else:
+            candidates: Set[str] = set()
+            for token in seeds:
+                candidates.update(self._postings[token])
+            if within is not None:
+                candidates.intersection_update(within)
+        if not candidates:
+            return []
+
+        average_length = self._total_length / len(self._lengths) or 1.0
+        weights = [(self._postings[token], self._idf(len(self._postings[token]))) for token in terms]
+        k1, b = self.k1, self.b
+
+        def score(doc_id: str) -> float:
+            norm = k1 * (1 - b + b * self._lengths[doc_id] / average_length)
+            total = 0.0
+            for posting, idf in weights:
+                frequency = posting.get(doc_id)
+                if frequency:
+                    total += idf * frequency * (k1 + 1) / (frequency + norm)
+            return total
+
+        return heapq.nlargest(limit, ((doc_id, score(doc_id)) for doc_id in candidates), key=lambda item: item[1])
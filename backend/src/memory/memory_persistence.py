@@ -0,0 +1,557 @@
+"""
+Persistencia de los almacenes de memoria en SQLite
+Cada alta, actualización y baja de los almacenes en memoria (episodios,
+conceptos, hechos, procedimientos, estrategias y memoria de trabajo) se
+añade a un log de cambios; la compactación periódica lo pliega en una tabla
+con el último valor de cada elemento y guarda una instantánea serializada
+de cada almacén, así que arrancar es deserializar la instantánea y
+reproducir solo los cambios posteriores
+"""
+
+import copy
+import dataclasses
+import functools
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Versión del formato de las instantáneas: subirla al cambiar los atributos
+# internos de los almacenes invalida las antiguas (se reconstruyen desde records)
+SNAPSHOT_FORMAT = 2
+
+DEFAULT_COMPACT_EVERY = 5000
+
+# Tipo de cambio -> (almacén, método de alta, método de baja)
+KINDS: Dict[str, Tuple[str, str, str]] = {
+    'episodes': ('episodic', 'store_episode', '_remove_episode'),
+    'concepts': ('semantic', 'store_concept', '_remove_concept'),
+    'facts': ('semantic', 'store_fact', '_remove_fact'),
+    'procedures': ('procedural', 'store_procedure', '_remove_procedure'),
+    'strategies': ('procedural', 'store_tool_strategy', '_remove_strategy'),
+    'working': ('working', '_put_entry', '_remove_context'),
+}
+
+# Tipos cuyo método de alta recibe (id, elemento) en lugar del elemento
+_KEYED_KINDS = {'working'}
+
+# Parámetros del constructor de cada almacén que se conservan al restaurar
+STORE_OPTIONS: Dict[str, Tuple[str, ...]] = {
+    'working': ('max_capacity', 'ttl_minutes'),
+    'episodic': ('max_episodes',),
+    'semantic': ('max_concepts', 'max_facts'),
+    'procedural': ('max_procedures', 'max_strategies'),
+}
+
+_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS changes ('
+    'seq INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, item_id TEXT NOT NULL, '
+    'origin TEXT NOT NULL, data BLOB)',
+    'CREATE TABLE IF NOT EXISTS records ('
+    'kind TEXT NOT NULL, item_id TEXT NOT NULL, position INTEGER NOT NULL, data BLOB NOT NULL, '
+    'PRIMARY KEY (kind, item_id))',
+    'CREATE INDEX IF NOT EXISTS records_position ON records (position)',
+    'CREATE TABLE IF NOT EXISTS snapshots ('
+    'store TEXT PRIMARY KEY, seq INTEGER NOT NULL, format INTEGER NOT NULL, data BLOB NOT NULL)',
+    'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)',
+)
+
+
+def locked_write(method: Callable) -> Callable:
+    """
+    Decorador de los métodos que modifican un almacén
+
+    Con una persistencia asociada se ejecutan con su cerrojo: compact()
+    copia el estado de los almacenes con ese mismo cerrojo, así que nunca
+    ve uno a medio modificar. Las lecturas no lo necesitan.
+    """
+    @functools.wraps(method)
+    def wrapper(store, *args, **kwargs):
+        persistence = store._persistence
+        if persistence is None:
+            return method(store, *args, **kwargs)
+        with persistence._lock:
+            return method(store, *args, **kwargs)
+    return wrapper
+
+
+class PendingSync(NamedTuple):
+    """Lo que poll() leyó del log y apply() aplicará a los almacenes"""
+    changes: Dict[Tuple[str, str], List[Any]]  # (tipo, id) -> [borrado, origen, seq, elemento]
+    last_seq: int
+    restored: Optional[Dict[str, Any]] = None  # recarga completa: nombre -> almacén restaurado
+    stats: Optional[Dict[str, Any]] = None
+
+
+# Valores que la copia de estado comparte en lugar de copiar: inmutables
+_SHARED_TYPES = frozenset({str, bytes, int, float, bool, complex, type(None), tuple, frozenset, datetime, timedelta})
+
+
+def _is_shared(value_type: type) -> bool:
+    # Los elementos de los almacenes (dataclasses) se comparten: los métodos
+    # de escritura los reemplazan o solo reasignan sus atributos
+    return value_type in _SHARED_TYPES or dataclasses.is_dataclass(value_type)
+
+
+def _copy_state(value: Any) -> Any:
+    """
+    Copia de los contenedores mutables de un estado (dicts, listas,
+    conjuntos, arrays y objetos auxiliares como los índices), compartiendo
+    los valores inmutables y los elementos de los almacenes
+
+    Es lo que compact() serializa fuera del cerrojo mientras las escrituras
+    siguen modificando los originales.
+    """
+    value_type = type(value)
+    if _is_shared(value_type):
+        return value
+    if isinstance(value, dict):
+        copied = copy.copy(value)  # conserva defaultdict y su default_factory
+        if not all(_is_shared(item_type) for item_type in set(map(type, copied.values()))):
+            for key, item in copied.items():
+                copied[key] = _copy_state(item)
+        return copied
+    if isinstance(value, list):
+        if all(_is_shared(item_type) for item_type in set(map(type, value))):
+            return value.copy()
+        return [_copy_state(item) for item in value]
+    if isinstance(value, set):
+        return value.copy()
+    if isinstance(value, np.ndarray):
+        return value.copy()
+    if hasattr(value, '__dict__'):
+        copied = value_type.__new__(value_type)
+        copied.__dict__.update(_copy_state(vars(value)))
+        return copied
+    return value
+
+
+class MemoryPersistence:
+    """
+    Log de cambios, registros compactados e instantáneas de los almacenes
+
+    Tablas:
+    - changes: log append-only (seq, tipo, id, origen, elemento serializado
+      o NULL para las bajas)
+    - records: último valor de cada elemento hasta la última compactación,
+      con el seq de su alta como posición (el orden de inserción que
+      conservan los almacenes)
+    - snapshots: almacén completo serializado en esa misma compactación
+      (un pickle por atributo)
+    - meta: compacted_seq, el seq hasta el que changes está plegado
+
+    Varios procesos pueden compartir el fichero (WAL): cada uno registra sus
+    cambios con su origen y sync() aplica los de los demás. Ante cambios
+    concurrentes del mismo elemento gana el de mayor seq. Si otro proceso
+    compactó cambios que este aún no había visto, sync() recarga todo.
+
+    sync() se divide en poll(), que solo lee el log (y, si hay que recargar,
+    restaura almacenes nuevos) y puede ir en otro hilo, y apply(), que
+    modifica los almacenes y debe ir en el hilo que los usa. compact() no
+    modifica los almacenes y también puede ir en otro hilo: con el cerrojo
+    solo copia su estado (_copy_state); la serialización va fuera.
+    """
+
+    def __init__(self, path: str, compact_every: int = DEFAULT_COMPACT_EVERY):
+        """
+        Inicializa la persistencia
+
+        Args:
+            path: Fichero SQLite (':memory:' para uno volátil)
+            compact_every: Cambios sin compactar que disparan maybe_compact()
+        """
+        self.path = path
+        self.compact_every = compact_every
+        self.origin = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        # Transacciones explícitas: BEGIN para lecturas coherentes y
+        # BEGIN IMMEDIATE para compactar con el cerrojo de escritura
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30.0)
+        self._lock = threading.RLock()
+        self._local = threading.local()  # applying: cambios que llegan del log y no se registran de nuevo
+        self._stores: Dict[str, Any] = {}
+        self._synced_seq = 0
+        # (tipo, id) -> seq del último cambio propio que poll() aún no ha dejado atrás
+        self._own_seqs: Dict[Tuple[str, str], int] = {}
+        self.last_load: Dict[str, Any] = {}
+        with self._lock:
+            if path != ':memory:':
+                self._db.execute('PRAGMA journal_mode=WAL')
+                self._db.execute('PRAGMA synchronous=NORMAL')
+            for statement in _SCHEMA:
+                self._db.execute(statement)
+
+    @contextmanager
+    def _transaction(self, mode: str = '') -> Iterator[sqlite3.Connection]:
+        with self._lock:
+            self._db.execute(f'BEGIN {mode}')
+            try:
+                yield self._db
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+            self._db.execute('COMMIT')
+
+    @contextmanager
+    def _applying(self) -> Iterator[None]:
+        """Los cambios hechos en este hilo vienen del log: record() los ignora"""
+        self._local.applying = True
+        try:
+            yield
+        finally:
+            self._local.applying = False
+
+    def _compacted_seq(self, db: sqlite3.Connection) -> int:
+        row = db.execute("SELECT value FROM meta WHERE key = 'compacted_seq'").fetchone()
+        return row[0] if row else 0
+
+    def record(self, kind: str, item_id: str, item: Any = None) -> None:
+        """
+        Añade un cambio al log
+
+        Args:
+            kind: Tipo de elemento (clave de KINDS)
+            item_id: ID del elemento
+            item: Elemento completo, o None para una baja
+        """
+        if getattr(self._local, 'applying', False):
+            return
+        data = None if item is None else pickle.dumps(item, protocol=pickle.HIGHEST_PROTOCOL)
+        try:
+            with self._lock:
+                cursor = self._db.execute(
+                    'INSERT INTO changes (kind, item_id, origin, data) VALUES (?, ?, ?, ?)',
+                    (kind, item_id, self.origin, data)
+                )
+                self._own_seqs[(kind, item_id)] = cursor.lastrowid
+        except sqlite3.Error as e:
+            logger.error(f"Error registrando cambio {kind}/{item_id}: {e}")
+
+    @staticmethod
+    def _apply(stores: Dict[str, Any], kind: str, item_id: str, data: Optional[bytes]) -> None:
+        store_name, put, remove = KINDS[kind]
+        store = stores.get(store_name)
+        if store is None:
+            return
+        if data is None:
+            getattr(store, remove)(item_id)
+        elif kind in _KEYED_KINDS:
+            getattr(store, put)(item_id, pickle.loads(data))
+        else:
+            getattr(store, put)(pickle.loads(data))
+
+    def _read_changes(self, db: sqlite3.Connection, after: int,
+                      skip_own: bool) -> Tuple[Dict[Tuple[str, str], List[Any]], int]:
+        """
+        Lee los cambios con seq > `after`: por elemento solo el último
+
+        Los elementos quedan en el orden de su primer cambio (el de su
+        última alta si se borraron entre medias), que es el orden de
+        inserción que conservan los almacenes. Con `skip_own` se omiten los
+        elementos cuyo último cambio es de este proceso (su valor en memoria
+        ya es ese). Devuelve ((tipo, id) -> [borrado en la ventana, origen,
+        seq, elemento], último seq visto).
+        """
+        latest: Dict[Tuple[str, str], List[Any]] = {}
+        last_seq = after
+        rows = db.execute(
+            'SELECT seq, kind, item_id, origin, data IS NULL, CASE WHEN origin = ? THEN NULL ELSE data END '
+            'FROM changes WHERE seq > ? ORDER BY seq',
+            (self.origin if skip_own else '', after)
+        )
+        for seq, kind, item_id, origin, deleted, data in rows:
+            key = (kind, item_id)
+            if deleted:
+                latest.pop(key, None)  # Un alta posterior va al final
+                latest[key] = [True, origin, seq, None]
+            elif key in latest:
+                latest[key][1:] = [origin, seq, data]
+            else:
+                latest[key] = [False, origin, seq, data]
+            last_seq = seq
+        if skip_own:
+            latest = {key: change for key, change in latest.items() if change[1] != self.origin}
+        return latest, last_seq
+
+    def _apply_changes(self, stores: Dict[str, Any], changes: Dict[Tuple[str, str], List[Any]]) -> int:
+        applied = 0
+        for (kind, item_id), (deleted, _, seq, data) in changes.items():
+            if self._own_seqs.get((kind, item_id), 0) > seq:
+                continue  # Este proceso lo cambió después de leerlo
+            if deleted and data is not None:
+                self._apply(stores, kind, item_id, None)  # Borrado y vuelto a dar de alta
+            self._apply(stores, kind, item_id, data)
+            applied += 1
+        return applied
+
+    def load(self, stores: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Restaura los almacenes y les asocia esta persistencia
+
+        El contenido actual de cada almacén se reemplaza por el persistido;
+        su capacidad configurada se conserva. Equivale a
+        apply(restore(stores)).
+
+        Args:
+            stores: Nombre ('working', 'episodic', 'semantic', 'procedural') -> almacén
+
+        Returns:
+            Estadísticas de la carga (origen de cada almacén, cambios
+            reproducidos y segundos)
+        """
+        self.apply(self.restore(stores))
+        return self.last_load
+
+    def restore(self, stores: Dict[str, Any]) -> PendingSync:
+        """
+        Asocia los almacenes y lee su estado persistido sin modificarlos
+
+        Returns:
+            Recarga completa para apply()
+        """
+        self._stores = dict(stores)
+        return self._poll(reload=True)
+
+    def poll(self) -> PendingSync:
+        """
+        Lee los cambios de otros procesos desde el último sync sin tocar los
+        almacenes (si otro proceso compactó cambios no vistos, restaura
+        almacenes nuevos para reemplazarlos)
+
+        Returns:
+            Cambios pendientes para apply()
+        """
+        return self._poll(reload=False)
+
+    def _poll(self, reload: bool) -> PendingSync:
+        started = time.perf_counter()
+        # Dentro de la transacción (con el cerrojo) solo se leen filas; la
+        # deserialización va fuera para no retener a las escrituras
+        with self._transaction() as db:
+            compacted_seq = self._compacted_seq(db)
+            reload = reload or compacted_seq > self._synced_seq
+            if not reload:
+                changes, last_seq = self._read_changes(db, self._synced_seq, skip_own=True)
+                return PendingSync(changes, last_seq)
+            snapshots = {
+                name: data
+                for name, seq, snapshot_format, data in db.execute(
+                    'SELECT store, seq, format, data FROM snapshots'
+                )
+                if seq == compacted_seq and snapshot_format == SNAPSHOT_FORMAT
+            }
+            sources = {name: 'snapshot' if name in snapshots else 'records' for name in self._stores}
+            kinds = [kind for kind, (name, _, _) in KINDS.items() if sources.get(name) == 'records']
+            records = db.execute(
+                f"SELECT kind, item_id, data FROM records WHERE kind IN ({','.join('?' * len(kinds))}) ORDER BY position",
+                kinds
+            ).fetchall() if kinds else []
+            changes, last_seq = self._read_changes(db, compacted_seq, skip_own=False)
+
+        restored: Dict[str, Any] = {}
+        for name, store in self._stores.items():
+            options = {option: getattr(store, option) for option in STORE_OPTIONS.get(name, ())}
+            if name in snapshots:
+                restored[name] = self._load_store(type(store), snapshots[name])
+                restored[name].__dict__.update(options)
+            else:
+                restored[name] = type(store)(**options)
+        for kind, item_id, data in records:
+            self._apply(restored, kind, item_id, data)
+        replayed = self._apply_changes(restored, changes)
+        return PendingSync({}, last_seq, restored, {
+            'sources': sources,
+            'records': len(records),
+            'replayed_changes': replayed,
+            'seconds': round(time.perf_counter() - started, 4)
+        })
+
+    def apply(self, pending: PendingSync) -> int:
+        """
+        Aplica a los almacenes lo leído por poll() o restore()
+
+        Returns:
+            Elementos actualizados; tras una recarga completa, los registros
+            y cambios reproducidos en ella
+        """
+        with self._lock, self._applying():
+            last_seq = pending.last_seq
+            if pending.restored is None:
+                applied = self._apply_changes(self._stores, pending.changes)
+            else:
+                started = time.perf_counter()
+                for name, store in self._stores.items():
+                    state = vars(pending.restored[name])
+                    state['_persistence'] = self
+                    for stale in vars(store).keys() - state.keys():
+                        delattr(store, stale)
+                    vars(store).update(state)
+                # Cambios registrados mientras se restauraba, también los propios
+                with self._transaction() as db:
+                    gap, last_seq = self._read_changes(db, last_seq, skip_own=False)
+                self._own_seqs.clear()
+                replayed = pending.stats['replayed_changes'] + self._apply_changes(self._stores, gap)
+                self.last_load = dict(pending.stats, replayed_changes=replayed,
+                                      seconds=round(pending.stats['seconds'] + time.perf_counter() - started, 4))
+                logger.info(f"Memoria restaurada desde {self.path}: {self.last_load}")
+                applied = self.last_load['records'] + replayed
+            self._synced_seq = max(self._synced_seq, last_seq)
+            self._own_seqs = {key: seq for key, seq in self._own_seqs.items() if seq > self._synced_seq}
+            return applied
+
+    def sync(self) -> int:
+        """
+        Aplica los cambios registrados por otros procesos desde el último sync
+
+        Returns:
+            Elementos actualizados; tras una recarga completa, los registros
+            y cambios reproducidos en ella
+        """
+        return self.apply(self.poll())
+
+    @staticmethod
+    def _dump_state(state: Dict[str, Any]) -> bytes:
+        # Un pickle por atributo: con uno solo para todo el almacén la tabla
+        # memo crece a millones de entradas y la carga es bastante más lenta
+        return pickle.dumps({
+            name: pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL) for name, value in state.items()
+        }, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def _load_store(store_type: type, data: bytes) -> Any:
+        store = store_type.__new__(store_type)
+        store.__dict__.update({name: pickle.loads(value) for name, value in pickle.loads(data).items()})
+        store._persistence = None
+        return store
+
+    def pending_changes(self) -> int:
+        """Cambios del log sin compactar (de todos los procesos)"""
+        with self._transaction() as db:
+            last = db.execute('SELECT MAX(seq) FROM changes').fetchone()[0] or 0
+            return max(0, last - self._compacted_seq(db))
+
+    def maybe_compact(self) -> bool:
+        """Compacta si el log acumula al menos compact_every cambios"""
+        if self.pending_changes() < self.compact_every:
+            return False
+        return self.compact()
+
+    def compact(self) -> bool:
+        """
+        Pliega el log en records y guarda una instantánea de cada almacén
+
+        Solo si no quedan cambios ajenos sin aplicar, así que el estado en
+        memoria es exactamente el del log hasta su último seq. Con el
+        cerrojo de los almacenes solo se copia ese estado; se serializa sin
+        él (las escrituras siguen) y después, con el cerrojo de escritura de
+        SQLite, se pliega el log hasta ese seq y se guardan las instantáneas.
+        No modifica los almacenes: si hay cambios ajenos pendientes (o otro
+        proceso compacta antes) devuelve False y se reintenta tras el
+        siguiente sync().
+
+        Returns:
+            True si se compactó
+        """
+        with self._transaction() as db:
+            compacted_seq = self._compacted_seq(db)
+            if compacted_seq > self._synced_seq or db.execute(
+                'SELECT 1 FROM changes WHERE seq > ? AND origin != ? LIMIT 1', (self._synced_seq, self.origin)
+            ).fetchone():
+                return False
+            last_seq = db.execute('SELECT MAX(seq) FROM changes').fetchone()[0] or 0
+            if last_seq <= compacted_seq:
+                return False
+            # Dentro de la transacción se tiene el cerrojo: ninguna escritura a medias
+            states = {
+                name: _copy_state({key: value for key, value in vars(store).items() if key != '_persistence'})
+                for name, store in self._stores.items()
+            }
+
+        snapshots = [(name, last_seq, SNAPSHOT_FORMAT, self._dump_state(state)) for name, state in states.items()]
+
+        with self._transaction('IMMEDIATE') as db:
+            if self._compacted_seq(db) != compacted_seq:
+                return False  # Otro proceso compactó mientras se serializaba
+            self._fold(db, last_seq)
+            db.executemany('INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?)', snapshots)
+            db.execute("INSERT OR REPLACE INTO meta VALUES ('compacted_seq', ?)", (last_seq,))
+            self._synced_seq = max(self._synced_seq, last_seq)
+            self._own_seqs = {key: seq for key, seq in self._own_seqs.items() if seq > self._synced_seq}
+        logger.info(f"Memoria compactada hasta seq {last_seq} en {self.path}")
+        return True
+
+    @staticmethod
+    def _fold(db: sqlite3.Connection, last_seq: int) -> None:
+        """Pliega en records los cambios con seq <= `last_seq` y los borra del log"""
+        positions = {
+            (kind, item_id): position
+            for kind, item_id, position in db.execute(
+                'SELECT kind, item_id, position FROM records WHERE (kind, item_id) IN '
+                '(SELECT kind, item_id FROM changes WHERE seq <= ?)', (last_seq,)
+            )
+        }
+        # (tipo, id) -> [posición (None = borrado), seq de su último cambio]
+        folded: Dict[Tuple[str, str], List[Optional[int]]] = {}
+        for seq, kind, item_id, deleted in db.execute(
+            'SELECT seq, kind, item_id, data IS NULL FROM changes WHERE seq <= ? ORDER BY seq', (last_seq,)
+        ):
+            key = (kind, item_id)
+            entry = folded.get(key)
+            if entry is None:
+                entry = folded[key] = [positions.get(key), seq]
+            entry[1] = seq
+            if deleted:
+                entry[0] = None
+            elif entry[0] is None:
+                entry[0] = seq
+
+        db.execute('CREATE TEMP TABLE IF NOT EXISTS folded (seq INTEGER PRIMARY KEY, position INTEGER NOT NULL)')
+        db.execute('DELETE FROM folded')
+        db.executemany('INSERT INTO folded VALUES (?, ?)',
+                       [(seq, position) for position, seq in folded.values() if position is not None])
+        db.execute(
+            'DELETE FROM records WHERE (kind, item_id) IN '
+            '(SELECT kind, item_id FROM changes WHERE seq <= ?)', (last_seq,)
+        )
+        db.execute(
+            'INSERT INTO records (kind, item_id, position, data) '
+            'SELECT changes.kind, changes.item_id, folded.position, changes.data '
+            'FROM folded JOIN changes ON changes.seq = folded.seq WHERE changes.data IS NOT NULL'
+        )
+        db.execute('DELETE FROM folded')
+        db.execute('DELETE FROM changes WHERE seq <= ?', (last_seq,))
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._transaction() as db:
+            records = dict(db.execute('SELECT kind, COUNT(*) FROM records GROUP BY kind').fetchall())
+            compacted_seq = self._compacted_seq(db)
+        stats = {
+            'path': self.path,
+            'origin': self.origin,
+            'synced_seq': self._synced_seq,
+            'compacted_seq': compacted_seq,
+            'pending_changes': self.pending_changes(),
+            'records': records,
+            'last_load': self.last_load
+        }
+        if self.path != ':memory:' and os.path.exists(self.path):
+            stats['file_size_mb'] = round(os.path.getsize(self.path) / (1024 * 1024), 2)
+        return stats
+
+    def close(self) -> None:
+        with self._lock:
+            for store in self._stores.values():
+                store._persistence = None
+            self._stores = {}
+            self._db.close()
@@ -9,6 +9,10 @@ import json
 import logging
 from dataclasses import dataclass
 from collections import defaultdict
+from operator import attrgetter
+
+from .eviction import EvictionHeap
+from .memory_persistence import locked_write
 
 logger = logging.getLogger(__name__)
 
@@ -65,7 +69,16 @@ class ToolStrategy:
             self.created_at = datetime.now()
 
 class ProceduralMemoryStore:
-    """Almacén de memoria procedimental para habilidades y procedimientos"""
+    """
+    Almacén de memoria procedimental para habilidades y procedimientos
+    
+    Procedimientos y estrategias se registran además en un montículo por
+    efectividad (tasa de éxito en las estrategias), así que desalojar el
+    peor al llenarse cuesta O(log n). Cada procedimiento recuerda las claves
+    de procedure_index con las que se indexó para quitarse solo de ellas.
+    Con persistencia asociada (MemoryPersistence), cada alta, actualización
+    y baja se registra en su log.
+    """
     
     def __init__(self, max_procedures: int = 1000, max_strategies: int = 5000):
         """
@@ -79,9 +92,20 @@ class ProceduralMemoryStore:
         self.max_strategies = max_strategies
         self.procedures: Dict[str, Procedure] = {}
         self.tool_strategies: Dict[str, ToolStrategy] = {}
-        self.procedure_index: Dict[str, List[str]] = defaultdict(list)  # contexto -> procedimientos
-        self.strategy_index: Dict[str, List[str]] = defaultdict(list)  # herramienta -> estrategias
+        # Índices como dict ordenado (conjunto con orden de inserción): bajas O(1)
+        self.procedure_index: Dict[str, Dict[str, None]] = defaultdict(dict)  # contexto -> procedimientos
+        self.strategy_index: Dict[str, Dict[str, None]] = defaultdict(dict)  # herramienta -> estrategias
+        self._indexed_keys: Dict[str, List[str]] = {}  # procedimiento -> claves de procedure_index
+        self._procedure_eviction = EvictionHeap(attrgetter('effectiveness_score'))
+        self._strategy_eviction = EvictionHeap(attrgetter('success_rate'))
+        self._persistence = None  # MemoryPersistence asociada, si la hay
+    
+    def _persist(self, kind: str, item_id: str, item: Any = None):
+        """Registra un cambio en la persistencia asociada (item None = baja)"""
+        if self._persistence is not None:
+            self._persistence.record(kind, item_id, item)
         
+    @locked_write
     def store_procedure(self, procedure: Procedure):
         """
         Almacena un procedimiento aprendido
@@ -90,23 +114,32 @@ class ProceduralMemoryStore:
             procedure: Procedimiento a almacenar
         """
         try:
-            # Aplicar límite de capacidad
-            if len(self.procedures) >= self.max_procedures:
+            if procedure.id in self.procedures:
+                # Reemplazo: reindexar con las condiciones nuevas
+                self._unindex_procedure(procedure.id)
+            elif len(self.procedures) >= self.max_procedures:
+                # Aplicar límite de capacidad
                 self._remove_least_effective_procedure()
             
             # Almacenar procedimiento
             self.procedures[procedure.id] = procedure
             
             # Actualizar índices por contexto
+            index_keys = []
             for context_key, context_value in procedure.context_conditions.items():
                 index_key = f"{context_key}:{context_value}"
-                self.procedure_index[index_key].append(procedure.id)
+                self.procedure_index[index_key][procedure.id] = None
+                index_keys.append(index_key)
+            self._indexed_keys[procedure.id] = index_keys
+            self._procedure_eviction.push(procedure.id, procedure)
+            self._persist('procedures', procedure.id, procedure)
             
             logger.debug(f"Procedimiento {procedure.id} almacenado en memoria procedimental")
             
         except Exception as e:
             logger.error(f"Error almacenando procedimiento {procedure.id}: {e}")
     
+    @locked_write
     def store_tool_strategy(self, strategy: ToolStrategy):
         """
         Almacena una estrategia de uso de herramientas
@@ -115,15 +148,21 @@ class ProceduralMemoryStore:
             strategy: Estrategia a almacenar
         """
         try:
-            # Aplicar límite de capacidad
-            if len(self.tool_strategies) >= self.max_strategies:
+            previous = self.tool_strategies.get(strategy.id)
+            if previous is not None:
+                # Reemplazo: quitarla del índice de su herramienta anterior
+                self._unindex_strategy(strategy.id, previous)
+            elif len(self.tool_strategies) >= self.max_strategies:
+                # Aplicar límite de capacidad
                 self._remove_least_effective_strategy()
             
             # Almacenar estrategia
             self.tool_strategies[strategy.id] = strategy
             
             # Actualizar índices por herramienta
-            self.strategy_index[strategy.tool_name].append(strategy.id)
+            self.strategy_index[strategy.tool_name][strategy.id] = None
+            self._strategy_eviction.push(strategy.id, strategy)
+            self._persist('strategies', strategy.id, strategy)
             
             logger.debug(f"Estrategia {strategy.id} almacenada en memoria procedimental")
             
@@ -200,6 +239,7 @@ class ProceduralMemoryStore:
             logger.error(f"Error obteniendo estrategia para {tool_name}: {e}")
             return None
     
+    @locked_write
     def update_procedure_effectiveness(self, procedure_id: str, success: bool, execution_time: float):
         """
         Actualiza la efectividad de un procedimiento
@@ -232,12 +272,15 @@ class ProceduralMemoryStore:
                 # Actualizar score de efectividad (combina éxito y velocidad)
                 time_factor = max(0.1, 1.0 - (execution_time / 300.0))  # 5 minutos como referencia
                 procedure.effectiveness_score = (procedure.success_rate * 0.7) + (time_factor * 0.3)
+                self._procedure_eviction.push(procedure_id, procedure)
+                self._persist('procedures', procedure_id, procedure)
                 
                 logger.debug(f"Procedimiento {procedure_id} actualizado: éxito={success}, efectividad={procedure.effectiveness_score:.2f}")
                 
         except Exception as e:
             logger.error(f"Error actualizando efectividad del procedimiento {procedure_id}: {e}")
     
+    @locked_write
     def update_strategy_effectiveness(self, strategy_id: str, success: bool, execution_time: float):
         """
         Actualiza la efectividad de una estrategia
@@ -265,12 +308,14 @@ class ProceduralMemoryStore:
                         (strategy.success_rate * (strategy.usage_count - 1) + 0.0) / 
                         strategy.usage_count
                     )
+                self._strategy_eviction.push(strategy_id, strategy)
                 
                 # Actualizar tiempo promedio de ejecución
                 strategy.avg_execution_time = (
                     (strategy.avg_execution_time * (strategy.usage_count - 1) + execution_time) / 
                     strategy.usage_count
                 )
+                self._persist('strategies', strategy_id, strategy)
                 
                 logger.debug(f"Estrategia {strategy_id} actualizada: éxito={success}, tiempo_promedio={strategy.avg_execution_time:.2f}s")
                 
@@ -478,33 +523,47 @@ class ProceduralMemoryStore:
         except Exception as e:
             logger.error(f"Error aprendiendo estrategia de herramienta: {e}")
     
+    def _unindex_procedure(self, procedure_id: str):
+        """Quita un procedimiento de las listas de procedure_index en las que se indexó"""
+        for index_key in self._indexed_keys.pop(procedure_id, ()):
+            index_entries = self.procedure_index.get(index_key)
+            if index_entries is not None:
+                index_entries.pop(procedure_id, None)
+                if not index_entries:
+                    del self.procedure_index[index_key]
+    
+    def _unindex_strategy(self, strategy_id: str, strategy: ToolStrategy):
+        """Quita una estrategia del índice de su herramienta"""
+        if strategy.tool_name in self.strategy_index:
+            self.strategy_index[strategy.tool_name].pop(strategy_id, None)
+    
     def _remove_least_effective_procedure(self):
         """Elimina el procedimiento menos efectivo"""
-        if not self.procedures:
-            return
-            
-        least_effective = min(self.procedures.items(), key=lambda x: x[1].effectiveness_score)
-        procedure_id = least_effective[0]
-        
-        del self.procedures[procedure_id]
-        
-        # Limpiar índices
-        for index_list in self.procedure_index.values():
-            if procedure_id in index_list:
-                index_list.remove(procedure_id)
+        procedure_id = self._procedure_eviction.peek(self.procedures)
+        if procedure_id is not None:
+            self._remove_procedure(procedure_id)
     
     def _remove_least_effective_strategy(self):
         """Elimina la estrategia menos efectiva"""
-        if not self.tool_strategies:
+        strategy_id = self._strategy_eviction.peek(self.tool_strategies)
+        if strategy_id is not None:
+            self._remove_strategy(strategy_id)
+    
+    @locked_write
+    def _remove_procedure(self, procedure_id: str):
+        """Elimina un procedimiento del almacén e índices"""
+        if self.procedures.pop(procedure_id, None) is None:
             return
-            
-        least_effective = min(self.tool_strategies.items(), key=lambda x: x[1].success_rate)
-        strategy_id = least_effective[0]
-        strategy = least_effective[1]
-        
-        del self.tool_strategies[strategy_id]
-        
-        # Limpiar índices
-        if strategy.tool_name in self.strategy_index:
-            if strategy_id in self.strategy_index[strategy.tool_name]:
-                self.strategy_index[strategy.tool_name].remove(strategy_id)
\ No newline at end of file
+        self._unindex_procedure(procedure_id)
+        self._procedure_eviction.discard(procedure_id)
+        self._persist('procedures', procedure_id)
+    
+    @locked_write
+    def _remove_strategy(self, strategy_id: str):
+        """Elimina una estrategia del almacén e índices"""
+        strategy = self.tool_strategies.pop(strategy_id, None)
+        if strategy is None:
+            return
+        self._unindex_strategy(strategy_id, strategy)
+        self._strategy_eviction.discard(strategy_id)
+        self._persist('strategies', strategy_id)
@@ -50,42 +50,54 @@ class SemanticIndexer:
             content: Contenido del documento
             metadata: Metadatos del documento
         """
+        await self.add_documents([{'doc_id': doc_id, 'content': content, 'metadata': metadata}])
+        logger.debug(f"Documento {doc_id} añadido al índice semántico")
+    
+    async def add_documents(self, documents: List[Dict[str, Any]]):
+        """
+        Añade varios documentos; los embeddings se calculan en lote
+        
+        Args:
+            documents: Lista de {'doc_id', 'content', 'metadata'}
+        """
         if not self.is_initialized:
             await self.initialize()
             
         try:
-            # Procesar metadatos
-            metadata = metadata or {}
-            self.document_metadata[doc_id] = {
-                **metadata,
-                'content': content,
-                'indexed_at': datetime.now(),
-                'word_count': len(content.split())
-            }
-            
-            # Indexación por palabras clave
-            keywords = self._extract_keywords(content)
-            for keyword in keywords:
-                self.keyword_index[keyword].add(doc_id)
-            
-            # Indexación por categoría
-            category = metadata.get('category', 'general')
-            self.category_index[category].add(doc_id)
-            
-            # Indexación temporal
-            date_key = datetime.now().strftime('%Y-%m-%d')
-            self.temporal_index[date_key].append(doc_id)
+            for document in documents:
+                self._index_locally(document['doc_id'], document['content'], document.get('metadata') or {})
             
             # Indexación semántica si está disponible
-            if self.embedding_service:
-                await self.embedding_service.add_document(doc_id, content, metadata)
-            
-            logger.debug(f"Documento {doc_id} añadido al índice semántico")
+            if self.embedding_service and documents:
+                await self.embedding_service.add_documents(documents)
             
         except Exception as e:
-            logger.error(f"Error añadiendo documento {doc_id} al índice: {e}")
+            doc_ids = ', '.join(document['doc_id'] for document in documents[:5])
+            logger.error(f"Error añadiendo documentos al índice ({doc_ids}...): {e}")
             raise
     
+    def _index_locally(self, doc_id: str, content: str, metadata: Dict[str, Any]):
+        """Índices de palabras clave, categoría y fecha de un documento"""
+        self.document_metadata[doc_id] = {
+            **metadata,
+            'content': content,
+            'indexed_at': datetime.now(),
+            'word_count': len(content.split())
+        }
+        
+        # Indexación por palabras clave
+        keywords = self._extract_keywords(content)
+        for keyword in keywords:
+            self.keyword_index[keyword].add(doc_id)
+        
+        # Indexación por categoría
+        category = metadata.get('category', 'general')
+        self.category_index[category].add(doc_id)
+        
+        # Indexación temporal
+        date_key = datetime.now().strftime('%Y-%m-%d')
+        self.temporal_index[date_key].append(doc_id)
+    
     async def search(self, query: str, search_type: str = 'hybrid', limit: int = 10, 
                     category: str = None, date_range: Tuple[str, str] = None) -> List[Dict[str, Any]]:
         """
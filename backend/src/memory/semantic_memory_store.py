@@ -9,6 +9,12 @@ import json
 import logging
 from dataclasses import dataclass
 from collections import defaultdict
+from operator import attrgetter
+import heapq
+
+from .eviction import EvictionHeap
+from .memory_persistence import locked_write
+from .triple_index import TripleIndex
 
 logger = logging.getLogger(__name__)
 
@@ -56,7 +62,22 @@ class SemanticFact:
             self.created_at = datetime.now()
 
 class SemanticMemoryStore:
-    """Almacén de memoria semántica para conocimiento general"""
+    """
+    Almacén de memoria semántica para conocimiento general
+    
+    Conceptos y hechos se registran además en un montículo por confianza,
+    así que desalojar el de menor confianza al llenarse cuesta O(log n).
+    Los hechos se indexan por tripleta (SPO/POS/OSP) y los conceptos por
+    relación entrante, de modo que las búsquedas y la inferencia recorren
+    índices en lugar de todo el almacén. Quien cambie la confianza fuera de
+    update_*_confidence, o las relaciones de un concepto, debe volver a
+    almacenar el elemento. Con persistencia asociada (MemoryPersistence),
+    cada alta, actualización y baja se registra en su log.
+    """
+    
+    # Saltos máximos de una cadena de inferencia y caminos memorizados por (sujeto, predicado)
+    MAX_INFERENCE_HOPS = 4
+    MAX_INFERENCE_PATHS = 1000
     
     def __init__(self, max_concepts: int = 10000, max_facts: int = 50000):
         """
@@ -72,7 +93,22 @@ class SemanticMemoryStore:
         self.facts: Dict[str, SemanticFact] = {}
         self.concept_index: Dict[str, Set[str]] = defaultdict(set)  # índice por categoría
         self.fact_index: Dict[str, Set[str]] = defaultdict(set)  # índice por sujeto
+        self._concept_eviction = EvictionHeap(attrgetter('confidence'))
+        self._fact_eviction = EvictionHeap(attrgetter('confidence'))
+        self._triples = TripleIndex()
+        # concepto destino -> {concepto origen: tipos de relación}
+        self._incoming: Dict[str, Dict[str, Set[str]]] = {}
+        self._indexed_relations: Dict[str, List[Tuple[str, str]]] = {}
+        # (sujeto, predicado, saltos) -> caminos (objeto, confianza mínima, hechos)
+        self._inference_cache: Dict[Tuple[str, str, int], List[Tuple[str, float, Tuple[str, ...]]]] = {}
+        self._persistence = None  # MemoryPersistence asociada, si la hay
+    
+    def _persist(self, kind: str, item_id: str, item: Any = None):
+        """Registra un cambio en la persistencia asociada (item None = baja)"""
+        if self._persistence is not None:
+            self._persistence.record(kind, item_id, item)
         
+    @locked_write
     def store_concept(self, concept: SemanticConcept):
         """
         Almacena un concepto semántico
@@ -81,27 +117,32 @@ class SemanticMemoryStore:
             concept: Concepto a almacenar
         """
         try:
-            # Aplicar límite de capacidad
-            if len(self.concepts) >= self.max_concepts:
-                self._remove_least_confident_concept()
-            
             # Actualizar si ya existe
             if concept.id in self.concepts:
                 existing_concept = self.concepts[concept.id]
                 concept.created_at = existing_concept.created_at
                 concept.updated_at = datetime.now()
+                self.concept_index[existing_concept.category].discard(concept.id)
+                self._unindex_relations(concept.id)
+            elif len(self.concepts) >= self.max_concepts:
+                # Aplicar límite de capacidad
+                self._remove_least_confident_concept()
             
             # Almacenar concepto
             self.concepts[concept.id] = concept
             
             # Actualizar índices
             self.concept_index[concept.category].add(concept.id)
+            self._index_relations(concept)
+            self._concept_eviction.push(concept.id, concept)
+            self._persist('concepts', concept.id, concept)
             
             logger.debug(f"Concepto {concept.id} almacenado en memoria semántica")
             
         except Exception as e:
             logger.error(f"Error almacenando concepto {concept.id}: {e}")
     
+    @locked_write
     def store_fact(self, fact: SemanticFact):
         """
         Almacena un hecho semántico
@@ -110,8 +151,11 @@ class SemanticMemoryStore:
             fact: Hecho a almacenar
         """
         try:
-            # Aplicar límite de capacidad
-            if len(self.facts) >= self.max_facts:
+            existing_fact = self.facts.get(fact.id)
+            if existing_fact is not None:
+                self.fact_index[existing_fact.subject].discard(fact.id)
+            elif len(self.facts) >= self.max_facts:
+                # Aplicar límite de capacidad
                 self._remove_least_confident_fact()
             
             # Almacenar hecho
@@ -119,6 +163,10 @@ class SemanticMemoryStore:
             
             # Actualizar índices
             self.fact_index[fact.subject].add(fact.id)
+            self._triples.add(fact.id, fact.subject, fact.predicate, fact.object)
+            self._fact_eviction.push(fact.id, fact)
+            self._inference_cache.clear()
+            self._persist('facts', fact.id, fact)
             
             logger.debug(f"Hecho {fact.id} almacenado en memoria semántica")
             
@@ -203,35 +251,11 @@ class SemanticMemoryStore:
             Lista de hechos coincidentes
         """
         try:
-            results = []
-            
-            # Filtrar por sujeto si se especifica
-            facts_to_search = self.facts.values()
-            if subject:
-                fact_ids = self.fact_index.get(subject, set())
-                facts_to_search = [self.facts[fid] for fid in fact_ids]
-            
-            for fact in facts_to_search:
-                match = True
-                
-                # Verificar predicado
-                if predicate and predicate.lower() not in fact.predicate.lower():
-                    match = False
-                
-                # Verificar objeto
-                if object and object.lower() not in fact.object.lower():
-                    match = False
-                
-                if match:
-                    results.append(fact)
-                    
-                    if len(results) >= limit:
-                        break
+            # Índices SPO/POS/OSP: sujeto exacto, predicado y objeto por fragmento
+            fact_ids = self._triples.find(subject, predicate, object)
             
-            # Ordenar por confianza
-            results.sort(key=lambda x: x.confidence, reverse=True)
-            
-            return results
+            # Los más confiables entre todas las coincidencias
+            return heapq.nlargest(limit, (self.facts[fid] for fid in fact_ids), key=lambda x: x.confidence)
             
         except Exception as e:
             logger.error(f"Error buscando hechos: {e}")
@@ -263,12 +287,11 @@ class SemanticMemoryStore:
                         if related_id in self.concepts:
                             related_concepts.append(self.concepts[related_id])
             
-            # Buscar en relaciones inversas
-            for other_concept in self.concepts.values():
-                for rel_type, related_ids in other_concept.relations.items():
-                    if concept_id in related_ids:
-                        if relation_type is None or rel_type == relation_type:
-                            related_concepts.append(other_concept)
+            # Buscar en relaciones inversas (índice de relaciones entrantes)
+            for source_id, rel_types in self._incoming.get(concept_id, {}).items():
+                if relation_type is None or relation_type in rel_types:
+                    if source_id in self.concepts:
+                        related_concepts.append(self.concepts[source_id])
             
             # Eliminar duplicados y ordenar por confianza
             unique_concepts = list({c.id: c for c in related_concepts}.values())
@@ -280,51 +303,80 @@ class SemanticMemoryStore:
             logger.error(f"Error obteniendo conceptos relacionados: {e}")
             return []
     
-    def infer_knowledge(self, query: str) -> List[Dict[str, Any]]:
+    def infer_knowledge(self, query: str, max_hops: int = 2) -> List[Dict[str, Any]]:
         """
         Infiere conocimiento basado en hechos y relaciones
         
         Args:
             query: Consulta para inferencia
+            max_hops: Hechos máximos por cadena transitiva (2 = A→B→C)
             
         Returns:
             Lista de inferencias
         """
         try:
-            inferences = []
-            query_lower = query.lower()
+            max_hops = min(max_hops, self.MAX_INFERENCE_HOPS)
+            if max_hops < 2:
+                return []
             
-            # Buscar hechos relacionados
-            related_facts = []
-            for fact in self.facts.values():
-                if (query_lower in fact.subject.lower() or 
-                    query_lower in fact.predicate.lower() or 
-                    query_lower in fact.object.lower()):
-                    related_facts.append(fact)
-            
-            # Inferencia simple: transitividad
-            for fact1 in related_facts:
-                for fact2 in related_facts:
-                    if fact1.object == fact2.subject and fact1.predicate == fact2.predicate:
-                        # Inferir relación transitiva
-                        inferences.append({
-                            'type': 'transitive',
-                            'subject': fact1.subject,
-                            'predicate': fact1.predicate,
-                            'object': fact2.object,
-                            'confidence': min(fact1.confidence, fact2.confidence) * 0.8,
-                            'supporting_facts': [fact1.id, fact2.id]
-                        })
-            
-            # Ordenar por confianza
-            inferences.sort(key=lambda x: x['confidence'], reverse=True)
-            
-            return inferences[:10]  # Limitar resultados
+            # Hechos relacionados: la consulta aparece en sujeto, predicado u objeto
+            related_facts = self._triples.containing(query)
+            
+            # Inferencia por transitividad: cadenas con el mismo predicado que
+            # parten de un hecho relacionado y siguen el índice SPO
+            inferences = []
+            for fact_id in related_facts:
+                fact1 = self.facts[fact_id]
+                for object_, confidence, chain in self._reachable(fact1.object, fact1.predicate, max_hops - 1):
+                    if fact_id in chain:
+                        continue
+                    inferences.append({
+                        'type': 'transitive',
+                        'subject': fact1.subject,
+                        'predicate': fact1.predicate,
+                        'object': object_,
+                        'confidence': min(fact1.confidence, confidence) * 0.8 ** len(chain),
+                        'supporting_facts': [fact_id, *chain],
+                        'hops': len(chain) + 1
+                    })
+            
+            # Ordenar por confianza y limitar resultados
+            return heapq.nlargest(10, inferences, key=lambda x: x['confidence'])
             
         except Exception as e:
             logger.error(f"Error infiriendo conocimiento: {e}")
             return []
     
+    def _reachable(self, subject: str, predicate: str, hops: int) -> List[Tuple[str, float, Tuple[str, ...]]]:
+        """
+        Cadenas de hasta `hops` hechos (subject, predicate, x) → (x, predicate, y) → ...
+        
+        Se memorizan hasta que cambia algún hecho; si una cadena ramifica en
+        más de MAX_INFERENCE_PATHS caminos se conservan los más confiables.
+        
+        Returns:
+            Lista de (objeto alcanzado, confianza mínima, ids de los hechos)
+        """
+        key = (subject, predicate, hops)
+        paths = self._inference_cache.get(key)
+        if paths is not None:
+            return paths
+        
+        paths = []
+        for object_, fact_ids in self._triples.objects(subject, predicate).items():
+            for fact_id in fact_ids:
+                confidence = self.facts[fact_id].confidence
+                paths.append((object_, confidence, (fact_id,)))
+                if hops > 1:
+                    for next_object, next_confidence, chain in self._reachable(object_, predicate, hops - 1):
+                        if fact_id not in chain:
+                            paths.append((next_object, min(confidence, next_confidence), (fact_id, *chain)))
+        if len(paths) > self.MAX_INFERENCE_PATHS:
+            paths = heapq.nlargest(self.MAX_INFERENCE_PATHS, paths, key=lambda x: x[1] * 0.8 ** len(x[2]))
+        self._inference_cache[key] = paths
+        return paths
+    
+    @locked_write
     def update_concept_confidence(self, concept_id: str, confidence_delta: float):
         """
         Actualiza la confianza de un concepto
@@ -338,10 +390,13 @@ class SemanticMemoryStore:
                 concept = self.concepts[concept_id]
                 concept.confidence = max(0.0, min(1.0, concept.confidence + confidence_delta))
                 concept.updated_at = datetime.now()
+                self._concept_eviction.push(concept_id, concept)
+                self._persist('concepts', concept_id, concept)
                 
         except Exception as e:
             logger.error(f"Error actualizando confianza del concepto {concept_id}: {e}")
     
+    @locked_write
     def update_fact_confidence(self, fact_id: str, confidence_delta: float):
         """
         Actualiza la confianza de un hecho
@@ -354,6 +409,9 @@ class SemanticMemoryStore:
             if fact_id in self.facts:
                 fact = self.facts[fact_id]
                 fact.confidence = max(0.0, min(1.0, fact.confidence + confidence_delta))
+                self._fact_eviction.push(fact_id, fact)
+                self._inference_cache.clear()
+                self._persist('facts', fact_id, fact)
                 
         except Exception as e:
             logger.error(f"Error actualizando confianza del hecho {fact_id}: {e}")
@@ -400,26 +458,53 @@ class SemanticMemoryStore:
     
     def _remove_least_confident_concept(self):
         """Elimina el concepto con menor confianza"""
-        if not self.concepts:
-            return
-            
-        least_confident = min(self.concepts.items(), key=lambda x: x[1].confidence)
-        concept_id = least_confident[0]
-        concept = least_confident[1]
-        
-        # Eliminar del almacén e índices
-        del self.concepts[concept_id]
-        self.concept_index[concept.category].discard(concept_id)
+        concept_id = self._concept_eviction.peek(self.concepts)
+        if concept_id is not None:
+            self._remove_concept(concept_id)
     
     def _remove_least_confident_fact(self):
         """Elimina el hecho con menor confianza"""
-        if not self.facts:
+        fact_id = self._fact_eviction.peek(self.facts)
+        if fact_id is not None:
+            self._remove_fact(fact_id)
+    
+    @locked_write
+    def _remove_concept(self, concept_id: str):
+        """Elimina un concepto del almacén e índices"""
+        concept = self.concepts.pop(concept_id, None)
+        if concept is None:
             return
-            
-        least_confident = min(self.facts.items(), key=lambda x: x[1].confidence)
-        fact_id = least_confident[0]
-        fact = least_confident[1]
-        
-        # Eliminar del almacén e índices
-        del self.facts[fact_id]
-        self.fact_index[fact.subject].discard(fact_id)
\ No newline at end of file
+        self.concept_index[concept.category].discard(concept_id)
+        self._unindex_relations(concept_id)
+        self._concept_eviction.discard(concept_id)
+        self._persist('concepts', concept_id)
+    
+    @locked_write
+    def _remove_fact(self, fact_id: str):
+        """Elimina un hecho del almacén e índices"""
+        fact = self.facts.pop(fact_id, None)
+        if fact is None:
+            return
+        self.fact_index[fact.subject].discard(fact_id)
+        self._triples.remove(fact_id)
+        self._fact_eviction.discard(fact_id)
+        self._inference_cache.clear()
+        self._persist('facts', fact_id)
+    
+    def _index_relations(self, concept: SemanticConcept):
+        """Registra las relaciones del concepto en el índice de relaciones entrantes"""
+        indexed = []
+        for rel_type, related_ids in concept.relations.items():
+            for related_id in related_ids:
+                self._incoming.setdefault(related_id, {}).setdefault(concept.id, set()).add(rel_type)
+                indexed.append((rel_type, related_id))
+        self._indexed_relations[concept.id] = indexed
+    
+    def _unindex_relations(self, concept_id: str):
+        """Quita las relaciones salientes del concepto del índice de relaciones entrantes"""
+        for _, related_id in self._indexed_relations.pop(concept_id, ()):
+            sources = self._incoming.get(related_id)
+            if sources is not None:
+                sources.pop(concept_id, None)
+                if not sources:
+                    del self._incoming[related_id]
\ No newline at end of file
@@ -0,0 +1,151 @@
+"""
+Índices de tripletas sujeto-predicado-objeto
+Tres índices hash anidados (SPO, POS y OSP) sobre los hechos semánticos:
+cualquier combinación de componentes conocidos se resuelve empezando por el
+índice que la tiene como prefijo, sin recorrer todos los hechos
+"""
+
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+Nested = Dict[str, Dict[str, Dict[str, Set[str]]]]
+
+SUBJECT, PREDICATE, OBJECT = 0, 1, 2
+
+
+def _insert(index: Nested, first: str, second: str, third: str, fact_id: str) -> None:
+    index.setdefault(first, {}).setdefault(second, {}).setdefault(third, set()).add(fact_id)
+
+
+def _delete(index: Nested, first: str, second: str, third: str, fact_id: str) -> bool:
+    """Quita un hecho y poda los niveles vacíos; True si `first` ya no tiene hechos"""
+    level2 = index[first]
+    level3 = level2[second]
+    ids = level3[third]
+    ids.discard(fact_id)
+    if not ids:
+        del level3[third]
+        if not level3:
+            del level2[second]
+            if not level2:
+                del index[first]
+                return True
+    return False
+
+
+def _leaves(level: dict) -> Iterator[str]:
+    for value in level.values():
+        if isinstance(value, set):
+            yield from value
+        else:
+            yield from _leaves(value)
+
+
+class TripleIndex:
+    """
+    Índices SPO/POS/OSP de fact_id por (sujeto, predicado, objeto)
+
+    Las claves son los textos exactos de cada hecho. Para las búsquedas por
+    fragmento (sin distinguir mayúsculas) se guarda la forma en minúsculas
+    de cada valor distinto por posición, así que filtrar por subcadena
+    recorre el vocabulario de esa posición y no los hechos.
+    """
+
+    def __init__(self):
+        self._spo: Nested = {}
+        self._pos: Nested = {}
+        self._osp: Nested = {}
+        self._triples: Dict[str, Tuple[str, str, str]] = {}
+        # Valores distintos de cada posición -> minúsculas
+        self._folded: Tuple[Dict[str, str], Dict[str, str], Dict[str, str]] = ({}, {}, {})
+
+    def __len__(self) -> int:
+        return len(self._triples)
+
+    def __contains__(self, fact_id: str) -> bool:
+        return fact_id in self._triples
+
+    def add(self, fact_id: str, subject: str, predicate: str, object: str) -> None:
+        """Indexa (o reindexa) un hecho"""
+        if fact_id in self._triples:
+            self.remove(fact_id)
+        self._triples[fact_id] = (subject, predicate, object)
+        _insert(self._spo, subject, predicate, object, fact_id)
+        _insert(self._pos, predicate, object, subject, fact_id)
+        _insert(self._osp, object, subject, predicate, fact_id)
+        for position, value in enumerate((subject, predicate, object)):
+            folded = self._folded[position]
+            if value not in folded:
+                folded[value] = value.lower()
+
+    def remove(self, fact_id: str) -> None:
+        triple = self._triples.pop(fact_id, None)
+        if triple is None:
+            return
+        subject, predicate, object = triple
+        emptied = (
+            _delete(self._spo, subject, predicate, object, fact_id),
+            _delete(self._pos, predicate, object, subject, fact_id),
+            _delete(self._osp, object, subject, predicate, fact_id),
+        )
+        for position, value in enumerate(triple):
+            if emptied[position]:
+                del self._folded[position][value]
+
+    def clear(self) -> None:
+        for container in (self._spo, self._pos, self._osp, self._triples, *self._folded):
+            container.clear()
+
+    def values_containing(self, position: int, fragment: str) -> List[str]:
+        """Valores distintos de una posición que contienen `fragment` (sin distinguir mayúsculas)"""
+        fragment = fragment.lower()
+        return [value for value, folded in self._folded[position].items() if fragment in folded]
+
+    def objects(self, subject: str, predicate: str) -> Dict[str, Set[str]]:
+        """Objeto -> fact_ids de los hechos (subject, predicate, *) exactos"""
+        return self._spo.get(subject, {}).get(predicate, {})
+
+    def containing(self, fragment: str) -> Set[str]:
+        """Hechos con `fragment` en el sujeto, el predicado o el objeto"""
+        found: Set[str] = set()
+        for position, index in ((SUBJECT, self._spo), (PREDICATE, self._pos), (OBJECT, self._osp)):
+            for value in self.values_containing(position, fragment):
+                found.update(_leaves(index[value]))
+        return found
+
+    def find(self, subject: Optional[str] = None, predicate: Optional[str] = None,
+             object: Optional[str] = None) -> Set[str]:
+        """
+        Hechos que cumplen los filtros indicados
+
+        Args:
+            subject: Sujeto exacto
+            predicate: Fragmento del predicado (sin distinguir mayúsculas)
+            object: Fragmento del objeto (sin distinguir mayúsculas)
+
+        Returns:
+            Conjunto de fact_ids (todos si no hay filtros)
+        """
+        predicate_fragment = predicate.lower() if predicate else None
+        object_fragment = object.lower() if object else None
+        folded_predicates, folded_objects = self._folded[PREDICATE], self._folded[OBJECT]
+        matched: Set[str] = set()
+        if subject:
+            for predicate_value, objects in self._spo.get(subject, {}).items():
+                if predicate_fragment is not None and predicate_fragment not in folded_predicates[predicate_value]:
+                    continue
+                for object_value, ids in objects.items():
+                    if object_fragment is None or object_fragment in folded_objects[object_value]:
+                        matched |= ids
+            return matched
+        if predicate:
+            for value in self.values_containing(PREDICATE, predicate):
+                for object_value, subjects in self._pos[value].items():
+                    if object_fragment is None or object_fragment in folded_objects[object_value]:
+                        matched.update(_leaves(subjects))
+            return matched
+        if object:
+            for value in self.values_containing(OBJECT, object):
+                matched.update(_leaves(self._osp[value]))
+            return matched
+        return set(self._triples)
+
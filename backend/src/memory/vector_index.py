@@ -0,0 +1,530 @@
+"""
+Índice vectorial con mapeo de IDs O(1) y borrado real
+Envuelve FAISS con un mapeo fila <-> doc_id, borrados por lápida con
+compactación periódica y modo exacto (Flat) o aproximado (IVF/HNSW)
+elegido según el tamaño del corpus
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+INDEX_AUTO = 'auto'
+INDEX_FLAT = 'flat'
+INDEX_IVF = 'ivf'
+INDEX_HNSW = 'hnsw'
+
+VECTORS_FILE = 'vectors.npy'
+DOC_IDS_FILE = 'vector_doc_ids.json'
+FAISS_FILE = 'faiss_index.idx'
+
+_ADD_CHUNK = 65536
+
+
+class VectorIndex:
+    """
+    Índice de vectores normalizados para similitud coseno (producto interno)
+
+    El ID de FAISS de cada vector es su fila en la matriz de vectores, así
+    que doc_id -> fila es un dict y fila -> doc_id una lista. Un borrado
+    deja una lápida (la fila apunta a None) que la búsqueda descarta; cuando
+    las lápidas superan `compact_ratio` se reconstruye el índice solo con
+    los vectores vivos. La matriz propia permite además cambiar de Flat a
+    HNSW al crecer el corpus sin volver a calcular embeddings.
+    """
+
+    def __init__(self,
+                 dimension: Optional[int] = None,
+                 mode: str = INDEX_AUTO,
+                 ann_threshold: int = 50000,
+                 compact_ratio: float = 0.25,
+                 compact_min: int = 64,
+                 hnsw_m: int = 32,
+                 hnsw_ef_search: int = 64,
+                 ivf_nprobe: int = 16):
+        """
+        Inicializa el índice
+
+        Args:
+            dimension: Dimensión de los vectores (se fija con el primer add si es None)
+            mode: auto, flat, ivf o hnsw; auto usa Flat por debajo de ann_threshold y HNSW por encima
+            ann_threshold: Número de vectores a partir del cual auto pasa a HNSW
+            compact_ratio: Fracción de lápidas que dispara la compactación
+            compact_min: Lápidas mínimas antes de compactar
+            hnsw_m: Vecinos por nodo del grafo HNSW
+            hnsw_ef_search: Amplitud de búsqueda HNSW
+            ivf_nprobe: Listas IVF visitadas por búsqueda
+        """
+        if mode not in (INDEX_AUTO, INDEX_FLAT, INDEX_IVF, INDEX_HNSW):
+            raise ValueError(f"Modo de índice desconocido: {mode}")
+        self.dimension = dimension
+        self.mode = mode
+        self.ann_threshold = ann_threshold
+        self.compact_ratio = compact_ratio
+        self.compact_min = compact_min
+        self.hnsw_m = hnsw_m
+        self.hnsw_ef_search = hnsw_ef_search
+        self.ivf_nprobe = ivf_nprobe
+
+        self._vectors: Optional[np.ndarray] = None
+        self._size = 0
+        self._doc_ids: List[Optional[str]] = []
+        self._rows: Dict[str, int] = {}
+        self._tombstones = 0
+        self._index = None
+        self._quantizer = None
+        self._built_size = 0
+        self._lock = threading.RLock()
+        # Se limpia mientras el índice FAISS se carga en segundo plano (load
+        # con mmap); las escrituras no lo esperan: actualizan matriz y mapeo y
+        # las filas nuevas entran en FAISS cuando termina la carga
+        self._ready = threading.Event()
+        self._ready.set()
+        # Cambia al vaciar o compactar: una carga en curso ya no vale
+        self._generation = 0
+
+        self.active_mode: Optional[str] = None
+        self.rebuilds = 0
+
+    # ------------------------------------------------------------------
+    # Consultas básicas
+    # ------------------------------------------------------------------
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._rows
+
+    @property
+    def tombstones(self) -> int:
+        return self._tombstones
+
+    @property
+    def doc_ids(self) -> List[str]:
+        return list(self._rows)
+
+    @property
+    def ready(self) -> bool:
+        """El índice FAISS está cargado (si no, las búsquedas son exactas sobre la matriz)"""
+        return self._ready.is_set()
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        return self._ready.wait(timeout)
+
+    def get_vector(self, doc_id: str) -> Optional[np.ndarray]:
+        """Vector normalizado de un documento"""
+        row = self._rows.get(doc_id)
+        return None if row is None else self._vectors[row].copy()
+
+    # ------------------------------------------------------------------
+    # Construcción del índice FAISS
+    # ------------------------------------------------------------------
+
+    def _resolve_mode(self, count: int) -> str:
+        if self.mode != INDEX_AUTO:
+            return self.mode
+        return INDEX_FLAT if count < self.ann_threshold else INDEX_HNSW
+
+    @staticmethod
+    def _ivf_lists(count: int) -> int:
+        return int(min(65536, max(16, 4 * np.sqrt(count))))
+
+    def _new_index(self, mode: str, training: np.ndarray):
+        """Índice FAISS vacío (entrenado si es IVF) para el modo indicado"""
+        self._quantizer = None
+        if mode == INDEX_HNSW:
+            index = faiss.IndexHNSWFlat(self.dimension, self.hnsw_m, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efSearch = self.hnsw_ef_search
+            return index, INDEX_HNSW
+        if mode == INDEX_IVF:
+            nlist = self._ivf_lists(len(training))
+            if len(training) >= nlist * 4:
+                self._quantizer = faiss.IndexFlatIP(self.dimension)
+                index = faiss.IndexIVFFlat(self._quantizer, self.dimension, nlist, faiss.METRIC_INNER_PRODUCT)
+                sample = training
+                if len(training) > nlist * 64:
+                    picks = np.random.default_rng(0).choice(len(training), nlist * 64, replace=False)
+                    sample = training[picks]
+                index.train(sample)
+                index.nprobe = min(self.ivf_nprobe, nlist)
+                return index, INDEX_IVF
+            # Muy pocos vectores para entrenar las listas: exacto hasta la próxima reconstrucción
+        return faiss.IndexFlatIP(self.dimension), INDEX_FLAT
+
+    def _build(self, count: int) -> None:
+        """Reconstruir el índice FAISS con las `count` primeras filas de la matriz"""
+        vectors = self._vectors[:count]
+        self._index, self.active_mode = self._new_index(self._resolve_mode(count), vectors)
+        for start in range(0, count, _ADD_CHUNK):
+            self._index.add(vectors[start:start + _ADD_CHUNK])
+        self._built_size = count
+        self.rebuilds += 1
+
+    def _ensure_capacity(self, extra: int) -> None:
+        needed = self._size + extra
+        if self._vectors is None:
+            self._vectors = np.empty((max(needed, 1024), self.dimension), dtype=np.float32)
+        elif needed > len(self._vectors):
+            grown = np.empty((max(needed, 2 * len(self._vectors)), self.dimension), dtype=np.float32)
+            grown[:self._size] = self._vectors[:self._size]
+            self._vectors = grown
+
+    def _needs_rebuild(self) -> bool:
+        """El corpus ha crecido lo bastante para cambiar de modo o re-entrenar IVF"""
+        target = self._resolve_mode(self._size)
+        if self.active_mode == INDEX_FLAT and target != INDEX_FLAT:
+            if self.mode == INDEX_AUTO:
+                return True
+            # IVF construido como Flat por falta de datos: reintentar al duplicarse
+            return self._size >= 2 * self._built_size
+        return self.active_mode == INDEX_IVF and self._size > 4 * self._built_size
+
+    # ------------------------------------------------------------------
+    # Escritura
+    # ------------------------------------------------------------------
+
+    def add(self, doc_ids: Iterable[str], vectors: np.ndarray) -> None:
+        """
+        Añade (o reemplaza) documentos
+
+        Args:
+            doc_ids: IDs de los documentos, en el orden de las filas de `vectors`
+            vectors: Matriz (n, d) o vector (d,) sin normalizar
+        """
+        doc_ids = list(doc_ids)
+        if not doc_ids:
+            return
+        vectors = np.array(vectors, dtype=np.float32, copy=True).reshape(len(doc_ids), -1)
+        faiss.normalize_L2(vectors)
+
+        with self._lock:
+            if self.dimension is None:
+                self.dimension = vectors.shape[1]
+            elif vectors.shape[1] != self.dimension:
+                raise ValueError(f"Dimensión {vectors.shape[1]} distinta de la del índice ({self.dimension})")
+
+            # Un doc_id repetido en el lote: gana la última aparición
+            last = {doc_id: position for position, doc_id in enumerate(doc_ids)}
+            if len(last) != len(doc_ids):
+                keep = sorted(last.values())
+                doc_ids = [doc_ids[position] for position in keep]
+                vectors = vectors[keep]
+
+            for doc_id in doc_ids:
+                if doc_id in self._rows:
+                    self._bury(doc_id)
+
+            self._ensure_capacity(len(doc_ids))
+            start = self._size
+            self._vectors[start:start + len(doc_ids)] = vectors
+            for offset, doc_id in enumerate(doc_ids):
+                self._rows[doc_id] = start + offset
+            self._doc_ids.extend(doc_ids)
+            self._size += len(doc_ids)
+
+            if not self._ready.is_set():
+                # Cargando en segundo plano: las búsquedas son exactas sobre la
+                # matriz y estas filas se añaden a FAISS al terminar la carga
+                return
+            if self._index is None or self._needs_rebuild():
+                self._build(self._size)
+            else:
+                self._index.add(vectors)
+            self._maybe_compact()
+
+    def _bury(self, doc_id: str) -> None:
+        row = self._rows.pop(doc_id)
+        self._doc_ids[row] = None
+        self._tombstones += 1
+
+    def remove(self, doc_id: str) -> bool:
+        """
+        Elimina un documento (lápida; el vector desaparece al compactar)
+
+        Returns:
+            True si el documento existía
+        """
+        with self._lock:
+            if doc_id not in self._rows:
+                return False
+            self._bury(doc_id)
+            self._maybe_compact()
+            return True
+
+    def _maybe_compact(self) -> None:
+        # Compactar renumera las filas: no mientras FAISS se carga con las antiguas
+        if not self._ready.is_set():
+            return
+        if self._tombstones >= self.compact_min and self._tombstones > self.compact_ratio * self._size:
+            self.compact()
+
+    def compact(self) -> None:
+        """Reconstruir matriz e índice solo con los vectores vivos"""
+        self._ready.wait()
+        with self._lock:
+            if not self._tombstones:
+                return
+            live = np.fromiter(self._rows.values(), dtype=np.int64, count=len(self._rows))
+            live.sort()
+            doc_ids = [self._doc_ids[row] for row in live]
+            removed = self._tombstones
+            self._generation += 1
+            self._vectors = self._vectors[live] if len(live) else None
+            self._load_rows(doc_ids)
+            logger.info(f"Índice vectorial compactado: {removed} lápidas eliminadas, {len(doc_ids)} vectores vivos")
+            if self._size:
+                self._build(self._size)
+            else:
+                self._index = None
+                self.active_mode = None
+
+    def _load_rows(self, doc_ids: List[Optional[str]]) -> None:
+        self._doc_ids = list(doc_ids)
+        self._rows = {doc_id: row for row, doc_id in enumerate(doc_ids) if doc_id is not None}
+        self._size = len(doc_ids)
+        self._tombstones = self._size - len(self._rows)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._vectors = None
+            self._load_rows([])
+            self._index = None
+            self.active_mode = None
+
+    # ------------------------------------------------------------------
+    # Búsqueda
+    # ------------------------------------------------------------------
+
+    def search(self, query: np.ndarray, top_k: int = 5) -> List[Tuple[str, float]]:
+        """
+        Busca los documentos más similares
+
+        Args:
+            query: Vector de consulta (d,) sin normalizar
+            top_k: Número máximo de resultados
+
+        Returns:
+            Lista de (doc_id, similitud coseno) de mayor a menor
+        """
+        with self._lock:
+            if not self._rows or top_k <= 0:
+                return []
+            query = np.array(query, dtype=np.float32, copy=True).reshape(1, -1)
+            faiss.normalize_L2(query)
+            if self._index is None:
+                return self._exact_search(query[0], top_k)
+
+            # Pedir de más para compensar las lápidas que salgan en el top
+            fetch = min(self._size, top_k + min(self._tombstones, top_k))
+            while True:
+                scores, labels = self._index.search(query, fetch)
+                results = []
+                for score, label in zip(scores[0], labels[0]):
+                    if label < 0:
+                        continue
+                    doc_id = self._doc_ids[label]
+                    if doc_id is None:
+                        continue
+                    results.append((doc_id, float(score)))
+                    if len(results) == top_k:
+                        return results
+                if fetch >= self._size:
+                    return results
+                fetch = min(self._size, fetch * 2)
+
+    def _exact_search(self, query: np.ndarray, top_k: int) -> List[Tuple[str, float]]:
+        """Búsqueda exacta directamente sobre la matriz (mientras no hay índice FAISS)"""
+        scores = self._vectors[:self._size] @ query
+        fetch = min(self._size, top_k + self._tombstones)
+        candidates = np.argpartition(-scores, fetch - 1)[:fetch]
+        candidates = candidates[np.argsort(-scores[candidates])]
+        results = []
+        for row in candidates:
+            doc_id = self._doc_ids[row]
+            if doc_id is not None:
+                results.append((doc_id, float(scores[row])))
+                if len(results) == top_k:
+                    break
+        return results
+
+    # ------------------------------------------------------------------
+    # Persistencia
+    # ------------------------------------------------------------------
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Estado inmutable para guardarlo fuera del lock
+
+        Las filas ya escritas de la matriz no se modifican nunca (crecer y
+        compactar crean una matriz nueva), así que basta una vista de las
+        primeras `_size` filas y una copia de la lista de IDs. El índice
+        FAISS se serializa solo si es aproximado: uno Flat se reconstruye
+        al cargar con un único add. Durante una carga en segundo plano aún no
+        hay índice FAISS y se guardan solo los vectores.
+        """
+        with self._lock:
+            vectors = self._vectors[:self._size] if self._size else \
+                np.empty((0, self.dimension or 0), dtype=np.float32)
+            faiss_bytes = None
+            if self._index is not None and self.active_mode != INDEX_FLAT:
+                faiss_bytes = faiss.serialize_index(self._index)
+            return {
+                'dimension': self.dimension,
+                'doc_ids': list(self._doc_ids),
+                'vectors': vectors,
+                'faiss': faiss_bytes
+            }
+
+    @staticmethod
+    def write_snapshot(state: Dict[str, Any], directory: str) -> None:
+        """Vuelca en `directory` un estado obtenido con snapshot()"""
+        np.save(os.path.join(directory, VECTORS_FILE), state['vectors'])
+        with open(os.path.join(directory, DOC_IDS_FILE), 'w', encoding='utf-8') as f:
+            json.dump({'dimension': state['dimension'], 'doc_ids': state['doc_ids']}, f)
+        faiss_path = os.path.join(directory, FAISS_FILE)
+        if state['faiss'] is not None:
+            # serialize_index usa el mismo formato que write_index
+            with open(faiss_path, 'wb') as f:
+                f.write(state['faiss'].tobytes())
+        elif os.path.exists(faiss_path):
+            os.remove(faiss_path)
+
+    def save(self, directory: str) -> None:
+        """Guarda vectores, IDs (None = lápida) e índice FAISS si es aproximado"""
+        self.write_snapshot(self.snapshot(), directory)
+
+    @classmethod
+    def exists(cls, directory: str) -> bool:
+        return os.path.exists(os.path.join(directory, VECTORS_FILE)) and \
+            os.path.exists(os.path.join(directory, DOC_IDS_FILE))
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = False, **options) -> 'VectorIndex':
+        """
+        Carga un índice guardado con save(); si el FAISS no cuadra se reconstruye
+
+        Args:
+            directory: Directorio del índice
+            mmap: Abrir la matriz de vectores en solo lectura con mmap y cargar
+                (o construir) el índice FAISS en segundo plano. El índice está
+                disponible al instante: hasta que FAISS termina, las búsquedas
+                son exactas sobre la matriz mapeada y las escrituras no
+                esperan (ver add). El primer add copia la matriz a memoria.
+        """
+        with open(os.path.join(directory, DOC_IDS_FILE), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        vectors = np.load(os.path.join(directory, VECTORS_FILE), mmap_mode='r' if mmap else None)
+        index = cls(dimension=data.get('dimension'), **options)
+        index._restore(data['doc_ids'], vectors, os.path.join(directory, FAISS_FILE), background=mmap)
+        return index
+
+    @classmethod
+    def from_vectors(cls, doc_ids: List[str], vectors: np.ndarray, **options) -> 'VectorIndex':
+        """Índice a partir de vectores ya normalizados (p.ej. migración del formato anterior)"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        index = cls(dimension=vectors.shape[1] if vectors.ndim == 2 else None, **options)
+        index._restore(list(doc_ids), vectors, None)
+        return index
+
+    def _restore(self, doc_ids: List[Optional[str]], vectors: np.ndarray, faiss_path: Optional[str],
+                 background: bool = False) -> None:
+        if not doc_ids:
+            return
+        if self.dimension is None:
+            self.dimension = vectors.shape[1]
+        self._vectors = vectors if isinstance(vectors, np.memmap) else \
+            np.ascontiguousarray(vectors, dtype=np.float32)
+        self._load_rows(doc_ids)
+        if not background:
+            self._attach(*self._open_index(faiss_path, self._vectors, self._size))
+            return
+        self._ready.clear()
+        threading.Thread(
+            target=self._restore_in_background,
+            args=(faiss_path, self._vectors, self._size, self._generation),
+            name='vector_index_loader', daemon=True
+        ).start()
+
+    def _restore_in_background(self, faiss_path: Optional[str], vectors: np.ndarray, count: int,
+                               generation: int) -> None:
+        loaded = None
+        started = time.monotonic()
+        try:
+            loaded = self._open_index(faiss_path, vectors, count)
+        except Exception as e:
+            logger.error(f"Error cargando el índice FAISS; se sigue con búsqueda exacta: {e}")
+        with self._lock:
+            try:
+                if loaded is not None and generation == self._generation:
+                    self._attach(*loaded)
+                    # Filas escritas durante la carga (reemplazos incluidos:
+                    # la fila antigua queda como lápida)
+                    if self._size > count:
+                        self._index.add(self._vectors[count:self._size])
+                    logger.info(
+                        f"Índice FAISS cargado en segundo plano: {count} vectores en "
+                        f"{time.monotonic() - started:.2f}s, {self._size - count} escritos durante la carga"
+                    )
+                elif loaded is not None:
+                    # Vaciado durante la carga: el índice cargado ya no sirve
+                    if self._size:
+                        self._build(self._size)
+            except Exception as e:
+                logger.error(f"Error aplicando las escrituras hechas durante la carga: {e}")
+                self._index = None
+                self.active_mode = None
+            finally:
+                self._ready.set()
+            if self._index is not None and self._needs_rebuild():
+                self._build(self._size)
+            self._maybe_compact()
+
+    def _open_index(self, faiss_path: Optional[str], vectors: np.ndarray, count: int):
+        """Índice FAISS guardado si cuadra con los vectores; si no, uno nuevo con ellos"""
+        if faiss_path and os.path.exists(faiss_path):
+            stored = faiss.read_index(faiss_path)
+            if stored.ntotal == count:
+                return stored, self._mode_of(stored), False
+            logger.warning("Índice FAISS desincronizado con los vectores guardados, reconstruyendo")
+        index, mode = self._new_index(self._resolve_mode(count), vectors[:count])
+        for start in range(0, count, _ADD_CHUNK):
+            index.add(np.ascontiguousarray(vectors[start:min(start + _ADD_CHUNK, count)]))
+        return index, mode, True
+
+    def _attach(self, index, mode: str, built: bool) -> None:
+        self._index = index
+        self.active_mode = mode
+        self._built_size = index.ntotal
+        self.rebuilds += int(built)
+
+    @staticmethod
+    def _mode_of(index) -> str:
+        if isinstance(index, faiss.IndexHNSWFlat):
+            return INDEX_HNSW
+        if isinstance(index, faiss.IndexIVF):
+            return INDEX_IVF
+        return INDEX_FLAT
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Estadísticas del índice"""
+        return {
+            'vectors': len(self._rows),
+            'tombstones': self._tombstones,
+            'dimension': self.dimension,
+            'mode': self.mode,
+            'active_mode': self.active_mode,
+            'rebuilds': self.rebuilds,
+            'ready': self._ready.is_set(),
+            'mmap': isinstance(self._vectors, np.memmap),
+            'capacity': 0 if self._vectors is None else len(self._vectors)
+        }
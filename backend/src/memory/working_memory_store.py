@@ -8,10 +8,17 @@ from datetime import datetime, timedelta
 import json
 import logging
 
+from .memory_persistence import locked_write
+
 logger = logging.getLogger(__name__)
 
 class WorkingMemoryStore:
-    """Almacén de memoria de trabajo para contexto inmediato"""
+    """
+    Almacén de memoria de trabajo para contexto inmediato
+    
+    Con persistencia asociada (MemoryPersistence), cada alta y baja de un
+    contexto se registra en su log; las estadísticas de acceso no.
+    """
     
     def __init__(self, max_capacity: int = 50, ttl_minutes: int = 60):
         """
@@ -25,7 +32,14 @@ class WorkingMemoryStore:
         self.ttl_minutes = ttl_minutes
         self.store: Dict[str, Dict[str, Any]] = {}
         self.access_order: List[str] = []  # Para LRU
+        self._persistence = None  # MemoryPersistence asociada, si la hay
+    
+    def _persist(self, kind: str, item_id: str, item: Any = None):
+        """Registra un cambio en la persistencia asociada (item None = baja)"""
+        if self._persistence is not None:
+            self._persistence.record(kind, item_id, item)
         
+    @locked_write
     def store_context(self, context_id: str, context_data: Dict[str, Any]):
         """
         Almacena contexto en memoria de trabajo
@@ -38,31 +52,22 @@ class WorkingMemoryStore:
             # Limpiar contextos expirados
             self._cleanup_expired()
             
-            # Si ya existe, actualizar orden de acceso
-            if context_id in self.store:
-                self.access_order.remove(context_id)
-            
-            # Aplicar límite de capacidad (LRU)
-            if len(self.store) >= self.max_capacity:
-                oldest_id = self.access_order.pop(0)
-                del self.store[oldest_id]
-            
             # Almacenar contexto
-            self.store[context_id] = {
+            entry = {
                 'data': context_data,
                 'created_at': datetime.now(),
                 'last_accessed': datetime.now(),
                 'access_count': 1
             }
-            
-            # Actualizar orden de acceso
-            self.access_order.append(context_id)
+            self._put_entry(context_id, entry)
+            self._persist('working', context_id, entry)
             
             logger.debug(f"Contexto {context_id} almacenado en memoria de trabajo")
             
         except Exception as e:
             logger.error(f"Error almacenando contexto {context_id}: {e}")
     
+    @locked_write
     def retrieve_context(self, context_id: str) -> Optional[Dict[str, Any]]:
         """
         Recupera contexto de memoria de trabajo
@@ -188,8 +193,11 @@ class WorkingMemoryStore:
         """Limpia contextos expirados"""
         self._cleanup_expired()
     
+    @locked_write
     def clear_all(self):
         """Limpia toda la memoria de trabajo"""
+        for context_id in self.store:
+            self._persist('working', context_id)
         self.store.clear()
         self.access_order.clear()
         logger.info("Memoria de trabajo limpiada")
@@ -221,6 +229,7 @@ class WorkingMemoryStore:
             )
         }
     
+    @locked_write
     def _cleanup_expired(self):
         """Limpia contextos expirados"""
         try:
@@ -241,10 +250,31 @@ class WorkingMemoryStore:
         expiry_time = context_entry['created_at'] + timedelta(minutes=self.ttl_minutes)
         return datetime.now() > expiry_time
     
+    @locked_write
+    def _put_entry(self, context_id: str, entry: Dict[str, Any]):
+        """
+        Coloca una entrada como la más reciente del orden LRU
+        
+        Args:
+            context_id: ID del contexto
+            entry: Entrada con 'data', 'created_at', 'last_accessed' y 'access_count'
+        """
+        if context_id in self.store:
+            # Si ya existe, actualizar orden de acceso
+            self.access_order.remove(context_id)
+        elif len(self.store) >= self.max_capacity and self.access_order:
+            # Aplicar límite de capacidad (LRU)
+            self._remove_context(self.access_order[0])
+        
+        self.store[context_id] = entry
+        self.access_order.append(context_id)
+    
+    @locked_write
     def _remove_context(self, context_id: str):
         """Elimina un contexto específico"""
         if context_id in self.store:
             del self.store[context_id]
+            self._persist('working', context_id)
             
         if context_id in self.access_order:
             self.access_order.remove(context_id)
\ No newline at end of file
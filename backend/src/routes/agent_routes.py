@@ -6,7 +6,7 @@ Y distingue entre conversaciones casuales y tareas complejas
 
 from flask import Blueprint, request, jsonify, current_app
 from datetime import datetime
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 import logging
 import time
 import uuid
@@ -50,6 +50,11 @@ from ..services.real_time_feedback import get_feedback_manager, RealTimeFeedback
 # 📄 NUEVO: Importar sistema de documento en vivo para recolección en tiempo real
 from ..services.documento_en_vivo import obtener_documento_en_vivo
 
+# 📏 Compactación de contexto para prompts
+from ..services.prompt_budget import format_previous_results
+from ..services.model_catalog import get_model_catalog
+from ..services.classification_router import ClassificationVote
+
 # 🔥 NUEVO: Importar sistema robusto de validación
 try:
     from .robust_validation_system import RobustValidationSystem
@@ -61,6 +66,9 @@ logger = logging.getLogger(__name__)
 # 🔄 CONSTANTE PARA SISTEMA DE REINTENTOS
 MAX_STEP_RETRIES = 5
 
+# 📏 Tokens máximos de resultados previos inyectados en prompts de análisis
+PREVIOUS_RESULTS_TOKEN_BUDGET = int(os.getenv('PREVIOUS_RESULTS_TOKEN_BUDGET', '600'))
+
 # 🔄 FUNCIONES AUXILIARES PARA SISTEMA DE REINTENTOS
 
 def track_step_retry(task_id: str, step_id: str, current_step: dict, error_message: str) -> dict:
@@ -273,6 +281,7 @@ def health_check():
         # Verificar Ollama
         ollama_service = get_ollama_service()
         ollama_healthy = ollama_service.is_healthy() if ollama_service else False
+        ollama_health = ollama_service.get_health_status() if ollama_service else {}
         
         return jsonify({
             'status': 'healthy',
@@ -284,7 +293,10 @@ def health_check():
                 'size_mb': mongo_status.get('size_mb', 0)
             },
             'ollama': {
-                'connected': ollama_healthy
+                'connected': ollama_healthy,
+                'circuit_state': ollama_health.get('circuit_state'),
+                'last_check_age_seconds': ollama_health.get('last_check_age_seconds'),
+                'models_count': ollama_health.get('models_count', 0)
             },
             'task_manager': {
                 'active_cache_size': len(task_manager.active_cache)
@@ -715,21 +727,26 @@ def get_ollama_queue_status():
                     "warning": "Queue status unavailable in GreenThread context"
                 }
             else:
-                # Usar asyncio normalmente
-                def run_async():
-                    new_loop = asyncio.new_event_loop()
-                    asyncio.set_event_loop(new_loop)
-                    try:
-                        return new_loop.run_until_complete(queue_manager.get_queue_status())
-                    finally:
-                        new_loop.close()
-                
-                with concurrent.futures.ThreadPoolExecutor() as executor:
-                    future = executor.submit(run_async)
-                    status = future.result(timeout=10)
+                # Consultar en el loop persistente que posee la cola
+                status = get_ollama_dispatcher().run(queue_manager.get_queue_status(), timeout=10)
         except Exception as e:
             status = {"error": f"No se pudo obtener estado: {str(e)}", "active_requests": 0, "pending_requests": 0}
         
+        # Métricas de la caché de respuestas LLM
+        ollama_service = get_ollama_service()
+        if ollama_service and hasattr(ollama_service, 'get_cache_stats'):
+            status['response_cache'] = ollama_service.get_cache_stats()
+        if ollama_service and hasattr(ollama_service, 'get_endpoint_pool_status'):
+            endpoint_pool_status = ollama_service.get_endpoint_pool_status()
+            if endpoint_pool_status:
+                status['endpoints'] = endpoint_pool_status
+        if ollama_service and hasattr(ollama_service, 'get_residency_status'):
+            status['model_residency'] = ollama_service.get_residency_status()
+        if ollama_service and hasattr(ollama_service, 'get_prompt_stats'):
+            status['prompt_tokens'] = ollama_service.get_prompt_stats()
+        if ollama_service and hasattr(ollama_service, 'get_classification_stats'):
+            status['classification_routing'] = ollama_service.get_classification_stats()
+        
         # Agregar información adicional
         status['endpoint_info'] = {
             'path': '/api/ollama-queue-status',
@@ -1308,7 +1325,7 @@ def execute_step_with_intelligent_tool_selection(step: dict, task_analysis: dict
                 # Usar versión CON RECOLECCIÓN EN VIVO para documentar información en tiempo real
                 result = execute_web_search_con_recoleccion_en_vivo(step_title, step_description, tool_manager, task_id, original_message)
             elif tool_name == 'enhanced_analysis':
-                result = execute_enhanced_analysis_step(step_title, step_description, ollama_service, original_message, results)
+                result = execute_enhanced_analysis_step(step_title, step_description, ollama_service, original_message, results, task_id)
             elif tool_name == 'multi_source_research':
                 result = execute_multi_source_research_step(step_title, step_description, tool_manager, task_id, original_message)
             elif tool_name in ['analysis', 'data_analysis']:
@@ -2577,10 +2594,11 @@ def consolidate_multi_search_content(all_content: list, title: str, description:
                 simple_content += f"• {content_text[:200]}...\n\n"
         return simple_content
 
-def execute_enhanced_analysis_step(title: str, description: str, ollama_service, original_message: str, previous_results: list) -> dict:
+def execute_enhanced_analysis_step(title: str, description: str, ollama_service, original_message: str, previous_results: list, task_id: str = None) -> dict:
     """
     🧠 SISTEMA JERÁRQUICO DE ANÁLISIS AVANZADO
     Genera sub-análisis específicos, ejecuta múltiples enfoques analíticos y auto-evalúa completitud
+    Con task_id, el texto de cada análisis se transmite en vivo al frontend
     """
     try:
         logger.info(f"🚀 INICIANDO ANÁLISIS JERÁRQUICO: {title}")
@@ -2588,13 +2606,12 @@ def execute_enhanced_analysis_step(title: str, description: str, ollama_service,
         # 🧠 PASO 1: GENERAR SUB-PLAN DE ANÁLISIS INTERNO
         sub_analyses = []
         
-        # Construir contexto con resultados previos
+        # Construir contexto con resultados previos (compactado: se repite en cada sub-análisis)
         context = ""
         if previous_results:
-            context = "\n\nCONTEXTO DE RESULTADOS PREVIOS:\n"
-            for i, prev_result in enumerate(previous_results[-3:]):  # Últimos 3 resultados
-                if prev_result.get('success'):
-                    context += f"- Herramienta {prev_result.get('tool', 'unknown')}: {prev_result.get('result', {}).get('summary', 'Sin resumen')}\n"
+            context = "\n\nCONTEXTO DE RESULTADOS PREVIOS:\n" + format_previous_results(
+                previous_results[-3:], max_tokens=PREVIOUS_RESULTS_TOKEN_BUDGET
+            )
         
         # Crear múltiples tipos de análisis basados en el título y contexto
         keywords = f"{title} {description}".lower()
@@ -2630,17 +2647,18 @@ def execute_enhanced_analysis_step(title: str, description: str, ollama_service,
         
         logger.info(f"📋 Sub-plan de análisis generado con {len(sub_analyses)} enfoques específicos")
         
-        # 📊 PASO 2: EJECUTAR SUB-ANÁLISIS CON DOCUMENTACIÓN PROGRESIVA
+        # 📊 PASO 2: EJECUTAR SUB-ANÁLISIS EN PARALELO CON DOCUMENTACIÓN PROGRESIVA
+        # Los sub-análisis son independientes: la latencia es la del más lento, no la suma
         accumulated_insights = []
         analyses_performed = 0
         
-        for i, sub_analysis in enumerate(sub_analyses):
-            if ollama_service and ollama_service.is_healthy():
-                try:
-                    logger.info(f"🔍 Ejecutando análisis {i+1}/{len(sub_analyses)}: {sub_analysis['focus']}")
-                    
-                    # Generar prompt específico según el tipo
-                    analysis_prompt = generate_hierarchical_analysis_prompt(
+        if ollama_service and ollama_service.is_healthy():
+            try:
+                logger.info(f"🔍 Ejecutando {len(sub_analyses)} análisis en paralelo")
+                
+                # Generar prompt específico según el tipo
+                analysis_prompts = [
+                    generate_hierarchical_analysis_prompt(
                         sub_analysis['prompt_template'],
                         title,
                         description,
@@ -2648,23 +2666,31 @@ def execute_enhanced_analysis_step(title: str, description: str, ollama_service,
                         context,
                         sub_analysis['focus']
                     )
-                    
-                    result = ollama_service.generate_response(analysis_prompt, {'temperature': 0.7})
-                    
-                    if not result.get('error'):
-                        analysis_content = result.get('response', '')
-                        if analysis_content and len(analysis_content) > 50:  # Mínimo contenido
-                            accumulated_insights.append({
-                                'type': sub_analysis['type'],
-                                'focus': sub_analysis['focus'],
-                                'content': analysis_content,
-                                'length': len(analysis_content)
-                            })
-                            analyses_performed += 1
-                            logger.info(f"✅ Análisis {i+1} completado: {len(analysis_content)} caracteres")
-                    
-                except Exception as analysis_error:
-                    logger.warning(f"⚠️ Error en análisis {i+1}: {str(analysis_error)}")
+                    for sub_analysis in sub_analyses
+                ]
+                
+                results = generate_batch_with_live_progress(
+                    ollama_service, analysis_prompts, {'temperature': 0.7}, task_id,
+                    [sub_analysis['focus'] for sub_analysis in sub_analyses]
+                )
+                
+                for i, (sub_analysis, result) in enumerate(zip(sub_analyses, results)):
+                    if result.get('error'):
+                        logger.warning(f"⚠️ Error en análisis {i+1}: {result['error']}")
+                        continue
+                    analysis_content = result.get('response', '')
+                    if analysis_content and len(analysis_content) > 50:  # Mínimo contenido
+                        accumulated_insights.append({
+                            'type': sub_analysis['type'],
+                            'focus': sub_analysis['focus'],
+                            'content': analysis_content,
+                            'length': len(analysis_content)
+                        })
+                        analyses_performed += 1
+                        logger.info(f"✅ Análisis {i+1} completado: {len(analysis_content)} caracteres")
+                
+            except Exception as analysis_error:
+                logger.warning(f"⚠️ Error en análisis jerárquicos: {str(analysis_error)}")
         
         logger.info(f"📚 Análisis jerárquico completado: {analyses_performed} análisis ejecutados")
         
@@ -2699,7 +2725,9 @@ GENERA un análisis integral que incluya:
 FORMATO: Análisis completo y estructurado en español.
                     """
                     
-                    synthesis_result = ollama_service.generate_response(synthesis_prompt, {'temperature': 0.8})
+                    synthesis_result = generate_response_with_live_progress(
+                        ollama_service, synthesis_prompt, {'temperature': 0.8}, task_id, 'Análisis de síntesis integral'
+                    )
                     
                     if not synthesis_result.get('error'):
                         synthesis_content = synthesis_result.get('response', '')
@@ -4437,7 +4465,9 @@ FORMATO: Genera directamente el contenido profesional completo solicitado en esp
 IMPORTANTE: Tu respuesta debe SER el contenido solicitado (informe/análisis/documento), no una descripción de lo que harás.
 """
         
-        result = ollama_service.generate_response(report_prompt, {'temperature': 0.6})
+        result = generate_response_with_live_progress(
+            ollama_service, report_prompt, {'temperature': 0.6}, task_id, title
+        )
         
         if result.get('error'):
             raise Exception(f"Error Ollama: {result['error']}")
@@ -4474,7 +4504,9 @@ PROHIBIDO usar: analizará, evaluará, estudiará, examinará, considerará, pro
 GENERA EL CONTENIDO REAL AHORA (sin introducción meta):
 """
             
-            retry_result = ollama_service.generate_response(ultra_strict_prompt, {'temperature': 0.5})
+            retry_result = generate_response_with_live_progress(
+                ollama_service, ultra_strict_prompt, {'temperature': 0.5}, task_id, title
+            )
             if not retry_result.get('error'):
                 report_content = retry_result.get('response', report_content)
         
@@ -5159,6 +5191,7 @@ Responde de manera específica y práctica.
 # Importar nuevo TaskManager para persistencia
 from ..services.task_manager import get_task_manager
 from src.services.ollama_queue_manager import get_ollama_queue_manager
+from src.services.ollama_dispatcher import get_ollama_dispatcher
 
 # Almacenamiento temporal para compartir conversaciones
 shared_conversations = {}
@@ -5284,11 +5317,76 @@ TASK_PATTERNS = [
     r'ayúdame\b.*\b(con|a crear|a generar|a desarrollar)'
 ]
 
+# Palabras clave que indican tarea aunque no encajen en TASK_PATTERNS
+TASK_KEYWORDS = [
+    'buscar', 'busca', 'investigar', 'investiga', 'analizar', 'analiza',
+    'crear', 'crea', 'generar', 'genera', 'desarrollar', 'desarrolla',
+    'hacer', 'haz', 'escribir', 'escribe', 'dame', 'dime', 'necesito',
+    'quiero', 'puedes', 'ayúdame', 'planificar', 'planifica', 'realizar',
+    'informe', 'reporte', 'análisis', 'estudio', 'investigación'
+]
+
+INTENT_LABELS = frozenset({'casual', 'tarea_investigacion', 'tarea_creacion', 'tarea_analisis', 'otro'})
+
+
+def _parse_intent_vote(response_text: str) -> Optional[ClassificationVote]:
+    """
+    Voto {'intent', 'confidence'} de una respuesta de clasificación
+
+    Una etiqueta desconocida se descarta y una sin confianza declarada
+    cuenta como 0.5, de modo que el router escala al modelo grande.
+    """
+    response_text = response_text.strip()
+    intent_data = None
+    
+    # Estrategia 1: JSON directo
+    cleaned_response = response_text.replace('```json', '').replace('```', '').strip()
+    if cleaned_response.startswith('{') and cleaned_response.endswith('}'):
+        try:
+            intent_data = json.loads(cleaned_response)
+        except json.JSONDecodeError:
+            pass
+    
+    # Estrategia 2: Buscar JSON en el texto
+    if not isinstance(intent_data, dict):
+        json_match = re.search(r'\{[^{}]*"intent"[^{}]*\}', response_text)
+        if json_match:
+            try:
+                intent_data = json.loads(json_match.group())
+            except json.JSONDecodeError:
+                intent_data = None
+    
+    # Estrategia 3: Extracción por regex
+    if not isinstance(intent_data, dict):
+        intent_match = re.search(r'"intent"\s*:\s*"([^"]+)"', response_text)
+        if not intent_match:
+            return None
+        intent_data = {"intent": intent_match.group(1)}
+    
+    intent = str(intent_data.get('intent', '')).lower().strip()
+    if intent not in INTENT_LABELS:
+        return None
+    try:
+        confidence = float(intent_data.get('confidence', 0.5))
+    except (TypeError, ValueError):
+        confidence = 0.5
+    return ClassificationVote(label=intent, confidence=confidence)
+
+
 def is_casual_conversation(message: str) -> bool:
     """
     Detecta si un mensaje es una conversación casual usando clasificación LLM
     Mejora implementada según UPGRADE.md Sección 1: Sistema de Contexto Dinámico Inteligente
+    
+    Los casos claros (saludos cortos, verbos de tarea explícitos) se
+    resuelven con la heurística sin coste; solo los ambiguos pasan por el
+    contexto inteligente y el clasificador LLM.
     """
+    obvious = _obvious_casual_or_task(message)
+    if obvious is not None:
+        logger.debug(f"⚡ Intención resuelta por heurística: '{message[:30]}...' -> {'CASUAL' if obvious else 'TAREA'}")
+        return obvious
+    
     try:
         # Obtener servicio de Ollama para clasificación inteligente
         ollama_service = get_ollama_service()
@@ -5324,15 +5422,15 @@ def is_casual_conversation(message: str) -> bool:
 
 {context_info}
 
-Responde ÚNICAMENTE con un objeto JSON con la clave 'intent'. No agregues explicaciones adicionales.
+Responde ÚNICAMENTE con un objeto JSON con las claves 'intent' y 'confidence' (entre 0 y 1). No agregues explicaciones adicionales.
 
 EJEMPLOS:
-- "hola" -> {{"intent": "casual"}}
-- "¿cómo estás?" -> {{"intent": "casual"}}
-- "gracias" -> {{"intent": "casual"}}
-- "buscar información sobre IA" -> {{"intent": "tarea_investigacion"}}
-- "crear un informe" -> {{"intent": "tarea_creacion"}}
-- "analizar datos" -> {{"intent": "tarea_analisis"}}
+- "hola" -> {{"intent": "casual", "confidence": 0.98}}
+- "¿cómo estás?" -> {{"intent": "casual", "confidence": 0.97}}
+- "gracias" -> {{"intent": "casual", "confidence": 0.95}}
+- "buscar información sobre IA" -> {{"intent": "tarea_investigacion", "confidence": 0.93}}
+- "crear un informe" -> {{"intent": "tarea_creacion", "confidence": 0.92}}
+- "analizar datos" -> {{"intent": "tarea_analisis", "confidence": 0.9}}
 
 Frase a clasificar: "{message}"
 
@@ -5340,77 +5438,41 @@ Respuesta JSON:"""
         
         logger.info(f"🤖 Clasificando intención con LLM para: '{message[:50]}...'")
         
-        # Llamar a Ollama con parámetros optimizados para JSON
-        response = ollama_service.generate_response(intent_prompt, {
-            'temperature': 0.2,  # Más bajo para respuestas consistentes
-            'response_format': 'json'
-        })
-        
-        if response.get('error'):
-            logger.warning(f"⚠️ Error en clasificación LLM: {response['error']}, usando fallback")
-            return _fallback_casual_detection(message)
-        
-        # Parsear respuesta JSON con estrategias robustas
-        response_text = response.get('response', '').strip()
-        logger.info(f"📥 Respuesta LLM clasificación: {response_text[:100]}...")
-        
-        # Intentar parseo JSON con múltiples estrategias
-        intent_data = None
-        
-        # Estrategia 1: JSON directo
-        try:
-            # Limpiar respuesta
-            cleaned_response = response_text.replace('```json', '').replace('```', '').strip()
-            if cleaned_response.startswith('{') and cleaned_response.endswith('}'):
-                intent_data = json.loads(cleaned_response)
-        except json.JSONDecodeError:
-            pass
-        
-        # Estrategia 2: Buscar JSON en el texto
-        if not intent_data:
-            try:
-                json_match = re.search(r'\{[^{}]*"intent"[^{}]*\}', response_text)
-                if json_match:
-                    intent_data = json.loads(json_match.group())
-            except json.JSONDecodeError:
-                pass
-        
-        # Estrategia 3: Extracción por regex
-        if not intent_data:
-            try:
-                intent_match = re.search(r'"intent"\s*:\s*"([^"]+)"', response_text)
-                if intent_match:
-                    intent_data = {"intent": intent_match.group(1)}
-            except:
-                pass
+        # Modelo pequeño primero; escala al modelo actual si la confianza es baja
+        routed = ollama_service.classify(
+            intent_prompt,
+            _parse_intent_vote,
+            call_site='intent_classification',
+            options={'temperature': 0.0, 'num_predict': 60},
+            cache_ttl=3600
+        )
         
-        # Validar resultado
-        if intent_data and 'intent' in intent_data:
-            intent = intent_data['intent'].lower().strip()
-            
-            # Clasificar como casual o tarea
-            is_casual = intent == 'casual'
-            
-            logger.info(f"✅ Clasificación LLM exitosa: '{message[:30]}...' -> {intent} -> {'CASUAL' if is_casual else 'TAREA'}")
-            
-            return is_casual
-        else:
+        if routed is None:
             logger.warning(f"⚠️ No se pudo parsear intención LLM, usando fallback para: {message[:30]}...")
             return _fallback_casual_detection(message)
+        
+        intent = routed.vote.label
+        is_casual = intent == 'casual'
+        logger.info(
+            f"✅ Clasificación LLM exitosa ({routed.model}{', escalada' if routed.escalated else ''}): "
+            f"'{message[:30]}...' -> {intent} -> {'CASUAL' if is_casual else 'TAREA'}"
+        )
+        return is_casual
             
     except Exception as e:
         logger.error(f"❌ Error en clasificación de intención LLM: {str(e)}")
         return _fallback_casual_detection(message)
 
-def _fallback_casual_detection(message: str) -> bool:
+def _obvious_casual_or_task(message: str) -> Optional[bool]:
     """
-    Lógica de respaldo heurística para detección de conversación casual
-    Se usa cuando Ollama no está disponible
+    Pre-filtro heurístico de intención
+
+    Returns:
+        True para un saludo o cortesía corta, False si hay un patrón o
+        palabra clave de tarea explícito, None si el mensaje es ambiguo
     """
     message_lower = message.lower().strip()
     
-    logger.info(f"🔄 Usando detección heurística de respaldo para: '{message[:30]}...'")
-    
     # Mensajes muy cortos (menos de 3 palabras) probablemente son casuales
     if len(message_lower.split()) <= 3:
         for pattern in CASUAL_PATTERNS:
@@ -5422,20 +5484,26 @@ def _fallback_casual_detection(message: str) -> bool:
         if re.search(pattern, message_lower):
             return False
     
-    # Verificar palabras clave que indican tarea (más amplio)
-    task_keywords = [
-        'buscar', 'busca', 'investigar', 'investiga', 'analizar', 'analiza',
-        'crear', 'crea', 'generar', 'genera', 'desarrollar', 'desarrolla',
-        'hacer', 'haz', 'escribir', 'escribe', 'dame', 'dime', 'necesito',
-        'quiero', 'puedes', 'ayúdame', 'planificar', 'planifica', 'realizar',
-        'informe', 'reporte', 'análisis', 'estudio', 'investigación'
-    ]
-    
     # Si contiene palabras clave de tareas, NO es casual
-    for keyword in task_keywords:
+    for keyword in TASK_KEYWORDS:
         if keyword in message_lower:
             return False
     
+    return None
+
+def _fallback_casual_detection(message: str) -> bool:
+    """
+    Lógica de respaldo heurística para detección de conversación casual
+    Se usa cuando Ollama no está disponible
+    """
+    message_lower = message.lower().strip()
+    
+    logger.info(f"🔄 Usando detección heurística de respaldo para: '{message[:30]}...'")
+    
+    obvious = _obvious_casual_or_task(message)
+    if obvious is not None:
+        return obvious
+    
     # Si no hay patrones de tareas y es muy corto, probablemente es casual
     if len(message_lower.split()) <= 5:
         return True
@@ -5447,6 +5515,59 @@ def get_websocket_manager():
     """Obtener la instancia de WebSocketManager desde current_app"""
     return getattr(current_app, 'websocket_manager', None)
 
+def build_report_stream_sink(task_id: str, section_title: str):
+    """
+    📡 Crear un sink que reenvía los tokens de Ollama al informe en vivo
+    
+    El WebSocketManager se resuelve aquí (con contexto de Flask) porque el
+    sink se invoca desde los threads de I/O del despachador de Ollama.
+    """
+    if not task_id:
+        return None
+    websocket_manager = get_websocket_manager()
+    if not websocket_manager:
+        return None
+    
+    def sink(content_delta: str, full_text: str):
+        # Solo el delta: reenviar el texto acumulado en cada lote crece de forma cuadrática
+        if content_delta:
+            websocket_manager.send_report_progress(task_id, section_title, content_delta)
+    
+    return sink
+
+def generate_response_with_live_progress(ollama_service, prompt: str, context: dict, task_id: str, section_title: str,
+                                         use_tools: bool = False) -> dict:
+    """
+    📡 Generar respuesta mostrando el texto en vivo si hay una tarea escuchando
+    
+    Usa streaming de Ollama con envío por lotes vía WebSocket; sin task_id o
+    sin WebSocket se comporta exactamente como generate_response (con el
+    mismo use_tools en ambos caminos).
+    """
+    sink = build_report_stream_sink(task_id, section_title)
+    if sink and hasattr(ollama_service, 'generate_streaming_response'):
+        return ollama_service.generate_streaming_response(prompt, context, use_tools=use_tools, on_chunk=sink,
+                                                          task_id=task_id)
+    return ollama_service.generate_response(prompt, context, use_tools=use_tools)
+
+def generate_batch_with_live_progress(ollama_service, prompts: list, context: dict, task_id: str, section_titles: list,
+                                      use_tools: bool = False) -> list:
+    """
+    📦 Generar varias respuestas independientes en paralelo con texto en vivo
+    
+    Cada prompt transmite su texto a su propia sección del informe. Si el
+    servicio no tiene generate_batch se ejecutan uno tras otro.
+    """
+    if not hasattr(ollama_service, 'generate_batch'):
+        return [
+            generate_response_with_live_progress(ollama_service, prompt, context, task_id, section_title,
+                                                 use_tools=use_tools)
+            for prompt, section_title in zip(prompts, section_titles)
+        ]
+    sinks = [build_report_stream_sink(task_id, section_title) for section_title in section_titles]
+    return ollama_service.generate_batch(prompts, context, use_tools=use_tools, task_id=task_id,
+                                         step_id='hierarchical_analysis', on_chunks=sinks)
+
 def get_ollama_service():
     """Obtener servicio de Ollama"""
     try:
@@ -5457,6 +5578,22 @@ def get_ollama_service():
         logger.error("❌ Ollama service not available")
         return None
 
+def prepare_plan_models(ollama_service, plan_steps: list) -> None:
+    """
+    🔥 Precargar en segundo plano el modelo que usarán los pasos del plan
+    
+    Evita que el primer paso pague la carga en frío del modelo y agote su
+    timeout. Nunca bloquea ni interrumpe la ejecución.
+    """
+    if not ollama_service or not hasattr(ollama_service, 'prepare_models_for_plan'):
+        return
+    try:
+        scheduled = ollama_service.prepare_models_for_plan(plan_steps)
+        if scheduled:
+            logger.info(f"🔥 Precarga de modelos lanzada para el plan: {scheduled}")
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo precargar modelos del plan: {e}")
+
 def get_intelligent_context_manager():
     """Obtener gestor de contexto inteligente"""
     try:
@@ -5591,6 +5728,7 @@ def execute_plan_with_real_tools(task_id: str, plan_steps: list, message: str):
         # Obtener servicios ANTES de crear el hilo
         ollama_service = get_ollama_service()
         tool_manager = get_tool_manager()
+        prepare_plan_models(ollama_service, plan_steps)
         
         # Obtener WebSocket manager para actualizaciones en tiempo real
         # Mejora implementada según UPGRADE.md Sección 3: WebSockets para Comunicación en Tiempo Real
@@ -6940,10 +7078,10 @@ Tu respuesta debe ser ÚNICAMENTE el título:
 """
         
         response = ollama_service.generate_response(title_prompt, {
-            'temperature': 0.3,  # Creativo pero controlado
+            'temperature': 0.0,  # Determinista: el mismo mensaje da el mismo título (cacheable)
             'max_tokens': 100,   # Título corto
             'top_p': 0.9
-        })
+        }, cache_ttl=86400, cache_tag='task_title')
         
         if response.get('error'):
             logger.warning(f"⚠️ Error generating title with LLM: {response['error']}")
@@ -8203,12 +8341,29 @@ def get_model_info():
         # Verificar conexión con Ollama
         connection_status = ollama_service.check_connection()
         
+        # Catálogo multi-proveedor: recomendación por tipo de tarea y telemetría
+        try:
+            catalog_status = ollama_service.get_model_catalog_status()
+            task_type = request.args.get('task_type')
+            if task_type:
+                recommended = get_model_catalog().select(
+                    task_type, prefer_local=request.args.get('prefer_local', 'true').lower() != 'false'
+                )
+                catalog_status['selection'] = {
+                    'task_type': task_type,
+                    'model': recommended.key if recommended is not None else None
+                }
+        except Exception as e:
+            logger.warning(f"Error getting model catalog: {e}")
+            catalog_status = {'error': str(e)}
+        
         return jsonify({
             "status": "success",
             "current_model": current_model_info,
             "available_configs": available_configs,
             "ollama_connection": connection_status,
-            "total_configured_models": len(available_configs)
+            "total_configured_models": len(available_configs),
+            "model_catalog": catalog_status
         }), 200
         
     except Exception as e:
@@ -9257,6 +9412,9 @@ def execute_task_steps_sequentially(task_id: str, steps: list):
     if hasattr(current_app, 'websocket_manager') and current_app.websocket_manager:
         feedback_manager.websocket_manager = current_app.websocket_manager
     
+    # 🔥 Cargar ya los modelos que necesitarán los pasos
+    prepare_plan_models(get_ollama_service(), steps)
+    
     # 🆕 OBTENER MENSAJE ORIGINAL DE LA TAREA PARA VALIDACIÓN DE RELEVANCIA
     original_message = ""
     try:
@@ -11099,36 +11257,6 @@ def chat():
         return jsonify({'error': str(e)}), 500
 
 
-def is_casual_conversation(message: str) -> bool:
-    """Determine if a message is casual conversation or a task request"""
-    casual_patterns = [
-        'hola', 'hello', 'hi', 'hey', 'saludos', 'buenos días', 'buenas tardes',
-        'buenas noches', 'qué tal', 'cómo estás', 'gracias', 'thank you',
-        'adiós', 'goodbye', 'bye', 'hasta luego'
-    ]
-    
-    message_lower = message.lower().strip()
-    
-    # Check if message is short and matches casual patterns
-    if len(message_lower) < 50 and any(pattern in message_lower for pattern in casual_patterns):
-        return True
-    
-    # Check for task indicators
-    task_patterns = [
-        'crear', 'crear un', 'hacer', 'generar', 'desarrollar', 'analizar',
-        'create', 'make', 'generate', 'develop', 'analyze', 'write',
-        'necesito', 'quiero', 'puedes', 'ayúdame', 'help me', 'can you',
-        'análisis', 'analysis', 'mercado', 'market', 'plan', 'task', 'tarea',
-        'informe', 'report', 'documento', 'document', 'buscar', 'search'
-    ]
-    
-    if any(pattern in message_lower for pattern in task_patterns):
-        return False
-    
-    # Default to TASK (not casual) if uncertain - most messages should be treated as tasks
-    return len(message_lower) < 10  # Only very short messages are casual
-
-
 # FIN del archivo - función duplicada removida
 
 @agent_bp.route('/delete-task/<task_id>', methods=['DELETE'])
@@ -0,0 +1,261 @@
+"""
+🪜 ENRUTADO ESPECULATIVO DE CLASIFICACIONES (MODELO PEQUEÑO PRIMERO)
+===================================================================
+
+Las clasificaciones (intención, conversación casual, categoría de tarea)
+son prompts cortos con una respuesta de una etiqueta, pero se enviaban al
+modelo actual, normalmente el grande. Este router:
+
+- Envía primero el prompt a un modelo pequeño (ya residente)
+- Acepta su respuesta si la etiqueta es válida y la confianza declarada
+  supera el umbral; si no, escala al modelo grande
+- Cada `audit_every` respuestas aceptadas repite la clasificación con el
+  modelo grande en segundo plano para medir la precisión del pequeño
+- Lleva contadores por ruta: latencias de cada modelo, tasa de escalado,
+  acuerdo pequeño/grande y segundos ahorrados estimados
+
+La generación y el parseo los inyecta el llamador (OllamaService,
+ModelManager), así que el router no depende del proveedor.
+"""
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ClassificationVote:
+    """🗳️ Respuesta parseada de un modelo: etiqueta, confianza y objeto original"""
+    label: str
+    confidence: float
+    payload: Any = None
+
+
+@dataclass
+class RoutedClassification:
+    """📦 Resultado final de una clasificación enrutada"""
+    vote: ClassificationVote
+    model: str
+    escalated: bool
+    latency_seconds: float
+    raw_response: str = ''
+    cached: bool = False
+
+
+# modelo -> texto de respuesta (None si la llamada falla)
+GenerateFn = Callable[[str], Optional[str]]
+# texto -> voto (None si no se puede parsear)
+ParseFn = Callable[[str], Optional[ClassificationVote]]
+
+
+@dataclass
+class RouteStats:
+    """📊 Contadores de una ruta de clasificación"""
+    calls: int = 0
+    small_attempts: int = 0
+    small_accepted: int = 0
+    small_unparsed: int = 0
+    escalations: int = 0
+    large_calls: int = 0
+    failures: int = 0
+    small_seconds: float = 0.0
+    large_seconds: float = 0.0
+    escalation_compared: int = 0
+    escalation_agreements: int = 0
+    audits: int = 0
+    audit_agreements: int = 0
+
+
+class ClassificationRouter:
+    """
+    🪜 ROUTER PEQUEÑO → GRANDE CON ESCALADO POR CONFIANZA
+
+    Args:
+        confidence_threshold: Confianza mínima para aceptar el modelo pequeño
+        audit_every: Cada cuántas respuestas aceptadas se audita con el grande (0 = nunca)
+    """
+
+    def __init__(self, confidence_threshold: float = 0.75, audit_every: int = 20):
+        self.confidence_threshold = confidence_threshold
+        self.audit_every = audit_every
+
+        self._stats: Dict[str, RouteStats] = {}
+        self._lock = threading.Lock()
+        self._audit_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='classifier_audit')
+
+    def _route_stats(self, call_site: str) -> RouteStats:
+        return self._stats.setdefault(call_site, RouteStats())
+
+    @staticmethod
+    def _attempt(generate_fn: GenerateFn, parse_fn: ParseFn, model: str):
+        started = time.monotonic()
+        try:
+            raw = generate_fn(model)
+        except Exception as e:
+            logger.warning(f"⚠️ Clasificación con {model} falló: {e}")
+            raw = None
+        latency = time.monotonic() - started
+        vote = None
+        if raw:
+            try:
+                vote = parse_fn(raw)
+            except Exception as e:
+                logger.debug(f"Respuesta de clasificación no parseable ({model}): {e}")
+        return raw or '', vote, latency
+
+    def classify(self,
+                 call_site: str,
+                 generate_fn: GenerateFn,
+                 parse_fn: ParseFn,
+                 small_model: Optional[str],
+                 large_model: str,
+                 confidence_threshold: Optional[float] = None) -> Optional[RoutedClassification]:
+        """
+        🎯 CLASIFICAR EMPEZANDO POR EL MODELO PEQUEÑO
+
+        Si el grande tampoco da un voto válido se devuelve el del pequeño
+        aunque su confianza sea baja.
+
+        Returns:
+            Clasificación o None si ningún modelo dio un voto válido
+        """
+        threshold = self.confidence_threshold if confidence_threshold is None else confidence_threshold
+        started = time.monotonic()
+        small_vote = None
+        small_raw = ''
+
+        with self._lock:
+            self._route_stats(call_site).calls += 1
+
+        if small_model and small_model != large_model:
+            small_raw, small_vote, latency = self._attempt(generate_fn, parse_fn, small_model)
+            accepted = small_vote is not None and small_vote.confidence >= threshold
+            with self._lock:
+                stats = self._route_stats(call_site)
+                stats.small_attempts += 1
+                stats.small_seconds += latency
+                stats.small_unparsed += int(small_vote is None)
+                if accepted:
+                    stats.small_accepted += 1
+                    audit = self.audit_every > 0 and stats.small_accepted % self.audit_every == 0
+                else:
+                    stats.escalations += 1
+                    audit = False
+            if accepted:
+                if audit:
+                    self._audit_executor.submit(
+                        self._audit, call_site, generate_fn, parse_fn, large_model, small_vote.label
+                    )
+                return RoutedClassification(
+                    vote=small_vote, model=small_model, escalated=False,
+                    latency_seconds=time.monotonic() - started, raw_response=small_raw
+                )
+            logger.info(
+                f"🪜 {call_site}: {small_model} sin confianza suficiente "
+                f"({small_vote.confidence if small_vote else 'sin voto'}), escalando a {large_model}"
+            )
+
+        large_raw, large_vote, latency = self._attempt(generate_fn, parse_fn, large_model)
+        with self._lock:
+            stats = self._route_stats(call_site)
+            stats.large_calls += 1
+            stats.large_seconds += latency
+            if small_vote is not None and large_vote is not None:
+                stats.escalation_compared += 1
+                stats.escalation_agreements += int(small_vote.label == large_vote.label)
+            if large_vote is None and small_vote is None:
+                stats.failures += 1
+
+        if large_vote is not None:
+            return RoutedClassification(
+                vote=large_vote, model=large_model, escalated=bool(small_model and small_model != large_model),
+                latency_seconds=time.monotonic() - started, raw_response=large_raw
+            )
+        if small_vote is not None:
+            return RoutedClassification(
+                vote=small_vote, model=small_model, escalated=True,
+                latency_seconds=time.monotonic() - started, raw_response=small_raw
+            )
+        return None
+
+    def _audit(self, call_site: str, generate_fn: GenerateFn, parse_fn: ParseFn,
+               large_model: str, small_label: str) -> None:
+        """Repetir con el modelo grande una clasificación aceptada y comparar"""
+        _, vote, latency = self._attempt(generate_fn, parse_fn, large_model)
+        if vote is None:
+            return
+        with self._lock:
+            stats = self._route_stats(call_site)
+            stats.audits += 1
+            stats.audit_agreements += int(vote.label == small_label)
+            stats.large_calls += 1
+            stats.large_seconds += latency
+
+    def get_stats(self) -> Dict[str, Any]:
+        """📊 Latencia, escalado, precisión estimada y ahorro por ruta"""
+        with self._lock:
+            routes = {}
+            for call_site, stats in self._stats.items():
+                avg_small = stats.small_seconds / stats.small_attempts if stats.small_attempts else None
+                avg_large = stats.large_seconds / stats.large_calls if stats.large_calls else None
+                # Sin el router, cada respuesta aceptada del pequeño habría costado una llamada al grande
+                saved = (
+                    stats.small_accepted * avg_large - stats.small_seconds
+                    if avg_large is not None else None
+                )
+                routes[call_site] = {
+                    'calls': stats.calls,
+                    'small_attempts': stats.small_attempts,
+                    'small_accepted': stats.small_accepted,
+                    'small_unparsed': stats.small_unparsed,
+                    'escalations': stats.escalations,
+                    'escalation_rate': round(stats.escalations / stats.small_attempts, 3) if stats.small_attempts else None,
+                    'large_calls': stats.large_calls,
+                    'failures': stats.failures,
+                    'avg_small_latency_seconds': round(avg_small, 3) if avg_small is not None else None,
+                    'avg_large_latency_seconds': round(avg_large, 3) if avg_large is not None else None,
+                    'escalation_agreement_rate': (
+                        round(stats.escalation_agreements / stats.escalation_compared, 3)
+                        if stats.escalation_compared else None
+                    ),
+                    'audits': stats.audits,
+                    'small_accuracy': round(stats.audit_agreements / stats.audits, 3) if stats.audits else None,
+                    'estimated_seconds_saved': round(saved, 2) if saved is not None else None
+                }
+            return {
+                'confidence_threshold': self.confidence_threshold,
+                'audit_every': self.audit_every,
+                'routes': routes
+            }
+
+
+# 🌐 INSTANCIA GLOBAL
+_global_router: Optional[ClassificationRouter] = None
+_global_router_lock = threading.Lock()
+
+
+def get_classification_router() -> ClassificationRouter:
+    """
+    🌐 OBTENER EL ROUTER GLOBAL
+
+    CLASSIFIER_CONFIDENCE_THRESHOLD fija el umbral de escalado y
+    CLASSIFIER_AUDIT_EVERY la frecuencia de auditoría (0 la desactiva).
+    """
+    global _global_router
+
+    if _global_router is None:
+        with _global_router_lock:
+            if _global_router is None:
+                _global_router = ClassificationRouter(
+                    confidence_threshold=float(os.getenv('CLASSIFIER_CONFIDENCE_THRESHOLD', '0.75')),
+                    audit_every=int(os.getenv('CLASSIFIER_AUDIT_EVERY', '20'))
+                )
+                logger.info("🌐 Nueva instancia global de ClassificationRouter creada")
+
+    return _global_router
@@ -0,0 +1,313 @@
+"""
+🔌 POOL COMPARTIDO DE SESIONES HTTP PARA OLLAMA Y OPENROUTER
+============================================================
+
+Las llamadas con `requests.get`/`requests.post` sueltos abren una conexión
+TCP nueva (y un handshake TLS en OpenRouter) por cada request. Este módulo
+mantiene una `requests.Session` por host con keep-alive y un pool de
+conexiones configurable:
+
+- Tamaño de pool por host (defecto global + overrides por host)
+- Política de reintentos con backoff exponencial: los errores de conexión
+  se reintentan siempre (el request nunca llegó al servidor); los códigos
+  de estado reintentables solo en métodos permitidos para ese host
+- Timeouts separados de conexión y lectura
+- Sesiones sin reintentos para sondas de salud, que deben fallar rápido
+
+Configurable por entorno:
+- HTTP_POOL_CONNECTIONS / HTTP_POOL_MAXSIZE: tamaño del pool por host
+- HTTP_MAX_RETRIES / HTTP_RETRY_BACKOFF: reintentos y factor de backoff
+- HTTP_CONNECT_TIMEOUT / HTTP_READ_TIMEOUT: timeouts por defecto (s)
+- HTTP_POOL_HOSTS: JSON con overrides por host, p.ej.
+  '{"openrouter.ai": {"pool_maxsize": 4, "max_retries": 5}}'
+"""
+
+import json
+import logging
+import os
+import threading
+from dataclasses import dataclass, field, replace
+from typing import Any, Dict, FrozenSet, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS'})
+
+
+@dataclass(frozen=True)
+class HTTPPoolConfig:
+    """
+    ⚙️ CONFIGURACIÓN DE POOL Y REINTENTOS PARA UN HOST
+    """
+    pool_connections: int = 4
+    pool_maxsize: int = 16
+    max_retries: int = 2
+    backoff_factor: float = 0.5
+    retry_statuses: Tuple[int, ...] = (429, 502, 503, 504)
+    retry_methods: FrozenSet[str] = field(default_factory=lambda: IDEMPOTENT_METHODS)
+    connect_timeout: float = 5.0
+    read_timeout: float = 180.0
+
+    def build_retry(self) -> Retry:
+        """Política de urllib3: sin reintentos de lectura para no duplicar generaciones"""
+        params = dict(
+            total=self.max_retries,
+            connect=self.max_retries,
+            read=0,
+            status=self.max_retries,
+            backoff_factor=self.backoff_factor,
+            status_forcelist=self.retry_statuses,
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+        try:
+            return Retry(allowed_methods=self.retry_methods, **params)
+        except TypeError:
+            # urllib3 < 1.26
+            return Retry(method_whitelist=self.retry_methods, **params)
+
+
+class HTTPSessionPool:
+    """
+    🔌 REGISTRO DE SESIONES HTTP CON KEEP-ALIVE, UNA POR HOST
+
+    Args:
+        default_config: Configuración para hosts sin override
+        host_overrides: Campos de HTTPPoolConfig a sobrescribir por host
+                        (clave = hostname, sin esquema ni puerto)
+    """
+
+    def __init__(self,
+                 default_config: Optional[HTTPPoolConfig] = None,
+                 host_overrides: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.default_config = default_config or HTTPPoolConfig()
+        self._host_overrides: Dict[str, Dict[str, Any]] = dict(host_overrides or {})
+        self._sessions: Dict[str, requests.Session] = {}
+        self._probe_sessions: Dict[str, requests.Session] = {}
+        self._configs: Dict[str, HTTPPoolConfig] = {}
+        self._lock = threading.Lock()
+
+        # Métricas por origen
+        self._requests_by_origin: Dict[str, int] = {}
+        self._errors_by_origin: Dict[str, int] = {}
+
+    @staticmethod
+    def origin_of(url: str) -> str:
+        """scheme://host[:port] de una URL"""
+        parts = urlsplit(url)
+        return f"{parts.scheme}://{parts.netloc}".lower()
+
+    def configure_host(self, host: str, **overrides: Any) -> None:
+        """
+        🎛️ AJUSTAR LA CONFIGURACIÓN DE UN HOST
+
+        Si ya existe una sesión para ese host se cierra y se recrea en la
+        siguiente petición con la nueva configuración.
+        """
+        with self._lock:
+            self._host_overrides.setdefault(host.lower(), {}).update(overrides)
+            stale = [origin for origin in self._sessions if urlsplit(origin).hostname == host.lower()]
+            for origin in stale:
+                self._sessions.pop(origin).close()
+                self._configs.pop(origin, None)
+            for origin in [origin for origin in self._probe_sessions if urlsplit(origin).hostname == host.lower()]:
+                self._probe_sessions.pop(origin).close()
+
+    def config_for(self, url: str) -> HTTPPoolConfig:
+        """Configuración efectiva para el host de una URL"""
+        origin = self.origin_of(url)
+        config = self._configs.get(origin)
+        if config is not None:
+            return config
+        overrides = self._host_overrides.get(urlsplit(origin).hostname or '', {})
+        if 'retry_methods' in overrides:
+            overrides = dict(overrides, retry_methods=frozenset(m.upper() for m in overrides['retry_methods']))
+        if 'retry_statuses' in overrides:
+            overrides = dict(overrides, retry_statuses=tuple(overrides['retry_statuses']))
+        return replace(self.default_config, **overrides)
+
+    def session_for(self, url: str, retry: bool = True) -> requests.Session:
+        """
+        🔗 OBTENER LA SESIÓN COMPARTIDA DEL HOST DE `url`
+
+        Las sesiones de requests son seguras para uso concurrente desde
+        varios threads siempre que no se muten cabeceras/cookies globales,
+        por eso las cabeceras se pasan siempre por petición.
+
+        Con retry=False se devuelve la sesión de sondeo del host: mismo pool
+        pero sin reintentos ni backoff, para que una sonda de salud contra
+        un servidor caído falle en un solo connect_timeout.
+        """
+        if not retry:
+            return self._probe_session_for(url)
+        origin = self.origin_of(url)
+        session = self._sessions.get(origin)
+        if session is not None:
+            return session
+
+        with self._lock:
+            session = self._sessions.get(origin)
+            if session is None:
+                config = self.config_for(url)
+                session = self._build_session(origin, config)
+                self._configs[origin] = config
+                self._sessions[origin] = session
+                logger.info(
+                    f"🔌 Sesión HTTP creada para {origin} "
+                    f"(pool={config.pool_maxsize}, reintentos={config.max_retries})"
+                )
+            return session
+
+    def _probe_session_for(self, url: str) -> requests.Session:
+        origin = self.origin_of(url)
+        session = self._probe_sessions.get(origin)
+        if session is not None:
+            return session
+
+        with self._lock:
+            session = self._probe_sessions.get(origin)
+            if session is None:
+                session = self._build_session(origin, replace(self.config_for(url), max_retries=0))
+                self._probe_sessions[origin] = session
+            return session
+
+    def timeout(self, url: str, read: Optional[float] = None,
+                connect: Optional[float] = None) -> Tuple[float, float]:
+        """Tupla (connect, read) para pasar como `timeout=` a requests"""
+        config = self.config_for(url)
+        return (
+            connect if connect is not None else config.connect_timeout,
+            read if read is not None else config.read_timeout
+        )
+
+    def request(self, method: str, url: str, *,
+                read_timeout: Optional[float] = None,
+                connect_timeout: Optional[float] = None,
+                retry: bool = True,
+                **kwargs: Any) -> requests.Response:
+        """
+        🌐 HACER UNA PETICIÓN USANDO LA SESIÓN DEL HOST
+
+        Acepta los mismos kwargs que requests (json, headers, stream...). Si
+        no se pasa `timeout` se usa (connect_timeout, read_timeout). Con
+        retry=False se usa la sesión de sondeo, sin reintentos.
+        """
+        if 'timeout' not in kwargs:
+            kwargs['timeout'] = self.timeout(url, read=read_timeout, connect=connect_timeout)
+        return self.session_for(url, retry=retry).request(method, url, **kwargs)
+
+    def get(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request('POST', url, **kwargs)
+
+    def close(self) -> None:
+        """🛑 Cerrar todas las sesiones y sus conexiones"""
+        with self._lock:
+            for session in [*self._sessions.values(), *self._probe_sessions.values()]:
+                session.close()
+            self._sessions.clear()
+            self._probe_sessions.clear()
+            self._configs.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """📊 Sesiones abiertas y peticiones por origen"""
+        return {
+            'sessions': len(self._sessions),
+            'origins': {
+                origin: {
+                    'pool_maxsize': self._configs[origin].pool_maxsize,
+                    'max_retries': self._configs[origin].max_retries,
+                    'requests': self._requests_by_origin.get(origin, 0),
+                    'server_errors': self._errors_by_origin.get(origin, 0)
+                }
+                for origin in list(self._sessions)
+                if origin in self._configs
+            }
+        }
+
+    def _build_session(self, origin: str, config: HTTPPoolConfig) -> requests.Session:
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=config.pool_connections,
+            pool_maxsize=config.pool_maxsize,
+            max_retries=config.build_retry()
+        )
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.hooks['response'].append(lambda response, *args, **kwargs: self._record(origin, response))
+        return session
+
+    def _record(self, origin: str, response: requests.Response) -> None:
+        self._requests_by_origin[origin] = self._requests_by_origin.get(origin, 0) + 1
+        if response.status_code >= 500:
+            self._errors_by_origin[origin] = self._errors_by_origin.get(origin, 0) + 1
+
+
+# 🌐 INSTANCIA GLOBAL
+_global_pool: Optional[HTTPSessionPool] = None
+_global_pool_lock = threading.Lock()
+
+
+def _load_host_overrides() -> Dict[str, Dict[str, Any]]:
+    raw = os.getenv('HTTP_POOL_HOSTS', '')
+    if not raw:
+        return {}
+    try:
+        overrides = json.loads(raw)
+        return {host.lower(): dict(values) for host, values in overrides.items()}
+    except (ValueError, AttributeError, TypeError) as e:
+        logger.warning(f"⚠️ HTTP_POOL_HOSTS inválido, se ignora: {e}")
+        return {}
+
+
+def get_http_session_pool() -> HTTPSessionPool:
+    """
+    🌐 OBTENER EL POOL GLOBAL DE SESIONES HTTP
+
+    OpenRouter se registra por defecto con reintentos también en POST para
+    429/503 (el servidor rechaza el request sin procesarlo) y con un pool
+    más pequeño.
+    """
+    global _global_pool
+
+    if _global_pool is None:
+        with _global_pool_lock:
+            if _global_pool is None:
+                default_config = HTTPPoolConfig(
+                    pool_connections=int(os.getenv('HTTP_POOL_CONNECTIONS', '4')),
+                    pool_maxsize=int(os.getenv('HTTP_POOL_MAXSIZE', '16')),
+                    max_retries=int(os.getenv('HTTP_MAX_RETRIES', '2')),
+                    backoff_factor=float(os.getenv('HTTP_RETRY_BACKOFF', '0.5')),
+                    connect_timeout=float(os.getenv('HTTP_CONNECT_TIMEOUT', '5')),
+                    read_timeout=float(os.getenv('HTTP_READ_TIMEOUT', '180'))
+                )
+                host_overrides = {
+                    'openrouter.ai': {
+                        'pool_maxsize': 8,
+                        'retry_statuses': (429, 503),
+                        'retry_methods': IDEMPOTENT_METHODS | {'POST'}
+                    }
+                }
+                for host, values in _load_host_overrides().items():
+                    host_overrides.setdefault(host, {}).update(values)
+                _global_pool = HTTPSessionPool(default_config, host_overrides)
+                logger.info("🌐 Nueva instancia global de HTTPSessionPool creada")
+
+    return _global_pool
+
+
+def shutdown_http_session_pool() -> None:
+    """🛑 Cerrar el pool global"""
+    global _global_pool
+
+    with _global_pool_lock:
+        if _global_pool is not None:
+            _global_pool.close()
+            _global_pool = None
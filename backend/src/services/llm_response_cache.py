@@ -0,0 +1,273 @@
+"""
+🗄️ CACHÉ DE RESPUESTAS DEL LLM DIRECCIONADA POR CONTENIDO
+=========================================================
+
+Muchas llamadas a Ollama son clasificaciones o extracciones prácticamente
+deterministas (intención del mensaje, título de tarea, palabras clave de
+búsqueda). Repetirlas en reintentos o tareas similares gasta 10-60s de GPU.
+
+Esta caché guarda respuestas con clave (modelo, prompt normalizado, opciones):
+- Nivel 1: LRU en memoria (OrderedDict)
+- Nivel 2 (opcional): SQLite en disco, compartido entre reinicios/procesos
+- TTL por entrada (lo decide cada punto de llamada)
+- Métricas de aciertos/fallos globales y por punto de llamada
+
+El uso es opt-in: solo se cachea cuando el llamador indica un cache_ttl.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+class LLMResponseCache:
+    """
+    🗄️ CACHÉ DE DOS NIVELES PARA RESPUESTAS DE OLLAMA
+
+    Args:
+        max_entries: Capacidad del nivel en memoria
+        db_path: Ruta del fichero SQLite para el nivel en disco (None = desactivado)
+        default_ttl: TTL (s) si el llamador no especifica uno
+    """
+
+    def __init__(self,
+                 max_entries: int = 1000,
+                 db_path: Optional[str] = None,
+                 default_ttl: float = 3600.0):
+        self.max_entries = max_entries
+        self.db_path = db_path
+        self.default_ttl = default_ttl
+
+        self._memory: "OrderedDict[str, Tuple[Dict[str, Any], float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+
+        # Métricas
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self._per_tag: Dict[str, Dict[str, int]] = {}
+
+        if db_path:
+            self._init_disk_tier(db_path)
+
+    # ------------------------------------------------------------------
+    # Claves
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def normalize_prompt(prompt: str) -> str:
+        """Normalizar espacios para que diferencias de formato no rompan la clave"""
+        return _WHITESPACE_RE.sub(' ', prompt or '').strip()
+
+    @classmethod
+    def make_key(cls, model: str, prompt: str, options: Optional[Dict[str, Any]] = None) -> str:
+        """Clave SHA-256 sobre (modelo, prompt normalizado, opciones ordenadas)"""
+        material = json.dumps(
+            {
+                'model': model,
+                'prompt': cls.normalize_prompt(prompt),
+                'options': options or {}
+            },
+            sort_keys=True,
+            ensure_ascii=False,
+            default=str
+        )
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    # ------------------------------------------------------------------
+    # Nivel en disco
+    # ------------------------------------------------------------------
+
+    def _init_disk_tier(self, db_path: str) -> None:
+        try:
+            directory = os.path.dirname(db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS llm_cache ('
+                ' key TEXT PRIMARY KEY,'
+                ' value TEXT NOT NULL,'
+                ' expires_at REAL NOT NULL,'
+                ' created_at REAL NOT NULL)'
+            )
+            self._db.execute('CREATE INDEX IF NOT EXISTS idx_llm_cache_expires ON llm_cache(expires_at)')
+            self._db.commit()
+            logger.info(f"🗄️ Nivel en disco de la caché LLM activo: {db_path}")
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo abrir la caché LLM en disco ({db_path}): {e}")
+            self._db = None
+
+    def _disk_get(self, key: str, now: float) -> Optional[Tuple[Dict[str, Any], float]]:
+        if self._db is None:
+            return None
+        try:
+            row = self._db.execute(
+                'SELECT value, expires_at FROM llm_cache WHERE key = ?', (key,)
+            ).fetchone()
+        except Exception as e:
+            logger.warning(f"⚠️ Error leyendo caché LLM en disco: {e}")
+            return None
+
+        if not row:
+            return None
+        value, expires_at = row
+        if expires_at < now:
+            self._db.execute('DELETE FROM llm_cache WHERE key = ?', (key,))
+            self._db.commit()
+            return None
+        return json.loads(value), expires_at
+
+    def _disk_set(self, key: str, value: Dict[str, Any], expires_at: float) -> None:
+        if self._db is None:
+            return
+        try:
+            self._db.execute(
+                'INSERT OR REPLACE INTO llm_cache (key, value, expires_at, created_at) VALUES (?, ?, ?, ?)',
+                (key, json.dumps(value, ensure_ascii=False, default=str), expires_at, time.time())
+            )
+            self._db.commit()
+        except Exception as e:
+            logger.warning(f"⚠️ Error escribiendo caché LLM en disco: {e}")
+
+    # ------------------------------------------------------------------
+    # API pública
+    # ------------------------------------------------------------------
+
+    def get(self, key: str, tag: str = "") -> Optional[Dict[str, Any]]:
+        """Obtener una respuesta cacheada vigente (None si no existe o expiró)"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at >= now:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    self._count(tag, 'hits')
+                    return dict(value)
+                del self._memory[key]
+
+            disk_entry = self._disk_get(key, now)
+            if disk_entry is not None:
+                value, expires_at = disk_entry
+                self._memory_set(key, value, expires_at)
+                self.disk_hits += 1
+                self._count(tag, 'hits')
+                return dict(value)
+
+            self.misses += 1
+            self._count(tag, 'misses')
+            return None
+
+    def set(self, key: str, value: Dict[str, Any], ttl: Optional[float] = None, tag: str = "") -> None:
+        """Guardar una respuesta con su TTL"""
+        expires_at = time.time() + (ttl if ttl is not None else self.default_ttl)
+        with self._lock:
+            self._memory_set(key, value, expires_at)
+            self._disk_set(key, value, expires_at)
+            self.stores += 1
+            self._count(tag, 'stores')
+
+    def invalidate(self, key: str) -> None:
+        """Eliminar una entrada de ambos niveles"""
+        with self._lock:
+            self._memory.pop(key, None)
+            if self._db is not None:
+                self._db.execute('DELETE FROM llm_cache WHERE key = ?', (key,))
+                self._db.commit()
+
+    def clear(self) -> None:
+        """Vaciar ambos niveles"""
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute('DELETE FROM llm_cache')
+                self._db.commit()
+
+    def purge_expired(self) -> int:
+        """Eliminar entradas expiradas; devuelve cuántas se borraron de memoria"""
+        now = time.time()
+        with self._lock:
+            expired = [key for key, (_, expires_at) in self._memory.items() if expires_at < now]
+            for key in expired:
+                del self._memory[key]
+            if self._db is not None:
+                self._db.execute('DELETE FROM llm_cache WHERE expires_at < ?', (now,))
+                self._db.commit()
+        return len(expired)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """📊 Métricas de la caché"""
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            'memory_entries': len(self._memory),
+            'max_entries': self.max_entries,
+            'disk_enabled': self._db is not None,
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'stores': self.stores,
+            'evictions': self.evictions,
+            'hit_rate': (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            'by_call_site': {tag: dict(counts) for tag, counts in self._per_tag.items()}
+        }
+
+    # ------------------------------------------------------------------
+    # Internos (requieren self._lock)
+    # ------------------------------------------------------------------
+
+    def _memory_set(self, key: str, value: Dict[str, Any], expires_at: float) -> None:
+        self._memory[key] = (dict(value), expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def _count(self, tag: str, metric: str) -> None:
+        if not tag:
+            return
+        counts = self._per_tag.setdefault(tag, {'hits': 0, 'misses': 0, 'stores': 0})
+        counts[metric] += 1
+
+
+# 🌐 INSTANCIA GLOBAL
+_global_cache: Optional[LLMResponseCache] = None
+_global_cache_lock = threading.Lock()
+
+
+def get_llm_response_cache() -> LLMResponseCache:
+    """
+    🌐 OBTENER LA CACHÉ GLOBAL DE RESPUESTAS LLM
+
+    Configurable por entorno:
+    - OLLAMA_CACHE_MAX_ENTRIES: capacidad en memoria (defecto 1000)
+    - OLLAMA_CACHE_DB_PATH: fichero SQLite del nivel en disco (vacío = sin disco)
+    """
+    global _global_cache
+
+    if _global_cache is None:
+        with _global_cache_lock:
+            if _global_cache is None:
+                _global_cache = LLMResponseCache(
+                    max_entries=int(os.getenv('OLLAMA_CACHE_MAX_ENTRIES', '1000')),
+                    db_path=os.getenv('OLLAMA_CACHE_DB_PATH') or None
+                )
+                logger.info("🌐 Nueva instancia global de LLMResponseCache creada")
+
+    return _global_cache
@@ -0,0 +1,542 @@
+"""
+🗂️ CATÁLOGO DE MODELOS MULTI-PROVEEDOR
+======================================
+
+ModelManager y OpenRouterService elegían modelo recorriendo la lista
+completa en cada llamada, deduciendo capacidades del nombre con búsquedas
+de subcadenas, y refresh_models consultaba Ollama y OpenRouter uno detrás
+de otro. Este catálogo:
+
+- Calcula una sola vez, al refrescar, una máscara de bits de capacidades
+  por modelo; filtrar por tipo de tarea es un AND de enteros
+- Mantiene telemetría real por modelo (latencia por token EWMA,
+  éxitos/fallos, tokens generados) alimentada por las llamadas de los
+  servicios
+- Refresca los proveedores en paralelo y en segundo plano: las consultas
+  devuelven el catálogo vigente aunque esté caducado y disparan el refresco
+- Puntúa los candidatos por latencia por token (no por latencia de la
+  llamada completa, que depende sobre todo de la longitud de la respuesta)
+  para elegir el modelo adecuado más rápido para cada tipo de tarea,
+  desempatando por coste
+
+Los proveedores se registran como funciones que devuelven CatalogEntry
+(como la sonda del monitor de salud), así que este módulo no depende de
+requests.
+"""
+
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from enum import IntFlag
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+PROVIDER_OLLAMA = 'ollama'
+PROVIDER_OPENROUTER = 'openrouter'
+LOCAL_PROVIDERS = frozenset({PROVIDER_OLLAMA})
+
+
+class ModelCapability(IntFlag):
+    """🏷️ Capacidades de un modelo como bits"""
+    NONE = 0
+    GENERAL = 1
+    CONVERSATIONAL = 2
+    CODE = 4
+    ANALYSIS = 8
+    REASONING = 16
+    RESEARCH = 32
+    VISION = 64
+    LARGE_CONTEXT = 128
+    EFFICIENT = 256
+
+
+# Palabras clave del nombre → capacidades (mismas reglas que el antiguo _infer_capabilities)
+_CAPABILITY_KEYWORDS = [
+    (('code', 'coder', 'coding', 'starcoder', 'codellama'), ModelCapability.CODE),
+    (('chat', 'instruct', 'assistant'), ModelCapability.CONVERSATIONAL),
+    (('claude', 'gpt-4', 'gemini'), ModelCapability.ANALYSIS | ModelCapability.REASONING | ModelCapability.RESEARCH),
+    (('vision', 'multimodal', 'gpt-4v'), ModelCapability.VISION),
+]
+_CAPABILITY_PATTERNS = [
+    (re.compile('|'.join(re.escape(keyword) for keyword in keywords)), mask)
+    for keywords, mask in _CAPABILITY_KEYWORDS
+]
+_LARGE_RE = re.compile(r'large|70b|65b|175b')
+_EFFICIENT_RE = re.compile(r'small|7b|13b|tiny')
+
+# Nombres de capacidad usados por UnifiedModel.capabilities
+_CAPABILITY_NAMES = {
+    ModelCapability.GENERAL: ['general'],
+    ModelCapability.CONVERSATIONAL: ['conversational'],
+    ModelCapability.CODE: ['code_generation', 'code_analysis', 'debugging'],
+    ModelCapability.ANALYSIS: ['analysis'],
+    ModelCapability.REASONING: ['reasoning'],
+    ModelCapability.RESEARCH: ['research'],
+    ModelCapability.VISION: ['vision'],
+    ModelCapability.LARGE_CONTEXT: ['large_context'],
+    ModelCapability.EFFICIENT: ['efficient'],
+}
+_NAME_TO_CAPABILITY = {
+    name: capability for capability, names in _CAPABILITY_NAMES.items() for name in names
+}
+
+
+@dataclass(frozen=True)
+class TaskProfile:
+    """🎯 Requisitos de un tipo de tarea: alguna de las capacidades y contexto mínimo"""
+    capabilities: ModelCapability
+    min_context: int = 0
+
+
+TASK_PROFILES: Dict[str, TaskProfile] = {
+    'code': TaskProfile(ModelCapability.CODE, 8000),
+    'chat': TaskProfile(ModelCapability.CONVERSATIONAL, 4000),
+    'analysis': TaskProfile(ModelCapability.ANALYSIS | ModelCapability.REASONING, 16000),
+    'research': TaskProfile(ModelCapability.RESEARCH | ModelCapability.ANALYSIS, 16000),
+    # Cualquier modelo sirve para una tarea general
+    'general': TaskProfile(ModelCapability.NONE, 4000),
+    # Prompts cortos de una etiqueta: basta un modelo pequeño
+    'classification': TaskProfile(ModelCapability.EFFICIENT),
+}
+
+
+def infer_capabilities(model_name: str) -> ModelCapability:
+    """Máscara de capacidades deducida del nombre del modelo"""
+    name = (model_name or '').lower()
+    mask = ModelCapability.NONE
+    for pattern, capability in _CAPABILITY_PATTERNS:
+        if pattern.search(name):
+            mask |= capability
+    if _LARGE_RE.search(name):
+        mask |= ModelCapability.LARGE_CONTEXT
+    elif _EFFICIENT_RE.search(name):
+        mask |= ModelCapability.EFFICIENT
+    return mask or ModelCapability.GENERAL
+
+
+def capability_names(mask: ModelCapability) -> List[str]:
+    """Lista de nombres de capacidad (formato de UnifiedModel) de una máscara"""
+    names: List[str] = []
+    for capability, capability_list in _CAPABILITY_NAMES.items():
+        if mask & capability:
+            names.extend(capability_list)
+    return names
+
+
+def capability_from_name(name: str) -> ModelCapability:
+    """Bit correspondiente a un nombre de capacidad ('code_generation' → CODE)"""
+    return _NAME_TO_CAPABILITY.get(name, ModelCapability.NONE)
+
+
+def approx_tokens(text: Any) -> int:
+    """Tokens aproximados de un texto (~4 caracteres por token) cuando el proveedor no los cuenta"""
+    return max(1, len(text) // 4) if isinstance(text, str) and text else 0
+
+
+def price_per_1k(price_per_token: Any) -> float:
+    """Precio por token de OpenRouter (número o cadena) → precio por 1k tokens"""
+    try:
+        return float(price_per_token or 0.0) * 1000
+    except (TypeError, ValueError):
+        return 0.0
+
+
+@dataclass
+class CatalogEntry:
+    """
+    📇 MODELO DEL CATÁLOGO
+
+    `capabilities` se calcula una vez al construir la entrada;
+    context_length 0 significa desconocido (no filtra).
+    """
+    provider: str
+    model_id: str
+    name: str
+    capabilities: ModelCapability
+    description: str = ''
+    context_length: int = 0
+    cost_per_1k_tokens: float = 0.0
+    size_mb: float = 0.0
+
+    @property
+    def key(self) -> str:
+        return f"{self.provider}:{self.model_id}"
+
+    @property
+    def is_local(self) -> bool:
+        return self.provider in LOCAL_PROVIDERS
+
+    @classmethod
+    def build(cls, provider: str, model_id: str, name: Optional[str] = None, **fields) -> 'CatalogEntry':
+        name = name or model_id
+        return cls(provider=provider, model_id=model_id, name=name,
+                   capabilities=infer_capabilities(name), **fields)
+
+
+@dataclass
+class ModelTelemetry:
+    """📊 Telemetría de llamadas reales a un modelo"""
+    calls: int = 0
+    failures: int = 0
+    latency_ewma: Optional[float] = None
+    token_latency_ewma: Optional[float] = None
+    output_tokens: int = 0
+    generation_seconds: float = 0.0
+    last_used: float = 0.0
+
+    @property
+    def success_rate(self) -> float:
+        return 1.0 - self.failures / self.calls if self.calls else 1.0
+
+    @property
+    def tokens_per_second(self) -> Optional[float]:
+        if not self.output_tokens or self.generation_seconds <= 0:
+            return None
+        return self.output_tokens / self.generation_seconds
+
+
+# () -> entradas del proveedor; lanza excepción si el proveedor no responde
+ProviderFetchFn = Callable[[], List[CatalogEntry]]
+
+
+class ModelCatalog:
+    """
+    🗂️ CATÁLOGO CACHEADO CON TELEMETRÍA Y SELECCIÓN POR PUNTUACIÓN
+
+    Args:
+        ttl: Segundos tras los que el catálogo se considera caducado
+        refresh_interval: Periodo del hilo de refresco en segundo plano
+        fetch_timeout: Tiempo máximo de espera por proveedor al refrescar
+        latency_alpha: Peso de la última medida en las EWMA de latencia
+    """
+
+    def __init__(self,
+                 ttl: float = 300.0,
+                 refresh_interval: float = 300.0,
+                 fetch_timeout: float = 20.0,
+                 latency_alpha: float = 0.3):
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval
+        self.fetch_timeout = fetch_timeout
+        self.latency_alpha = latency_alpha
+
+        self._providers: Dict[str, ProviderFetchFn] = {}
+        self._entries: Dict[str, Dict[str, CatalogEntry]] = {}
+        self._telemetry: Dict[str, ModelTelemetry] = {}
+        self._provider_errors: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='model_catalog')
+
+        self.refreshed_at: Optional[float] = None
+        self.version = 0
+        self.refreshes = 0
+        self._background_thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+
+    # ------------------------------------------------------------------
+    # Proveedores y refresco
+    # ------------------------------------------------------------------
+
+    def register_provider(self, provider: str, fetch_fn: ProviderFetchFn) -> None:
+        """Registrar (o reemplazar) la función que lista los modelos de un proveedor"""
+        with self._lock:
+            self._providers[provider] = fetch_fn
+
+    def has_provider(self, provider: str) -> bool:
+        return provider in self._providers
+
+    def update_provider(self, provider: str, entries: Iterable[CatalogEntry]) -> None:
+        """Reemplazar los modelos de un proveedor (p.ej. tras un fetch_models externo)"""
+        with self._lock:
+            self._entries[provider] = {entry.key: entry for entry in entries}
+            self._provider_errors.pop(provider, None)
+            self.version += 1
+
+    def refresh(self, providers: Optional[Iterable[str]] = None) -> bool:
+        """
+        🔄 CONSULTAR LOS PROVEEDORES EN PARALELO
+
+        Un proveedor que falla conserva sus modelos anteriores.
+
+        Returns:
+            True si al menos un proveedor respondió
+        """
+        with self._refresh_lock:
+            with self._lock:
+                fetchers = {
+                    provider: fetch_fn for provider, fetch_fn in self._providers.items()
+                    if providers is None or provider in providers
+                }
+            futures = {provider: self._executor.submit(fetch_fn) for provider, fetch_fn in fetchers.items()}
+
+            success = False
+            for provider, future in futures.items():
+                try:
+                    entries = future.result(timeout=self.fetch_timeout)
+                except Exception as e:
+                    logger.warning(f"⚠️ No se pudo refrescar el catálogo de {provider}: {e}")
+                    with self._lock:
+                        self._provider_errors[provider] = str(e) or type(e).__name__
+                    continue
+                self.update_provider(provider, entries)
+                success = True
+                logger.info(f"🗂️ Catálogo {provider}: {len(entries)} modelos")
+
+            self.refreshed_at = time.time()
+            self.refreshes += 1
+            return success
+
+    def refresh_async(self) -> bool:
+        """Refrescar en un hilo aparte si no hay ya un refresco en curso"""
+        if self._refresh_lock.locked():
+            return False
+        threading.Thread(target=self.refresh, name='model_catalog_refresh', daemon=True).start()
+        return True
+
+    @property
+    def is_stale(self) -> bool:
+        return self.refreshed_at is None or time.time() - self.refreshed_at > self.ttl
+
+    def _ensure_fresh(self) -> None:
+        if not self.is_stale or not self._providers:
+            return
+        if self.refreshed_at is None:
+            # Primera consulta: no hay nada que devolver mientras tanto
+            self.refresh()
+        else:
+            self.refresh_async()
+
+    def start_background_refresh(self) -> None:
+        """Arrancar (una sola vez) el hilo que refresca cada refresh_interval"""
+        if self.refresh_interval <= 0:
+            return
+        with self._lock:
+            if self._background_thread is not None and self._background_thread.is_alive():
+                return
+            self._stop_event.clear()
+            self._background_thread = threading.Thread(
+                target=self._background_loop, name='model_catalog_background', daemon=True
+            )
+            self._background_thread.start()
+
+    def stop_background_refresh(self) -> None:
+        self._stop_event.set()
+
+    def _background_loop(self) -> None:
+        while not self._stop_event.wait(self.refresh_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"❌ Error en el refresco periódico del catálogo: {e}")
+
+    # ------------------------------------------------------------------
+    # Consultas
+    # ------------------------------------------------------------------
+
+    def entries(self, provider: Optional[str] = None) -> List[CatalogEntry]:
+        """Modelos del catálogo (dispara un refresco si ha caducado)"""
+        self._ensure_fresh()
+        with self._lock:
+            if provider is not None:
+                return list(self._entries.get(provider, {}).values())
+            return [entry for entries in self._entries.values() for entry in entries.values()]
+
+    def get(self, key: str) -> Optional[CatalogEntry]:
+        provider = key.split(':', 1)[0]
+        with self._lock:
+            return self._entries.get(provider, {}).get(key)
+
+    def find(self,
+             capabilities: ModelCapability = ModelCapability.NONE,
+             max_cost: Optional[float] = None,
+             min_context: Optional[int] = None,
+             provider: Optional[str] = None) -> List[CatalogEntry]:
+        """
+        🔎 FILTRAR EN UNA PASADA
+
+        capabilities exige al menos uno de los bits (NONE = sin requisito).
+        """
+        required = int(capabilities)
+        return [
+            entry for entry in self.entries(provider)
+            if (not required or int(entry.capabilities) & required)
+            and (max_cost is None or entry.cost_per_1k_tokens <= max_cost)
+            and (not min_context or not entry.context_length or entry.context_length >= min_context)
+        ]
+
+    def _median_token_latency(self) -> Optional[float]:
+        measured = sorted(
+            telemetry.token_latency_ewma for telemetry in self._telemetry.values()
+            if telemetry.token_latency_ewma is not None
+        )
+        if not measured:
+            return None
+        middle = len(measured) // 2
+        return measured[middle] if len(measured) % 2 else (measured[middle - 1] + measured[middle]) / 2
+
+    def expected_token_latency(self, entry: CatalogEntry, median: Optional[float] = None) -> float:
+        """
+        ⏱️ SEGUNDOS POR TOKEN GENERADO ESPERADOS
+
+        Medidos (EWMA) si hay telemetría; un modelo aún sin probar parte de
+        la mediana del catálogo, así que ni se descarta ni se prefiere a
+        ciegas. Los fallos la penalizan: un modelo que falla la mitad de las
+        veces "tarda" el doble. Sin ninguna medida en el catálogo vale 0 y
+        deciden el coste y el tamaño.
+        """
+        telemetry = self._telemetry.get(entry.key)
+        if telemetry is not None and telemetry.token_latency_ewma is not None:
+            latency = telemetry.token_latency_ewma
+        else:
+            latency = self._median_token_latency() if median is None else median
+            latency = latency or 0.0
+        success_rate = telemetry.success_rate if telemetry is not None else 1.0
+        return latency / max(success_rate, 0.05)
+
+    def score(self, entry: CatalogEntry, median: Optional[float] = None) -> tuple:
+        """Clave de orden: más rápido por token, luego más barato, luego más grande"""
+        return (round(self.expected_token_latency(entry, median), 6), entry.cost_per_1k_tokens,
+                -entry.size_mb, entry.key)
+
+    def select(self,
+               task_type: str = 'general',
+               max_cost: Optional[float] = None,
+               prefer_local: bool = False,
+               provider: Optional[str] = None) -> Optional[CatalogEntry]:
+        """
+        🎯 MODELO ADECUADO MÁS RÁPIDO PARA UN TIPO DE TAREA
+
+        Si ningún modelo cumple capacidades y contexto se relajan esos
+        requisitos, y si ninguno entra en el presupuesto se ignora el coste
+        (igual que la selección anterior). Con prefer_local se mantiene el
+        criterio de siempre para los locales: el más grande (mejor calidad),
+        y la velocidad solo desempata.
+        """
+        profile = TASK_PROFILES.get(task_type, TASK_PROFILES['general'])
+        candidates = (
+            self.find(profile.capabilities, None, profile.min_context, provider)
+            or self.entries(provider)
+        )
+        if not candidates:
+            return None
+        if max_cost is not None:
+            candidates = [entry for entry in candidates if entry.cost_per_1k_tokens <= max_cost] or candidates
+        with self._lock:
+            median = self._median_token_latency()
+            if prefer_local:
+                local = [entry for entry in candidates if entry.is_local]
+                if local:
+                    return min(local, key=lambda entry: (-entry.size_mb,) + self.score(entry, median))
+            return min(candidates, key=lambda entry: self.score(entry, median))
+
+    # ------------------------------------------------------------------
+    # Telemetría
+    # ------------------------------------------------------------------
+
+    def record_call(self, provider: str, model_id: str, latency_seconds: float,
+                    success: bool = True, output_tokens: Optional[int] = None,
+                    generation_seconds: Optional[float] = None) -> None:
+        """
+        📈 REGISTRAR UNA LLAMADA REAL A UN MODELO
+
+        Args:
+            latency_seconds: Duración de la llamada completa
+            output_tokens: Tokens generados; sin ellos la llamada solo cuenta
+                para la tasa de éxito, no para la velocidad
+            generation_seconds: Tiempo de generación de esos tokens si el
+                proveedor lo informa (eval_duration de Ollama); si no, se
+                usa la duración de la llamada
+        """
+        key = f"{provider}:{model_id}"
+        with self._lock:
+            telemetry = self._telemetry.setdefault(key, ModelTelemetry())
+            telemetry.calls += 1
+            telemetry.last_used = time.time()
+            if not success:
+                telemetry.failures += 1
+                return
+            if telemetry.latency_ewma is None:
+                telemetry.latency_ewma = latency_seconds
+            else:
+                telemetry.latency_ewma += self.latency_alpha * (latency_seconds - telemetry.latency_ewma)
+            if output_tokens:
+                seconds = generation_seconds if generation_seconds else latency_seconds
+                token_latency = seconds / output_tokens
+                if telemetry.token_latency_ewma is None:
+                    telemetry.token_latency_ewma = token_latency
+                else:
+                    telemetry.token_latency_ewma += self.latency_alpha * (token_latency - telemetry.token_latency_ewma)
+                telemetry.output_tokens += output_tokens
+                telemetry.generation_seconds += seconds
+
+    def telemetry(self, key: str) -> Optional[ModelTelemetry]:
+        with self._lock:
+            return self._telemetry.get(key)
+
+    def get_status(self) -> Dict[str, Any]:
+        """📊 Estado del catálogo, recomendación por tipo de tarea y telemetría"""
+        recommendations = {}
+        for task_type in TASK_PROFILES:
+            entry = self.select(task_type)
+            recommendations[task_type] = entry.key if entry is not None else None
+
+        now = time.time()
+        with self._lock:
+            return {
+                'version': self.version,
+                'refreshes': self.refreshes,
+                'age_seconds': round(now - self.refreshed_at, 1) if self.refreshed_at else None,
+                'ttl_seconds': self.ttl,
+                'background_refresh': bool(self._background_thread and self._background_thread.is_alive()),
+                'providers': {
+                    provider: {
+                        'models': len(self._entries.get(provider, {})),
+                        'last_error': self._provider_errors.get(provider)
+                    }
+                    for provider in set(self._providers) | set(self._entries)
+                },
+                'recommended': recommendations,
+                'telemetry': {
+                    key: {
+                        'calls': telemetry.calls,
+                        'failures': telemetry.failures,
+                        'latency_ewma_seconds': round(telemetry.latency_ewma, 3) if telemetry.latency_ewma is not None else None,
+                        'token_latency_ewma_ms': round(telemetry.token_latency_ewma * 1000, 2) if telemetry.token_latency_ewma is not None else None,
+                        'tokens_per_second': round(telemetry.tokens_per_second, 1) if telemetry.tokens_per_second else None,
+                        'idle_seconds': round(now - telemetry.last_used, 1)
+                    }
+                    for key, telemetry in self._telemetry.items()
+                }
+            }
+
+
+# 🌐 INSTANCIA GLOBAL
+_global_catalog: Optional[ModelCatalog] = None
+_global_catalog_lock = threading.Lock()
+
+
+def get_model_catalog() -> ModelCatalog:
+    """
+    🌐 OBTENER EL CATÁLOGO GLOBAL
+
+    MODEL_CATALOG_TTL fija la caducidad (s) y MODEL_CATALOG_REFRESH_INTERVAL
+    el periodo del refresco en segundo plano (0 lo desactiva).
+    """
+    global _global_catalog
+
+    if _global_catalog is None:
+        with _global_catalog_lock:
+            if _global_catalog is None:
+                _global_catalog = ModelCatalog(
+                    ttl=float(os.getenv('MODEL_CATALOG_TTL', '300')),
+                    refresh_interval=float(os.getenv('MODEL_CATALOG_REFRESH_INTERVAL', '300'))
+                )
+                logger.info("🌐 Nueva instancia global de ModelCatalog creada")
+
+    return _global_catalog
@@ -0,0 +1,225 @@
+"""
+📈 CONTROL ADAPTATIVO DE CONCURRENCIA POR MODELO (AIMD)
+======================================================
+
+Un límite fijo de 2 requests simultáneos desaprovecha GPUs grandes con
+modelos pequeños y satura GPUs pequeñas con modelos grandes, que acaban
+fallando por timeout en la cola larga de latencias.
+
+Este limitador ajusta el número de requests simultáneos de cada modelo:
+- Aumento aditivo: cada respuesta rápida con el límite en uso suma
+  `increase_step / limit` (≈ +1 por "ventana" completa)
+- Disminución multiplicativa: un timeout, o una latencia por token media
+  por encima de `latency_tolerance` veces la latencia base del modelo,
+  multiplica el límite por `backoff_ratio`
+
+La señal de congestión es el tiempo por token generado (eval_duration /
+eval_count de Ollama), no la duración total del request: una respuesta de
+40s con 2.000 tokens no está más congestionada que una de 2s con 100. La
+latencia base es un percentil bajo de las últimas `baseline_window`
+muestras del modelo, así que un valor atípico rápido no la fija para
+siempre y se adapta sola a cambios de hardware.
+
+Todas las llamadas ocurren en el event loop del despachador de la cola.
+"""
+
+import logging
+import math
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def token_latency(result: Dict[str, Any]) -> Optional[float]:
+    """
+    Segundos por token generado de una respuesta de Ollama
+
+    Returns:
+        eval_duration / eval_count en segundos, o None si la respuesta no
+        trae esas métricas (error, respuesta vacía o proveedor sin ellas)
+    """
+    if not isinstance(result, dict):
+        return None
+    count, duration = result.get('eval_count'), result.get('eval_duration')
+    if not isinstance(count, (int, float)) or not isinstance(duration, (int, float)) or count <= 0 or duration <= 0:
+        return None
+    return duration / 1e9 / count
+
+
+@dataclass
+class ModelLimit:
+    """
+    🎚️ LÍMITE Y TELEMETRÍA DE UN MODELO
+    """
+    model: str
+    limit: float
+    in_flight: int = 0
+    latency_ewma: Optional[float] = None
+    baseline_latency: Optional[float] = None
+    recent_latencies: Deque[float] = field(default_factory=deque)
+    samples: int = 0
+    timeouts: int = 0
+    increases: int = 0
+    decreases: int = 0
+    last_decrease_at: float = 0.0
+
+    @property
+    def current_limit(self) -> int:
+        return max(1, int(math.floor(self.limit)))
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    📈 LIMITADOR AIMD GUIADO POR LATENCIA Y TIMEOUTS
+
+    Args:
+        initial_limit: Límite inicial de cada modelo
+        min_limit: Límite mínimo
+        max_limit: Límite máximo
+        latency_tolerance: Cociente latencia_media/latencia_base (por token)
+                           que se considera congestión
+        backoff_ratio: Factor multiplicativo al detectar congestión
+        increase_step: Incremento aditivo por ventana completa de éxitos
+        ewma_alpha: Peso de la última muestra en la latencia media
+        decrease_cooldown: Segundos mínimos entre dos reducciones (un
+                           pico de timeouts simultáneos cuenta como uno)
+        baseline_window: Muestras recientes sobre las que se calcula la base
+        baseline_percentile: Percentil (0-1) de esas muestras usado como base
+    """
+
+    def __init__(self,
+                 initial_limit: int = 2,
+                 min_limit: int = 1,
+                 max_limit: int = 8,
+                 latency_tolerance: float = 2.0,
+                 backoff_ratio: float = 0.7,
+                 increase_step: float = 1.0,
+                 ewma_alpha: float = 0.2,
+                 decrease_cooldown: float = 5.0,
+                 baseline_window: int = 50,
+                 baseline_percentile: float = 0.2):
+        self.initial_limit = initial_limit
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_tolerance = latency_tolerance
+        self.backoff_ratio = backoff_ratio
+        self.increase_step = increase_step
+        self.ewma_alpha = ewma_alpha
+        self.decrease_cooldown = decrease_cooldown
+        self.baseline_window = baseline_window
+        self.baseline_percentile = baseline_percentile
+
+        self._models: Dict[str, ModelLimit] = {}
+
+    def _state(self, model: str) -> ModelLimit:
+        state = self._models.get(model)
+        if state is None:
+            state = ModelLimit(model=model, limit=float(self.initial_limit))
+            self._models[model] = state
+        return state
+
+    # ------------------------------------------------------------------
+    # Huecos
+    # ------------------------------------------------------------------
+
+    def limit_for(self, model: str) -> int:
+        return self._state(model).current_limit
+
+    def has_capacity(self, model: str) -> bool:
+        state = self._state(model)
+        return state.in_flight < state.current_limit
+
+    def acquire(self, model: str) -> None:
+        self._state(model).in_flight += 1
+
+    def release(self, model: str) -> None:
+        state = self._state(model)
+        if state.in_flight > 0:
+            state.in_flight -= 1
+
+    # ------------------------------------------------------------------
+    # Señales
+    # ------------------------------------------------------------------
+
+    def on_success(self, model: str, token_seconds: Optional[float]) -> None:
+        """
+        ✅ Registrar una respuesta (llamar antes de release)
+
+        Args:
+            model: Modelo que respondió
+            token_seconds: Segundos por token generado (ver token_latency);
+                           None si no se conoce, y entonces solo cuenta como
+                           éxito para el aumento aditivo
+        """
+        state = self._state(model)
+        state.samples += 1
+
+        if token_seconds is not None and token_seconds > 0:
+            if state.latency_ewma is None:
+                state.latency_ewma = token_seconds
+            else:
+                state.latency_ewma += self.ewma_alpha * (token_seconds - state.latency_ewma)
+
+            state.recent_latencies.append(token_seconds)
+            if len(state.recent_latencies) > self.baseline_window:
+                state.recent_latencies.popleft()
+            ordered = sorted(state.recent_latencies)
+            state.baseline_latency = ordered[int(self.baseline_percentile * (len(ordered) - 1))]
+
+            if state.latency_ewma > state.baseline_latency * self.latency_tolerance:
+                self._decrease(
+                    state,
+                    f"latencia por token {state.latency_ewma * 1000:.1f}ms > "
+                    f"{self.latency_tolerance}x base {state.baseline_latency * 1000:.1f}ms"
+                )
+                return
+
+        if state.in_flight >= state.current_limit:
+            # Solo crecer si el límite actual se está usando de verdad
+            self._increase(state)
+
+    def on_timeout(self, model: str) -> None:
+        """⏱️ Registrar un timeout (llamar antes de release)"""
+        state = self._state(model)
+        state.timeouts += 1
+        self._decrease(state, "timeout")
+
+    def _increase(self, state: ModelLimit) -> None:
+        previous = state.current_limit
+        state.limit = min(float(self.max_limit), state.limit + self.increase_step / state.limit)
+        if state.current_limit > previous:
+            state.increases += 1
+            logger.info(f"📈 Concurrencia de {state.model}: {previous} → {state.current_limit}")
+
+    def _decrease(self, state: ModelLimit, reason: str) -> None:
+        now = time.monotonic()
+        if now - state.last_decrease_at < self.decrease_cooldown:
+            return
+        previous = state.current_limit
+        state.limit = max(float(self.min_limit), state.limit * self.backoff_ratio)
+        state.last_decrease_at = now
+        state.decreases += 1
+        logger.warning(f"📉 Concurrencia de {state.model}: {previous} → {state.current_limit} ({reason})")
+
+    def get_status(self) -> Dict[str, Any]:
+        """📊 Límite y latencias por modelo"""
+        return {
+            'min_limit': self.min_limit,
+            'max_limit': self.max_limit,
+            'models': {
+                model: {
+                    'limit': state.current_limit,
+                    'in_flight': state.in_flight,
+                    'token_latency_ewma_ms': round(state.latency_ewma * 1000, 2) if state.latency_ewma is not None else None,
+                    'baseline_token_latency_ms': round(state.baseline_latency * 1000, 2) if state.baseline_latency is not None else None,
+                    'samples': state.samples,
+                    'timeouts': state.timeouts,
+                    'increases': state.increases,
+                    'decreases': state.decreases
+                }
+                for model, state in self._models.items()
+            }
+        }
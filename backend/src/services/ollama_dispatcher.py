@@ -0,0 +1,254 @@
+"""
+🧵 DESPACHADOR PERSISTENTE PARA LA COLA DE OLLAMA
+==================================================
+
+Mantiene un único event loop de asyncio corriendo en un thread de background
+que es dueño del OllamaQueueManager global. Todos los llamadores síncronos
+(rutas Flask, herramientas, OllamaService) envían sus corutinas a este loop
+mediante un handle thread-safe en lugar de crear un ThreadPoolExecutor y un
+event loop nuevos por cada llamada.
+
+BENEFICIOS:
+- ✅ El semáforo y el lock de la cola viven en un solo loop, por lo que la
+  prioridad y max_concurrent_requests se respetan a nivel de proceso
+- ✅ El coste por llamada se reduce a enviar un future
+- ✅ Las tareas de mantenimiento de la cola (limpieza) siguen vivas
+- ✅ Pool de threads persistente para las llamadas HTTP bloqueantes
+"""
+
+import asyncio
+import concurrent.futures
+import logging
+import os
+import threading
+from typing import Any, Awaitable, Optional
+
+from .ollama_queue_manager import (
+    OllamaQueueManager,
+    get_ollama_queue_manager,
+    shutdown_ollama_queue_manager
+)
+
+logger = logging.getLogger(__name__)
+
+
+class OllamaQueueDispatcher:
+    """
+    🧵 LOOP DE BACKGROUND QUE CENTRALIZA LAS LLAMADAS A LA COLA
+
+    Uso típico desde código síncrono:
+        dispatcher = get_ollama_dispatcher()
+        result = dispatcher.run(service._execute_with_queue(...), timeout=60)
+    """
+
+    def __init__(self, io_workers: int = 8, queue_manager: Optional[OllamaQueueManager] = None):
+        """
+        Args:
+            io_workers: Threads del pool usado por run_in_executor dentro del loop
+                        (llamadas HTTP bloqueantes a Ollama)
+            queue_manager: Gestor de cola propio (sin arrancar); None usa el global.
+                           stop() solo cierra el global si es el que se usa
+        """
+        self.io_workers = io_workers
+        self._own_queue_manager = queue_manager
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._io_executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self._ready = threading.Event()
+        self._start_lock = threading.Lock()
+        self._queue_manager: Optional[OllamaQueueManager] = None
+        self._start_error: Optional[BaseException] = None
+
+    @property
+    def loop(self) -> Optional[asyncio.AbstractEventLoop]:
+        """Event loop del despachador (None si no ha arrancado)"""
+        return self._loop
+
+    @property
+    def queue_manager(self) -> OllamaQueueManager:
+        """Gestor de cola que pertenece al loop del despachador"""
+        self.start()
+        return self._queue_manager
+
+    @property
+    def is_running(self) -> bool:
+        """True si el thread del loop está vivo y aceptando trabajo"""
+        return (
+            self._thread is not None
+            and self._thread.is_alive()
+            and self._loop is not None
+            and self._loop.is_running()
+        )
+
+    def in_dispatcher_thread(self) -> bool:
+        """True si el código actual se ejecuta dentro del loop del despachador"""
+        return self._thread is not None and threading.current_thread() is self._thread
+
+    def start(self, timeout: float = 10.0) -> None:
+        """
+        🚀 ARRANCAR EL LOOP DE BACKGROUND (IDEMPOTENTE)
+
+        Crea el thread, el event loop y arranca el OllamaQueueManager dentro
+        de ese loop para que sus primitivas asyncio queden ligadas a él.
+        Si el gestor no arranca, el loop se detiene y se relanza su error;
+        la siguiente llamada vuelve a intentarlo.
+        """
+        if self.is_running:
+            return
+
+        with self._start_lock:
+            # Otro thread puede estar arrancando el loop: en ese caso solo esperamos
+            if self._thread is None or not self._thread.is_alive():
+                self._ready.clear()
+                self._start_error = None
+                self._thread = threading.Thread(
+                    target=self._run_loop,
+                    name="ollama_dispatcher",
+                    daemon=True
+                )
+                self._thread.start()
+                logger.info("🧵 Arrancando OllamaQueueDispatcher (loop persistente en background)")
+
+        if not self._ready.wait(timeout):
+            raise RuntimeError("El despachador de Ollama no arrancó a tiempo")
+        error = self._start_error
+        if error is not None:
+            # Esperar a que el thread termine para que el reintento cree uno nuevo
+            thread = self._thread
+            if thread is not None:
+                thread.join(timeout)
+            raise error
+
+    def _run_loop(self) -> None:
+        """Cuerpo del thread de background: posee el loop durante toda su vida"""
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+
+        self._io_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.io_workers,
+            thread_name_prefix="ollama_io"
+        )
+        loop.set_default_executor(self._io_executor)
+        self._loop = loop
+
+        async def bootstrap():
+            try:
+                queue_manager = self._own_queue_manager or get_ollama_queue_manager()
+                await queue_manager.start()
+                self._queue_manager = queue_manager
+            except Exception as e:
+                logger.error(f"❌ El gestor de cola de Ollama no arrancó: {str(e)}")
+                self._start_error = e
+                loop.stop()
+            finally:
+                self._ready.set()
+
+        loop.create_task(bootstrap())
+
+        try:
+            loop.run_forever()
+        finally:
+            try:
+                pending = asyncio.all_tasks(loop)
+                for task in pending:
+                    task.cancel()
+                if pending:
+                    loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+                loop.run_until_complete(loop.shutdown_asyncgens())
+            finally:
+                self._io_executor.shutdown(wait=False)
+                loop.close()
+                logger.info("🛑 Loop del despachador de Ollama cerrado")
+
+    def submit(self, coro: Awaitable[Any]) -> concurrent.futures.Future:
+        """
+        📤 ENVIAR UNA CORUTINA AL LOOP DEL DESPACHADOR
+
+        Returns:
+            concurrent.futures.Future con el resultado de la corutina
+        """
+        if self.in_dispatcher_thread():
+            # Bloquear esperando al propio loop provocaría un deadlock
+            if asyncio.iscoroutine(coro):
+                coro.close()
+            raise RuntimeError("submit() no puede llamarse desde el loop del despachador")
+
+        self.start()
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def run(self, coro: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+        """
+        ⏳ ENVIAR UNA CORUTINA Y ESPERAR SU RESULTADO DE FORMA SÍNCRONA
+
+        Si se agota el timeout la corutina se cancela en el loop para que no
+        siga ocupando un hueco de la cola.
+
+        Raises:
+            concurrent.futures.TimeoutError: Si el resultado no llega a tiempo
+        """
+        future = self.submit(coro)
+        try:
+            return future.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """
+        🛑 DETENER EL LOOP Y EL GESTOR DE COLA
+        """
+        if not self.is_running:
+            return
+
+        try:
+            shutdown = (self._own_queue_manager.stop() if self._own_queue_manager is not None
+                        else shutdown_ollama_queue_manager())
+            stop_future = asyncio.run_coroutine_threadsafe(shutdown, self._loop)
+            stop_future.result(timeout=timeout)
+        except Exception as e:
+            logger.warning(f"⚠️ Error deteniendo gestor de cola: {str(e)}")
+
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout)
+        self._loop = None
+        self._thread = None
+        self._queue_manager = None
+
+
+# 🌐 INSTANCIA GLOBAL DEL DESPACHADOR
+_global_dispatcher: Optional[OllamaQueueDispatcher] = None
+_global_dispatcher_lock = threading.Lock()
+
+
+def get_ollama_dispatcher() -> OllamaQueueDispatcher:
+    """
+    🌐 OBTENER INSTANCIA GLOBAL DEL DESPACHADOR
+
+    Patrón singleton: un único loop de background por proceso
+    """
+    global _global_dispatcher
+
+    if _global_dispatcher is None:
+        with _global_dispatcher_lock:
+            if _global_dispatcher is None:
+                _global_dispatcher = OllamaQueueDispatcher(
+                    io_workers=int(os.getenv('OLLAMA_DISPATCHER_IO_WORKERS', '8'))
+                )
+                logger.info("🌐 Nueva instancia global de OllamaQueueDispatcher creada")
+
+    return _global_dispatcher
+
+
+def shutdown_ollama_dispatcher() -> None:
+    """
+    🛑 CERRAR EL DESPACHADOR GLOBAL
+
+    Debe ser llamado al cerrar la aplicación
+    """
+    global _global_dispatcher
+
+    if _global_dispatcher:
+        _global_dispatcher.stop()
+        _global_dispatcher = None
+        logger.info("🛑 Despachador de Ollama cerrado globalmente")
@@ -0,0 +1,301 @@
+"""
+🖧 POOL DE ENDPOINTS DE OLLAMA CON BALANCEO DE CARGA
+===================================================
+
+En producción hay varias máquinas con Ollama. Este pool mantiene, por
+endpoint:
+- Modelos instalados (/api/tags) y cargados en memoria (/api/ps)
+- Requests en vuelo frente a su límite de concurrencia
+- Latencia media móvil (EWMA) de las generaciones
+
+y elige para cada request el endpoint menos cargado que ya tenga el modelo
+caliente. Un endpoint que falla por timeout o conexión queda fuera de la
+rotación durante `failure_cooldown` segundos y el request se reintenta en
+otro (failover).
+
+OllamaQueueManager usa el pool para que los límites de concurrencia sean
+por endpoint en lugar de globales.
+"""
+
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class EndpointState:
+    """
+    📍 ESTADO DE UN ENDPOINT DE OLLAMA
+    """
+    url: str
+    max_concurrent: int = 2
+    in_flight: int = 0
+    installed_models: Set[str] = field(default_factory=set)  # vacío = desconocido
+    loaded_models: Set[str] = field(default_factory=set)
+    latency_ewma: Optional[float] = None
+    requests_total: int = 0
+    failures_total: int = 0
+    timeouts_total: int = 0
+    consecutive_failures: int = 0
+    unavailable_until: float = 0.0
+
+    @property
+    def available(self) -> bool:
+        return time.time() >= self.unavailable_until
+
+    @property
+    def load(self) -> float:
+        return self.in_flight / max(1, self.max_concurrent)
+
+    @property
+    def has_capacity(self) -> bool:
+        return self.in_flight < self.max_concurrent
+
+    def can_serve(self, model: str) -> bool:
+        return not self.installed_models or model in self.installed_models
+
+    def is_warm(self, model: str) -> bool:
+        return model in self.loaded_models
+
+
+class OllamaEndpointPool:
+    """
+    🖧 BALANCEADOR DE REQUESTS ENTRE VARIOS ENDPOINTS DE OLLAMA
+
+    Args:
+        endpoints: URLs base de los endpoints
+        max_concurrent_per_endpoint: Requests simultáneos por endpoint
+        latency_alpha: Peso de la última medida en la EWMA de latencia
+        failure_cooldown: Segundos fuera de rotación tras un fallo
+    """
+
+    def __init__(self,
+                 endpoints: Iterable[str],
+                 max_concurrent_per_endpoint: int = 2,
+                 latency_alpha: float = 0.3,
+                 failure_cooldown: float = 30.0):
+        self.max_concurrent_per_endpoint = max_concurrent_per_endpoint
+        self.latency_alpha = latency_alpha
+        self.failure_cooldown = failure_cooldown
+
+        self._states: Dict[str, EndpointState] = {}
+        self._lock = threading.Lock()
+        self.failovers = 0
+
+        self.set_endpoints(endpoints)
+
+    @staticmethod
+    def normalize(url: str) -> str:
+        return url.rstrip('/')
+
+    @property
+    def endpoints(self) -> List[str]:
+        return list(self._states)
+
+    @property
+    def total_capacity(self) -> int:
+        """Suma de huecos de los endpoints en rotación"""
+        with self._lock:
+            return sum(state.max_concurrent for state in self._states.values() if state.available)
+
+    def __contains__(self, url: str) -> bool:
+        return self.normalize(url) in self._states
+
+    def set_endpoints(self, endpoints: Iterable[str]) -> None:
+        """Reemplazar el conjunto de endpoints conservando el estado de los que siguen"""
+        with self._lock:
+            urls = list(dict.fromkeys(self.normalize(url) for url in endpoints if url))
+            self._states = {
+                url: self._states.get(url) or EndpointState(url=url, max_concurrent=self.max_concurrent_per_endpoint)
+                for url in urls
+            }
+        logger.info(f"🖧 Pool de endpoints Ollama: {urls}")
+
+    # ------------------------------------------------------------------
+    # Selección
+    # ------------------------------------------------------------------
+
+    def _select_locked(self, model: str, exclude: Tuple[str, ...],
+                       require_capacity: bool) -> Optional[EndpointState]:
+        candidates = [
+            state for state in self._states.values()
+            if state.url not in exclude and state.can_serve(model)
+            and (state.has_capacity or not require_capacity)
+        ]
+        # Si todos están en cooldown no se bloquea la cola: se intenta igualmente
+        in_rotation = [state for state in candidates if state.available]
+        if in_rotation:
+            candidates = in_rotation
+        if not candidates:
+            return None
+
+        # Caliente primero, luego menos cargado, luego más rápido
+        return min(
+            candidates,
+            key=lambda state: (
+                not state.is_warm(model),
+                state.load,
+                state.latency_ewma if state.latency_ewma is not None else 0.0
+            )
+        )
+
+    def has_capacity(self, model: str) -> bool:
+        """¿Hay algún endpoint que pueda aceptar ya un request de este modelo?"""
+        with self._lock:
+            return self._select_locked(model, (), True) is not None
+
+    def choose(self, model: str) -> Optional[str]:
+        """Endpoint que elegiría acquire() para `model`, sin reservar hueco"""
+        with self._lock:
+            state = self._select_locked(model, (), False)
+            return state.url if state is not None else None
+
+    def acquire(self, model: str, exclude: Iterable[str] = (),
+                require_capacity: bool = True) -> Optional[str]:
+        """
+        🎯 RESERVAR UN HUECO EN EL MEJOR ENDPOINT PARA `model`
+
+        Returns:
+            URL del endpoint elegido o None si ninguno puede atenderlo
+        """
+        with self._lock:
+            state = self._select_locked(
+                model, tuple(self.normalize(url) for url in exclude), require_capacity
+            )
+            if state is None:
+                return None
+            state.in_flight += 1
+            state.requests_total += 1
+            return state.url
+
+    def release(self, url: str) -> None:
+        """Liberar el hueco reservado con acquire()"""
+        with self._lock:
+            state = self._states.get(self.normalize(url))
+            if state is not None and state.in_flight > 0:
+                state.in_flight -= 1
+
+    def failover(self, failed_url: str, model: str, tried: Iterable[str]) -> Optional[str]:
+        """
+        🔀 MOVER UN REQUEST FALLIDO A OTRO ENDPOINT
+
+        Reserva en otro endpoint (aunque esté lleno: el request ya tenía
+        hueco) y libera el del endpoint fallido.
+        """
+        alternative = self.acquire(model, exclude=tried, require_capacity=False)
+        if alternative is None:
+            return None
+        self.release(failed_url)
+        self.failovers += 1
+        logger.warning(f"🔀 Failover de {model}: {failed_url} → {alternative}")
+        return alternative
+
+    # ------------------------------------------------------------------
+    # Telemetría
+    # ------------------------------------------------------------------
+
+    def record_success(self, url: str, model: str, latency_seconds: float) -> None:
+        """✅ Generación completada: actualizar latencia y marcar el modelo como caliente"""
+        with self._lock:
+            state = self._states.get(self.normalize(url))
+            if state is None:
+                return
+            if state.latency_ewma is None:
+                state.latency_ewma = latency_seconds
+            else:
+                state.latency_ewma += self.latency_alpha * (latency_seconds - state.latency_ewma)
+            state.loaded_models.add(model)
+            state.consecutive_failures = 0
+            state.unavailable_until = 0.0
+
+    def record_failure(self, url: str, error: str = "", timed_out: bool = False) -> None:
+        """❌ Timeout o error de conexión: sacar el endpoint de rotación un tiempo"""
+        with self._lock:
+            state = self._states.get(self.normalize(url))
+            if state is None:
+                return
+            state.failures_total += 1
+            state.timeouts_total += int(timed_out)
+            state.consecutive_failures += 1
+            state.unavailable_until = time.time() + self.failure_cooldown
+        logger.warning(f"🚫 Endpoint Ollama {url} fuera de rotación {self.failure_cooldown}s: {error}")
+
+    def mark_loaded(self, url: str, model: str) -> None:
+        """Marcar un modelo como cargado tras una precarga"""
+        with self._lock:
+            state = self._states.get(self.normalize(url))
+            if state is not None:
+                state.loaded_models.add(model)
+
+    def update_models(self, url: str,
+                      installed: Optional[Iterable[str]] = None,
+                      loaded: Optional[Iterable[str]] = None) -> None:
+        """Actualizar modelos instalados/cargados a partir de /api/tags y /api/ps"""
+        with self._lock:
+            state = self._states.get(self.normalize(url))
+            if state is None:
+                return
+            if installed is not None:
+                state.installed_models = set(installed)
+            if loaded is not None:
+                state.loaded_models = set(loaded)
+
+    def get_status(self) -> Dict[str, Any]:
+        """📊 Estado de cada endpoint para rutas de monitoreo"""
+        with self._lock:
+            return {
+                'failovers': self.failovers,
+                'endpoints': [
+                    {
+                        'url': state.url,
+                        'available': state.available,
+                        'in_flight': state.in_flight,
+                        'max_concurrent': state.max_concurrent,
+                        'loaded_models': sorted(state.loaded_models),
+                        'installed_models_count': len(state.installed_models),
+                        'latency_ewma_seconds': round(state.latency_ewma, 3) if state.latency_ewma is not None else None,
+                        'requests_total': state.requests_total,
+                        'failures_total': state.failures_total,
+                        'timeouts_total': state.timeouts_total
+                    }
+                    for state in self._states.values()
+                ]
+            }
+
+
+# 🌐 INSTANCIA GLOBAL
+_global_pool: Optional[OllamaEndpointPool] = None
+_global_pool_lock = threading.Lock()
+
+
+def get_ollama_endpoint_pool() -> Optional[OllamaEndpointPool]:
+    """
+    🌐 OBTENER EL POOL GLOBAL DE ENDPOINTS
+
+    Solo existe si hay más de un endpoint configurado (OLLAMA_ENDPOINTS o
+    configuración runtime); con uno solo se mantiene el comportamiento de
+    límite global del gestor de cola.
+    """
+    global _global_pool
+
+    if _global_pool is None:
+        from ..config.ollama_config import get_ollama_config
+
+        config = get_ollama_config()
+        endpoints = config.endpoints
+        if len(endpoints) < 2:
+            return None
+
+        with _global_pool_lock:
+            if _global_pool is None:
+                _global_pool = OllamaEndpointPool(
+                    endpoints,
+                    max_concurrent_per_endpoint=config.max_concurrent_per_endpoint
+                )
+                logger.info("🌐 Nueva instancia global de OllamaEndpointPool creada")
+
+    return _global_pool
@@ -0,0 +1,315 @@
+"""
+🩺 MONITOR DE SALUD DE OLLAMA CON CACHÉ Y CIRCUIT BREAKER
+=========================================================
+
+Evita hacer un `GET /api/tags` síncrono antes de cada generación. Un thread
+de background mantiene una instantánea (salud + lista de modelos) con TTL y
+los llamadores consultan la caché en lugar de la red.
+
+CIRCUIT BREAKER:
+- CLOSED: funcionamiento normal, se cuentan fallos consecutivos
+- OPEN: tras `failure_threshold` fallos se considera Ollama caído sin hacer
+  ninguna llamada de red durante `reset_timeout` segundos
+- HALF_OPEN: pasado el reset_timeout se permite una sonda; si responde se
+  cierra el circuito, si falla se vuelve a abrir
+
+Las llamadas reales de generación también alimentan el breaker mediante
+report_success()/report_failure(), de modo que un Ollama caído se detecta
+sin esperar al siguiente sondeo.
+"""
+
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Callable, Dict, List, Optional, Any
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitState(Enum):
+    """Estados del circuit breaker de Ollama"""
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+@dataclass
+class HealthSnapshot:
+    """
+    📸 ÚLTIMO ESTADO CONOCIDO DE UN ENDPOINT DE OLLAMA
+    """
+    healthy: bool = False
+    models: List[str] = field(default_factory=list)
+    checked_at: float = 0.0
+    latency_ms: float = 0.0
+    error: Optional[str] = None
+
+    @property
+    def age_seconds(self) -> float:
+        """Segundos desde la última sonda (infinito si nunca se sondeó)"""
+        if not self.checked_at:
+            return float('inf')
+        return time.time() - self.checked_at
+
+
+class OllamaHealthMonitor:
+    """
+    🩺 MONITOR DE SALUD PARA UN ENDPOINT DE OLLAMA
+
+    Args:
+        endpoint: URL base del endpoint monitorizado
+        probe: Función que consulta el endpoint y devuelve la lista de modelos,
+               lanzando una excepción si no está disponible
+        ttl: Edad máxima (s) de la instantánea antes de re-sondear a demanda
+        interval: Intervalo (s) del sondeo de background
+        failure_threshold: Fallos consecutivos que abren el circuito
+        reset_timeout: Tiempo (s) que el circuito permanece abierto
+        idle_timeout: Sin consultas durante este tiempo (s) el sondeo de
+                      background se detiene; se reanuda en la siguiente consulta
+    """
+
+    def __init__(self,
+                 endpoint: str,
+                 probe: Callable[[], List[str]],
+                 ttl: float = 30.0,
+                 interval: float = 15.0,
+                 failure_threshold: int = 3,
+                 reset_timeout: float = 30.0,
+                 idle_timeout: float = 600.0):
+        self.endpoint = endpoint
+        self.probe = probe
+        self.ttl = ttl
+        self.interval = interval
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.idle_timeout = idle_timeout
+
+        self._snapshot = HealthSnapshot()
+        self._state = CircuitState.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._last_access = time.time()
+
+        self._lock = threading.Lock()
+        self._probe_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        # Métricas
+        self.probes_total = 0
+        self.probes_failed = 0
+        self.cache_hits = 0
+
+    # ------------------------------------------------------------------
+    # Ciclo de vida
+    # ------------------------------------------------------------------
+
+    def start(self) -> None:
+        """🚀 Arrancar el sondeo de background (idempotente)"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(
+                target=self._monitor_loop,
+                name=f"ollama_health[{self.endpoint}]",
+                daemon=True
+            )
+            self._thread.start()
+        logger.info(f"🩺 Monitor de salud de Ollama iniciado para {self.endpoint} (cada {self.interval}s)")
+
+    def stop(self) -> None:
+        """🛑 Detener el sondeo de background"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 1)
+            self._thread = None
+
+    def touch(self) -> None:
+        """Marcar el endpoint como en uso para que el sondeo siga (o vuelva a) activo"""
+        self._last_access = time.time()
+        self.start()
+
+    def _monitor_loop(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            if time.time() - self._last_access > self.idle_timeout:
+                # Endpoint sin consultas (p.ej. uno temporal): liberar el thread
+                logger.info(f"💤 Monitor de salud de {self.endpoint} inactivo, deteniendo sondeo")
+                break
+            try:
+                if self._probe_allowed():
+                    self.refresh()
+            except Exception as e:
+                logger.error(f"❌ Error en bucle de monitor de salud: {str(e)}")
+
+    # ------------------------------------------------------------------
+    # Sondeo y circuit breaker
+    # ------------------------------------------------------------------
+
+    def _probe_allowed(self) -> bool:
+        """Con el circuito abierto no se sondea hasta que vence reset_timeout"""
+        with self._lock:
+            if self._state != CircuitState.OPEN:
+                return True
+            if time.time() - self._opened_at >= self.reset_timeout:
+                self._state = CircuitState.HALF_OPEN
+                logger.info(f"🟡 Circuito de Ollama semi-abierto para {self.endpoint}, probando endpoint")
+                return True
+            return False
+
+    def refresh(self, blocking: bool = True) -> HealthSnapshot:
+        """
+        🔄 SONDEAR EL ENDPOINT AHORA Y ACTUALIZAR LA INSTANTÁNEA
+
+        Args:
+            blocking: Si es False y otra sonda está en curso, devuelve la
+                      instantánea actual sin esperar
+        """
+        if not self._probe_lock.acquire(blocking=blocking):
+            return self._snapshot
+
+        try:
+            started = time.time()
+            self.probes_total += 1
+            try:
+                models = self.probe()
+                latency_ms = (time.time() - started) * 1000
+                self._snapshot = HealthSnapshot(
+                    healthy=True,
+                    models=list(models or []),
+                    checked_at=time.time(),
+                    latency_ms=latency_ms
+                )
+                self.report_success()
+            except Exception as e:
+                self.probes_failed += 1
+                self._snapshot = HealthSnapshot(
+                    healthy=False,
+                    models=self._snapshot.models,
+                    checked_at=time.time(),
+                    latency_ms=(time.time() - started) * 1000,
+                    error=str(e)
+                )
+                self.report_failure(str(e))
+            return self._snapshot
+        finally:
+            self._probe_lock.release()
+
+    def report_success(self) -> None:
+        """✅ Registrar una interacción exitosa con el endpoint"""
+        with self._lock:
+            if self._state != CircuitState.CLOSED:
+                logger.info(f"🟢 Circuito de Ollama cerrado para {self.endpoint}")
+            self._state = CircuitState.CLOSED
+            self._consecutive_failures = 0
+
+    def report_failure(self, error: str = "") -> None:
+        """❌ Registrar un fallo de conexión con el endpoint"""
+        with self._lock:
+            self._consecutive_failures += 1
+            should_open = (
+                self._state == CircuitState.HALF_OPEN
+                or self._consecutive_failures >= self.failure_threshold
+            )
+            if should_open and self._state != CircuitState.OPEN:
+                logger.warning(
+                    f"🔴 Circuito de Ollama abierto para {self.endpoint} tras "
+                    f"{self._consecutive_failures} fallos: {error}"
+                )
+            if should_open:
+                self._state = CircuitState.OPEN
+                self._opened_at = time.time()
+
+    # ------------------------------------------------------------------
+    # Consultas (servidas desde caché)
+    # ------------------------------------------------------------------
+
+    @property
+    def state(self) -> CircuitState:
+        return self._state
+
+    def get_snapshot(self) -> HealthSnapshot:
+        """
+        📸 OBTENER LA INSTANTÁNEA DE SALUD
+
+        Solo hace red si nunca se ha sondeado (bloqueante), si la instantánea
+        superó el TTL (no bloqueante) o si toca la sonda semi-abierta.
+        """
+        self.touch()
+
+        if not self._snapshot.checked_at:
+            return self.refresh(blocking=True)
+
+        if not self._probe_allowed():
+            self.cache_hits += 1
+            return self._snapshot
+
+        if self._state == CircuitState.HALF_OPEN or self._snapshot.age_seconds > self.ttl:
+            return self.refresh(blocking=False)
+
+        self.cache_hits += 1
+        return self._snapshot
+
+    def is_healthy(self) -> bool:
+        """True si el endpoint respondió en la última sonda y el circuito no está abierto"""
+        snapshot = self.get_snapshot()
+        return snapshot.healthy and self._state != CircuitState.OPEN
+
+    def get_models(self) -> List[str]:
+        """Lista de modelos de la última sonda exitosa"""
+        return list(self.get_snapshot().models)
+
+    def get_status(self) -> Dict[str, Any]:
+        """📊 Estado del monitor para rutas de salud"""
+        snapshot = self._snapshot
+        return {
+            'endpoint': self.endpoint,
+            'healthy': snapshot.healthy and self._state != CircuitState.OPEN,
+            'circuit_state': self._state.value,
+            'consecutive_failures': self._consecutive_failures,
+            'last_check_age_seconds': round(snapshot.age_seconds, 2) if snapshot.checked_at else None,
+            'last_latency_ms': round(snapshot.latency_ms, 1),
+            'last_error': snapshot.error,
+            'models_count': len(snapshot.models),
+            'probes_total': self.probes_total,
+            'probes_failed': self.probes_failed,
+            'cache_hits': self.cache_hits
+        }
+
+
+# 🌐 REGISTRO GLOBAL DE MONITORES (uno por endpoint)
+_monitors: Dict[str, OllamaHealthMonitor] = {}
+_monitors_lock = threading.Lock()
+
+
+def get_ollama_health_monitor(endpoint: str, probe: Callable[[], List[str]]) -> OllamaHealthMonitor:
+    """
+    🌐 OBTENER EL MONITOR DE SALUD DE UN ENDPOINT
+
+    Todas las instancias de OllamaService que apuntan al mismo endpoint
+    comparten el mismo monitor y por tanto la misma caché.
+    """
+    with _monitors_lock:
+        monitor = _monitors.get(endpoint)
+        if monitor is None:
+            monitor = OllamaHealthMonitor(
+                endpoint=endpoint,
+                probe=probe,
+                ttl=float(os.getenv('OLLAMA_HEALTH_TTL', '30')),
+                interval=float(os.getenv('OLLAMA_HEALTH_INTERVAL', '15')),
+                failure_threshold=int(os.getenv('OLLAMA_HEALTH_FAILURE_THRESHOLD', '3')),
+                reset_timeout=float(os.getenv('OLLAMA_HEALTH_RESET_TIMEOUT', '30'))
+            )
+            _monitors[endpoint] = monitor
+        return monitor
+
+
+def shutdown_ollama_health_monitors() -> None:
+    """🛑 Detener todos los monitores de salud"""
+    with _monitors_lock:
+        for monitor in _monitors.values():
+            monitor.stop()
+        _monitors.clear()
@@ -0,0 +1,245 @@
+"""
+🔥 RESIDENCIA DE MODELOS DE OLLAMA (WARM-KEEPING Y PRECARGA)
+============================================================
+
+Cambiar de modelo (p.ej. llama3.1:8b → qwen3:32b) hace que el primer
+request pague la carga del modelo en GPU, a menudo decenas de segundos que
+consumen el timeout del paso. Este gestor:
+
+- Lleva la cuenta de qué modelos están residentes en cada endpoint
+  (/api/ps con TTL + las generaciones que completan con éxito). /api/ps se
+  consulta en segundo plano: las preguntas de residencia se responden
+  siempre desde la caché y nunca bloquean el thread del request
+- Lanza precargas en segundo plano (`/api/generate` con prompt vacío y
+  `keep_alive`) del modelo que va a ejecutar el plan, o al cambiar de
+  modelo con set_model
+- Deduplica precargas en curso para el mismo (endpoint, modelo)
+
+El transporte HTTP lo inyecta OllamaService (como la sonda del monitor de
+salud), así que este módulo no depende de requests.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (endpoint, modelo, keep_alive) -> None; lanza excepción si falla
+PreloadFn = Callable[[str, str, str], None]
+# endpoint -> modelos cargados en memoria
+RunningModelsFn = Callable[[str], List[str]]
+
+# Estados de paso que ya no necesitan modelo
+_FINISHED_STEP_STATES = frozenset({'completed', 'failed', 'skipped'})
+
+
+class ModelResidencyManager:
+    """
+    🔥 GESTOR DE MODELOS RESIDENTES POR ENDPOINT
+
+    Args:
+        preload_fn: Función que carga un modelo en un endpoint
+        running_fn: Función que devuelve los modelos cargados de un endpoint
+        keep_alive: Tiempo que Ollama debe mantener el modelo cargado
+        refresh_ttl: Edad máxima (s) de la lista de modelos cargados
+        max_workers: Precargas simultáneas
+    """
+
+    def __init__(self,
+                 preload_fn: PreloadFn,
+                 running_fn: Optional[RunningModelsFn] = None,
+                 keep_alive: str = '30m',
+                 refresh_ttl: float = 30.0,
+                 max_workers: int = 2):
+        self.preload_fn = preload_fn
+        self.running_fn = running_fn
+        self.keep_alive = keep_alive
+        self.refresh_ttl = refresh_ttl
+
+        self._resident: Dict[str, Dict[str, float]] = {}
+        self._refreshed_at: Dict[str, float] = {}
+        self._refreshing: Dict[str, Future] = {}
+        self._pending: Dict[Tuple[str, str], Future] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ollama_preload')
+        # Aparte de las precargas: una carga larga no debe retrasar /api/ps
+        self._refresh_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ollama_ps')
+
+        # Métricas
+        self.preloads_started = 0
+        self.preloads_failed = 0
+        self.preloads_skipped = 0
+
+    # ------------------------------------------------------------------
+    # Estado de residencia
+    # ------------------------------------------------------------------
+
+    def refresh(self, endpoint: str, force: bool = False) -> Optional[Future]:
+        """
+        🔄 ACTUALIZAR EN SEGUNDO PLANO LOS MODELOS CARGADOS DE UN ENDPOINT
+
+        Returns:
+            Future de la consulta a /api/ps (la misma si ya había una en
+            curso) o None si la lista está al día o no hay running_fn
+        """
+        if self.running_fn is None:
+            return None
+        with self._lock:
+            pending = self._refreshing.get(endpoint)
+            if pending is not None:
+                return pending
+            if not force and time.time() - self._refreshed_at.get(endpoint, 0.0) < self.refresh_ttl:
+                return None
+            future = self._refresh_executor.submit(self._run_refresh, endpoint)
+            self._refreshing[endpoint] = future
+            return future
+
+    def _run_refresh(self, endpoint: str) -> None:
+        try:
+            running: Optional[List[str]] = self.running_fn(endpoint)
+        except Exception as e:
+            logger.debug(f"No se pudieron consultar modelos cargados en {endpoint}: {e}")
+            running = None
+        now = time.time()
+        with self._lock:
+            self._refreshing.pop(endpoint, None)
+            # También tras un fallo: no reintentar antes del TTL
+            self._refreshed_at[endpoint] = now
+            if running is not None:
+                previous = self._resident.get(endpoint, {})
+                self._resident[endpoint] = {model: previous.get(model, now) for model in running}
+
+    def resident_models(self, endpoint: str) -> Set[str]:
+        """
+        Modelos cargados en el endpoint (según /api/ps y uso reciente)
+
+        Responde con lo conocido ahora mismo; si la lista está caducada se
+        pide otra en segundo plano para las próximas consultas.
+        """
+        self.refresh(endpoint)
+        with self._lock:
+            return set(self._resident.get(endpoint, {}))
+
+    def is_resident(self, endpoint: str, model: str) -> bool:
+        return model in self.resident_models(endpoint)
+
+    def mark_used(self, endpoint: str, model: str) -> None:
+        """Una generación terminó bien: el modelo está cargado en ese endpoint"""
+        with self._lock:
+            self._resident.setdefault(endpoint, {})[model] = time.time()
+
+    # ------------------------------------------------------------------
+    # Precarga
+    # ------------------------------------------------------------------
+
+    def preload(self, endpoint: str, model: str) -> Optional[Future]:
+        """
+        🔥 PRECARGAR UN MODELO EN SEGUNDO PLANO
+
+        Con la caché de /api/ps aún vacía se precarga igualmente: para un
+        modelo ya cargado Ollama responde al momento y solo renueva su
+        keep_alive.
+
+        Returns:
+            Future de la precarga (la misma si ya había una en curso) o None
+            si el modelo ya estaba residente
+        """
+        if self.is_resident(endpoint, model):
+            self.preloads_skipped += 1
+            return None
+
+        key = (endpoint, model)
+        with self._lock:
+            pending = self._pending.get(key)
+            if pending is not None and not pending.done():
+                return pending
+            future = self._executor.submit(self._run_preload, endpoint, model)
+            self._pending[key] = future
+            self.preloads_started += 1
+        logger.info(f"🔥 Precargando {model} en {endpoint} (keep_alive={self.keep_alive})")
+        return future
+
+    def _run_preload(self, endpoint: str, model: str) -> bool:
+        started = time.time()
+        try:
+            self.preload_fn(endpoint, model, self.keep_alive)
+            self.mark_used(endpoint, model)
+            logger.info(f"✅ {model} residente en {endpoint} ({time.time() - started:.1f}s)")
+            return True
+        except Exception as e:
+            self.preloads_failed += 1
+            logger.warning(f"⚠️ Falló la precarga de {model} en {endpoint}: {e}")
+            return False
+        finally:
+            with self._lock:
+                self._pending.pop((endpoint, model), None)
+
+    @staticmethod
+    def has_pending_steps(plan_steps: Iterable[Dict[str, Any]]) -> bool:
+        """¿Le queda al plan algún paso por ejecutar?"""
+        return any(
+            isinstance(step, dict) and not step.get('completed')
+            and step.get('status') not in _FINISHED_STEP_STATES
+            for step in plan_steps or []
+        )
+
+    def prepare_for_plan(self,
+                         plan_steps: Iterable[Dict[str, Any]],
+                         model: str,
+                         endpoint: str) -> List[str]:
+        """
+        📋 PRECARGAR EL MODELO QUE EJECUTARÁ LOS PRÓXIMOS PASOS
+
+        Todos los pasos se ejecutan con el modelo actual del servicio (los
+        pasos no eligen modelo), así que es el único que se precarga.
+
+        Returns:
+            Modelos para los que se lanzó una precarga
+        """
+        if not model or not self.has_pending_steps(plan_steps):
+            return []
+        return [model] if self.preload(endpoint, model) is not None else []
+
+    def get_status(self) -> Dict[str, Any]:
+        """📊 Modelos residentes y precargas"""
+        now = time.time()
+        with self._lock:
+            return {
+                'keep_alive': self.keep_alive,
+                'resident': {
+                    endpoint: {model: round(now - last_used, 1) for model, last_used in models.items()}
+                    for endpoint, models in self._resident.items()
+                },
+                'preloading': [f"{model}@{endpoint}" for endpoint, model in self._pending],
+                'preloads_started': self.preloads_started,
+                'preloads_failed': self.preloads_failed,
+                'preloads_skipped': self.preloads_skipped
+            }
+
+
+# 🌐 INSTANCIA GLOBAL
+_global_manager: Optional[ModelResidencyManager] = None
+_global_manager_lock = threading.Lock()
+
+
+def get_model_residency_manager(preload_fn: PreloadFn,
+                                running_fn: Optional[RunningModelsFn] = None,
+                                keep_alive: str = '30m') -> ModelResidencyManager:
+    """
+    🌐 OBTENER EL GESTOR GLOBAL DE RESIDENCIA
+
+    El transporte se fija en la primera llamada; todas las instancias de
+    OllamaService comparten el mismo estado de residencia.
+    """
+    global _global_manager
+
+    if _global_manager is None:
+        with _global_manager_lock:
+            if _global_manager is None:
+                _global_manager = ModelResidencyManager(preload_fn, running_fn, keep_alive=keep_alive)
+                logger.info("🌐 Nueva instancia global de ModelResidencyManager creada")
+
+    return _global_manager
@@ -8,7 +8,13 @@ estabilidad del sistema cuando múltiples tareas están activas simultáneamente
 
 CARACTERÍSTICAS:
 - ✅ Límite configurable de llamadas concurrentes (por defecto: 2)
-- ✅ Cola FIFO para requests en espera
+- ✅ Cola de prioridad (heap) con despacho explícito al liberarse un hueco
+- ✅ Envejecimiento (aging) para que los requests LOW no sufran inanición
+- ✅ Equidad por tarea: una tarea con muchos requests no bloquea a las demás
+- ✅ Deduplicación single-flight: requests idénticos comparten una ejecución
+- ✅ Límites de concurrencia por endpoint cuando hay varios Ollama
+- ✅ Concurrencia adaptativa por modelo (AIMD) y descarte de carga LOW
+- ✅ Agrupación por modelo: se evita alternar modelos (recargas en GPU)
 - ✅ Timeout personalizado por request
 - ✅ Priorización de tareas por importancia
 - ✅ Logs detallados para debugging
@@ -24,9 +30,17 @@ llamar a Ollama al mismo tiempo, causando:
 - Degradación del rendimiento
 
 SOLUCIÓN:
-Este gestor controla el acceso a Ollama usando un semáforo asyncio,
-garantizando que solo un número limitado de requests se procesen
-simultáneamente, mientras mantiene una cola para los demás.
+Este gestor controla el acceso a Ollama con un contador de huecos y un
+heap de requests en espera. Cuando un hueco se libera se despacha
+explícitamente la cabeza del heap, de modo que el orden de ejecución lo
+decide la prioridad efectiva y no qué corutina despierta primero.
+
+PRIORIDAD EFECTIVA (menor clave = se despacha antes):
+    clave = t_encolado - prioridad * aging_seconds_per_level
+            + carga_de_la_tarea * task_fairness_penalty
+Como el término t_encolado es común al paso del tiempo, la clave es
+estable y equivale a subir un nivel de prioridad cada
+aging_seconds_per_level segundos de espera.
 
 Creado por: Sistema de reintentos de 5 pasos
 Fecha: 2025-01-03
@@ -34,18 +48,37 @@ Versión: 1.0.0
 """
 
 import asyncio
+import hashlib
+import heapq
+import itertools
+import json
 import logging
+import os
 import time
 import uuid
 from datetime import datetime, timedelta
 from enum import Enum
-from typing import Dict, List, Optional, Any, Callable, Awaitable
+from typing import Dict, List, Optional, Any, Callable, Awaitable, Set
 from dataclasses import dataclass, field
 from concurrent.futures import ThreadPoolExecutor
 import threading
 
+from .ollama_adaptive_limiter import AdaptiveConcurrencyLimiter, token_latency
+from .ollama_endpoint_pool import OllamaEndpointPool, get_ollama_endpoint_pool
+
 logger = logging.getLogger(__name__)
 
+class QueueOverloadedError(RuntimeError):
+    """
+    🚧 REQUEST RECHAZADO POR DESCARTE DE CARGA
+    
+    Incluye retry_after: segundos sugeridos antes de reintentar.
+    """
+    
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
 class RequestPriority(Enum):
     """
     🔴 NIVELES DE PRIORIDAD PARA REQUESTS DE OLLAMA
@@ -89,6 +122,23 @@ class OllamaRequest:
     retry_count: int = 0
     last_error: Optional[str] = None
     
+    # Single-flight: requests idénticos en vuelo comparten resultado
+    coalesce: bool = True
+    
+    # Endpoint asignado al conceder el hueco (solo con pool de endpoints)
+    endpoint: Optional[str] = None
+    
+    # Progreso de streaming (solo si el request se sirve token a token)
+    streaming: bool = False
+    tokens_streamed: int = 0
+    first_token_at: Optional[datetime] = None
+    
+    def record_streamed_token(self) -> None:
+        """Registrar un token recibido de Ollama durante el streaming"""
+        if self.first_token_at is None:
+            self.first_token_at = datetime.now()
+        self.tokens_streamed += 1
+    
     def __post_init__(self):
         """Validaciones y configuración post-inicialización"""
         if not self.prompt.strip():
@@ -111,6 +161,16 @@ class OllamaRequest:
         """Tiempo transcurrido desde la creación del request"""
         return (datetime.now() - self.created_at).total_seconds()
     
+    @property
+    def coalescing_key(self) -> str:
+        """Clave de deduplicación: (modelo, hash del prompt, opciones)"""
+        material = json.dumps(
+            {'model': self.model, 'prompt': self.prompt, 'options': self.options},
+            sort_keys=True,
+            default=str
+        )
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+    
     @property
     def processing_time_seconds(self) -> Optional[float]:
         """Tiempo de procesamiento si está completado"""
@@ -139,6 +199,11 @@ class QueueStats:
     ollama_errors: int = 0
     timeout_errors: int = 0
     
+    coalesced_requests: int = 0
+    coalescing_handoffs: int = 0
+    shed_requests: int = 0
+    model_batched_requests: int = 0
+    
     uptime_start: datetime = field(default_factory=datetime.now)
     
     @property
@@ -153,6 +218,36 @@ class QueueStats:
             return 0.0
         return (self.requests_completed / self.uptime_seconds) * 60
 
+@dataclass(order=True)
+class QueueEntry:
+    """
+    🧾 ENTRADA DEL HEAP DE ESPERA
+    
+    Se ordena por (sort_key, sequence); el resto de campos no participa
+    en la comparación. Las entradas canceladas se marcan y se descartan
+    al llegar a la cabeza del heap (borrado perezoso).
+    """
+    sort_key: float
+    sequence: int
+    request: OllamaRequest = field(compare=False)
+    slot: asyncio.Future = field(compare=False)
+    granted: bool = field(default=False, compare=False)
+    cancelled: bool = field(default=False, compare=False)
+
+@dataclass
+class InFlightGroup:
+    """
+    🛫 GRUPO SINGLE-FLIGHT
+    
+    Un request líder se encola y ejecuta; los requests idénticos que llegan
+    mientras está en cola o en proceso se adjuntan y reciben su resultado.
+    """
+    key: str
+    leader: OllamaRequest
+    result: asyncio.Future
+    entry: Optional[QueueEntry] = None
+    followers: int = 0
+
 class OllamaQueueManager:
     """
     🚦 GESTOR PRINCIPAL DE COLA PARA OLLAMA
@@ -164,12 +259,36 @@ class OllamaQueueManager:
     - max_concurrent_requests: Máximo número de requests simultáneos (defecto: 2)
     - max_queue_size: Tamaño máximo de cola (defecto: 50)
     - cleanup_interval: Intervalo de limpieza en segundos (defecto: 300)
+    - aging_seconds_per_level: Espera que equivale a subir un nivel de prioridad
+    - task_fairness_penalty: Segundos de penalización por cada request que la
+      misma tarea ya tiene en cola o en proceso
+    - endpoint_pool: Si se indica, el límite de concurrencia es el de cada
+      endpoint y cada request se asigna al mejor endpoint al despacharse
+    - adaptive_limiter: Si se indica, además limita la concurrencia de cada
+      modelo según su latencia y timeouts; max_concurrent_requests (o el
+      pool) actúa como techo
+    - shed_queue_size / shed_wait_seconds: SLO de cola; si ambos se superan
+      los requests LOW se rechazan al instante con un retry_after
+    - model_batch_window: Un request del último modelo despachado puede
+      adelantarse a la cabeza del heap si su clave es como mucho estos
+      segundos mayor; así los requests se agrupan por modelo y Ollama no
+      descarga y recarga modelos alternando entre ellos (0 = desactivado)
+    
+    Todas las operaciones sobre el heap ocurren en el event loop del
+    despachador sin puntos de espera intermedios, por lo que no necesitan lock.
     """
     
     def __init__(self, 
                  max_concurrent_requests: int = 2,
                  max_queue_size: int = 50,
-                 cleanup_interval: int = 300):
+                 cleanup_interval: int = 300,
+                 aging_seconds_per_level: float = 30.0,
+                 task_fairness_penalty: float = 10.0,
+                 endpoint_pool: Optional[OllamaEndpointPool] = None,
+                 adaptive_limiter: Optional[AdaptiveConcurrencyLimiter] = None,
+                 shed_queue_size: Optional[int] = None,
+                 shed_wait_seconds: float = 60.0,
+                 model_batch_window: float = 0.0):
         """
         Inicializar el gestor de cola de Ollama
         
@@ -177,17 +296,42 @@ class OllamaQueueManager:
             max_concurrent_requests: Máximo requests concurrentes a Ollama
             max_queue_size: Tamaño máximo de la cola de espera
             cleanup_interval: Intervalo de limpieza en segundos
+            aging_seconds_per_level: Segundos de espera por nivel de prioridad ganado
+            task_fairness_penalty: Penalización (s) por request pendiente de la misma tarea
+            endpoint_pool: Pool de endpoints para balanceo (None = un solo endpoint)
+            adaptive_limiter: Limitador AIMD por modelo (None = límite fijo)
+            shed_queue_size: Tamaño de cola a partir del cual se descartan LOW (None = nunca)
+            shed_wait_seconds: Espera media (s) a partir de la cual se descartan LOW
+            model_batch_window: Adelanto máximo (s) para agrupar requests del mismo modelo
         """
         self.max_concurrent_requests = max_concurrent_requests
         self.max_queue_size = max_queue_size
         self.cleanup_interval = cleanup_interval
+        self.aging_seconds_per_level = aging_seconds_per_level
+        self.task_fairness_penalty = task_fairness_penalty
+        self.endpoint_pool = endpoint_pool
+        self.adaptive_limiter = adaptive_limiter
+        self.shed_queue_size = shed_queue_size
+        self.shed_wait_seconds = shed_wait_seconds
+        self.model_batch_window = model_batch_window
+        
+        # Último modelo despachado (el que está cargado en Ollama)
+        self._last_model: Optional[str] = None
+        
+        # Espera reciente en cola (EWMA) para el descarte de carga
+        self._wait_ewma = 0.0
+        
+        # Heap de requests en espera + índice por request_id
+        self._heap: List[QueueEntry] = []
+        self._waiting: Dict[str, QueueEntry] = {}
+        self._sequence = itertools.count()
         
-        # Semáforo para controlar concurrencia
-        self._semaphore = asyncio.Semaphore(max_concurrent_requests)
+        # Huecos de ejecución ocupados y carga pendiente por tarea
+        self._active_count = 0
+        self._task_load: Dict[str, int] = {}
         
-        # Cola prioritaria - organizamos por prioridad
-        self._queue: List[OllamaRequest] = []
-        self._queue_lock = asyncio.Lock()
+        # Grupos single-flight por clave de deduplicación
+        self._inflight: Dict[str, InFlightGroup] = {}
         
         # Estado interno
         self._processing_requests: Dict[str, OllamaRequest] = {}
@@ -206,6 +350,8 @@ class OllamaQueueManager:
         logger.info(f"   - Max requests concurrentes: {max_concurrent_requests}")
         logger.info(f"   - Tamaño máximo de cola: {max_queue_size}")
         logger.info(f"   - Intervalo de limpieza: {cleanup_interval}s")
+        if endpoint_pool is not None:
+            logger.info(f"   - Endpoints: {endpoint_pool.endpoints}")
     
     async def start(self) -> None:
         """
@@ -227,6 +373,11 @@ class OllamaQueueManager:
         """
         self._shutdown = True
         
+        # Despertar a los requests que siguen esperando hueco
+        for entry in list(self._waiting.values()):
+            if not entry.slot.done():
+                entry.slot.set_exception(RuntimeError("OllamaQueueManager está cerrado"))
+        
         if self._cleanup_task and not self._cleanup_task.done():
             self._cleanup_task.cancel()
             try:
@@ -245,8 +396,11 @@ class OllamaQueueManager:
         """
         📥 ENCOLAR UN REQUEST PARA PROCESAMIENTO
         
-        Agrega un request a la cola y espera su procesamiento,
-        respetando prioridades y límites de concurrencia.
+        Agrega un request al heap y espera a que el despachador le asigne
+        un hueco, respetando prioridad efectiva, equidad por tarea y
+        límites de concurrencia. Si ya hay un request idéntico (mismo
+        modelo, prompt y opciones) en cola o en proceso, este se adjunta a
+        él y comparte su resultado sin volver a ejecutar en la GPU.
         
         Args:
             ollama_request: Request a procesar
@@ -262,102 +416,212 @@ class OllamaQueueManager:
         if self._shutdown:
             raise RuntimeError("OllamaQueueManager está cerrado")
         
-        # Verificar tamaño de cola
-        async with self._queue_lock:
-            if len(self._queue) >= self.max_queue_size:
-                self.stats.requests_failed += 1
-                raise RuntimeError(f"Cola de Ollama llena (max: {self.max_queue_size})")
-            
-            # Insertar en posición correcta según prioridad
-            inserted = False
-            for i, queued_request in enumerate(self._queue):
-                if ollama_request.priority.value > queued_request.priority.value:
-                    self._queue.insert(i, ollama_request)
-                    inserted = True
-                    break
+        if not ollama_request.coalesce:
+            return await self._enqueue_and_execute(ollama_request, execution_callback)
+        
+        key = ollama_request.coalescing_key
+        flight = self._inflight.get(key)
+        if flight is not None:
+            return await self._join_flight(flight, ollama_request, execution_callback)
+        return await self._lead_flight(key, ollama_request, execution_callback)
+    
+    async def _lead_flight(self,
+                           key: str,
+                           ollama_request: OllamaRequest,
+                           execution_callback: Callable[[OllamaRequest], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        """
+        🛫 EJECUTAR COMO LÍDER DE UN GRUPO SINGLE-FLIGHT
+        
+        El resultado se comparte con los seguidores salvo que el líder no
+        llegue a completar la llamada (cancelación, timeout o rechazo de la
+        cola): entonces el grupo se resuelve con None y un seguidor toma el
+        relevo con su propio request en lugar de heredar ese error.
+        """
+        flight = InFlightGroup(
+            key=key,
+            leader=ollama_request,
+            result=asyncio.get_running_loop().create_future()
+        )
+        self._inflight[key] = flight
+        
+        try:
+            result = await self._enqueue_and_execute(ollama_request, execution_callback, flight)
+        except BaseException:
+            if not flight.result.done():
+                flight.result.set_result(None)
+            raise
+        finally:
+            if self._inflight.get(key) is flight:
+                del self._inflight[key]
+        
+        if not flight.result.done():
+            handed_over = isinstance(result, dict) and result.get('error_type') == 'timeout'
+            flight.result.set_result(None if handed_over else result)
+        return result
+    
+    async def _join_flight(self,
+                           flight: InFlightGroup,
+                           ollama_request: OllamaRequest,
+                           execution_callback: Callable[[OllamaRequest], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        """
+        🔗 ADJUNTAR UN REQUEST IDÉNTICO A UNO YA EN VUELO
+        
+        Si el seguidor tiene más prioridad que el líder y este aún espera en
+        cola, el líder hereda esa prioridad. Si el líder no completa la
+        llamada, el primer seguidor en despertar lidera un grupo nuevo y el
+        resto se adjunta a él.
+        """
+        self.stats.coalesced_requests += 1
+        logger.info(
+            f"🔗 Request {ollama_request.request_id} (tarea: {ollama_request.task_id}) "
+            f"deduplicado con {flight.leader.request_id}"
+        )
+        
+        while True:
+            flight.followers += 1
+            self._promote(flight, ollama_request.priority)
             
-            if not inserted:
-                self._queue.append(ollama_request)
+            # shield: cancelar a un seguidor no debe cancelar el resultado compartido
+            result = await asyncio.shield(flight.result)
+            if result is not None:
+                return dict(result)
             
-            self.stats.requests_queued += 1
-            self.stats.current_queue_size = len(self._queue)
-            self.stats.max_queue_size_reached = max(self.stats.max_queue_size_reached, self.stats.current_queue_size)
+            if self._shutdown:
+                raise RuntimeError("OllamaQueueManager está cerrado")
+            flight = self._inflight.get(flight.key)
+            if flight is None:
+                self.stats.coalescing_handoffs += 1
+                logger.info(f"🔁 Request {ollama_request.request_id} toma el relevo del líder no completado")
+                return await self._lead_flight(ollama_request.coalescing_key, ollama_request, execution_callback)
+    
+    def _promote(self, flight: InFlightGroup, priority: RequestPriority) -> None:
+        """Subir la prioridad de un líder que todavía está en el heap"""
+        entry = flight.entry
+        if entry is None or entry.granted or entry.cancelled:
+            return
+        
+        boost = priority.value - entry.request.priority.value
+        if boost <= 0:
+            return
+        
+        entry.request.priority = priority
+        entry.cancelled = True
+        promoted = QueueEntry(
+            sort_key=entry.sort_key - boost * self.aging_seconds_per_level,
+            sequence=next(self._sequence),
+            request=entry.request,
+            slot=entry.slot
+        )
+        heapq.heappush(self._heap, promoted)
+        self._waiting[entry.request.request_id] = promoted
+        flight.entry = promoted
+        self._dispatch_pending()
+    
+    async def _enqueue_and_execute(self,
+                                   ollama_request: OllamaRequest,
+                                   execution_callback: Callable[[OllamaRequest], Awaitable[Dict[str, Any]]],
+                                   flight: Optional[InFlightGroup] = None) -> Dict[str, Any]:
+        """Encolar en el heap, esperar hueco y ejecutar el callback"""
+        # Verificar tamaño de cola
+        if len(self._waiting) >= self.max_queue_size:
+            self.stats.requests_failed += 1
+            raise RuntimeError(f"Cola de Ollama llena (max: {self.max_queue_size})")
+        
+        # Descarte de carga: con la cola por encima del SLO, LOW no entra
+        if ollama_request.priority == RequestPriority.LOW and self._is_overloaded():
+            retry_after = round(max(1.0, self._estimated_wait()), 1)
+            self.stats.shed_requests += 1
+            logger.warning(
+                f"🚧 Request LOW {ollama_request.request_id} descartado: cola {len(self._waiting)}, "
+                f"espera estimada {retry_after}s"
+            )
+            raise QueueOverloadedError(
+                f"Cola de Ollama saturada, reintentar en {retry_after}s",
+                retry_after=retry_after
+            )
+        
+        entry = self._push(ollama_request)
+        if flight is not None:
+            flight.entry = entry
         
         logger.info(f"📥 Request encolado: {ollama_request.request_id} (tarea: {ollama_request.task_id}, prioridad: {ollama_request.priority.name})")
-        logger.info(f"📊 Cola actual: {len(self._queue)} requests, {len(self._processing_requests)} procesando")
+        logger.info(f"📊 Cola actual: {len(self._waiting)} requests, {len(self._processing_requests)} procesando")
+        
+        self._dispatch_pending()
         
         try:
-            # Esperar a que el semáforo permita procesar
-            async with self._semaphore:
-                # Obtener el request de la cola
-                async with self._queue_lock:
-                    if ollama_request in self._queue:
-                        self._queue.remove(ollama_request)
-                        self.stats.current_queue_size = len(self._queue)
-                        self._processing_requests[ollama_request.request_id] = ollama_request
-                        self.stats.requests_processing += 1
-                        ollama_request.started_at = datetime.now()
+            # Esperar a que el despachador asigne un hueco a este request
+            try:
+                await entry.slot
+            except asyncio.CancelledError:
+                self._abandon(entry)
+                raise
+            
+            wait_time = (ollama_request.started_at - ollama_request.created_at).total_seconds()
+            self._wait_ewma += 0.2 * (wait_time - self._wait_ewma)
+            logger.info(f"🔄 Procesando request {ollama_request.request_id} (esperó {wait_time:.1f}s en cola)")
+            
+            # Ejecutar la llamada real a Ollama con timeout
+            try:
+                result = await asyncio.wait_for(
+                    execution_callback(ollama_request),
+                    timeout=ollama_request.timeout
+                )
+                
+                # Marcar como completado exitosamente
+                ollama_request.completed_at = datetime.now()
+                processing_time = ollama_request.processing_time_seconds
+                self._record_outcome(ollama_request, result)
+                
+                self._completed_requests[ollama_request.request_id] = ollama_request
+                self.stats.requests_completed += 1
+                
+                # Actualizar estadísticas
+                self._update_average_times(wait_time, processing_time)
+                
+                logger.info(f"✅ Request {ollama_request.request_id} completado exitosamente (procesado en {processing_time:.1f}s)")
+                
+                return result
+                
+            except asyncio.TimeoutError:
+                if self.adaptive_limiter is not None:
+                    self.adaptive_limiter.on_timeout(ollama_request.model)
+                self.stats.timeout_errors += 1
+                self.stats.requests_failed += 1
+                error_msg = f"Timeout después de {ollama_request.timeout}s para modelo {ollama_request.model}"
+                logger.error(f"⏱️ {error_msg} - Request: {ollama_request.request_id}")
+                
+                ollama_request.last_error = error_msg
+                ollama_request.completed_at = datetime.now()
+                self._failed_requests[ollama_request.request_id] = ollama_request
+                
+                return {'error': error_msg, 'error_type': 'timeout'}
+                
+            except asyncio.CancelledError:
+                raise
+                
+            except Exception as e:
+                self.stats.ollama_errors += 1
+                self.stats.requests_failed += 1
+                error_msg = str(e)
+                logger.error(f"❌ Error en request {ollama_request.request_id}: {error_msg}")
+                
+                ollama_request.last_error = error_msg
+                ollama_request.completed_at = datetime.now()
+                self._failed_requests[ollama_request.request_id] = ollama_request
                 
-                wait_time = (ollama_request.started_at - ollama_request.created_at).total_seconds()
-                logger.info(f"🔄 Procesando request {ollama_request.request_id} (esperó {wait_time:.1f}s en cola)")
+                return {'error': error_msg, 'error_type': 'ollama_error'}
                 
-                # Ejecutar la llamada real a Ollama con timeout
-                try:
-                    result = await asyncio.wait_for(
-                        execution_callback(ollama_request),
-                        timeout=ollama_request.timeout
-                    )
-                    
-                    # Marcar como completado exitosamente
-                    ollama_request.completed_at = datetime.now()
-                    processing_time = ollama_request.processing_time_seconds
-                    
-                    self._completed_requests[ollama_request.request_id] = ollama_request
-                    self.stats.requests_completed += 1
-                    
-                    # Actualizar estadísticas
-                    self._update_average_times(wait_time, processing_time)
-                    
-                    logger.info(f"✅ Request {ollama_request.request_id} completado exitosamente (procesado en {processing_time:.1f}s)")
-                    
-                    return result
-                    
-                except asyncio.TimeoutError:
-                    self.stats.timeout_errors += 1
-                    self.stats.requests_failed += 1
-                    error_msg = f"Timeout después de {ollama_request.timeout}s para modelo {ollama_request.model}"
-                    logger.error(f"⏱️ {error_msg} - Request: {ollama_request.request_id}")
-                    
-                    ollama_request.last_error = error_msg
-                    ollama_request.completed_at = datetime.now()
-                    self._failed_requests[ollama_request.request_id] = ollama_request
-                    
-                    return {'error': error_msg, 'error_type': 'timeout'}
-                    
-                except Exception as e:
-                    self.stats.ollama_errors += 1
-                    self.stats.requests_failed += 1
-                    error_msg = str(e)
-                    logger.error(f"❌ Error en request {ollama_request.request_id}: {error_msg}")
-                    
-                    ollama_request.last_error = error_msg
-                    ollama_request.completed_at = datetime.now()
-                    self._failed_requests[ollama_request.request_id] = ollama_request
-                    
-                    return {'error': error_msg, 'error_type': 'ollama_error'}
-                    
-                finally:
-                    # Limpiar del tracking de procesamiento
-                    if ollama_request.request_id in self._processing_requests:
-                        del self._processing_requests[ollama_request.request_id]
-                        self.stats.requests_processing -= 1
+            finally:
+                # Liberar el hueco y despachar el siguiente de la cola
+                self._release(ollama_request)
+        
+        except asyncio.CancelledError:
+            raise
         
         except Exception as e:
-            # Error en el manejo de cola o semáforo
-            async with self._queue_lock:
-                if ollama_request in self._queue:
-                    self._queue.remove(ollama_request)
-                    self.stats.current_queue_size = len(self._queue)
+            # Error en el manejo de cola
+            self._abandon(entry)
             
             self.stats.requests_failed += 1
             error_msg = f"Error en gestor de cola: {str(e)}"
@@ -365,6 +629,189 @@ class OllamaQueueManager:
             
             return {'error': error_msg, 'error_type': 'queue_error'}
     
+    # ------------------------------------------------------------------
+    # 🧮 PLANIFICADOR: heap, despacho explícito y liberación de huecos
+    # ------------------------------------------------------------------
+    
+    def _compute_sort_key(self, ollama_request: OllamaRequest) -> float:
+        """
+        Clave de prioridad efectiva (menor = antes)
+        
+        Combina instante de encolado, prioridad (convertida en segundos de
+        antigüedad equivalente) y la carga pendiente de la misma tarea.
+        """
+        task_load = self._task_load.get(ollama_request.task_id, 0)
+        return (
+            time.monotonic()
+            - ollama_request.priority.value * self.aging_seconds_per_level
+            + task_load * self.task_fairness_penalty
+        )
+    
+    def _push(self, ollama_request: OllamaRequest) -> QueueEntry:
+        """Insertar un request en el heap de espera (O(log n))"""
+        entry = QueueEntry(
+            sort_key=self._compute_sort_key(ollama_request),
+            sequence=next(self._sequence),
+            request=ollama_request,
+            slot=asyncio.get_running_loop().create_future()
+        )
+        heapq.heappush(self._heap, entry)
+        self._waiting[ollama_request.request_id] = entry
+        self._task_load[ollama_request.task_id] = self._task_load.get(ollama_request.task_id, 0) + 1
+        
+        self.stats.requests_queued += 1
+        self.stats.current_queue_size = len(self._waiting)
+        self.stats.max_queue_size_reached = max(self.stats.max_queue_size_reached, self.stats.current_queue_size)
+        return entry
+    
+    def _has_free_slot(self, entry: QueueEntry) -> bool:
+        """¿Puede ejecutarse ya esta entrada?"""
+        if self.adaptive_limiter is not None and not self.adaptive_limiter.has_capacity(entry.request.model):
+            return False
+        if self.endpoint_pool is not None:
+            return self.endpoint_pool.has_capacity(entry.request.model)
+        return self._active_count < self.max_concurrent_requests
+    
+    def _dispatch_pending(self) -> None:
+        """
+        🚀 DESPACHAR EN ORDEN DE PRIORIDAD MIENTRAS HAYA HUECOS LIBRES
+        
+        Una entrada que no puede ejecutarse (su modelo está en su límite
+        adaptativo o sin endpoint libre) no bloquea a las siguientes: se
+        aparta junto con el resto de entradas de su modelo, se sigue
+        buscando entre las de otros modelos y al terminar vuelven al heap.
+        """
+        skipped: List[QueueEntry] = []
+        blocked_models: Set[str] = set()
+        try:
+            while self._heap and not self._at_global_limit():
+                entry = self._heap[0]
+                if entry.cancelled:
+                    heapq.heappop(self._heap)
+                    continue
+                
+                if self._last_model not in blocked_models:
+                    batched = self._model_batch_candidate(entry)
+                    if batched is not None and self._has_free_slot(batched):
+                        # Sacar del heap una entrada interior: O(n), n <= max_queue_size
+                        self._heap.remove(batched)
+                        heapq.heapify(self._heap)
+                        self.stats.model_batched_requests += 1
+                        self._grant(batched)
+                        continue
+                    if batched is not None:
+                        blocked_models.add(self._last_model)
+                
+                heapq.heappop(self._heap)
+                model = entry.request.model
+                if model in blocked_models or not self._has_free_slot(entry):
+                    blocked_models.add(model)
+                    skipped.append(entry)
+                    continue
+                self._grant(entry)
+        finally:
+            for entry in skipped:
+                heapq.heappush(self._heap, entry)
+    
+    def _at_global_limit(self) -> bool:
+        """¿Están ocupados todos los huecos, sea cual sea el modelo?"""
+        return self.endpoint_pool is None and self._active_count >= self.max_concurrent_requests
+    
+    def _model_batch_candidate(self, head: QueueEntry) -> Optional[QueueEntry]:
+        """
+        Entrada del último modelo despachado que puede adelantarse a `head`
+        
+        Solo se adelanta una entrada cuya clave no supere la de la cabeza en
+        más de model_batch_window segundos, así que la cabeza espera como
+        mucho esa ventana: las entradas nuevas del mismo modelo llegan con
+        claves cada vez mayores y acaban quedando fuera.
+        """
+        if (self.model_batch_window <= 0 or self._last_model is None
+                or head.request.model == self._last_model):
+            return None
+        limit = head.sort_key + self.model_batch_window
+        best: Optional[QueueEntry] = None
+        for candidate in self._heap:
+            if (not candidate.cancelled and candidate.request.model == self._last_model
+                    and candidate.sort_key <= limit and (best is None or candidate < best)):
+                best = candidate
+        return best
+    
+    def _grant(self, entry: QueueEntry) -> None:
+        """Asignar un hueco de ejecución a una entrada"""
+        ollama_request = entry.request
+        self._waiting.pop(ollama_request.request_id, None)
+        self._active_count += 1
+        
+        self._processing_requests[ollama_request.request_id] = ollama_request
+        self.stats.requests_processing += 1
+        self.stats.current_queue_size = len(self._waiting)
+        ollama_request.started_at = datetime.now()
+        self._last_model = ollama_request.model
+        if self.endpoint_pool is not None:
+            ollama_request.endpoint = self.endpoint_pool.acquire(ollama_request.model)
+        if self.adaptive_limiter is not None:
+            self.adaptive_limiter.acquire(ollama_request.model)
+        
+        entry.granted = True
+        if not entry.slot.done():
+            entry.slot.set_result(True)
+    
+    def _release(self, ollama_request: OllamaRequest) -> None:
+        """Liberar el hueco de un request terminado y despachar el siguiente"""
+        if ollama_request.request_id in self._processing_requests:
+            del self._processing_requests[ollama_request.request_id]
+            self.stats.requests_processing -= 1
+            self._active_count -= 1
+            self._decrement_task_load(ollama_request.task_id)
+            if self.endpoint_pool is not None and ollama_request.endpoint:
+                self.endpoint_pool.release(ollama_request.endpoint)
+            if self.adaptive_limiter is not None:
+                self.adaptive_limiter.release(ollama_request.model)
+        self._dispatch_pending()
+    
+    def _record_outcome(self, ollama_request: OllamaRequest, result: Dict[str, Any]) -> None:
+        """Alimentar el limitador adaptativo con el resultado de una ejecución (latencia por token)"""
+        if self.adaptive_limiter is None or not isinstance(result, dict):
+            return
+        if result.get('error_type') == 'timeout':
+            self.adaptive_limiter.on_timeout(ollama_request.model)
+        elif 'error' not in result:
+            self.adaptive_limiter.on_success(ollama_request.model, token_latency(result))
+    
+    def _estimated_wait(self) -> float:
+        """Espera estimada para un request nuevo: la reciente o la del backlog actual"""
+        capacity = max(1, self._active_count)
+        backlog = len(self._waiting) * self.stats.average_processing_time / capacity
+        return max(self._wait_ewma, backlog)
+    
+    def _is_overloaded(self) -> bool:
+        """¿Se superan a la vez el SLO de tamaño de cola y el de espera?"""
+        if self.shed_queue_size is None:
+            return False
+        return len(self._waiting) >= self.shed_queue_size and self._estimated_wait() >= self.shed_wait_seconds
+    
+    def _abandon(self, entry: QueueEntry) -> None:
+        """Retirar una entrada cuyo llamador ya no espera (cancelación/error)"""
+        request_id = entry.request.request_id
+        if request_id in self._processing_requests:
+            self._release(entry.request)
+            return
+        
+        # La entrada vigente puede ser otra si el request fue promocionado
+        current = self._waiting.pop(request_id, None)
+        if current is not None:
+            current.cancelled = True
+            self._decrement_task_load(entry.request.task_id)
+            self.stats.current_queue_size = len(self._waiting)
+    
+    def _decrement_task_load(self, task_id: str) -> None:
+        remaining = self._task_load.get(task_id, 0) - 1
+        if remaining > 0:
+            self._task_load[task_id] = remaining
+        else:
+            self._task_load.pop(task_id, None)
+    
     def _update_average_times(self, wait_time: float, processing_time: Optional[float]) -> None:
         """Actualizar promedios de tiempo de manera eficiente"""
         if self.stats.requests_completed > 1:
@@ -390,31 +837,43 @@ class OllamaQueueManager:
         Returns:
             Diccionario con estadísticas y estado actual
         """
-        async with self._queue_lock:
-            queue_requests = [
-                {
-                    'request_id': req.request_id,
-                    'task_id': req.task_id,
-                    'priority': req.priority.name,
-                    'model': req.model,
-                    'age_seconds': req.age_seconds,
-                    'timeout': req.timeout
-                }
-                for req in self._queue
-            ]
+        # Orden de despacho: el heap ordenado sin entradas canceladas
+        queue_requests = [
+            {
+                'request_id': entry.request.request_id,
+                'task_id': entry.request.task_id,
+                'priority': entry.request.priority.name,
+                'model': entry.request.model,
+                'age_seconds': entry.request.age_seconds,
+                'timeout': entry.request.timeout
+            }
+            for entry in sorted(self._waiting.values())
+        ]
         
         processing_requests = [
             {
                 'request_id': req.request_id,
                 'task_id': req.task_id,
                 'model': req.model,
+                'endpoint': req.endpoint,
                 'started_at': req.started_at.isoformat() if req.started_at else None,
-                'age_seconds': req.age_seconds
+                'age_seconds': req.age_seconds,
+                'streaming': req.streaming,
+                'tokens_streamed': req.tokens_streamed,
+                'time_to_first_token': (
+                    (req.first_token_at - req.started_at).total_seconds()
+                    if req.first_token_at and req.started_at else None
+                )
             }
             for req in self._processing_requests.values()
         ]
         
-        return {
+        max_concurrent = (
+            self.endpoint_pool.total_capacity if self.endpoint_pool is not None
+            else self.max_concurrent_requests
+        )
+        
+        status = {
             'queue': {
                 'size': len(queue_requests),
                 'max_size': self.max_queue_size,
@@ -422,15 +881,40 @@ class OllamaQueueManager:
             },
             'processing': {
                 'active_count': len(processing_requests),
-                'max_concurrent': self.max_concurrent_requests,
+                'max_concurrent': max_concurrent,
                 'requests': processing_requests
             },
             'semaphore': {
-                'available_permits': self._semaphore._value if hasattr(self._semaphore, '_value') else 0
+                'available_permits': max(0, max_concurrent - self._active_count)
+            },
+            'coalescing': {
+                'inflight_groups': len(self._inflight),
+                'followers_waiting': sum(flight.followers for flight in self._inflight.values()),
+                'coalesced_requests': self.stats.coalesced_requests,
+                'leader_handoffs': self.stats.coalescing_handoffs
+            },
+            'load_shedding': {
+                'enabled': self.shed_queue_size is not None,
+                'queue_size_slo': self.shed_queue_size,
+                'wait_seconds_slo': self.shed_wait_seconds,
+                'estimated_wait_seconds': round(self._estimated_wait(), 2),
+                'overloaded': self._is_overloaded(),
+                'shed_requests': self.stats.shed_requests
+            },
+            'scheduler': {
+                'aging_seconds_per_level': self.aging_seconds_per_level,
+                'task_fairness_penalty': self.task_fairness_penalty,
+                'pending_by_task': dict(self._task_load)
+            },
+            'model_batching': {
+                'window_seconds': self.model_batch_window,
+                'last_model': self._last_model,
+                'batched_requests': self.stats.model_batched_requests
             },
             'stats': {
                 'total_requests': self.stats.requests_queued,
                 'successful_requests': self.stats.requests_completed,
+                'coalesced_requests': self.stats.coalesced_requests,
                 'failed_requests': self.stats.requests_failed,
                 'average_wait_time': self.stats.average_wait_time,
                 'average_processing_time': self.stats.average_processing_time
@@ -440,6 +924,11 @@ class OllamaQueueManager:
                 'created_at': datetime.now().isoformat()
             }
         }
+        if self.endpoint_pool is not None:
+            status['endpoints'] = self.endpoint_pool.get_status()
+        if self.adaptive_limiter is not None:
+            status['adaptive_concurrency'] = self.adaptive_limiter.get_status()
+        return status
     
     def get_active_requests_count(self) -> int:
         """Obtener número de requests activos (procesándose)"""
@@ -447,7 +936,7 @@ class OllamaQueueManager:
     
     def get_queue_size(self) -> int:
         """Obtener número de requests en cola esperando"""
-        return len(self._queue)
+        return len(self._waiting)
     
     async def _cleanup_loop(self) -> None:
         """
@@ -509,10 +998,22 @@ def get_ollama_queue_manager() -> OllamaQueueManager:
     global _global_queue_manager
     
     if _global_queue_manager is None:
+        adaptive = os.getenv('OLLAMA_ADAPTIVE_CONCURRENCY', 'true').lower() == 'true'
+        max_concurrent = int(os.getenv('OLLAMA_MAX_CONCURRENT', '8' if adaptive else '2'))
+        shed_queue_size = os.getenv('OLLAMA_SHED_QUEUE_SIZE', '10')
+        
         _global_queue_manager = OllamaQueueManager(
-            max_concurrent_requests=2,  # Máximo 2 requests concurrentes por defecto
+            max_concurrent_requests=max_concurrent,  # Techo global (fijo si no hay adaptativo)
             max_queue_size=20,          # Cola máxima de 20 requests
-            cleanup_interval=300        # Limpieza cada 5 minutos
+            cleanup_interval=300,       # Limpieza cada 5 minutos
+            endpoint_pool=get_ollama_endpoint_pool(),  # Solo con varios endpoints
+            adaptive_limiter=AdaptiveConcurrencyLimiter(
+                initial_limit=int(os.getenv('OLLAMA_INITIAL_CONCURRENCY', '2')),
+                max_limit=max_concurrent
+            ) if adaptive else None,
+            shed_queue_size=int(shed_queue_size) if shed_queue_size else None,
+            shed_wait_seconds=float(os.getenv('OLLAMA_SHED_WAIT_SECONDS', '60')),
+            model_batch_window=float(os.getenv('OLLAMA_MODEL_BATCH_WINDOW', '0'))
         )
         logger.info("🌐 Nueva instancia global de OllamaQueueManager creada")
     
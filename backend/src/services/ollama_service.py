@@ -17,8 +17,7 @@ import logging
 import asyncio
 import concurrent.futures
 import threading
-from typing import Dict, List, Optional, Any
-import requests
+from typing import Callable, Dict, List, Optional, Any
 from requests.exceptions import RequestException, Timeout
 
 # Importar configuración centralizada
@@ -28,9 +27,30 @@ from ..config.ollama_config import get_ollama_config, get_ollama_endpoint, get_o
 from .ollama_queue_manager import (
     OllamaQueueManager, 
     OllamaRequest, 
+    QueueOverloadedError,
     RequestPriority,
     get_ollama_queue_manager
 )
+from .ollama_dispatcher import get_ollama_dispatcher
+from .ollama_health_monitor import OllamaHealthMonitor, get_ollama_health_monitor
+from .ollama_streaming import StreamSink, TokenStreamBatcher
+from .llm_response_cache import LLMResponseCache, get_llm_response_cache
+from .tool_call_parser import ToolCallExtractor, parse_tool_calls
+from .http_session_pool import get_http_session_pool
+from .ollama_endpoint_pool import OllamaEndpointPool, get_ollama_endpoint_pool
+from .ollama_model_residency import ModelResidencyManager, get_model_residency_manager
+from .model_catalog import PROVIDER_OLLAMA, CatalogEntry, ModelCapability, ModelCatalog, get_model_catalog
+from .classification_router import ParseFn, RoutedClassification, get_classification_router
+from .prompt_budget import (
+    STRATEGY_EXTRACT, STRATEGY_MIDDLE, STRATEGY_TAIL, PromptSection,
+    format_previous_results, get_prompt_assembler
+)
+
+# Claves del contexto de generate_response que se envían como opciones de Ollama
+CONTEXT_SAMPLING_OPTIONS = frozenset({
+    'temperature', 'top_p', 'top_k', 'min_p', 'repeat_penalty', 'seed', 'stop', 'num_predict'
+})
+CONTEXT_OPTION_ALIASES = {'max_tokens': 'num_predict'}
 
 class OllamaService:
     def __init__(self, base_url: str = None):
@@ -49,6 +69,12 @@ class OllamaService:
         self.use_queue = os.getenv('OLLAMA_USE_QUEUE', 'true').lower() == 'true'
         self._queue_manager = None  # Se inicializará lazy
         
+        # 🗄️ Caché de respuestas para llamadas deterministas (opt-in por cache_ttl)
+        self.use_response_cache = os.getenv('OLLAMA_CACHE_ENABLED', 'true').lower() == 'true'
+        
+        # 🔥 Tiempo que Ollama mantiene cargado el modelo tras cada request
+        self.keep_alive = os.getenv('OLLAMA_KEEP_ALIVE', '30m')
+        
         # Logging específico para cola
         self.logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
         
@@ -82,7 +108,8 @@ class OllamaService:
                                  options: Dict[str, Any],
                                  priority: RequestPriority = RequestPriority.NORMAL,
                                  task_id: str = "",
-                                 step_id: str = "") -> Dict[str, Any]:
+                                 step_id: str = "",
+                                 on_token: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
         """
         🚦 EJECUTAR LLAMADA A OLLAMA A TRAVÉS DE LA COLA
         
@@ -96,6 +123,8 @@ class OllamaService:
             priority: Prioridad del request
             task_id: ID de la tarea (para tracking)
             step_id: ID del paso (para tracking)
+            on_token: Si se indica, la llamada se hace en modo streaming y se
+                      invoca con cada token recibido
             
         Returns:
             Resultado de Ollama o error
@@ -103,7 +132,7 @@ class OllamaService:
         queue_manager = self._get_queue_manager()
         if not queue_manager:
             self.logger.warning("⚠️ Gestor de cola no disponible, ejecutando llamada directa")
-            return await self._execute_direct_call(prompt, model, options)
+            return await self._execute_direct_call(prompt, model, options, on_token)
         
         # Crear request para la cola
         ollama_request = OllamaRequest(
@@ -113,14 +142,26 @@ class OllamaService:
             model=model,
             options=options,
             priority=priority,
-            timeout=self._get_model_config(model).get("request_timeout", 180)
+            timeout=self._get_model_config(model).get("request_timeout", 180),
+            # Un seguidor deduplicado no recibiría los tokens del líder
+            coalesce=on_token is None
         )
         
         self.logger.info(f"🚦 Encolando request para modelo {model} (tarea: {task_id}, prioridad: {priority.name})")
         
         # Función callback que ejecuta la llamada real
         async def execution_callback(request: OllamaRequest) -> Dict[str, Any]:
-            return await self._execute_direct_call(request.prompt, request.model, request.options)
+            if on_token is None:
+                return await self._execute_routed(request, queue_manager.endpoint_pool)
+            
+            # En streaming el request refleja su progreso en get_queue_status
+            request.streaming = True
+            
+            def relay_token(token: str) -> None:
+                request.record_streamed_token()
+                on_token(token)
+            
+            return await self._execute_routed(request, queue_manager.endpoint_pool, relay_token)
         
         # Ejecutar a través de la cola
         try:
@@ -134,14 +175,142 @@ class OllamaService:
             
             return result
             
+        except QueueOverloadedError as e:
+            self.logger.warning(f"🚧 Request rechazado por saturación de la cola: {str(e)}")
+            return {'error': str(e), 'error_type': 'load_shed', 'retry_after': e.retry_after}
         except Exception as e:
             self.logger.error(f"❌ Error en cola de Ollama: {str(e)}")
             return {'error': str(e), 'error_type': 'queue_system_error'}
     
+    async def _execute_routed(self,
+                              request: OllamaRequest,
+                              endpoint_pool: Optional[OllamaEndpointPool],
+                              on_token: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+        """
+        🖧 EJECUTAR EN EL ENDPOINT ASIGNADO POR LA COLA, CON FAILOVER
+        
+        Solo se enruta si este servicio apunta a uno de los endpoints del
+        pool (las instancias temporales con otro endpoint lo respetan). Ante
+        timeout o error de conexión se reintenta en otro endpoint, salvo que
+        ya se hayan emitido tokens en streaming.
+        """
+        if endpoint_pool is None or not request.endpoint or self.base_url not in endpoint_pool:
+            return await self._execute_direct_call(request.prompt, request.model, request.options, on_token)
+        
+        tried = []
+        while True:
+            endpoint = request.endpoint
+            started = time.monotonic()
+            result = await self._execute_direct_call(
+                request.prompt, request.model, request.options, on_token, base_url=endpoint
+            )
+            
+            if 'error' not in result:
+                endpoint_pool.record_success(endpoint, request.model, time.monotonic() - started)
+                return result
+            
+            if result.get('error_type') not in ('timeout', 'connection_error'):
+                return result
+            
+            endpoint_pool.record_failure(endpoint, result['error'], timed_out=result['error_type'] == 'timeout')
+            tried.append(endpoint)
+            if request.tokens_streamed:
+                return result
+            
+            alternative = endpoint_pool.failover(endpoint, request.model, tried)
+            if alternative is None:
+                return result
+            request.endpoint = alternative
+    
+    async def agenerate_raw(self,
+                            prompt: str,
+                            model: Optional[str] = None,
+                            options: Optional[Dict[str, Any]] = None,
+                            priority: RequestPriority = RequestPriority.NORMAL,
+                            task_id: str = "",
+                            step_id: str = "") -> Dict[str, Any]:
+        """
+        ⚡ GENERAR DESDE CÓDIGO ASYNC SIN OCUPAR UN THREAD
+        
+        Pensado para clientes async (browser-use): el prompt se envía tal
+        cual, sin system prompt ni presupuesto de Mitosis, para que su
+        prefijo sea idéntico entre pasos y Ollama reutilice su caché KV.
+        
+        La corutina se ejecuta en el loop del despachador y se espera con
+        asyncio.wrap_future desde el loop del llamador. Si el llamador se
+        cancela, la cancelación llega a la cola: el request sale del heap o
+        libera su hueco aunque la petición HTTP en curso no se interrumpa.
+        
+        Args:
+            prompt: Prompt completo
+            model: Modelo (por defecto el actual; no cambia el modelo del servicio)
+            options: Opciones que sobrescriben las de la configuración del modelo
+            priority: Prioridad en la cola
+            task_id: ID de la tarea (para tracking)
+            step_id: ID del paso (para tracking)
+        
+        Returns:
+            Respuesta cruda de Ollama ({'response': ...}) o {'error': ...}
+        """
+        model = model or self.get_current_model()
+        merged_options = dict(self._get_model_config(model).get("options", {}))
+        merged_options.update(options or {})
+        
+        if not self.use_queue:
+            return await self._execute_direct_call(prompt, model, merged_options)
+        
+        coro = self._execute_with_queue(
+            prompt=prompt,
+            model=model,
+            options=merged_options,
+            priority=priority,
+            task_id=task_id,
+            step_id=step_id
+        )
+        dispatcher = get_ollama_dispatcher()
+        if dispatcher.in_dispatcher_thread():
+            return await coro
+        return await asyncio.wrap_future(dispatcher.submit(coro))
+    
+    def _dispatch_to_queue(self,
+                           prompt: str,
+                           priority: RequestPriority,
+                           task_id: str,
+                           step_id: str,
+                           timeout: float,
+                           on_token: Optional[Callable[[str], None]] = None,
+                           options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        🧵 ENVIAR UNA LLAMADA A LA COLA DESDE CÓDIGO SÍNCRONO
+        
+        Usa el loop persistente del despachador global, de modo que todas las
+        llamadas comparten el mismo OllamaQueueManager y sus límites de
+        concurrencia se aplican a nivel de proceso. Sin `options` se usan las
+        de la configuración del modelo.
+        
+        Raises:
+            concurrent.futures.TimeoutError: Si la cola no responde a tiempo
+        """
+        model = self.get_current_model()
+        return get_ollama_dispatcher().run(
+            self._execute_with_queue(
+                prompt=prompt,
+                model=model,
+                options=options if options is not None else self._get_model_config(model).get("options", {}),
+                priority=priority,
+                task_id=task_id,
+                step_id=step_id,
+                on_token=on_token
+            ),
+            timeout=timeout
+        )
+    
     async def _execute_direct_call(self, 
                                   prompt: str, 
                                   model: str, 
-                                  options: Dict[str, Any]) -> Dict[str, Any]:
+                                  options: Dict[str, Any],
+                                  on_token: Optional[Callable[[str], None]] = None,
+                                  base_url: Optional[str] = None) -> Dict[str, Any]:
         """
         🔧 EJECUTAR LLAMADA DIRECTA A OLLAMA (SIN COLA)
         
@@ -150,7 +319,7 @@ class OllamaService:
         """
         try:
             # Usar la lógica existente pero adaptada para async
-            loop = asyncio.get_event_loop()
+            loop = asyncio.get_running_loop()
             
             # Ejecutar la llamada en un thread pool para no bloquear
             result = await loop.run_in_executor(
@@ -158,7 +327,9 @@ class OllamaService:
                 self._call_ollama_api_sync, 
                 prompt, 
                 model, 
-                options
+                options,
+                on_token,
+                base_url
             )
             
             return result
@@ -167,12 +338,19 @@ class OllamaService:
             self.logger.error(f"❌ Error en llamada directa a Ollama: {str(e)}")
             return {'error': str(e), 'error_type': 'direct_call_error'}
     
-    def _call_ollama_api_sync(self, prompt: str, model: str, options: Dict[str, Any]) -> Dict[str, Any]:
+    def _call_ollama_api_sync(self, prompt: str, model: str, options: Dict[str, Any],
+                              on_token: Optional[Callable[[str], None]] = None,
+                              base_url: Optional[str] = None) -> Dict[str, Any]:
         """
         🔧 VERSIÓN SINCRÓNICA DE LA LLAMADA A OLLAMA
         
-        Esta es la implementación original adaptada para ser llamada desde async
+        Esta es la implementación original adaptada para ser llamada desde async.
+        Con on_token se usa "stream": True y cada token se entrega en cuanto
+        llega; el resultado final tiene el mismo formato que sin streaming.
+        base_url permite dirigir la llamada a otro endpoint del pool.
         """
+        base_url = base_url or self.base_url
+        started = time.monotonic()
         try:
             model_config = self._get_model_config(model)
             request_timeout = model_config.get("request_timeout", self.request_timeout)
@@ -194,8 +372,9 @@ class OllamaService:
             payload = {
                 "model": model,
                 "prompt": prompt,
-                "stream": False,
-                "options": final_options
+                "stream": on_token is not None,
+                "options": final_options,
+                "keep_alive": self.keep_alive
             }
             
             # Logging detallado para debug
@@ -209,33 +388,57 @@ class OllamaService:
                 'Content-Type': 'application/json'
             }
             # Agregar header ngrok si el endpoint es ngrok
-            if 'ngrok' in self.base_url:
+            if 'ngrok' in base_url:
                 headers['ngrok-skip-browser-warning'] = 'true'
             
-            response = requests.post(
-                f"{self.base_url}/api/generate",
+            response = get_http_session_pool().post(
+                f"{base_url}/api/generate",
                 json=payload,
                 headers=headers,
-                timeout=min(request_timeout, 180)  # Máximo 3 minutos para evitar cuelgues
+                read_timeout=min(request_timeout, 180),  # Máximo 3 minutos para evitar cuelgues
+                stream=on_token is not None
             )
             
             if response.status_code == 200:
-                return response.json()
+                monitor = self._get_health_monitor(base_url)
+                monitor.report_success()
+                if base_url != self.base_url:
+                    # Endpoint del pool: mantener su sondeo (modelos cargados) activo
+                    monitor.touch()
+                self._get_residency_manager().mark_used(base_url, model)
+                if on_token is not None:
+                    # Cerrar devuelve la conexión al pool aunque el stream acabe antes
+                    with response:
+                        result = self._consume_generate_stream(response, on_token)
+                else:
+                    result = response.json()
+                get_model_catalog().record_call(
+                    PROVIDER_OLLAMA, model, time.monotonic() - started,
+                    success='error' not in result, output_tokens=result.get('eval_count'),
+                    generation_seconds=(result.get('eval_duration') or 0) / 1e9
+                )
+                return result
             else:
+                get_model_catalog().record_call(PROVIDER_OLLAMA, model, time.monotonic() - started, success=False)
                 self.logger.error(f"❌ Ollama API returned error for model {model}: HTTP {response.status_code}")
                 return {
                     'error': f"HTTP {response.status_code}: {response.text}"
                 }
                 
         except Timeout:
+            get_model_catalog().record_call(PROVIDER_OLLAMA, model, time.monotonic() - started, success=False)
             self.logger.error(f"⏱️ Ollama API request timed out after {request_timeout} seconds for model {model}.")
             return {
-                'error': f"Timeout después de {request_timeout} segundos para el modelo {model}. El modelo puede necesitar más tiempo para respuestas complejas."
+                'error': f"Timeout después de {request_timeout} segundos para el modelo {model}. El modelo puede necesitar más tiempo para respuestas complejas.",
+                'error_type': 'timeout'
             }
         except RequestException as e:
+            get_model_catalog().record_call(PROVIDER_OLLAMA, model, time.monotonic() - started, success=False)
             self.logger.error(f"🔌 Connection error to Ollama API for model {model}: {str(e)}")
+            self._get_health_monitor(base_url).report_failure(str(e))
             return {
-                'error': f"Error de conexión: {str(e)}"
+                'error': f"Error de conexión: {str(e)}",
+                'error_type': 'connection_error'
             }
         except Exception as e:
             self.logger.error(f"💥 Unexpected error in Ollama API call for model {model}: {str(e)}")
@@ -243,6 +446,40 @@ class OllamaService:
                 'error': f"Error inesperado: {str(e)}"
             }
     
+    def _consume_generate_stream(self, response, on_token: Callable[[str], None]) -> Dict[str, Any]:
+        """
+        📡 LEER UNA RESPUESTA STREAMING DE /api/generate
+        
+        Cada línea es un JSON con un fragmento en 'response'; la última trae
+        'done': True y las métricas de generación.
+        """
+        chunks = []
+        final_chunk: Dict[str, Any] = {}
+        
+        for line in response.iter_lines():
+            if not line:
+                continue
+            try:
+                chunk = json.loads(line.decode('utf-8'))
+            except json.JSONDecodeError:
+                continue
+            
+            if chunk.get('error'):
+                return {'error': chunk['error']}
+            
+            token = chunk.get('response', '')
+            if token:
+                chunks.append(token)
+                on_token(token)
+            
+            if chunk.get('done'):
+                final_chunk = chunk
+                break
+        
+        result = dict(final_chunk)
+        result['response'] = "".join(chunks)
+        return result
+    
     def update_endpoint(self, new_endpoint: str) -> bool:
         """
         Actualiza el endpoint de Ollama dinámicamente
@@ -251,8 +488,8 @@ class OllamaService:
             old_endpoint = self.base_url
             self.base_url = new_endpoint
             
-            # Verificar que el nuevo endpoint funciona
-            if self.is_healthy():
+            # Verificar que el nuevo endpoint funciona (sonda explícita, sin caché)
+            if self._get_health_monitor().refresh().healthy:
                 logging.getLogger(__name__).info(f"✅ Ollama endpoint updated: {old_endpoint} → {new_endpoint}")
                 return True
             else:
@@ -385,16 +622,156 @@ class OllamaService:
         }
         
         
+    def _get_health_monitor(self, base_url: Optional[str] = None) -> OllamaHealthMonitor:
+        """
+        🩺 OBTENER MONITOR DE SALUD DE UN ENDPOINT (POR DEFECTO EL ACTUAL)
+        
+        El monitor es compartido por endpoint y mantiene en caché la salud y
+        la lista de modelos, evitando un GET /api/tags por cada generación.
+        """
+        base_url = base_url or self.base_url
+        return get_ollama_health_monitor(base_url, lambda: self._fetch_model_tags(base_url))
+    
+    def _fetch_model_tags(self, base_url: str) -> List[str]:
+        """
+        Consultar /api/tags de un endpoint; lanza excepción si no responde
+        
+        Si el endpoint pertenece al pool de balanceo, también se consulta
+        /api/ps para saber qué modelos están ya cargados en memoria.
+        """
+        headers = {}
+        if 'ngrok' in base_url:
+            headers['ngrok-skip-browser-warning'] = 'true'
+        
+        # Sonda de salud: sin reintentos, un endpoint caído debe fallar ya
+        response = get_http_session_pool().get(f"{base_url}/api/tags", read_timeout=5, headers=headers, retry=False)
+        if response.status_code != 200:
+            raise RequestException(f"HTTP {response.status_code}")
+        data = response.json()
+        models = [model['name'] for model in data.get('models', [])]
+        
+        endpoint_pool = get_ollama_endpoint_pool()
+        if endpoint_pool is not None and base_url in endpoint_pool:
+            loaded = None
+            try:
+                ps_response = get_http_session_pool().get(
+                    f"{base_url}/api/ps", read_timeout=5, headers=headers, retry=False
+                )
+                if ps_response.status_code == 200:
+                    loaded = [model['name'] for model in ps_response.json().get('models', [])]
+            except RequestException as e:
+                self.logger.debug(f"No se pudo consultar /api/ps en {base_url}: {e}")
+            endpoint_pool.update_models(base_url, installed=models, loaded=loaded)
+        
+        return models
+    
+    def _get_residency_manager(self) -> ModelResidencyManager:
+        """🔥 Gestor compartido de modelos residentes (precarga y keep_alive)"""
+        return get_model_residency_manager(self._send_preload, self._fetch_running_models, self.keep_alive)
+    
+    def _send_preload(self, base_url: str, model: str, keep_alive: str) -> None:
+        """
+        Cargar un modelo sin generar: /api/generate con prompt vacío
+        
+        La carga puede tardar tanto como una generación en frío, así que se
+        usa el request_timeout del modelo.
+        """
+        headers = {'Content-Type': 'application/json'}
+        if 'ngrok' in base_url:
+            headers['ngrok-skip-browser-warning'] = 'true'
+        
+        request_timeout = self._get_model_config(model).get("request_timeout", self.request_timeout)
+        response = get_http_session_pool().post(
+            f"{base_url}/api/generate",
+            json={"model": model, "prompt": "", "stream": False, "keep_alive": keep_alive},
+            headers=headers,
+            read_timeout=request_timeout
+        )
+        if response.status_code != 200:
+            raise RequestException(f"HTTP {response.status_code}: {response.text}")
+        
+        endpoint_pool = get_ollama_endpoint_pool()
+        if endpoint_pool is not None and base_url in endpoint_pool:
+            endpoint_pool.mark_loaded(base_url, model)
+    
+    def _fetch_running_models(self, base_url: str) -> List[str]:
+        """Modelos cargados en memoria según /api/ps"""
+        headers = {}
+        if 'ngrok' in base_url:
+            headers['ngrok-skip-browser-warning'] = 'true'
+        response = get_http_session_pool().get(f"{base_url}/api/ps", read_timeout=5, headers=headers)
+        if response.status_code != 200:
+            raise RequestException(f"HTTP {response.status_code}")
+        return [model['name'] for model in response.json().get('models', [])]
+    
+    def _endpoint_for_model(self, model: str) -> str:
+        """Endpoint donde se ejecutará `model`: el del pool si lo hay, si no el actual"""
+        endpoint_pool = get_ollama_endpoint_pool()
+        if endpoint_pool is not None and self.base_url in endpoint_pool:
+            return endpoint_pool.choose(model) or self.base_url
+        return self.base_url
+    
+    def preload_model(self, model_name: Optional[str] = None,
+                      wait: bool = False, timeout: Optional[float] = None) -> bool:
+        """
+        🔥 CARGAR UN MODELO ANTES DE NECESITARLO
+        
+        Args:
+            model_name: Modelo a cargar (por defecto el actual)
+            wait: Esperar a que termine la carga
+            timeout: Espera máxima si wait=True
+        
+        Returns:
+            True si el modelo ya estaba residente, la precarga se lanzó o
+            (con wait) terminó bien
+        """
+        model = model_name or self.get_current_model()
+        future = self._get_residency_manager().preload(self._endpoint_for_model(model), model)
+        if future is None or not wait:
+            return True
+        try:
+            return future.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            self.logger.warning(f"⏱️ La precarga de {model} sigue en curso tras {timeout}s")
+            return False
+    
+    def prepare_models_for_plan(self, plan_steps: List[Dict[str, Any]]) -> List[str]:
+        """
+        📋 PRECARGAR EL MODELO DE LOS PRÓXIMOS PASOS DE UN PLAN
+        
+        Returns:
+            Modelos cuya precarga se lanzó
+        """
+        model = self.get_current_model()
+        return self._get_residency_manager().prepare_for_plan(plan_steps, model, self._endpoint_for_model(model))
+    
+    def get_residency_status(self) -> Dict[str, Any]:
+        """📊 Modelos residentes por endpoint y precargas"""
+        return self._get_residency_manager().get_status()
+    
+    def get_endpoint_pool_status(self) -> Optional[Dict[str, Any]]:
+        """
+        📊 ESTADO DEL POOL DE ENDPOINTS (None si solo hay uno)
+        
+        Arranca el monitor de salud de cada endpoint para que sus modelos
+        instalados y cargados se mantengan actualizados en segundo plano.
+        """
+        endpoint_pool = get_ollama_endpoint_pool()
+        if endpoint_pool is None:
+            return None
+        for endpoint in endpoint_pool.endpoints:
+            self._get_health_monitor(endpoint).touch()
+        return endpoint_pool.get_status()
+    
+    def get_health_status(self) -> Dict[str, Any]:
+        """📊 Estado del monitor de salud (caché + circuit breaker)"""
+        return self._get_health_monitor().get_status()
+    
     def is_healthy(self) -> bool:
-        """Verificar si Ollama está disponible"""
+        """Verificar si Ollama está disponible (desde la caché del monitor de salud)"""
         try:
-            headers = {}
-            if 'ngrok' in self.base_url:
-                headers['ngrok-skip-browser-warning'] = 'true'
-            
-            response = requests.get(f"{self.base_url}/api/tags", timeout=5, headers=headers)
-            return response.status_code == 200
-        except:
+            return self._get_health_monitor().is_healthy()
+        except Exception:
             return False
     
     def is_available(self) -> bool:
@@ -424,23 +801,14 @@ class OllamaService:
             return True
     
     def check_connection(self) -> Dict[str, Any]:
-        """Verificar conexión con Ollama y retornar información detallada"""
+        """
+        Verificar conexión con Ollama y retornar información detallada
+        
+        Es un diagnóstico explícito: fuerza una sonda nueva, que además
+        actualiza la caché del monitor de salud.
+        """
         try:
-            headers = {}
-            if 'ngrok' in self.base_url:
-                headers['ngrok-skip-browser-warning'] = 'true'
-            
-            response = requests.get(f"{self.base_url}/api/tags", timeout=5, headers=headers)
-            if response.status_code == 200:
-                data = response.json()
-                models = [model['name'] for model in data.get('models', [])]
-                return {
-                    'status': 'connected',
-                    'url': self.base_url,
-                    'models_available': len(models),
-                    'current_model': self.current_model or self.default_model,
-                    'healthy': True
-                }
+            snapshot = self._get_health_monitor().refresh()
         except Exception as e:
             return {
                 'status': 'error',
@@ -449,6 +817,24 @@ class OllamaService:
                 'healthy': False
             }
         
+        if snapshot.healthy:
+            return {
+                'status': 'connected',
+                'url': self.base_url,
+                'models_available': len(snapshot.models),
+                'current_model': self.current_model or self.default_model,
+                'healthy': True,
+                'latency_ms': round(snapshot.latency_ms, 1)
+            }
+        
+        if snapshot.error:
+            return {
+                'status': 'error',
+                'url': self.base_url,
+                'error': snapshot.error,
+                'healthy': False
+            }
+        
         return {
             'status': 'disconnected',
             'url': self.base_url,
@@ -456,18 +842,13 @@ class OllamaService:
         }
     
     def get_available_models(self) -> List[str]:
-        """Obtener lista de modelos disponibles desde Ollama"""
+        """Obtener lista de modelos disponibles desde Ollama (desde la caché del monitor)"""
         try:
-            headers = {}
-            if 'ngrok' in self.base_url:
-                headers['ngrok-skip-browser-warning'] = 'true'
-            
-            response = requests.get(f"{self.base_url}/api/tags", timeout=5, headers=headers)
-            if response.status_code == 200:
-                data = response.json()
-                models = [model['name'] for model in data.get('models', [])]
+            monitor = self._get_health_monitor()
+            models = monitor.get_models()
+            if monitor.is_healthy() and models:
                 return models
-        except:
+        except Exception:
             pass
         
         # Fallback a modelos conocidos si no se puede conectar
@@ -479,13 +860,138 @@ class OllamaService:
             "phi3"
         ]
     
+    def catalog_entries(self) -> List[CatalogEntry]:
+        """Modelos instalados como entradas del catálogo de modelos"""
+        return [CatalogEntry.build(PROVIDER_OLLAMA, model) for model in self.get_available_models()]
+    
+    def _model_catalog(self) -> ModelCatalog:
+        """Catálogo global, registrando Ollama como proveedor si nadie lo hizo"""
+        catalog = get_model_catalog()
+        if not catalog.has_provider(PROVIDER_OLLAMA):
+            catalog.register_provider(PROVIDER_OLLAMA, self.catalog_entries)
+        return catalog
+    
+    def get_model_catalog_status(self) -> Dict[str, Any]:
+        """📊 Catálogo de modelos"""
+        return self._model_catalog().get_status()
+    
+    def _classifier_model(self) -> Optional[str]:
+        """
+        Modelo pequeño para clasificaciones: OLLAMA_CLASSIFIER_MODEL o el
+        modelo eficiente más rápido del catálogo, siempre que ya esté
+        cargado (no se paga una carga en GPU por una clasificación). Si el
+        configurado no está cargado se precarga y, mientras tanto, clasifica
+        el modelo grande.
+        """
+        residency = self._get_residency_manager()
+        resident = residency.resident_models(self.base_url)
+        configured = os.getenv('OLLAMA_CLASSIFIER_MODEL')
+        if configured:
+            if configured in resident:
+                return configured
+            residency.preload(self.base_url, configured)
+            return None
+        
+        catalog = self._model_catalog()
+        candidates = [
+            entry for entry in catalog.find(ModelCapability.EFFICIENT, provider=PROVIDER_OLLAMA)
+            if entry.model_id in resident
+        ]
+        if not candidates:
+            return None
+        return min(candidates, key=catalog.score).model_id
+    
+    def generate_raw(self,
+                     prompt: str,
+                     model: Optional[str] = None,
+                     options: Optional[Dict[str, Any]] = None,
+                     priority: RequestPriority = RequestPriority.NORMAL,
+                     task_id: str = "",
+                     step_id: str = "",
+                     timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        🧵 VERSIÓN SÍNCRONA DE agenerate_raw
+        
+        Prompt tal cual (sin system prompt) con un modelo concreto, a través
+        de la cola si está activa. Sin timeout se espera el request_timeout
+        del modelo más un margen para la cola.
+        """
+        model = model or self.get_current_model()
+        in_green_thread = 'GreenThread' in threading.current_thread().name
+        if not self.use_queue or in_green_thread:
+            merged_options = dict(self._get_model_config(model).get("options", {}))
+            merged_options.update(options or {})
+            return self._call_ollama_api_sync(prompt, model, merged_options)
+        
+        return get_ollama_dispatcher().run(
+            self.agenerate_raw(prompt, model, options, priority, task_id, step_id),
+            timeout=timeout or self._get_model_config(model).get("request_timeout", self.request_timeout) + 60
+        )
+    
+    def classify(self,
+                 prompt: str,
+                 parse_fn: ParseFn,
+                 call_site: str = "classification",
+                 options: Optional[Dict[str, Any]] = None,
+                 cache_ttl: Optional[float] = None) -> Optional[RoutedClassification]:
+        """
+        🪜 CLASIFICAR CON EL MODELO PEQUEÑO Y ESCALAR SI HAY POCA CONFIANZA
+        
+        Args:
+            prompt: Prompt de clasificación completo (se envía sin system prompt)
+            parse_fn: Texto de respuesta -> ClassificationVote (o None)
+            call_site: Nombre de la ruta para los contadores
+            options: Opciones de generación (temperature, num_predict...)
+            cache_ttl: Si se indica, la respuesta final se cachea estos segundos
+        
+        Returns:
+            RoutedClassification o None si ningún modelo dio un voto válido
+        """
+        large_model = self.get_current_model()
+        cache_key = None
+        if cache_ttl and self._is_cacheable_sampling(large_model, options):
+            cache_key = LLMResponseCache.make_key(f"route:{large_model}", prompt, options)
+            cached = get_llm_response_cache().get(cache_key, call_site)
+            if cached is not None:
+                vote = parse_fn(cached['response'])
+                if vote is not None:
+                    return RoutedClassification(
+                        vote=vote, model=cached['model'], escalated=False,
+                        latency_seconds=0.0, raw_response=cached['response'], cached=True
+                    )
+        
+        def generate(model: str) -> Optional[str]:
+            result = self.generate_raw(
+                prompt, model, options, priority=RequestPriority.HIGH,
+                task_id=call_site, step_id=model
+            )
+            return None if result.get('error') else result.get('response', '')
+        
+        routed = get_classification_router().classify(
+            call_site, generate, parse_fn, self._classifier_model(), large_model
+        )
+        if routed is not None and cache_key:
+            get_llm_response_cache().set(
+                cache_key, {'response': routed.raw_response, 'model': routed.model},
+                ttl=cache_ttl, tag=call_site
+            )
+        return routed
+    
+    def get_classification_stats(self) -> Dict[str, Any]:
+        """📊 Contadores por ruta del router de clasificaciones"""
+        return get_classification_router().get_stats()
+    
     def set_model(self, model_name: str) -> bool:
         """Establecer el modelo a usar - FORZAR sin validación de disponibilidad"""
         # 🚀 FIX CRÍTICO: Permitir cambio de modelo sin validar disponibilidad
         # porque el frontend puede enviar modelos válidos que no aparecen en la lista
+        previous_model = self.get_current_model()
         self.current_model = model_name
         logger = logging.getLogger(__name__)
         logger.info(f"🔄 Modelo forzado a: {model_name}")
+        if model_name != previous_model:
+            # Cargar el nuevo modelo ya, no en el primer paso que lo use
+            self.preload_model(model_name)
         return True
     
     def set_model_with_validation(self, model_name: str) -> bool:
@@ -493,6 +999,7 @@ class OllamaService:
         available_models = self.get_available_models()
         if model_name in available_models:
             self.current_model = model_name
+            self.preload_model(model_name)
             return True
         return False
     
@@ -527,7 +1034,7 @@ class OllamaService:
         try:
             # Construir el prompt con system prompt para conversación casual
             system_prompt = self._build_system_prompt(use_tools=False, conversation_mode=True)
-            full_prompt = self._build_full_prompt(prompt, context, system_prompt)
+            full_prompt = self._build_full_prompt(prompt, context, system_prompt, call_site='casual_response')
             
             # Determinar si usar cola o llamada directa
             if self.use_queue:
@@ -540,25 +1047,14 @@ class OllamaService:
                         self.logger.warning("⚠️ Detectado GreenThread, usando llamada directa")
                         response = self._call_ollama_api(full_prompt)
                     else:
-                        # Usar cola con prioridad normal para conversaciones casuales
-                        def run_async():
-                            new_loop = asyncio.new_event_loop()
-                            asyncio.set_event_loop(new_loop)
-                            try:
-                                return new_loop.run_until_complete(self._execute_with_queue(
-                                    prompt=full_prompt,
-                                    model=self.get_current_model(),
-                                    options=self._get_model_config(self.get_current_model()).get("options", {}),
-                                    priority=RequestPriority.LOW,
-                                    task_id="casual_conversation",
-                                    step_id="casual_response"
-                                ))
-                            finally:
-                                new_loop.close()
-                        
-                        with concurrent.futures.ThreadPoolExecutor() as executor:
-                            future = executor.submit(run_async)
-                            response = future.result(timeout=30)
+                        # Usar cola con prioridad baja para conversaciones casuales
+                        response = self._dispatch_to_queue(
+                            prompt=full_prompt,
+                            priority=RequestPriority.LOW,
+                            task_id="casual_conversation",
+                            step_id="casual_response",
+                            timeout=30
+                        )
                 except Exception as e:
                     self.logger.error(f"❌ Error en execute con cola: {e}")
                     # Fallback a llamada directa
@@ -568,7 +1064,7 @@ class OllamaService:
                 response = self._call_ollama_api(full_prompt)
             
             if response.get('error'):
-                return {
+                error_response = {
                     'response': f"❌ Error al generar respuesta: {response['error']}",
                     'tool_calls': [],
                     'raw_response': "",
@@ -576,6 +1072,9 @@ class OllamaService:
                     'timestamp': time.time(),
                     'error': response['error']
                 }
+                if 'retry_after' in response:
+                    error_response['retry_after'] = response['retry_after']
+                return error_response
             
             # Para conversación casual, no parseamos tool calls, solo devolvemos el texto
             response_text = response.get('response', '').strip()
@@ -599,7 +1098,8 @@ class OllamaService:
                 'error': str(e)
             }
 
-    def generate_response(self, prompt: str, context: Dict = None, use_tools: bool = True, task_id: str = "", step_id: str = "") -> Dict[str, Any]:
+    def generate_response(self, prompt: str, context: Dict = None, use_tools: bool = True, task_id: str = "", step_id: str = "",
+                          cache_ttl: Optional[float] = None, cache_tag: str = "", bypass_cache: bool = False) -> Dict[str, Any]:
         """
         🔄 GENERAR RESPUESTA CON COLA Y PRIORIZACIÓN INTELIGENTE
         
@@ -608,14 +1108,37 @@ class OllamaService:
         
         Args:
             prompt: Mensaje del usuario
-            context: Contexto adicional (historial, herramientas, etc.)
+            context: Contexto adicional (historial, herramientas, etc.); sus
+                     opciones de muestreo (temperature, top_p, max_tokens...)
+                     sobrescriben las del modelo en la petición
             use_tools: Si debe considerar el uso de herramientas
             task_id: ID de la tarea (para tracking y priorización)
             step_id: ID del paso (para tracking)
+            cache_ttl: Si se indica, la respuesta se cachea durante estos segundos
+                       (solo si se muestrea con temperature 0: clasificación, extracción)
+            cache_tag: Nombre del punto de llamada para las métricas de caché
+            bypass_cache: Ignorar la caché al leer (la respuesta nueva sí se guarda)
         
         Returns:
             Dict con respuesta, tool_calls, y metadatos incluyendo info de cola
         """
+        model = self.get_current_model()
+        options = self._request_options(model, context)
+        system_prompt = self._build_system_prompt(use_tools, conversation_mode=False)
+        full_prompt = self._build_full_prompt(prompt, context, system_prompt, call_site=cache_tag or 'generate_response')
+        
+        cache_key = None
+        if cache_ttl and self._is_cacheable_sampling(model, options):
+            # Clave con lo que realmente se envía: prompt completo y opciones fusionadas
+            cache_key = LLMResponseCache.make_key(model, full_prompt, options)
+            if not bypass_cache:
+                cached = get_llm_response_cache().get(cache_key, cache_tag)
+                if cached is not None:
+                    self.logger.info(f"🗄️ Respuesta servida desde caché ({cache_tag or 'sin etiqueta'})")
+                    cached['timestamp'] = time.time()
+                    cached['cached'] = True
+                    return cached
+        
         if not self.is_healthy():
             return {
                 'response': "⚠️ Ollama no está disponible en este momento. Verifica la configuración del endpoint de Ollama.",
@@ -627,10 +1150,6 @@ class OllamaService:
             }
         
         try:
-            # Construir el prompt completo
-            system_prompt = self._build_system_prompt(use_tools, conversation_mode=False)
-            full_prompt = self._build_full_prompt(prompt, context, system_prompt)
-            
             # 🔍 DETERMINAR PRIORIDAD AUTOMÁTICAMENTE
             priority = self._determine_request_priority(prompt, context, task_id, step_id)
             
@@ -643,75 +1162,359 @@ class OllamaService:
                     if hasattr(current_thread, 'name') and 'GreenThread' in current_thread.name:
                         # En eventlet, usar llamada directa
                         self.logger.warning("⚠️ Detectado GreenThread, usando llamada directa")
-                        response = self._call_ollama_api(full_prompt)
+                        response = self._call_ollama_api(full_prompt, options)
                     else:
                         # Usar cola con prioridad determinada automáticamente
-                        def run_async():
-                            new_loop = asyncio.new_event_loop()
-                            asyncio.set_event_loop(new_loop)
-                            try:
-                                return new_loop.run_until_complete(self._execute_with_queue(
-                                    prompt=full_prompt,
-                                    model=self.get_current_model(),
-                                    options=self._get_model_config(self.get_current_model()).get("options", {}),
-                                    priority=priority,
-                                    task_id=task_id or "unknown_task",
-                                    step_id=step_id or "unknown_step"
-                                ))
-                            finally:
-                                new_loop.close()
-                        
-                        with concurrent.futures.ThreadPoolExecutor() as executor:
-                            future = executor.submit(run_async)
-                            response = future.result(timeout=60)
+                        response = self._dispatch_to_queue(
+                            prompt=full_prompt,
+                            priority=priority,
+                            task_id=task_id or "unknown_task",
+                            step_id=step_id or "unknown_step",
+                            timeout=60,
+                            options=options
+                        )
                 except Exception as e:
                     self.logger.error(f"❌ Error en execute con cola: {e}")
                     # Fallback a llamada directa
-                    response = self._call_ollama_api(full_prompt)
+                    response = self._call_ollama_api(full_prompt, options)
                 
                 self.logger.info(f"🚦 Request procesado a través de cola (prioridad: {priority.name})")
                 
             else:
                 # Llamada directa tradicional (sin cola)
-                response = self._call_ollama_api(full_prompt)
+                response = self._call_ollama_api(full_prompt, options)
                 self.logger.warning("⚠️ Request procesado SIN cola - riesgo de problemas de concurrencia")
             
+            result = self._build_generation_result(response, priority)
+            if result.get('error'):
+                return result
+            
+            if cache_key and result['raw_response']:
+                get_llm_response_cache().set(cache_key, result, ttl=cache_ttl, tag=cache_tag)
+            
+            return result
+            
+        except Exception as e:
+            return {
+                'response': f"❌ Error interno: {str(e)}",
+                'tool_calls': [],
+                'raw_response': "",
+                'model': self.get_current_model(),
+                'timestamp': time.time(),
+                'error': str(e),
+                'used_queue': self.use_queue
+            }
+    
+    def _build_generation_result(self, response: Dict[str, Any], priority: RequestPriority) -> Dict[str, Any]:
+        """Formato común de resultado de generate_response / generate_batch"""
+        if response.get('error'):
+            return {
+                'response': f"❌ Error al generar respuesta: {response['error']}",
+                'tool_calls': [],
+                'raw_response': "",
+                'model': self.get_current_model(),
+                'timestamp': time.time(),
+                'error': response['error'],
+                'used_queue': self.use_queue,
+                'priority': priority.name if self.use_queue else 'none'
+            }
+        
+        # Parsear la respuesta
+        parsed_response = self._parse_response(response.get('response', ''))
+        
+        return {
+            'response': parsed_response['text'],
+            'tool_calls': parsed_response['tool_calls'],
+            'raw_response': response.get('response', ''),
+            'model': self.get_current_model(),
+            'timestamp': time.time(),
+            'used_queue': self.use_queue,
+            'priority': priority.name if self.use_queue else 'none'
+        }
+    
+    def generate_batch(self,
+                       prompts: List[str],
+                       context: Dict = None,
+                       use_tools: bool = False,
+                       task_id: str = "",
+                       step_id: str = "",
+                       priority: Optional[RequestPriority] = None,
+                       on_chunks: Optional[List[Optional[StreamSink]]] = None,
+                       timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        📦 GENERAR VARIAS RESPUESTAS INDEPENDIENTES EN PARALELO
+        
+        Todos los prompts se encolan a la vez y la cola los ejecuta
+        concurrentemente hasta el límite de cada endpoint/modelo, así que la
+        latencia total se acerca a la del prompt más lento en lugar de a la
+        suma. Un fallo en un elemento no afecta a los demás.
+        
+        Args:
+            prompts: Prompts independientes
+            context: Contexto común a todos los prompts
+            use_tools: Si debe considerar el uso de herramientas
+            task_id: ID de la tarea (para tracking y priorización)
+            step_id: ID del paso; cada elemento se registra como step_id#i
+            priority: Prioridad común (por defecto se determina con el primer prompt)
+            on_chunks: Sink de streaming opcional por elemento (None = sin streaming)
+            timeout: Espera máxima del lote completo (por defecto el peor caso secuencial)
+        
+        Returns:
+            Lista en el mismo orden que `prompts` con el formato de
+            generate_response más 'batch_index'; los elementos fallidos
+            llevan 'error'
+        """
+        if not prompts:
+            return []
+        
+        model = self.get_current_model()
+        if not self.is_healthy():
+            return [
+                {
+                    'response': "⚠️ Ollama no está disponible en este momento. Verifica la configuración del endpoint de Ollama.",
+                    'tool_calls': [],
+                    'raw_response': "",
+                    'model': model,
+                    'timestamp': time.time(),
+                    'error': 'Ollama no disponible',
+                    'batch_index': index
+                }
+                for index in range(len(prompts))
+            ]
+        
+        system_prompt = self._build_system_prompt(use_tools, conversation_mode=False)
+        full_prompts = [
+            self._build_full_prompt(prompt, context, system_prompt, call_site='generate_batch')
+            for prompt in prompts
+        ]
+        if priority is None:
+            priority = self._determine_request_priority(prompts[0], context, task_id, step_id)
+        
+        sinks = list(on_chunks or [])
+        batchers = [
+            TokenStreamBatcher(sinks[index]) if index < len(sinks) and sinks[index] else None
+            for index in range(len(prompts))
+        ]
+        options = self._get_model_config(model).get("options", {})
+        request_timeout = self._get_model_config(model).get("request_timeout", 180)
+        
+        current_thread = threading.current_thread()
+        in_green_thread = hasattr(current_thread, 'name') and 'GreenThread' in current_thread.name
+        
+        if self.use_queue and not in_green_thread:
+            async def run_batch() -> List[Any]:
+                return await asyncio.gather(
+                    *[
+                        self._execute_with_queue(
+                            prompt=full_prompt,
+                            model=model,
+                            options=options,
+                            priority=priority,
+                            task_id=task_id or "unknown_task",
+                            step_id=f"{step_id or 'batch'}#{index}",
+                            on_token=batchers[index].add if batchers[index] else None
+                        )
+                        for index, full_prompt in enumerate(full_prompts)
+                    ],
+                    return_exceptions=True
+                )
+            
+            try:
+                responses = get_ollama_dispatcher().run(
+                    run_batch(),
+                    timeout=timeout or request_timeout * len(prompts) + 60
+                )
+            except Exception as e:
+                self.logger.error(f"❌ Lote de {len(prompts)} prompts falló en la cola: {e}")
+                responses = [{'error': str(e), 'error_type': 'queue_system_error'}] * len(prompts)
+        else:
+            # Sin cola (o en eventlet): ejecución secuencial con la misma semántica por elemento
+            responses = []
+            for index, full_prompt in enumerate(full_prompts):
+                try:
+                    responses.append(self._call_ollama_api_sync(
+                        full_prompt, model, options, batchers[index].add if batchers[index] else None
+                    ))
+                except Exception as e:
+                    responses.append(e)
+        
+        results = []
+        for index, response in enumerate(responses):
+            if batchers[index]:
+                batchers[index].close()
+            if isinstance(response, BaseException):
+                response = {'error': str(response), 'error_type': 'batch_item_error'}
+            result = self._build_generation_result(response, priority)
+            result['batch_index'] = index
+            results.append(result)
+        
+        failed = sum(1 for result in results if result.get('error'))
+        self.logger.info(f"📦 Lote completado: {len(results) - failed}/{len(results)} respuestas correctas")
+        return results
+    
+    def generate_streaming_response(self,
+                                    prompt: str,
+                                    context: Dict = None,
+                                    use_tools: bool = False,
+                                    on_chunk: Optional[StreamSink] = None,
+                                    task_id: str = "",
+                                    step_id: str = "",
+                                    flush_tokens: Optional[int] = None,
+                                    flush_interval_ms: Optional[int] = None) -> Dict[str, Any]:
+        """
+        📡 GENERAR RESPUESTA EN STREAMING CON ENTREGA INCREMENTAL
+        
+        Igual que generate_response, pero Ollama se consulta con
+        "stream": True y los tokens se entregan a on_chunk en lotes
+        (cada flush_tokens tokens o flush_interval_ms milisegundos). Pensado
+        para pasos largos de análisis e informes, donde el primer texto
+        visible llega en menos de un segundo en lugar de al final.
+        
+        Args:
+            prompt: Mensaje del usuario
+            context: Contexto adicional
+            use_tools: Si debe considerar el uso de herramientas
+            on_chunk: Sink que recibe (delta, texto_acumulado) por lote
+            task_id: ID de la tarea (para tracking y priorización)
+            step_id: ID del paso (para tracking)
+            flush_tokens: Tokens por lote (por defecto OLLAMA_STREAM_FLUSH_TOKENS)
+            flush_interval_ms: Intervalo máximo entre lotes (por defecto OLLAMA_STREAM_FLUSH_MS)
+        
+        Returns:
+            Dict con el mismo formato que generate_response más métricas de streaming
+        """
+        if not self.is_healthy():
+            return {
+                'response': "⚠️ Ollama no está disponible en este momento. Verifica la configuración del endpoint de Ollama.",
+                'tool_calls': [],
+                'raw_response': "",
+                'model': self.get_current_model(),
+                'timestamp': time.time(),
+                'error': 'Ollama no disponible'
+            }
+        
+        batcher = TokenStreamBatcher(on_chunk, flush_tokens, flush_interval_ms)
+        # Los tool calls se extraen a medida que llegan los tokens
+        extractor = ToolCallExtractor()
+        priority = RequestPriority.NORMAL
+        
+        def on_token(token: str) -> None:
+            batcher.add(token)
+            extractor.feed(token)
+        
+        try:
+            system_prompt = self._build_system_prompt(use_tools, conversation_mode=False)
+            full_prompt = self._build_full_prompt(prompt, context, system_prompt, call_site='streaming_response')
+            priority = self._determine_request_priority(prompt, context, task_id, step_id)
+            model = self.get_current_model()
+            
+            current_thread = threading.current_thread()
+            in_green_thread = hasattr(current_thread, 'name') and 'GreenThread' in current_thread.name
+            
+            if self.use_queue and not in_green_thread:
+                # El timeout cubre la espera en cola más la generación completa
+                response = self._dispatch_to_queue(
+                    prompt=full_prompt,
+                    priority=priority,
+                    task_id=task_id or "unknown_task",
+                    step_id=step_id or "unknown_step",
+                    timeout=self._get_model_config(model).get("request_timeout", 180) + 60,
+                    on_token=on_token
+                )
+            else:
+                response = self._call_ollama_api_sync(
+                    full_prompt,
+                    model,
+                    self._get_model_config(model).get("options", {}),
+                    on_token
+                )
+            
+            batcher.close()
+            
             if response.get('error'):
                 return {
                     'response': f"❌ Error al generar respuesta: {response['error']}",
                     'tool_calls': [],
-                    'raw_response': "",
-                    'model': self.get_current_model(),
+                    'raw_response': batcher.text,
+                    'model': model,
                     'timestamp': time.time(),
                     'error': response['error'],
                     'used_queue': self.use_queue,
-                    'priority': priority.name if self.use_queue else 'none'
+                    'priority': priority.name,
+                    'streamed': True
                 }
             
-            # Parsear la respuesta
-            parsed_response = self._parse_response(response.get('response', ''))
+            if batcher.text == response.get('response', ''):
+                parsed_response = extractor.finish()
+            else:
+                parsed_response = self._parse_response(response.get('response', ''))
             
             return {
                 'response': parsed_response['text'],
                 'tool_calls': parsed_response['tool_calls'],
                 'raw_response': response.get('response', ''),
-                'model': self.get_current_model(),
+                'model': model,
                 'timestamp': time.time(),
                 'used_queue': self.use_queue,
-                'priority': priority.name if self.use_queue else 'none'
+                'priority': priority.name,
+                'streamed': True,
+                'stream_stats': {
+                    'tokens': batcher.tokens_received,
+                    'flushes': batcher.flushes,
+                    'time_to_first_token': batcher.time_to_first_token
+                }
             }
             
         except Exception as e:
+            batcher.close()
             return {
                 'response': f"❌ Error interno: {str(e)}",
                 'tool_calls': [],
-                'raw_response': "",
+                'raw_response': batcher.text,
                 'model': self.get_current_model(),
                 'timestamp': time.time(),
                 'error': str(e),
-                'used_queue': self.use_queue
+                'used_queue': self.use_queue,
+                'streamed': True
             }
     
+    def _request_options(self, model: str, context: Optional[Dict] = None) -> Dict[str, Any]:
+        """Opciones de la configuración del modelo con las de muestreo que indique el contexto"""
+        options = dict(self._get_model_config(model).get("options", {}))
+        for key, value in (context or {}).items():
+            option = CONTEXT_OPTION_ALIASES.get(key, key)
+            if option in CONTEXT_SAMPLING_OPTIONS:
+                options[option] = value
+        return options
+    
+    def _sampling_temperature(self, model: str, overrides: Optional[Dict] = None) -> float:
+        """Temperature pedida por el llamador o, si no la indica, la configurada para el modelo"""
+        options = self._get_model_config(model).get("options", {})
+        temperature = (overrides or {}).get('temperature', options.get('temperature', 0.7))
+        try:
+            return float(temperature)
+        except (TypeError, ValueError):
+            return float(options.get('temperature', 0.7))
+    
+    def _is_cacheable_sampling(self, model: str, overrides: Optional[Dict] = None) -> bool:
+        """
+        Solo se cachean respuestas muestreadas con temperature 0: con más
+        temperatura la caché fijaría una muestra aleatoria como la respuesta
+        """
+        if not self.use_response_cache:
+            return False
+        temperature = self._sampling_temperature(model, overrides)
+        if temperature > 0:
+            self.logger.debug(f"🗄️ Caché omitida: temperature={temperature} no es determinista")
+            return False
+        return True
+    
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """📊 Métricas de la caché de respuestas LLM"""
+        stats = get_llm_response_cache().get_stats()
+        stats['enabled'] = self.use_response_cache
+        return stats
+    
     def _determine_request_priority(self, prompt: str, context: Dict, task_id: str, step_id: str) -> RequestPriority:
         """
         🔍 DETERMINAR PRIORIDAD DE REQUEST AUTOMÁTICAMENTE
@@ -786,114 +1589,15 @@ class OllamaService:
     
     def _parse_response(self, response_text: str) -> Dict[str, Any]:
         """
-        Parsear respuesta para extraer texto y tool calls con estrategias robustas
-        Mejora implementada según UPGRADE.md Sección 4: Servicio Ollama y Extracción de Query
-        """
-        import re
-        import json
-        import logging
-        
-        logger = logging.getLogger(__name__)
-        
-        if not response_text or not isinstance(response_text, str):
-            return {'text': '', 'tool_calls': []}
-        
-        tool_calls = []
-        clean_text = response_text
-        
-        # Estrategia 1: Buscar bloques JSON clásicos con ``` 
-        json_pattern_1 = r'```json\s*(\{.*?\})\s*```'
-        matches_1 = re.findall(json_pattern_1, response_text, re.DOTALL)
-        
-        for match in matches_1:
-            try:
-                data = json.loads(match)
-                if 'tool_call' in data:
-                    tool_calls.append(data['tool_call'])
-                    # Remover el bloque JSON del texto
-                    clean_text = clean_text.replace(f'```json\n{match}\n```', '')
-                    logger.debug(f"✅ JSON parsing strategy 1 successful: {match[:50]}...")
-            except json.JSONDecodeError as e:
-                logger.debug(f"⚠️ JSON parsing strategy 1 failed for match: {str(e)}")
-                continue
-        
-        # Estrategia 2: Buscar JSON sin marcadores de bloque
-        if not tool_calls:
-            json_pattern_2 = r'\{[^{}]*"tool_call"[^{}]*\{[^{}]*\}[^{}]*\}'
-            matches_2 = re.findall(json_pattern_2, response_text)
-            
-            for match in matches_2:
-                try:
-                    data = json.loads(match)
-                    if 'tool_call' in data:
-                        tool_calls.append(data['tool_call'])
-                        clean_text = clean_text.replace(match, '')
-                        logger.debug(f"✅ JSON parsing strategy 2 successful: {match[:50]}...")
-                except json.JSONDecodeError as e:
-                    logger.debug(f"⚠️ JSON parsing strategy 2 failed: {str(e)}")
-                    continue
-        
-        # Estrategia 3: Buscar cualquier JSON válido y verificar si contiene tool_call
-        if not tool_calls:
-            json_pattern_3 = r'\{[^}]*\}'
-            potential_jsons = re.findall(json_pattern_3, response_text)
-            
-            for potential_json in potential_jsons:
-                try:
-                    # Intentar corregir JSON mal formateado
-                    corrected_json = potential_json.replace("'", '"')  # Comillas simples por dobles
-                    data = json.loads(corrected_json)
-                    
-                    if isinstance(data, dict) and 'tool_call' in data:
-                        tool_calls.append(data['tool_call'])
-                        clean_text = clean_text.replace(potential_json, '')
-                        logger.debug(f"✅ JSON parsing strategy 3 successful: {potential_json[:50]}...")
-                        break
-                except (json.JSONDecodeError, ValueError) as e:
-                    logger.debug(f"⚠️ JSON parsing strategy 3 failed for '{potential_json[:30]}...': {str(e)}")
-                    continue
-        
-        # Estrategia 4: Extracción por regex específico de tool_call
-        if not tool_calls:
-            try:
-                tool_pattern = r'"tool_call"\s*:\s*\{[^}]*"tool"\s*:\s*"([^"]+)"[^}]*"parameters"\s*:\s*\{[^}]*\}'
-                tool_matches = re.finditer(tool_pattern, response_text)
-                
-                for tool_match in tool_matches:
-                    try:
-                        # Intentar construir tool_call básico desde regex
-                        full_match = tool_match.group()
-                        tool_name_match = re.search(r'"tool"\s*:\s*"([^"]+)"', full_match)
-                        params_match = re.search(r'"parameters"\s*:\s*(\{[^}]*\})', full_match)
-                        
-                        if tool_name_match:
-                            tool_call = {
-                                "tool": tool_name_match.group(1),
-                                "parameters": json.loads(params_match.group(1)) if params_match else {}
-                            }
-                            tool_calls.append(tool_call)
-                            clean_text = clean_text.replace(tool_match.group(), '')
-                            logger.debug(f"✅ JSON parsing strategy 4 successful for tool: {tool_call['tool']}")
-                            
-                    except (json.JSONDecodeError, AttributeError) as e:
-                        logger.debug(f"⚠️ JSON parsing strategy 4 failed for tool extraction: {str(e)}")
-                        continue
-                        
-            except Exception as e:
-                logger.debug(f"⚠️ JSON parsing strategy 4 overall failed: {str(e)}")
-        
-        # Limpiar texto final
-        clean_text = re.sub(r'```\w*\n?', '', clean_text)  # Remover marcadores de código
-        clean_text = re.sub(r'\n\s*\n', '\n', clean_text)  # Remover líneas vacías múltiples
-        clean_text = clean_text.strip()
+        Parsear respuesta para extraer texto y tool calls
         
-        if tool_calls:
-            logger.info(f"🔧 Successfully extracted {len(tool_calls)} tool calls from Ollama response")
-        
-        return {
-            'text': clean_text,
-            'tool_calls': tool_calls
-        }
+        Usa el extractor de un solo paso (llaves balanceadas, consciente de
+        bloques ```), que encuentra JSON anidado y tolera JSON mal formado.
+        """
+        parsed = parse_tool_calls(response_text)
+        if parsed['tool_calls']:
+            self.logger.info(f"🔧 Successfully extracted {len(parsed['tool_calls'])} tool calls from Ollama response")
+        return parsed
     
     def _build_system_prompt(self, use_tools: bool, conversation_mode: bool = False) -> str:
         """Construir prompt del sistema"""
@@ -976,25 +1680,70 @@ Herramientas disponibles:
         
         return base_prompt
     
-    def _build_full_prompt(self, prompt: str, context: Dict, system_prompt: str) -> str:
-        """Construir prompt completo con contexto"""
-        full_prompt = f"{system_prompt}\n\n"
+    def _build_full_prompt(self, prompt: str, context: Dict, system_prompt: str,
+                           call_site: Optional[str] = None) -> str:
+        """
+        Construir prompt completo con contexto dentro del presupuesto de tokens
+        
+        Orden: system prompt (prefijo estable), ID de tarea, resultados
+        previos, conversación anterior y mensaje del usuario. Si no cabe se
+        compactan primero los resultados previos, luego el historial y, como
+        último recurso, el centro del mensaje del usuario.
+        
+        call_site: nombre del punto de llamada para las métricas (None = no registrar)
+        """
+        sections = [
+            PromptSection('system', system_prompt, priority=100, footer="\n\n", required=True, cacheable=True)
+        ]
+        budget = self._prompt_token_budget(self.get_current_model())
         
         # Añadir contexto si está disponible
         if context:
             if 'task_id' in context:
-                full_prompt += f"ID de tarea: {context['task_id']}\n"
+                sections.append(PromptSection('task_id', f"ID de tarea: {context['task_id']}\n", priority=90))
+            
+            if context.get('previous_results'):
+                sections.append(PromptSection(
+                    'previous_results', format_previous_results(context['previous_results']),
+                    priority=10, header="Resultados previos:\n", footer="\n",
+                    max_tokens=budget // 4, strategy=STRATEGY_EXTRACT
+                ))
             
             if 'previous_messages' in context and context['previous_messages']:
-                full_prompt += "Conversación anterior:\n"
+                history = ""
                 for msg in context['previous_messages'][-3:]:  # Últimos 3 mensajes
                     sender = "Usuario" if msg.get('sender') == 'user' else "Asistente"
-                    full_prompt += f"{sender}: {msg.get('content', '')}\n"
-                full_prompt += "\n"
+                    history += f"{sender}: {msg.get('content', '')}\n"
+                sections.append(PromptSection(
+                    'previous_messages', history, priority=20,
+                    header="Conversación anterior:\n", footer="\n",
+                    max_tokens=budget // 4, strategy=STRATEGY_TAIL
+                ))
         
-        full_prompt += f"Usuario: {prompt}\nAsistente: "
+        sections.append(PromptSection(
+            'user_prompt', prompt, priority=50, header="Usuario: ", footer="\nAsistente: ",
+            strategy=STRATEGY_MIDDLE, required=True
+        ))
         
-        return full_prompt
+        return get_prompt_assembler().assemble(sections, budget, call_site=call_site).text
+    
+    def _prompt_token_budget(self, model: str) -> int:
+        """
+        Tokens disponibles para el prompt con este modelo
+        
+        Si la configuración del modelo fija num_ctx se reserva espacio para
+        la respuesta (num_predict, mínimo 512); si no, el presupuesto global.
+        """
+        options = self._get_model_config(model).get('options', {})
+        num_ctx = options.get('num_ctx')
+        if not num_ctx:
+            return get_prompt_assembler().default_budget
+        reserve = max(512, options.get('num_predict') or 0)
+        return max(512, num_ctx - reserve)
+    
+    def get_prompt_stats(self) -> Dict[str, Any]:
+        """📊 Tokens de prompt por punto de llamada"""
+        return get_prompt_assembler().get_stats()
     
     def chat_streaming(self, prompt: str, context: Dict = None, use_tools: bool = True):
         """
@@ -1011,7 +1760,7 @@ Herramientas disponibles:
         
         try:
             system_prompt = self._build_system_prompt(use_tools, conversation_mode=False)
-            full_prompt = self._build_full_prompt(prompt, context, system_prompt)
+            full_prompt = self._build_full_prompt(prompt, context, system_prompt, call_site='chat_streaming')
             
             payload = {
                 "model": self.get_current_model(),
@@ -1021,7 +1770,8 @@ Herramientas disponibles:
                     "temperature": 0.7,
                     "top_p": 0.9,
                     "top_k": 40
-                }
+                },
+                "keep_alive": self.keep_alive
             }
             
             # Headers necesarios para ngrok
@@ -1031,22 +1781,23 @@ Herramientas disponibles:
             if 'ngrok' in self.base_url:
                 headers['ngrok-skip-browser-warning'] = 'true'
             
-            response = requests.post(
+            response = get_http_session_pool().post(
                 f"{self.base_url}/api/generate",
                 json=payload,
                 headers=headers,
-                timeout=self.request_timeout,
+                read_timeout=self.request_timeout,
                 stream=True
             )
             
             if response.status_code == 200:
-                for line in response.iter_lines():
-                    if line:
-                        try:
-                            chunk = json.loads(line.decode('utf-8'))
-                            yield chunk
-                        except json.JSONDecodeError:
-                            continue
+                with response:
+                    for line in response.iter_lines():
+                        if line:
+                            try:
+                                chunk = json.loads(line.decode('utf-8'))
+                                yield chunk
+                            except json.JSONDecodeError:
+                                continue
             else:
                 yield {
                     'response': f"❌ Error HTTP {response.status_code}: {response.text}",
@@ -0,0 +1,113 @@
+"""
+📡 UTILIDADES DE STREAMING DE TOKENS DE OLLAMA
+==============================================
+
+Ollama devuelve un objeto JSON por línea cuando se usa `"stream": True`.
+Enviar cada token por WebSocket saturaría al cliente, así que
+TokenStreamBatcher agrupa los tokens y los entrega al sink cada N tokens o
+cada M milisegundos, lo que ocurra primero.
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Sink: recibe (texto_nuevo, texto_acumulado)
+StreamSink = Callable[[str, str], None]
+
+
+class TokenStreamBatcher:
+    """
+    📦 AGRUPADOR DE TOKENS PARA ENTREGA INCREMENTAL
+
+    Args:
+        sink: Función que recibe (delta, texto_completo_hasta_ahora)
+        flush_tokens: Tokens acumulados que fuerzan un envío
+        flush_interval_ms: Tiempo máximo entre envíos con tokens pendientes
+    """
+
+    def __init__(self,
+                 sink: Optional[StreamSink] = None,
+                 flush_tokens: Optional[int] = None,
+                 flush_interval_ms: Optional[int] = None):
+        self.sink = sink
+        self.flush_tokens = flush_tokens or int(os.getenv('OLLAMA_STREAM_FLUSH_TOKENS', '24'))
+        self.flush_interval = (flush_interval_ms or int(os.getenv('OLLAMA_STREAM_FLUSH_MS', '250'))) / 1000.0
+
+        self._pending: List[str] = []
+        self._chunks: List[str] = []
+        self._lock = threading.Lock()
+        self._started_at = time.monotonic()
+        self._last_flush = self._started_at
+
+        # Métricas
+        self.tokens_received = 0
+        self.flushes = 0
+        self.first_token_at: Optional[float] = None
+
+    @property
+    def text(self) -> str:
+        """Texto completo recibido hasta ahora"""
+        return "".join(self._chunks)
+
+    @property
+    def time_to_first_token(self) -> Optional[float]:
+        """Segundos entre la creación del batcher y el primer token"""
+        if self.first_token_at is None:
+            return None
+        return self.first_token_at - self._started_at
+
+    def add(self, token: str) -> None:
+        """Registrar un token; envía el lote si se alcanzó algún umbral"""
+        if not token:
+            return
+
+        with self._lock:
+            now = time.monotonic()
+            if self.first_token_at is None:
+                self.first_token_at = now
+
+            self._pending.append(token)
+            self._chunks.append(token)
+            self.tokens_received += 1
+
+            # El primer token se envía de inmediato para que el usuario vea actividad
+            should_flush = (
+                self.flushes == 0
+                or len(self._pending) >= self.flush_tokens
+                or now - self._last_flush >= self.flush_interval
+            )
+            if should_flush:
+                self._flush_locked(now)
+
+    def flush(self) -> None:
+        """Enviar los tokens pendientes, si los hay"""
+        with self._lock:
+            self._flush_locked(time.monotonic())
+
+    def close(self) -> str:
+        """Enviar lo pendiente y devolver el texto completo"""
+        self.flush()
+        return self.text
+
+    def _flush_locked(self, now: float) -> None:
+        if not self._pending:
+            return
+
+        delta = "".join(self._pending)
+        self._pending = []
+        self._last_flush = now
+        self.flushes += 1
+
+        if self.sink is None:
+            return
+
+        try:
+            self.sink(delta, "".join(self._chunks))
+        except Exception as e:
+            # Un fallo del canal de salida nunca debe romper la generación
+            logger.warning(f"⚠️ Error enviando lote de streaming: {str(e)}")
@@ -0,0 +1,313 @@
+"""
+📏 PRESUPUESTO DE TOKENS Y COMPACTACIÓN DE PROMPTS
+==================================================
+
+En modelos locales la longitud del prompt domina la latencia (el prefill
+es proporcional a los tokens de entrada) y, si supera num_ctx, Ollama
+recorta el principio del prompt en silencio: justo el system prompt.
+
+Este módulo ensambla el prompt a partir de secciones con prioridad:
+- Estimación rápida de tokens sin tokenizador (trozos de palabra de hasta
+  4 caracteres + signos de puntuación, una regex compilada)
+- Límite máximo por sección y presupuesto total
+- Si no cabe, se compactan primero las secciones de menor valor:
+  resumen extractivo (primera frase de cada línea), conservar el final
+  (historial), conservar el principio o recortar el centro
+- El system prompt va siempre primero y sin cambios, así Ollama puede
+  reutilizar su caché de prefijo; su recuento de tokens se memoriza
+- Métricas de tokens por punto de llamada
+"""
+
+import logging
+import os
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Trozo de palabra (≈ un token BPE) o signo suelto
+_PIECE_RE = re.compile(r"\w{1,4}|[^\w\s]")
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s")
+
+STRATEGY_HEAD = 'head'        # conservar el principio
+STRATEGY_TAIL = 'tail'        # conservar el final (lo más reciente)
+STRATEGY_MIDDLE = 'middle'    # conservar principio y final
+STRATEGY_EXTRACT = 'extract'  # primera frase de cada línea, luego principio
+
+_ELISION = "\n[...]\n"
+_MIN_USEFUL_TOKENS = 24
+_SYSTEM_CACHE_SIZE = 32
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimación rápida del número de tokens de un texto"""
+    if not text:
+        return 0
+    return len(_PIECE_RE.findall(text))
+
+
+def _piece_starts(text: str) -> List[int]:
+    return [match.start() for match in _PIECE_RE.finditer(text)]
+
+
+def truncate_to_tokens(text: str, max_tokens: int, strategy: str = STRATEGY_HEAD) -> str:
+    """
+    ✂️ RECORTAR UN TEXTO A `max_tokens` TOKENS ESTIMADOS
+
+    Args:
+        text: Texto original
+        max_tokens: Tokens máximos del resultado
+        strategy: head, tail, middle o extract
+    """
+    if max_tokens <= 0:
+        return ''
+    if strategy == STRATEGY_EXTRACT:
+        text = extractive_summary(text)
+        strategy = STRATEGY_HEAD
+
+    starts = _piece_starts(text)
+    if len(starts) <= max_tokens:
+        return text
+
+    if strategy == STRATEGY_TAIL:
+        return text[starts[len(starts) - max_tokens]:]
+    if strategy == STRATEGY_MIDDLE and max_tokens > 8:
+        keep = (max_tokens - 3) // 2  # el marcador de elisión cuenta ~3 tokens
+        return text[:starts[keep]].rstrip() + _ELISION + text[starts[len(starts) - keep]:]
+    return text[:starts[max_tokens]].rstrip()
+
+
+def extractive_summary(text: str) -> str:
+    """Resumen extractivo barato: la primera frase de cada línea no vacía"""
+    lines = []
+    for line in text.splitlines():
+        line = line.strip()
+        if line:
+            lines.append(_SENTENCE_END_RE.split(line, 1)[0])
+    return '\n'.join(lines)
+
+
+def format_previous_results(previous_results: Iterable[Dict[str, Any]],
+                            max_tokens: Optional[int] = None) -> str:
+    """
+    📋 LÍNEAS "- Herramienta X: resumen" DE LOS RESULTADOS PREVIOS CORRECTOS
+
+    Con max_tokens el bloque se compacta (resumen extractivo) para no
+    arrastrar resultados completos de pasos anteriores a cada prompt.
+    """
+    lines = []
+    for previous in previous_results or []:
+        if not isinstance(previous, dict) or not previous.get('success'):
+            continue
+        result = previous.get('result', {})
+        summary = result.get('summary', 'Sin resumen') if isinstance(result, dict) else str(result)
+        lines.append(f"- Herramienta {previous.get('tool', 'unknown')}: {summary}")
+    text = '\n'.join(lines)
+    if max_tokens is not None and estimate_tokens(text) > max_tokens:
+        text = truncate_to_tokens(text, max_tokens, STRATEGY_EXTRACT)
+    return text + '\n' if text else ''
+
+
+@dataclass
+class PromptSection:
+    """
+    🧩 SECCIÓN DEL PROMPT
+
+    Se renderiza como header + body + footer; solo body se compacta.
+    Las secciones de mayor prioridad se compactan las últimas y las
+    `required` nunca se eliminan del todo.
+    """
+    name: str
+    body: str
+    priority: int = 0
+    header: str = ''
+    footer: str = ''
+    max_tokens: Optional[int] = None
+    strategy: str = STRATEGY_HEAD
+    required: bool = False
+    cacheable: bool = False
+
+    def render(self) -> str:
+        return f"{self.header}{self.body}{self.footer}"
+
+
+@dataclass
+class AssembledPrompt:
+    """📦 Prompt final y su contabilidad de tokens"""
+    text: str
+    tokens: int
+    original_tokens: int
+    budget: int
+    compacted: List[str] = field(default_factory=list)
+    dropped: List[str] = field(default_factory=list)
+
+
+@dataclass
+class CallSiteStats:
+    """📊 Tokens de prompt de un punto de llamada"""
+    calls: int = 0
+    prompt_tokens_total: int = 0
+    prompt_tokens_max: int = 0
+    original_tokens_total: int = 0
+    compacted_calls: int = 0
+    over_budget_calls: int = 0
+
+
+class PromptAssembler:
+    """
+    📏 ENSAMBLADOR DE PROMPTS CON PRESUPUESTO DE TOKENS
+
+    Args:
+        default_budget: Tokens de prompt por defecto si el modelo no fija num_ctx
+    """
+
+    def __init__(self, default_budget: int = 6144):
+        self.default_budget = default_budget
+        self._system_tokens: Dict[str, int] = {}
+        self._stats: Dict[str, CallSiteStats] = {}
+        self._lock = threading.Lock()
+        self.system_cache_hits = 0
+
+    def _section_tokens(self, section: PromptSection) -> int:
+        if not section.cacheable:
+            return estimate_tokens(section.body)
+        tokens = self._system_tokens.get(section.body)
+        if tokens is None:
+            tokens = estimate_tokens(section.body)
+            with self._lock:
+                if len(self._system_tokens) >= _SYSTEM_CACHE_SIZE:
+                    self._system_tokens.clear()
+                self._system_tokens[section.body] = tokens
+        else:
+            self.system_cache_hits += 1
+        return tokens
+
+    def assemble(self, sections: List[PromptSection], budget: Optional[int] = None,
+                 call_site: Optional[str] = None) -> AssembledPrompt:
+        """
+        🧱 ENSAMBLAR LAS SECCIONES DENTRO DEL PRESUPUESTO
+
+        El orden de las secciones en el prompt es el de la lista; la
+        prioridad solo decide qué se compacta antes.
+        """
+        budget = budget or self.default_budget
+        body_tokens = [self._section_tokens(section) for section in sections]
+        frame_tokens = sum(estimate_tokens(section.header) + estimate_tokens(section.footer) for section in sections)
+        original_tokens = sum(body_tokens) + frame_tokens
+
+        bodies = [section.body for section in sections]
+        compacted: List[str] = []
+        dropped: List[str] = []
+
+        # 1. Límites por sección
+        for index, section in enumerate(sections):
+            if section.max_tokens is not None and body_tokens[index] > section.max_tokens:
+                bodies[index] = truncate_to_tokens(section.body, section.max_tokens, section.strategy)
+                body_tokens[index] = estimate_tokens(bodies[index])
+                compacted.append(section.name)
+
+        # 2. Presupuesto total: compactar de menor a mayor valor
+        total = sum(body_tokens) + frame_tokens
+        for index in sorted(range(len(sections)), key=lambda i: sections[i].priority):
+            if total <= budget:
+                break
+            section = sections[index]
+            excess = total - budget
+            target = body_tokens[index] - excess
+            if target < _MIN_USEFUL_TOKENS and not section.required:
+                frame = estimate_tokens(section.header) + estimate_tokens(section.footer)
+                total -= body_tokens[index] + frame
+                body_tokens[index] = 0
+                bodies[index] = None
+                dropped.append(section.name)
+                continue
+            if section.cacheable:
+                # El prefijo del sistema no se toca: se perdería la caché de Ollama
+                continue
+            bodies[index] = truncate_to_tokens(bodies[index], max(target, _MIN_USEFUL_TOKENS), section.strategy)
+            new_tokens = estimate_tokens(bodies[index])
+            total -= body_tokens[index] - new_tokens
+            body_tokens[index] = new_tokens
+            if section.name not in compacted:
+                compacted.append(section.name)
+
+        parts = []
+        for section, body in zip(sections, bodies):
+            if body is None:
+                continue
+            if body and section.body.endswith('\n') and not body.endswith('\n'):
+                body += '\n'
+            parts.append(f"{section.header}{body}{section.footer}")
+
+        assembled = AssembledPrompt(
+            text=''.join(parts),
+            tokens=total,
+            original_tokens=original_tokens,
+            budget=budget,
+            compacted=compacted,
+            dropped=dropped
+        )
+        if compacted or dropped:
+            logger.info(
+                f"📏 Prompt compactado ({call_site or 'sin etiqueta'}): "
+                f"{original_tokens} → {total} tokens (presupuesto {budget}), "
+                f"recortadas={compacted} eliminadas={dropped}"
+            )
+        if call_site:
+            self._record(call_site, assembled)
+        return assembled
+
+    def _record(self, call_site: str, assembled: AssembledPrompt) -> None:
+        with self._lock:
+            stats = self._stats.setdefault(call_site, CallSiteStats())
+            stats.calls += 1
+            stats.prompt_tokens_total += assembled.tokens
+            stats.prompt_tokens_max = max(stats.prompt_tokens_max, assembled.tokens)
+            stats.original_tokens_total += assembled.original_tokens
+            stats.compacted_calls += int(bool(assembled.compacted or assembled.dropped))
+            stats.over_budget_calls += int(assembled.tokens > assembled.budget)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """📊 Tokens de prompt por punto de llamada"""
+        with self._lock:
+            return {
+                'default_budget': self.default_budget,
+                'system_prompt_cache_hits': self.system_cache_hits,
+                'call_sites': {
+                    call_site: {
+                        'calls': stats.calls,
+                        'avg_prompt_tokens': round(stats.prompt_tokens_total / stats.calls, 1),
+                        'max_prompt_tokens': stats.prompt_tokens_max,
+                        'avg_original_tokens': round(stats.original_tokens_total / stats.calls, 1),
+                        'compacted_calls': stats.compacted_calls,
+                        'over_budget_calls': stats.over_budget_calls
+                    }
+                    for call_site, stats in self._stats.items()
+                }
+            }
+
+
+# 🌐 INSTANCIA GLOBAL
+_global_assembler: Optional[PromptAssembler] = None
+_global_assembler_lock = threading.Lock()
+
+
+def get_prompt_assembler() -> PromptAssembler:
+    """
+    🌐 OBTENER EL ENSAMBLADOR GLOBAL
+
+    OLLAMA_PROMPT_TOKEN_BUDGET fija el presupuesto por defecto (tokens).
+    """
+    global _global_assembler
+
+    if _global_assembler is None:
+        with _global_assembler_lock:
+            if _global_assembler is None:
+                _global_assembler = PromptAssembler(
+                    default_budget=int(os.getenv('OLLAMA_PROMPT_TOKEN_BUDGET', '6144'))
+                )
+                logger.info("🌐 Nueva instancia global de PromptAssembler creada")
+
+    return _global_assembler
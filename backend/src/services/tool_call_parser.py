@@ -0,0 +1,417 @@
+"""
+🔧 EXTRACTOR INCREMENTAL DE TOOL CALLS EN RESPUESTAS DEL LLM
+============================================================
+
+Sustituye a las cuatro estrategias regex de OllamaService._parse_response
+(cada una recorría el texto completo y hacía str.replace sobre él) por un
+único recorrido. Se salta directamente al siguiente carácter significativo
+para el estado actual ({, }, comillas, ```...) y el texto intermedio se
+copia en bloque; en texto normal, el caso más común, con str.find:
+
+- Escáner de llaves balanceadas que respeta cadenas JSON (comillas dobles
+  y simples) y escapes, por lo que encuentra objetos anidados a cualquier
+  profundidad
+- Consciente de bloques ``` : los marcadores se eliminan del texto, los
+  bloques json/sin lenguaje se analizan y los de otros lenguajes (python,
+  bash...) se tratan como texto literal
+- Incremental: feed() acepta fragmentos de streaming y devuelve los tool
+  calls completados en ese fragmento
+- Tolerante: reintenta con comillas simples y comas finales corregidas y,
+  si el objeto sigue roto, recupera "tool"/"parameters" del fragmento
+- Una llave sin cerrar (p.ej. "{x" en prosa) se descarta al llegar a una
+  línea en blanco o a un marcador de bloque, y el resto se vuelve a escanear
+
+Cada objeto candidato se decodifica una sola vez. El re-escaneo tras una
+llave descartada no vuelve a abrir candidatos en las llaves que ese mismo
+escaneo ya vio abiertas fuera de cadenas y sin cerrar: un objeto que
+empieza en ellas acabaría descartado en el mismo punto. Así una ráfaga de
+llaves sin cerrar cuesta un re-escaneo y no uno por llave. Los casos que
+aún obligarían a re-escanear mucho (llaves dentro de cadenas, p.ej. tras
+apóstrofos en una línea enorme) tienen un presupuesto proporcional a la
+entrada; agotado, el objeto descartado pasa entero al texto. El coste es
+lineal en el tamaño de la respuesta.
+"""
+
+import json
+import logging
+import re
+from typing import Any, Dict, FrozenSet, List, Optional, Pattern, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Lenguajes de bloque cuyo contenido puede contener tool calls
+JSON_FENCE_LANGUAGES = frozenset({'', 'json', 'tool', 'tool_call', 'javascript', 'js'})
+
+_TRAILING_COMMA_RE = re.compile(r',\s*([}\]])')
+_BLANK_LINES_RE = re.compile(r'\n\s*\n')
+_SALVAGE_TOOL_RE = re.compile(r'"tool"\s*:\s*"([^"]+)"')
+_SALVAGE_PARAMS_RE = re.compile(r'"parameters"\s*:\s*(\{[^{}]*\})')
+
+# Siguiente carácter significativo según el estado del escáner (en texto,
+# { o `, se busca con str.find)
+_NEXT_IN_LITERAL_FENCE = re.compile(r'`')
+_NEXT_IN_OBJECT = re.compile(r'[{}"\'`\n]')
+_NEXT_IN_DOUBLE_QUOTED = re.compile(r'["\\]')
+_NEXT_IN_SINGLE_QUOTED = re.compile(r"['\\\n]")
+
+# Caracteres re-escaneados permitidos: por carácter recibido y mínimo fijo
+REPLAY_BUDGET_FACTOR = 4
+REPLAY_BUDGET_MIN = 64 * 1024
+
+_NO_DEAD_BRACES: FrozenSet[int] = frozenset()
+
+
+def _find_tool_calls(data: Any) -> List[Dict[str, Any]]:
+    """Tool calls de un objeto decodificado: el de primer nivel o los anidados"""
+    if isinstance(data, dict):
+        if 'tool_call' in data:
+            return [data['tool_call']]
+        found = []
+        for value in data.values():
+            found.extend(_find_tool_calls(value))
+        return found
+    if isinstance(data, list):
+        found = []
+        for item in data:
+            found.extend(_find_tool_calls(item))
+        return found
+    return []
+
+
+def _decode_candidate(fragment: str) -> Optional[Any]:
+    """json.loads con las correcciones habituales de salida de LLM"""
+    for attempt in (fragment, fragment.replace("'", '"')):
+        try:
+            return json.loads(attempt)
+        except ValueError:
+            pass
+        try:
+            return json.loads(_TRAILING_COMMA_RE.sub(r'\1', attempt))
+        except ValueError:
+            pass
+    return None
+
+
+def _salvage_tool_call(fragment: str) -> Optional[Dict[str, Any]]:
+    """Recuperar tool/parameters de un objeto que no es JSON válido"""
+    if '"tool_call"' not in fragment:
+        return None
+    tool_match = _SALVAGE_TOOL_RE.search(fragment)
+    if not tool_match:
+        return None
+    parameters: Dict[str, Any] = {}
+    params_match = _SALVAGE_PARAMS_RE.search(fragment)
+    if params_match:
+        try:
+            parameters = json.loads(params_match.group(1))
+        except ValueError:
+            pass
+    return {'tool': tool_match.group(1), 'parameters': parameters}
+
+
+class ToolCallExtractor:
+    """
+    🔎 ESCÁNER DE UN SOLO PASO PARA TEXTO + TOOL CALLS
+
+    Uso en streaming:
+        extractor = ToolCallExtractor()
+        for chunk in stream:
+            for tool_call in extractor.feed(chunk):
+                ...
+        result = extractor.finish()
+    """
+
+    def __init__(self):
+        self.tool_calls: List[Dict[str, Any]] = []
+
+        self._text: List[str] = []
+        self._candidate: List[str] = []
+        self._candidate_size = 0
+        # Posición en el candidato de cada llave abierta fuera de cadenas y aún sin cerrar
+        self._open_braces: List[int] = []
+        self._depth = 0
+        self._quote: Optional[str] = None
+        self._escape = False
+        self._line_blank = False
+
+        self._ticks = 0
+        self._in_fence = False
+        self._fence_literal = False
+        self._reading_lang: Optional[List[str]] = None
+        self._skip_newline = False
+
+        # Re-escaneo de un candidato descartado, antes del resto del fragmento:
+        # (texto, posiciones de llaves que no pueden cerrar un objeto)
+        self._replay: Optional[Tuple[str, FrozenSet[int]]] = None
+        self._fed = 0
+
+        self.candidates_seen = 0
+        self.chars_replayed = 0
+
+    # ------------------------------------------------------------------
+    # API
+    # ------------------------------------------------------------------
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """Procesar un fragmento; devuelve los tool calls completados en él"""
+        start = len(self.tool_calls)
+        self._fed += len(chunk)
+        self._scan(chunk, _NO_DEAD_BRACES)
+        return self.tool_calls[start:]
+
+    def finish(self) -> Dict[str, Any]:
+        """Cerrar el escaneo y devolver {'text', 'tool_calls'}"""
+        self._flush_ticks()
+        self._reading_lang = None
+        while self._candidate:
+            # Objeto sin cerrar (respuesta truncada): texto, salvo que sea recuperable
+            self._abandon_candidate()
+            if self._replay is not None:
+                (replay, dead), self._replay = self._replay, None
+                self._scan(replay, dead)
+            self._flush_ticks()
+
+        text = ''.join(self._text)
+        text = _BLANK_LINES_RE.sub('\n', text).strip()
+        return {'text': text, 'tool_calls': list(self.tool_calls)}
+
+    # ------------------------------------------------------------------
+    # Máquina de estados
+    # ------------------------------------------------------------------
+
+    def _next_pattern(self) -> Optional[Pattern]:
+        """Regex del siguiente carácter significativo; None en texto normal"""
+        if self._quote == '"':
+            return _NEXT_IN_DOUBLE_QUOTED
+        if self._quote == "'":
+            return _NEXT_IN_SINGLE_QUOTED
+        if self._fence_literal:
+            return _NEXT_IN_LITERAL_FENCE
+        if self._depth > 0:
+            return _NEXT_IN_OBJECT
+        return None
+
+    def _scan(self, text: str, dead: FrozenSet[int]) -> None:
+        """
+        Recorrer `text`; `dead` son posiciones de llaves que se copian como
+        texto sin abrir candidato (ver _abandon_candidate)
+        """
+        # Tramos interrumpidos por un re-escaneo: (texto, posición, llaves muertas)
+        pending: List[Tuple[str, int, FrozenSet[int]]] = []
+        pos = 0
+        # Próximas { y ` del tramo (-1: no hay más); valen hasta que pos las pasa
+        brace_at = tick_at = None
+        while True:
+            if pos >= len(text):
+                if not pending:
+                    break
+                text, pos, dead = pending.pop()
+                brace_at = tick_at = None
+                continue
+
+            if self._ticks or self._escape or self._skip_newline or self._reading_lang is not None:
+                # Estados de un solo carácter: camino lento
+                self._step(text[pos])
+                pos += 1
+            else:
+                pattern = self._next_pattern()
+                if pattern is None:
+                    if brace_at is None or 0 <= brace_at < pos:
+                        brace_at = text.find('{', pos)
+                    if tick_at is None or 0 <= tick_at < pos:
+                        tick_at = text.find('`', pos)
+                    end = min(brace_at, tick_at) if brace_at >= 0 and tick_at >= 0 else max(brace_at, tick_at)
+                else:
+                    match = pattern.search(text, pos)
+                    end = match.start() if match else -1
+                if end < 0:
+                    self._copy_span(text[pos:])
+                    pos = len(text)
+                    continue
+                if end > pos:
+                    self._copy_span(text[pos:end])
+                if pattern is None and end in dead:
+                    self._text.append('{')
+                else:
+                    self._step(text[end])
+                pos = end + 1
+
+            if self._replay is not None:
+                pending.append((text, pos, dead))
+                (text, dead), self._replay = self._replay, None
+                pos = 0
+                brace_at = tick_at = None
+
+    def _copy_span(self, span: str) -> None:
+        """Copiar un tramo sin caracteres significativos al destino actual"""
+        if self._depth > 0 or self._quote is not None:
+            self._append_candidate(span)
+            if self._quote is None and not span.isspace():
+                self._line_blank = False
+        else:
+            self._text.append(span)
+
+    def _step(self, char: str) -> None:
+        if self._quote is not None:
+            if self._quote == "'" and char == '\n':
+                # Una cadena con comilla simple no cruza líneas: era un apóstrofo
+                self._append_candidate(char)
+                self._abandon_candidate()
+                return
+            # Dentro de una cadena del objeto candidato: todo es literal
+            self._append_candidate(char)
+            if self._escape:
+                self._escape = False
+            elif char == '\\':
+                self._escape = True
+            elif char == self._quote:
+                self._quote = None
+            return
+
+        if char == '`':
+            self._ticks += 1
+            return
+        if self._ticks:
+            self._flush_ticks()
+
+        if self._reading_lang is not None:
+            if char.isalnum() or char == '_':
+                self._reading_lang.append(char)
+                return
+            language = ''.join(self._reading_lang).lower()
+            self._reading_lang = None
+            self._fence_literal = language not in JSON_FENCE_LANGUAGES
+            if char == '\n':
+                return
+
+        if self._skip_newline:
+            self._skip_newline = False
+            if char == '\n':
+                return
+
+        if self._fence_literal or (self._depth == 0 and char != '{'):
+            self._text.append(char)
+            return
+
+        if char == '\n':
+            if self._line_blank:
+                # Línea en blanco dentro de un "objeto": era una llave suelta
+                self._append_candidate(char)
+                self._abandon_candidate()
+                return
+            self._line_blank = True
+        elif not char.isspace():
+            self._line_blank = False
+
+        if char == '{':
+            self._depth += 1
+            self._open_braces.append(self._candidate_size)
+        elif char == '}':
+            self._depth -= 1
+            self._open_braces.pop()
+        elif char in '"\'' and self._depth > 0:
+            self._quote = char
+        self._append_candidate(char)
+
+        if self._depth == 0:
+            self._complete_candidate()
+
+    def _flush_ticks(self) -> None:
+        """Resolver una racha de acentos graves: marcador de bloque o texto"""
+        ticks, self._ticks = self._ticks, 0
+        if ticks < 3:
+            self._emit('`' * ticks)
+            return
+
+        if self._candidate:
+            # Un bloque que se cierra con un objeto a medias: no era JSON
+            self._abandon_candidate(at_fence=True)
+
+        if self._in_fence:
+            self._in_fence = False
+            self._fence_literal = False
+            self._skip_newline = True
+        else:
+            self._in_fence = True
+            self._reading_lang = []
+
+    def _emit(self, text: str) -> None:
+        if self._depth > 0:
+            self._append_candidate(text)
+        else:
+            self._text.append(text)
+
+    def _append_candidate(self, text: str) -> None:
+        self._candidate.append(text)
+        self._candidate_size += len(text)
+
+    def _reset_candidate(self) -> str:
+        fragment = ''.join(self._candidate)
+        self._candidate = []
+        self._candidate_size = 0
+        self._open_braces = []
+        return fragment
+
+    def _complete_candidate(self) -> None:
+        fragment = self._reset_candidate()
+        self.candidates_seen += 1
+
+        data = _decode_candidate(fragment)
+        found = _find_tool_calls(data) if data is not None else []
+        if not found:
+            salvaged = _salvage_tool_call(fragment) if data is None else None
+            if salvaged is None:
+                self._text.append(fragment)
+                return
+            found = [salvaged]
+
+        self.tool_calls.extend(found)
+        logger.debug(f"✅ Tool call extraído: {fragment[:50]}...")
+
+    def _abandon_candidate(self, at_fence: bool = False) -> None:
+        """
+        Descartar un objeto que no llegó a cerrarse
+
+        Si contiene un tool call recuperable se usa; si no, la llave de
+        apertura pasa al texto y el resto se vuelve a escanear. Las llaves
+        que siguen abiertas fuera de cadenas no pueden cerrar un objeto antes
+        del punto de descarte (desde ellas el escaneo sería idéntico) ni
+        contener un tool call recuperable (su fragmento es un sufijo de este),
+        así que en el re-escaneo se copian como texto. Con un marcador de
+        bloque no vale: el marcador ya se consumió y no está en el re-escaneo.
+        """
+        open_braces = self._open_braces
+        fragment = self._reset_candidate()
+        self._depth = 0
+        self._quote = None
+        self._escape = False
+        self._line_blank = False
+
+        salvaged = _salvage_tool_call(fragment)
+        if salvaged is not None:
+            self.tool_calls.append(salvaged)
+            return
+
+        self.chars_replayed += len(fragment)
+        if self.chars_replayed > self._fed * REPLAY_BUDGET_FACTOR + REPLAY_BUDGET_MIN:
+            # Entrada patológica: sin más re-escaneos, el objeto es texto
+            self._text.append(fragment)
+            return
+        self._text.append(fragment[:1])
+        dead = _NO_DEAD_BRACES if at_fence else frozenset(offset - 1 for offset in open_braces[1:])
+        self._replay = (fragment[1:], dead)
+
+
+def parse_tool_calls(response_text: str) -> Dict[str, Any]:
+    """
+    🔧 SEPARAR TEXTO Y TOOL CALLS DE UNA RESPUESTA COMPLETA
+
+    Returns:
+        {'text': texto limpio, 'tool_calls': [dict, ...]}
+    """
+    if not response_text or not isinstance(response_text, str):
+        return {'text': '', 'tool_calls': []}
+
+    extractor = ToolCallExtractor()
+    extractor.feed(response_text)
+    return extractor.finish()
@@ -1226,9 +1226,11 @@ NO uses eventos específicos inventados."""
             # Generar respuesta usando el LLM
             response = ollama_service.generate_response(
                 prompt=prompt,
-                context={'max_tokens': 800, 'temperature': 0.7},
+                context={'max_tokens': 800, 'temperature': 0.0},  # Determinista: cacheable
                 use_tools=False,
-                task_id="search_generation"
+                task_id="search_generation",
+                cache_ttl=86400,
+                cache_tag="search_keywords"
             )
             
             if response and isinstance(response, dict) and response.get('response'):
@@ -95,7 +95,8 @@ class WebBrowserManager:
         if ollama_service:
             self.llm_model = MitosisOllamaChatModel.create_from_mitosis_config(
                 ollama_service=ollama_service,
-                model="llama3.1:8b"
+                model="llama3.1:8b",
+                task_id=task_id
             )
         else:
             # Fallback: create new OllamaService
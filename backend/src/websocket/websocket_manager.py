@@ -156,8 +156,12 @@ class WebSocketManager:
                 if not self.active_connections[task_id]:
                     del self.active_connections[task_id]
                     
-    def send_update(self, task_id: str, update_type: UpdateType, data: Dict[str, Any]):
-        """Send update to all clients listening to a task - ENHANCED VERSION WITH MESSAGE PERSISTENCE"""
+    def send_update(self, task_id: str, update_type: UpdateType, data: Dict[str, Any], store: bool = True):
+        """Send update to all clients listening to a task - ENHANCED VERSION WITH MESSAGE PERSISTENCE
+
+        store=False emits without keeping the message for late-joining clients
+        (callers that keep their own collapsed copy, e.g. report progress)
+        """
         if not self.is_initialized or not self.socketio:
             logger.warning("WebSocket not initialized, cannot send update")
             return
@@ -177,9 +181,10 @@ class WebSocketManager:
         }
         
         # Store message for late-joining clients (keep last 50 messages per task)
-        self.stored_messages[task_id].append(update_data)
-        if len(self.stored_messages[task_id]) > 50:
-            self.stored_messages[task_id] = self.stored_messages[task_id][-50:]
+        if store:
+            self.stored_messages[task_id].append(update_data)
+            if len(self.stored_messages[task_id]) > 50:
+                self.stored_messages[task_id] = self.stored_messages[task_id][-50:]
         
         # 🚀 ENHANCED LOGGING for debugging
         logger.info(f"📡 Storing and attempting to send {update_type.value} update for task {task_id}")
@@ -208,7 +213,7 @@ class WebSocketManager:
             # Strategy 3: Store in session storage for retrieval
             if not hasattr(self, 'session_messages'):
                 self.session_messages = {}
-            for session_id in self.active_connections.get(task_id, []):
+            for session_id in (self.active_connections.get(task_id, []) if store else []):
                 if session_id not in self.session_messages:
                     self.session_messages[session_id] = []
                 self.session_messages[session_id].append(update_data)
@@ -607,7 +612,13 @@ class WebSocketManager:
         })
 
     def send_report_progress(self, task_id: str, section_title: str, content_delta: str, full_report_so_far: str = ""):
-        """Send incremental report progress update for real-time report building"""
+        """Send incremental report progress update for real-time report building
+
+        Live clients get only the delta (the frontend concatenates). For
+        late-joining clients each section keeps ONE stored message whose
+        content_delta accumulates the section text, so streaming flushes never
+        push step/completion events out of the 50-message replay buffer.
+        """
         # ✅ VALIDACIONES PARA EVITAR ERRORES DE UNDEFINED EN FRONTEND
         if not section_title or not isinstance(section_title, str):
             section_title = "Report Section"
@@ -617,14 +628,39 @@ class WebSocketManager:
             
         full_report_so_far = str(full_report_so_far) if full_report_so_far else ""
         
-        self.send_update(task_id, UpdateType.REPORT_PROGRESS, {
+        data = {
             'section_title': str(section_title),
             'content_delta': str(content_delta),
             'full_report_so_far': full_report_so_far,
             'message': f'Generando informe: {section_title}',
             'timestamp': datetime.now().isoformat(),
             'type': 'report_progress'  # ✅ Añadir campo type explícito para el frontend
+        }
+        self.send_update(task_id, UpdateType.REPORT_PROGRESS, data, store=False)
+        self._store_report_section(task_id, data)
+
+    def _store_report_section(self, task_id: str, data: Dict[str, Any]):
+        """Keep one accumulated report_progress message per section for replay"""
+        if not hasattr(self, 'stored_messages'):
+            self.stored_messages = {}
+        messages = self.stored_messages.setdefault(task_id, [])
+        for message in messages:
+            stored = message['data']
+            if message['type'] == UpdateType.REPORT_PROGRESS.value and stored['section_title'] == data['section_title']:
+                if data['full_report_so_far']:
+                    stored['full_report_so_far'] = data['full_report_so_far']
+                else:
+                    stored['content_delta'] += data['content_delta']
+                stored['timestamp'] = message['timestamp'] = data['timestamp']
+                return
+        messages.append({
+            'task_id': task_id,
+            'type': UpdateType.REPORT_PROGRESS.value,
+            'timestamp': data['timestamp'],
+            'data': dict(data)
         })
+        if len(messages) > 50:
+            self.stored_messages[task_id] = messages[-50:]
 
     def send_browser_visual_event(self, task_id: str, event_data: Dict[str, Any]):
         """Send browser visual event for real-time web navigation visualization - CRITICAL FIX"""
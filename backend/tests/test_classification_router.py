@@ -0,0 +1,102 @@
+import json
+
+import pytest
+
+from src.services.classification_router import ClassificationRouter, ClassificationVote
+
+
+def _parse(text):
+    data = json.loads(text)
+    return ClassificationVote(label=data["intent"], confidence=data.get("confidence", 0.5))
+
+
+def _generator(answers, calls):
+    def generate(model):
+        calls.append(model)
+        return answers.get(model)
+    return generate
+
+
+def test_confident_small_model_answer_is_not_escalated():
+    router = ClassificationRouter(confidence_threshold=0.75, audit_every=0)
+    calls = []
+    answers = {"small": '{"intent": "casual", "confidence": 0.9}'}
+
+    routed = router.classify("intent", _generator(answers, calls), _parse, "small", "large")
+
+    assert routed.model == "small" and not routed.escalated
+    assert routed.vote.label == "casual"
+    assert calls == ["small"]
+    stats = router.get_stats()["routes"]["intent"]
+    assert stats["small_accepted"] == 1 and stats["escalations"] == 0
+
+
+def test_low_confidence_or_unparseable_answer_escalates_to_large_model():
+    router = ClassificationRouter(confidence_threshold=0.75, audit_every=0)
+    calls = []
+    answers = {
+        "small": '{"intent": "casual", "confidence": 0.4}',
+        "large": '{"intent": "tarea_creacion", "confidence": 0.95}',
+    }
+
+    routed = router.classify("intent", _generator(answers, calls), _parse, "small", "large")
+    assert routed.model == "large" and routed.escalated
+    assert routed.vote.label == "tarea_creacion"
+    assert calls == ["small", "large"]
+
+    answers["small"] = "no es json"
+    router.classify("intent", _generator(answers, calls), _parse, "small", "large")
+
+    stats = router.get_stats()["routes"]["intent"]
+    assert stats["escalations"] == 2
+    assert stats["small_unparsed"] == 1
+    assert stats["escalation_agreement_rate"] == 0.0
+    assert stats["escalation_rate"] == 1.0
+
+
+def test_same_model_makes_a_single_call_and_audits_measure_accuracy():
+    router = ClassificationRouter(confidence_threshold=0.75, audit_every=1)
+    calls = []
+    answers = {
+        "small": '{"intent": "casual", "confidence": 0.9}',
+        "large": '{"intent": "casual", "confidence": 0.9}',
+    }
+
+    routed = router.classify("single", _generator(answers, calls), _parse, "large", "large")
+    assert routed.model == "large" and not routed.escalated
+    assert calls == ["large"]
+
+    router.classify("audited", _generator(answers, calls), _parse, "small", "large")
+    router._audit_executor.shutdown(wait=True)
+    stats = router.get_stats()["routes"]["audited"]
+    assert stats["audits"] == 1
+    assert stats["small_accuracy"] == 1.0
+
+
+def test_small_vote_is_kept_when_large_model_fails():
+    router = ClassificationRouter(confidence_threshold=0.75, audit_every=0)
+    answers = {"small": '{"intent": "otro", "confidence": 0.3}'}
+
+    routed = router.classify("intent", _generator(answers, []), _parse, "small", "large")
+    assert routed.model == "small" and routed.escalated
+    assert router.classify("intent", _generator({}, []), _parse, "small", "large") is None
+    assert router.get_stats()["routes"]["intent"]["failures"] == 1
+
+
+def test_configured_classifier_model_is_used_only_once_resident(monkeypatch):
+    pytest.importorskip("requests")
+    from src.services.ollama_model_residency import ModelResidencyManager
+    from src.services.ollama_service import OllamaService
+
+    preloads = []
+    residency = ModelResidencyManager(lambda endpoint, model, keep_alive: preloads.append(model))
+    service = OllamaService(base_url="http://ollama:11434")
+    monkeypatch.setattr(service, "_get_residency_manager", lambda: residency)
+    monkeypatch.setenv("OLLAMA_CLASSIFIER_MODEL", "qwen3:1.7b")
+
+    assert service._classifier_model() is None  # aún sin cargar: clasifica el grande
+    pending = residency.preload("http://ollama:11434", "qwen3:1.7b")  # la misma precarga, si sigue en curso
+    if pending is not None:
+        pending.result(5)
+    assert preloads == ["qwen3:1.7b"]
+    assert service._classifier_model() == "qwen3:1.7b"
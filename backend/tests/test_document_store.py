@@ -0,0 +1,35 @@
+import pytest
+
+pytest.importorskip("src.memory", reason="src.memory necesita las dependencias de requirements.txt")
+
+from src.memory.document_store import DocumentStore  # noqa: E402
+
+
+def _document(content, **metadata):
+    return {'content': content, 'metadata': metadata, 'created_at': '2024-01-01T00:00:00'}
+
+
+def test_documents_persist_and_are_read_by_id(tmp_path):
+    path = str(tmp_path / "documents.sqlite")
+    store = DocumentStore(path)
+    store.put_many({'a': _document('uno', tags=['x']), 'b': _document('dos')})
+    store['a'] = _document('uno bis', tags=['y'])
+    store.close()
+
+    reopened = DocumentStore(path)
+    assert len(reopened) == 2 and 'a' in reopened
+    assert reopened.get('a') == _document('uno bis', tags=['y'])
+    assert set(reopened.get_many(['a', 'c'])) == {'a'}
+
+
+def test_pop_clear_and_paged_iteration(tmp_path):
+    store = DocumentStore(str(tmp_path / "documents.sqlite"))
+    store.put_many({f"doc-{i:04d}": _document(str(i)) for i in range(1200)})
+
+    assert [doc_id for doc_id, _ in store.items()][:2] == ['doc-0000', 'doc-0001']
+    assert sum(1 for _ in store.items()) == 1200
+    assert store.pop('doc-0000')['content'] == '0'
+    assert store.pop('doc-0000') is None and len(store) == 1199
+
+    store.clear()
+    assert len(store) == 0 and not store
@@ -0,0 +1,35 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("src.memory", reason="src.memory necesita las dependencias de requirements.txt")
+
+from src.memory.embedding_cache import EmbeddingCache, content_hash  # noqa: E402
+
+
+def test_hash_depends_on_model_and_text():
+    assert content_hash("hola", "a") == content_hash("hola", "a")
+    assert content_hash("hola", "a") != content_hash("hola", "b")
+    assert content_hash("hola", "a") != content_hash("adiós", "a")
+
+
+def test_memory_lru_evicts_least_recently_used():
+    cache = EmbeddingCache(max_entries=2)
+    cache.put_many({"a": np.ones(4), "b": np.zeros(4)})
+    cache.get_many(["a"])
+    cache.put_many({"c": np.full(4, 2.0)})
+
+    found = cache.get_many(["a", "b", "c"])
+    assert set(found) == {"a", "c"}
+    assert cache.get_stats()["misses"] == 1
+
+
+def test_disk_tier_survives_restart_and_is_trimmed(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = EmbeddingCache(max_entries=0, disk_path=path, max_disk_entries=10)
+    cache.put_many({f"k{i}": np.full(3, float(i)) for i in range(20)})
+
+    reopened = EmbeddingCache(max_entries=10, disk_path=path, max_disk_entries=10)
+    found = reopened.get_many([f"k{i}" for i in range(20)])
+    assert set(found) == {f"k{i}" for i in range(10, 20)}
+    np.testing.assert_array_equal(found["k15"], np.full(3, 15.0, dtype=np.float32))
+    assert reopened.get_stats()["disk_hits"] == 10
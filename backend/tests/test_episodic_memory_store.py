@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("src.memory", reason="src.memory necesita las dependencias de requirements.txt")
+
+from src.memory.episodic_memory_store import Episode, EpisodicMemoryStore  # noqa: E402
+
+BASE = datetime(2024, 1, 1)
+
+
+def _episode(number, title, description="", success=True, importance=3, tags=None, context=None):
+    return Episode(
+        id=f"ep-{number}", title=title, description=description, context=context or {},
+        actions=[], outcomes=[], timestamp=BASE + timedelta(minutes=number),
+        success=success, importance=importance, tags=tags or []
+    )
+
+
+def test_search_ranks_by_bm25_and_filters_by_task():
+    store = EpisodicMemoryStore()
+    store.store_episode(_episode(1, "Desplegar servidor", "docker compose", context={'task_id': 't1'}))
+    store.store_episode(_episode(2, "Revisar logs del servidor", "servidor caído, servidor reiniciado",
+                                 context={'task_id': 't2'}))
+    store.store_episode(_episode(3, "Escribir informe", tags=["Docker"], context={'task_id': 't1'}))
+
+    assert [ep.id for ep in store.search_episodes("servidor")] == ["ep-2", "ep-1"]
+    assert {ep.id for ep in store.search_episodes("docker", task_id="t1")} == {"ep-1", "ep-3"}
+    assert [ep.id for ep in store.search_episodes("servidor", task_id="t2")] == ["ep-2"]
+    assert store.search_episodes("servidor", task_id="otra") == []
+
+
+def test_success_partition_context_keywords_and_removal():
+    store = EpisodicMemoryStore()
+    store.store_episode(_episode(1, "a", importance=2, context={'tool': 'web_search'}))
+    store.store_episode(_episode(2, "b", importance=5, context={'tool': 'shell'}))
+    store.store_episode(_episode(3, "c", success=False, importance=5, context={'tool': 'web_search'}))
+    store.store_episode(_episode(4, "d", importance=2, context={'tool': 'web_search'}))
+
+    assert [ep.id for ep in store.get_successful_episodes()] == ["ep-2", "ep-4", "ep-1"]
+    assert [ep.id for ep in store.get_successful_episodes(["web_search"])] == ["ep-4", "ep-1"]
+    assert store.get_stats()['failed_episodes'] == 1
+
+    store._remove_episode("ep-4")
+    assert [ep.id for ep in store.get_successful_episodes(["web_search"])] == ["ep-1"]
+
+    # Episodio modificado en memoria: reindex_episode actualiza los índices
+    episode = store.retrieve_episode("ep-1")
+    episode.context = {'tool': 'shell', 'task_id': 'nueva'}
+    store.reindex_episode("ep-1")
+    assert store.get_successful_episodes(["web_search"]) == []
+    assert [ep.id for ep in store.search_episodes("a", task_id="nueva")] == ["ep-1"]
+
+
+def test_similar_episodes_match_pairwise_similarity_and_reuse_rows():
+    store = EpisodicMemoryStore(max_episodes=50)
+    tools = ['web_search', 'shell', 'file_manager']
+    for number in range(80):
+        context = {'tool': tools[number % 3], 'task_type': f"tipo{number % 5}"}
+        if number % 2:
+            context['language'] = 'ES'
+        store.store_episode(_episode(number, f"episodio {number}", context=context))
+
+    query = {'tool': 'shell', 'task_type': 'tipo2', 'language': 'es'}
+    expected = sorted(
+        (ep for ep in store.episodes.values()
+         if store._calculate_context_similarity(query, ep.context) > 0.3),
+        key=lambda ep: store._calculate_context_similarity(query, ep.context), reverse=True
+    )[:5]
+    found = store.find_similar_episodes(query, limit=5)
+    similarity = [store._calculate_context_similarity(query, ep.context) for ep in found]
+    assert similarity == [store._calculate_context_similarity(query, ep.context) for ep in expected]
+    assert similarity[0] == 1.0
+
+    # Las filas de los episodios desalojados se reutilizan
+    assert store._context_features.get_stats()['rows'] == 50
+    assert store._context_features.get_stats()['capacity'] == 50
+    assert store.find_similar_episodes({}) == []
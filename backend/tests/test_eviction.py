@@ -0,0 +1,69 @@
+import pytest
+
+pytest.importorskip("src.memory", reason="src.memory necesita las dependencias de requirements.txt")
+
+from src.memory.eviction import EvictionHeap  # noqa: E402
+from src.memory.procedural_memory_store import Procedure, ProceduralMemoryStore  # noqa: E402
+from src.memory.semantic_memory_store import SemanticFact, SemanticMemoryStore  # noqa: E402
+
+
+class Item:
+    def __init__(self, score):
+        self.score = score
+
+
+def test_heap_tracks_updates_removals_and_insertion_order_ties():
+    items = {name: Item(score) for name, score in [("a", 0.5), ("b", 0.2), ("c", 0.2), ("d", 0.9)]}
+    heap = EvictionHeap(lambda item: item.score)
+    for name, item in items.items():
+        heap.push(name, item)
+    assert heap.peek(items) == "b"  # empate con "c": gana el insertado antes
+
+    items["b"].score = 0.8
+    heap.push("b", items["b"])
+    assert heap.peek(items) == "c"
+
+    del items["c"]
+    heap.discard("c")
+    items["a"].score = 0.95  # subida sin push: la entrada se reubica al llegar a la cima
+    assert heap.peek(items) == "b"
+    assert len(heap) == 3
+
+    for round_ in range(500):
+        items["d"].score = 1 + round_ / 1000
+        heap.push("d", items["d"])
+    assert heap.peek(items) == "b"
+    assert len(heap._heap) <= 2 * len(heap) + 64
+
+
+def test_semantic_store_evicts_least_confident_fact_after_updates():
+    store = SemanticMemoryStore(max_facts=3)
+    for number, confidence in enumerate([0.9, 0.4, 0.7]):
+        store.store_fact(SemanticFact(id=f"f{number}", subject="python", predicate="es",
+                                      object=f"o{number}", context={}, confidence=confidence))
+    store.update_fact_confidence("f1", 0.5)   # f1 -> 0.9
+    store.update_fact_confidence("f0", -0.8)  # f0 -> ~0.1
+
+    store.store_fact(SemanticFact(id="f3", subject="rust", predicate="es", object="o3", context={}))
+    assert set(store.facts) == {"f1", "f2", "f3"}
+    assert store.fact_index["python"] == {"f1", "f2"}
+
+    # Reemplazar un hecho existente no desaloja otro
+    store.store_fact(SemanticFact(id="f3", subject="go", predicate="es", object="o3", context={}))
+    assert set(store.facts) == {"f1", "f2", "f3"}
+    assert "f3" not in store.fact_index["rust"]
+
+
+def test_procedural_eviction_cleans_only_its_index_keys():
+    store = ProceduralMemoryStore(max_procedures=2)
+    for number, score in enumerate([0.6, 0.3]):
+        store.store_procedure(Procedure(id=f"p{number}", name="p", description="", steps=[],
+                                        context_conditions={'task_type': f"t{number}"}, effectiveness_score=score))
+    store.update_procedure_effectiveness("p1", success=True, execution_time=0.0)  # p1 -> 1.0
+    store.store_procedure(Procedure(id="p2", name="p", description="", steps=[],
+                                    context_conditions={'task_type': 't1'}, effectiveness_score=0.5))
+
+    assert set(store.procedures) == {"p1", "p2"}
+    assert "task_type:t0" not in store.procedure_index
+    assert list(store.procedure_index["task_type:t1"]) == ["p1", "p2"]
+    assert [p.id for p in store.find_applicable_procedures({'task_type': 't1', 'category': 'general'})] == ["p1", "p2"]
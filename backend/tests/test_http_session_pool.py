@@ -0,0 +1,47 @@
+import pytest
+
+pytest.importorskip("requests")
+
+from src.services.http_session_pool import HTTPPoolConfig, HTTPSessionPool
+
+
+def test_one_session_per_origin_is_reused():
+    pool = HTTPSessionPool()
+    try:
+        first = pool.session_for("http://ollama:11434/api/generate")
+        assert pool.session_for("http://ollama:11434/api/tags") is first
+        assert pool.session_for("https://openrouter.ai/api/v1/models") is not first
+        assert pool.get_stats()["sessions"] == 2
+    finally:
+        pool.close()
+
+
+def test_host_overrides_and_split_timeouts():
+    pool = HTTPSessionPool(
+        HTTPPoolConfig(connect_timeout=3, read_timeout=60),
+        host_overrides={"openrouter.ai": {"pool_maxsize": 4, "retry_methods": ["get", "post"]}}
+    )
+    config = pool.config_for("https://openrouter.ai/api/v1/chat/completions")
+    assert config.pool_maxsize == 4
+    assert "POST" in config.retry_methods
+    assert pool.config_for("http://ollama:11434").pool_maxsize == HTTPPoolConfig().pool_maxsize
+    assert pool.timeout("http://ollama:11434", read=5) == (3, 5)
+
+
+def test_retry_policy_never_retries_reads():
+    retry = HTTPPoolConfig(max_retries=3).build_retry()
+    assert retry.connect == 3
+    assert retry.read == 0
+
+
+def test_probe_session_skips_retries():
+    pool = HTTPSessionPool(HTTPPoolConfig(max_retries=3))
+    try:
+        url = "http://ollama:11434/api/tags"
+        probe = pool.session_for(url, retry=False)
+        assert probe is pool.session_for(url, retry=False)
+        assert probe is not pool.session_for(url)
+        assert probe.get_adapter(url).max_retries.total == 0
+        assert pool.session_for(url).get_adapter(url).max_retries.total == 3
+    finally:
+        pool.close()
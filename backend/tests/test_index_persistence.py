@@ -0,0 +1,71 @@
+import os
+
+import pytest
+
+# El paquete src.memory importa todas sus dependencias (pandas, faiss, sentence_transformers)
+pytest.importorskip("src.memory", reason="src.memory necesita las dependencias de requirements.txt")
+
+from src.memory.index_persistence import OP_ADD, OP_REMOVE, IndexJournal, SnapshotStore  # noqa: E402
+
+
+def test_journal_replays_in_order_and_stops_at_torn_record(tmp_path):
+    journal = IndexJournal(str(tmp_path))
+    first = journal.open()
+    journal.append({'op': OP_ADD, 'doc_id': 'a'})
+    journal.append({'op': OP_REMOVE, 'doc_id': 'a'})
+    journal.close()
+
+    # Caída a mitad de escritura: cabecera completa, payload incompleto
+    with open(tmp_path / f"journal-{first:08d}.log", 'ab') as f:
+        f.write(b'\x40\x00\x00\x00\x00\x00\x00\x00partial')
+
+    reopened = IndexJournal(str(tmp_path))
+    assert reopened.open() == first + 1
+    reopened.append({'op': OP_ADD, 'doc_id': 'b'})
+
+    assert [(r['op'], r['doc_id']) for r in reopened.replay()] == [
+        (OP_ADD, 'a'), (OP_REMOVE, 'a'), (OP_ADD, 'b')
+    ]
+    assert [r['doc_id'] for r in reopened.replay(from_sequence=first + 1)] == ['b']
+
+
+def test_rotate_and_prune_keep_only_unsnapshotted_segments(tmp_path):
+    journal = IndexJournal(str(tmp_path))
+    journal.open()
+    journal.append({'op': OP_ADD, 'doc_id': 'a'})
+    sequence = journal.rotate()
+    journal.append({'op': OP_ADD, 'doc_id': 'b'})
+    journal.prune(sequence)
+
+    assert journal.segments() == [sequence]
+    assert [r['doc_id'] for r in journal.replay()] == ['b']
+
+
+def test_snapshot_is_published_atomically(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    assert store.current() is None
+
+    def write_ok(directory):
+        with open(os.path.join(directory, 'data'), 'w') as f:
+            f.write('v1')
+
+    store.write(3, write_ok, {'documents': 1})
+    assert store.current()['sequence'] == 3
+
+    def write_crash(directory):
+        with open(os.path.join(directory, 'data'), 'w') as f:
+            f.write('partial')
+        raise OSError("disco lleno")
+
+    with pytest.raises(OSError):
+        store.write(5, write_crash)
+
+    # El snapshot anterior sigue vigente e intacto
+    current = store.current()
+    assert current['sequence'] == 3 and current['documents'] == 1
+    with open(os.path.join(current['path'], 'data')) as f:
+        assert f.read() == 'v1'
+
+    store.write(7, write_ok)
+    assert store.current()['sequence'] == 7
+    assert sorted(os.listdir(tmp_path)) == ['CURRENT', 'snapshot-00000007']
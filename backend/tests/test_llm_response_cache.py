@@ -0,0 +1,36 @@
+from src.services.llm_response_cache import LLMResponseCache
+
+
+def test_key_ignores_whitespace_but_not_options():
+    key = LLMResponseCache.make_key("llama3.1:8b", "Clasifica:  hola\n", {"temperature": 0.2})
+    assert key == LLMResponseCache.make_key("llama3.1:8b", "Clasifica: hola", {"temperature": 0.2})
+    assert key != LLMResponseCache.make_key("llama3.1:8b", "Clasifica: hola", {"temperature": 0.7})
+    assert key != LLMResponseCache.make_key("qwen3:32b", "Clasifica: hola", {"temperature": 0.2})
+
+
+def test_memory_tier_lru_and_ttl():
+    cache = LLMResponseCache(max_entries=2)
+    cache.set("a", {"response": "A"}, ttl=60, tag="intent")
+    cache.set("b", {"response": "B"}, ttl=60)
+    assert cache.get("a", tag="intent") == {"response": "A"}
+
+    cache.set("c", {"response": "C"}, ttl=60)
+    assert cache.get("b") is None  # expulsado por LRU
+    assert cache.evictions == 1
+
+    cache.set("d", {"response": "D"}, ttl=-1)
+    assert cache.get("d") is None
+
+    stats = cache.get_stats()
+    assert stats["by_call_site"]["intent"] == {"hits": 1, "misses": 0, "stores": 1}
+
+
+def test_disk_tier_survives_new_instance(tmp_path):
+    db_path = str(tmp_path / "llm_cache.db")
+    LLMResponseCache(db_path=db_path).set("k", {"response": "persistida"}, ttl=60)
+
+    fresh = LLMResponseCache(db_path=db_path)
+    assert fresh.get("k") == {"response": "persistida"}
+    assert fresh.disk_hits == 1
+    assert fresh.get("k") == {"response": "persistida"}
+    assert fresh.memory_hits == 1
@@ -0,0 +1,232 @@
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("src.memory", reason="src.memory necesita las dependencias de requirements.txt")
+
+from src.memory.episodic_memory_store import Episode, EpisodicMemoryStore  # noqa: E402
+from src.memory.memory_persistence import MemoryPersistence  # noqa: E402
+from src.memory.procedural_memory_store import ProceduralMemoryStore, ToolStrategy  # noqa: E402
+from src.memory.semantic_memory_store import SemanticFact, SemanticMemoryStore  # noqa: E402
+from src.memory.working_memory_store import WorkingMemoryStore  # noqa: E402
+
+BASE = datetime(2024, 1, 1)
+
+
+def _stores(max_episodes=100):
+    return {
+        'working': WorkingMemoryStore(max_capacity=2),
+        'episodic': EpisodicMemoryStore(max_episodes=max_episodes),
+        'semantic': SemanticMemoryStore(),
+        'procedural': ProceduralMemoryStore(),
+    }
+
+
+def _episode(number, importance=3, context=None):
+    return Episode(id=f"ep-{number}", title=f"episodio {number}", description="despliegue", context=context or {},
+                   actions=[], outcomes=[], timestamp=BASE + timedelta(seconds=number), importance=importance)
+
+
+def _populate(stores):
+    episodic, semantic = stores['episodic'], stores['semantic']
+    for number in range(4):
+        episodic.store_episode(_episode(number, importance=number + 1, context={'tool': f"t{number % 2}"}))
+    episodic._remove_episode("ep-0")
+    episode = episodic.retrieve_episode("ep-1")
+    episode.importance = 5
+    episodic.reindex_episode("ep-1")
+
+    semantic.store_fact(SemanticFact(id="f1", subject="perro", predicate="es_un", object="mamífero", context={}))
+    semantic.store_fact(SemanticFact(id="f2", subject="mamífero", predicate="es_un", object="animal", context={}))
+    semantic.update_fact_confidence("f1", -0.5)
+
+    stores['procedural'].store_tool_strategy(ToolStrategy(id="s1", tool_name="shell", strategy_name="s",
+                                                          parameters={}, context_pattern="general"))
+    for number in range(3):  # capacidad 2: el primero se desaloja
+        stores['working'].store_context(f"ctx-{number}", {'n': number})
+
+
+def _assert_restored(stores):
+    reference = _stores()
+    _populate(reference)
+    episodic = stores['episodic']
+    assert sorted(episodic.episodes) == ["ep-1", "ep-2", "ep-3"]
+    assert [e.id for e in episodic.search_episodes("", limit=1)] == ["ep-1"]  # importancia reindexada
+    assert len(episodic.search_episodes("despliegue")) == 3
+    assert ([e.id for e in episodic.find_similar_episodes({'tool': "t1"})]
+            == [e.id for e in reference['episodic'].find_similar_episodes({'tool': "t1"})])
+    assert stores['semantic'].facts["f1"].confidence == pytest.approx(0.5)
+    assert [i['object'] for i in stores['semantic'].infer_knowledge("perro")] == ["animal"]
+    assert list(stores['procedural'].strategy_index["shell"]) == ["s1"]
+    assert sorted(stores['working'].store) == ["ctx-1", "ctx-2"]
+
+
+@pytest.mark.parametrize("drop_snapshots", [False, True])
+def test_restores_from_snapshot_or_records_and_replays_log(tmp_path, drop_snapshots):
+    path = str(tmp_path / "memory.sqlite")
+    writer = MemoryPersistence(path)
+    stores = _stores()
+    writer.load(stores)
+    _populate(stores)
+    assert writer.compact()
+    stores['episodic'].store_episode(_episode(9))  # queda en el log, sin compactar
+    stores['episodic']._remove_episode("ep-9")
+    writer.close()
+
+    if drop_snapshots:
+        reader = MemoryPersistence(path)
+        reader._db.execute('DELETE FROM snapshots')
+    else:
+        reader = MemoryPersistence(path)
+    restored = _stores()
+    loaded = reader.load(restored)
+    assert set(loaded['sources'].values()) == {'records' if drop_snapshots else 'snapshot'}
+    assert loaded['replayed_changes'] == 1  # alta y baja de ep-9: solo cuenta la última
+    _assert_restored(restored)
+
+    # La capacidad configurada prevalece sobre la guardada
+    smaller = _stores(max_episodes=3)
+    reader.load(smaller)
+    assert smaller['episodic'].max_episodes == 3
+    smaller['episodic'].store_episode(_episode(10))
+    assert "ep-2" not in smaller['episodic'].episodes
+    reader.close()
+
+
+def test_workers_share_changes_and_reload_after_foreign_compaction(tmp_path):
+    path = str(tmp_path / "memory.sqlite")
+    first, second = MemoryPersistence(path), MemoryPersistence(path)
+    first_stores, second_stores = _stores(), _stores()
+    first.load(first_stores)
+    second.load(second_stores)
+
+    first_stores['episodic'].store_episode(_episode(1))
+    second_stores['episodic'].store_episode(_episode(2))
+    assert second.sync() == 1
+    assert sorted(second_stores['episodic'].episodes) == ["ep-1", "ep-2"]
+
+    # Mismo elemento desde los dos procesos: gana el último cambio registrado
+    second_stores['episodic'].store_episode(_episode(1, importance=4))
+    first_stores['episodic'].store_episode(_episode(1, importance=2))
+    first.sync()
+    second.sync()
+    assert first_stores['episodic'].episodes["ep-1"].importance == 2
+    assert second_stores['episodic'].episodes["ep-1"].importance == 2
+
+    # El segundo compacta cambios que el primero no ha visto: recarga completa
+    second_stores['episodic']._remove_episode("ep-2")
+    assert second.compact()
+    first.sync()
+    assert first.last_load['sources']['episodic'] == 'snapshot'
+    assert sorted(first_stores['episodic'].episodes) == ["ep-1"]
+    first_stores['episodic'].store_episode(_episode(3))
+    second.sync()
+    assert sorted(second_stores['episodic'].episodes) == ["ep-1", "ep-3"]
+    first.close()
+    second.close()
+
+
+def test_compaction_in_another_thread_while_stores_are_written(tmp_path):
+    path = str(tmp_path / "memory.sqlite")
+    writer = MemoryPersistence(path)
+    stores = _stores(max_episodes=5000)
+    writer.load(stores)
+    for number in range(1000):
+        stores['episodic'].store_episode(_episode(number, context={'tool': f"t{number % 3}"}))
+
+    # Con el cerrojo tomado (como durante compact()) una escritura no toca el almacén
+    with writer._lock:
+        writing = threading.Thread(target=stores['episodic'].store_episode, args=(_episode(5000),))
+        writing.start()
+        writing.join(0.2)
+        assert writing.is_alive() and "ep-5000" not in stores['episodic'].episodes
+    writing.join()
+    assert "ep-5000" in stores['episodic'].episodes
+
+    compacting = threading.Thread(target=lambda: [writer.compact() for _ in range(5)])
+    compacting.start()
+    for number in range(1000, 3000):
+        stores['episodic'].store_episode(_episode(number))
+        if number % 3 == 0:
+            stores['episodic']._remove_episode(f"ep-{number - 1000}")
+            stores['working'].store_context(f"ctx-{number}", {'n': number})
+    compacting.join()
+    writer.compact()
+    writer.close()
+
+    restored = _stores(max_episodes=5000)
+    reader = MemoryPersistence(path)
+    assert reader.load(restored)['sources']['episodic'] == 'snapshot'
+    assert sorted(restored['episodic'].episodes) == sorted(stores['episodic'].episodes)
+    assert len(restored['episodic'].search_episodes("despliegue", limit=5000)) == len(stores['episodic'].episodes)
+    restored['episodic']._remove_episode("ep-2999")  # bajas sobre el índice deserializado
+    assert "ep-2999" not in {e.id for e in restored['episodic'].search_episodes("episodio 2999")}
+    reader.close()
+
+
+def test_compaction_serializes_a_copy_without_holding_the_lock(tmp_path, monkeypatch):
+    path = str(tmp_path / "memory.sqlite")
+    writer = MemoryPersistence(path)
+    stores = _stores()
+    writer.load(stores)
+    stores['episodic'].store_episode(_episode(1))
+    stores['semantic'].store_fact(SemanticFact(id="f1", subject="mitosis", predicate="usa", object="ollama", context={}))
+
+    dumping, resume = threading.Event(), threading.Event()
+    dump_state = MemoryPersistence._dump_state
+    dumped = []
+
+    def slow_dump(state):
+        if 'episodes' in state:
+            dumped.append(state)
+            dumping.set()
+            resume.wait(5)
+        return dump_state(state)
+
+    monkeypatch.setattr(MemoryPersistence, '_dump_state', staticmethod(slow_dump))
+    compacting = threading.Thread(target=writer.compact)
+    compacting.start()
+    assert dumping.wait(5)
+    # Mientras se serializa, las escrituras no esperan y no cambian la copia
+    writing = threading.Thread(target=lambda: (
+        stores['episodic'].store_episode(_episode(2)), stores['episodic']._remove_episode("ep-1")))
+    writing.start()
+    writing.join(2)
+    assert not writing.is_alive()
+    assert list(dumped[0]['episodes']) == ["ep-1"]
+    resume.set()
+    compacting.join()
+    monkeypatch.undo()
+    writer.close()
+
+    restored = _stores()
+    reader = MemoryPersistence(path)
+    assert reader.load(restored)['sources']['episodic'] == 'snapshot'
+    assert sorted(restored['episodic'].episodes) == ["ep-2"]
+    assert [e.id for e in restored['episodic'].search_episodes("episodio 2")] == ["ep-2"]
+    assert restored['semantic'].facts["f1"].object == "ollama"
+    reader.close()
+
+def test_own_write_between_poll_and_apply_wins(tmp_path):
+    path = str(tmp_path / "memory.sqlite")
+    first, second = MemoryPersistence(path), MemoryPersistence(path)
+    first_stores, second_stores = _stores(), _stores()
+    first.load(first_stores)
+    second.load(second_stores)
+
+    first_stores['episodic'].store_episode(_episode(1, importance=2))
+    pending = second.poll()
+    second_stores['episodic'].store_episode(_episode(1, importance=4))  # posterior a lo leído
+    assert second.apply(pending) == 0
+    assert second_stores['episodic'].episodes["ep-1"].importance == 4
+    first.sync()
+    assert first_stores['episodic'].episodes["ep-1"].importance == 4
+
+    # Con cambios ajenos sin aplicar no se compacta; tras sync() sí
+    first_stores['episodic'].store_episode(_episode(2))
+    assert not second.compact()
+    second.sync()
+    assert second.compact()
+    first.close()
+    second.close()
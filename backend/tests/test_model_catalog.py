@@ -0,0 +1,121 @@
+import threading
+
+from src.services.model_catalog import (
+    PROVIDER_OLLAMA,
+    PROVIDER_OPENROUTER,
+    CatalogEntry,
+    ModelCapability,
+    ModelCatalog,
+    capability_names,
+    infer_capabilities,
+)
+
+
+def _catalog(ollama=(), openrouter=()):
+    catalog = ModelCatalog(refresh_interval=0)
+    catalog.register_provider(PROVIDER_OLLAMA, lambda: list(ollama))
+    catalog.register_provider(PROVIDER_OPENROUTER, lambda: list(openrouter))
+    return catalog
+
+
+def test_capabilities_are_precomputed_as_bitmask():
+    mask = infer_capabilities("codellama:7b-instruct")
+    assert mask & ModelCapability.CODE
+    assert mask & ModelCapability.CONVERSATIONAL
+    assert mask & ModelCapability.EFFICIENT
+    assert infer_capabilities("mistral") == ModelCapability.GENERAL
+    assert capability_names(ModelCapability.CODE) == ["code_generation", "code_analysis", "debugging"]
+
+
+def test_select_picks_fastest_adequate_model_per_token():
+    catalog = _catalog(ollama=[
+        CatalogEntry.build(PROVIDER_OLLAMA, "codellama:13b"),
+        CatalogEntry.build(PROVIDER_OLLAMA, "deepseek-coder:6.7b"),
+        CatalogEntry.build(PROVIDER_OLLAMA, "llama3.1:8b"),
+    ])
+    # codellama tardó más en total pero generó mucho más: es el más rápido por token
+    catalog.record_call(PROVIDER_OLLAMA, "codellama:13b", 9.0, output_tokens=900, generation_seconds=8.0)
+    catalog.record_call(PROVIDER_OLLAMA, "deepseek-coder:6.7b", 2.0, output_tokens=50, generation_seconds=1.8)
+    catalog.record_call(PROVIDER_OLLAMA, "llama3.1:8b", 0.5, output_tokens=100, generation_seconds=0.4)
+
+    # llama3.1 es el más rápido pero no sabe programar
+    assert catalog.select("code").model_id == "codellama:13b"
+    assert catalog.select("general").model_id == "llama3.1:8b"
+
+    # Los fallos penalizan la latencia esperada
+    for _ in range(5):
+        catalog.record_call(PROVIDER_OLLAMA, "codellama:13b", 0.0, success=False)
+    assert catalog.select("code").model_id == "deepseek-coder:6.7b"
+
+
+def test_untried_models_start_at_catalogue_median():
+    catalog = _catalog(ollama=[
+        CatalogEntry.build(PROVIDER_OLLAMA, "slow:7b"),
+        CatalogEntry.build(PROVIDER_OLLAMA, "mid:7b"),
+        CatalogEntry.build(PROVIDER_OLLAMA, "fast:7b"),
+        CatalogEntry.build(PROVIDER_OLLAMA, "new:7b"),
+    ])
+    catalog.refresh()
+    catalog.record_call(PROVIDER_OLLAMA, "slow:7b", 10.0, output_tokens=100)
+    catalog.record_call(PROVIDER_OLLAMA, "mid:7b", 5.0, output_tokens=100)
+    catalog.record_call(PROVIDER_OLLAMA, "fast:7b", 1.0, output_tokens=100)
+    new = catalog.get("ollama:new:7b")
+    assert catalog.expected_token_latency(new) == catalog.expected_token_latency(catalog.get("ollama:mid:7b"))
+    assert catalog.select("general").model_id == "fast:7b"
+    # Sin tokens la llamada solo cuenta para la tasa de éxito
+    catalog.record_call(PROVIDER_OLLAMA, "new:7b", 0.1)
+    assert catalog.telemetry("ollama:new:7b").token_latency_ewma is None
+
+
+def test_select_respects_budget_context_and_local_preference():
+    catalog = _catalog(
+        ollama=[CatalogEntry.build(PROVIDER_OLLAMA, "llama3.1:8b")],
+        openrouter=[
+            CatalogEntry.build(PROVIDER_OPENROUTER, "anthropic/claude-3-opus", "Claude 3 Opus",
+                               context_length=200000, cost_per_1k_tokens=0.015),
+            CatalogEntry.build(PROVIDER_OPENROUTER, "google/gemini-flash", "Gemini Flash",
+                               context_length=1000000, cost_per_1k_tokens=0.0001),
+            CatalogEntry.build(PROVIDER_OPENROUTER, "openai/gpt-4-small", "GPT-4 small",
+                               context_length=8000, cost_per_1k_tokens=0.0001),
+        ],
+    )
+    best = catalog.select("analysis", max_cost=0.001, provider=PROVIDER_OPENROUTER)
+    assert best.model_id == "google/gemini-flash"
+    assert catalog.select("general", prefer_local=True).provider == PROVIDER_OLLAMA
+
+    # prefer_local: el local más grande, aunque otro sea más rápido
+    catalog.update_provider(PROVIDER_OLLAMA, [
+        CatalogEntry.build(PROVIDER_OLLAMA, "llama3.1:8b", size_mb=4700),
+        CatalogEntry.build(PROVIDER_OLLAMA, "llama3.1:70b", size_mb=40000),
+    ])
+    catalog.record_call(PROVIDER_OLLAMA, "llama3.1:8b", 1.0, output_tokens=100)
+    catalog.record_call(PROVIDER_OLLAMA, "llama3.1:70b", 9.0, output_tokens=100)
+    assert catalog.select("general", prefer_local=True).model_id == "llama3.1:70b"
+    assert catalog.select("general", provider=PROVIDER_OLLAMA).model_id == "llama3.1:8b"
+    # Nada cumple el presupuesto: se ignora el coste
+    assert catalog.select("analysis", max_cost=0.0, provider=PROVIDER_OPENROUTER) is not None
+
+
+def test_failed_provider_keeps_previous_models_and_stale_refresh_is_async():
+    calls = []
+    release = threading.Event()
+    fail = {"value": False}
+
+    def fetch():
+        calls.append(1)
+        if fail["value"]:
+            release.wait(5)
+            raise ConnectionError("down")
+        return [CatalogEntry.build(PROVIDER_OLLAMA, "llama3.1:8b")]
+
+    catalog = ModelCatalog(ttl=0, refresh_interval=0)
+    catalog.register_provider(PROVIDER_OLLAMA, fetch)
+    assert [entry.model_id for entry in catalog.entries()] == ["llama3.1:8b"]
+
+    # Caducado: se devuelve el catálogo vigente sin esperar al proveedor
+    fail["value"] = True
+    assert [entry.model_id for entry in catalog.entries()] == ["llama3.1:8b"]
+    release.set()
+    assert catalog.refresh() is False
+    assert catalog.get_status()["providers"][PROVIDER_OLLAMA]["last_error"] == "down"
+    assert [entry.model_id for entry in catalog.entries(PROVIDER_OLLAMA)] == ["llama3.1:8b"]
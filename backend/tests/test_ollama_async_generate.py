@@ -0,0 +1,61 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("requests")
+
+from src.services.ollama_queue_manager import OllamaQueueManager
+from src.services.ollama_service import OllamaService
+
+
+def _service(monkeypatch):
+    service = OllamaService(base_url="http://ollama:11434")
+    service.use_queue = True
+    service._queue_manager = OllamaQueueManager(max_concurrent_requests=1)
+    return service
+
+
+def test_agenerate_raw_sends_prompt_verbatim_with_overridden_options(monkeypatch):
+    service = _service(monkeypatch)
+    seen = {}
+
+    async def fake_call(prompt, model, options, on_token=None, base_url=None):
+        seen.update(prompt=prompt, model=model, options=options)
+        return {"response": "ok"}
+
+    monkeypatch.setattr(service, "_execute_direct_call", fake_call)
+    result = asyncio.run(service.agenerate_raw("SYSTEM: x\n\nASSISTANT:", model="qwen3:32b", options={"stop": ["USER:"]}))
+
+    assert result == {"response": "ok"}
+    assert seen["prompt"] == "SYSTEM: x\n\nASSISTANT:"
+    assert seen["model"] == "qwen3:32b"
+    assert seen["options"]["stop"] == ["USER:"]
+    assert service.current_model is None  # el modelo del servicio no cambia
+
+
+def test_cancelled_caller_releases_queue_slot(monkeypatch):
+    service = _service(monkeypatch)
+    started = threading.Event()
+
+    async def slow_call(prompt, model, options, on_token=None, base_url=None):
+        started.set()
+        await asyncio.sleep(10)
+        return {"response": "tarde"}
+
+    monkeypatch.setattr(service, "_execute_direct_call", slow_call)
+
+    async def caller():
+        task = asyncio.ensure_future(service.agenerate_raw("hola", task_id="browser"))
+        await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(caller())
+
+    deadline = time.monotonic() + 2
+    while service._queue_manager.get_active_requests_count() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert service._queue_manager.get_active_requests_count() == 0
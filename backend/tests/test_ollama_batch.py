@@ -0,0 +1,101 @@
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip("requests")
+
+from src.services.ollama_queue_manager import OllamaQueueManager
+from src.services.ollama_service import OllamaService
+
+
+def _service(monkeypatch, max_concurrent=4):
+    service = OllamaService(base_url="http://ollama:11434")
+    service.use_queue = True
+    service._queue_manager = OllamaQueueManager(max_concurrent_requests=max_concurrent)
+    monkeypatch.setattr(service, "is_healthy", lambda: True)
+    return service
+
+
+def test_batch_runs_concurrently_and_keeps_order(monkeypatch):
+    service = _service(monkeypatch)
+    active = {"now": 0, "peak": 0}
+
+    async def fake_call(prompt, model, options, on_token=None, base_url=None):
+        active["now"] += 1
+        active["peak"] = max(active["peak"], active["now"])
+        await asyncio.sleep(0.2)
+        active["now"] -= 1
+        if "fallo" in prompt:
+            return {"error": "boom"}
+        return {"response": prompt.rsplit("Usuario: ", 1)[1].split("\n")[0]}
+
+    monkeypatch.setattr(service, "_execute_direct_call", fake_call)
+
+    started = time.monotonic()
+    results = service.generate_batch(["uno", "fallo", "tres", "cuatro"], task_id="t")
+    elapsed = time.monotonic() - started
+
+    assert [r["batch_index"] for r in results] == [0, 1, 2, 3]
+    assert [r["response"] for r in results if not r.get("error")] == ["uno", "tres", "cuatro"]
+    assert results[1]["error"] == "boom"
+    assert active["peak"] == 4
+    assert elapsed < 0.6
+
+
+def test_batch_respects_queue_concurrency_limit(monkeypatch):
+    service = _service(monkeypatch, max_concurrent=2)
+    active = {"now": 0, "peak": 0}
+
+    async def fake_call(prompt, model, options, on_token=None, base_url=None):
+        active["now"] += 1
+        active["peak"] = max(active["peak"], active["now"])
+        await asyncio.sleep(0.05)
+        active["now"] -= 1
+        return {"response": "ok"}
+
+    monkeypatch.setattr(service, "_execute_direct_call", fake_call)
+    results = service.generate_batch([f"p{i}" for i in range(5)], task_id="t")
+
+    assert all(not r.get("error") for r in results)
+    assert active["peak"] == 2
+
+
+def test_response_cache_only_stores_temperature_zero(monkeypatch):
+    from src.services import ollama_service
+    from src.services.llm_response_cache import LLMResponseCache
+
+    service = _service(monkeypatch)
+    service.use_queue = False
+    service.use_response_cache = True
+    cache = LLMResponseCache()
+    monkeypatch.setattr(ollama_service, "get_llm_response_cache", lambda: cache)
+    calls = []
+    monkeypatch.setattr(service, "_call_ollama_api",
+                        lambda prompt, custom_options=None: calls.append(custom_options) or {"response": f"r{len(calls)}"})
+
+    for _ in range(2):
+        sampled = service.generate_response("palabras clave", {"temperature": 0.7}, use_tools=False, cache_ttl=60)
+    assert sampled["response"] == "r2" and len(calls) == 2
+    assert calls[-1]["temperature"] == 0.7
+
+    for _ in range(2):
+        greedy = service.generate_response("palabras clave", {"temperature": 0, "max_tokens": 20},
+                                           use_tools=False, cache_ttl=60)
+    assert greedy["response"] == "r3" and greedy.get("cached") and len(calls) == 3
+    # La muestra cacheada se pidió realmente con temperature 0
+    assert calls[-1]["temperature"] == 0 and calls[-1]["num_predict"] == 20
+
+
+def test_generate_response_sends_context_sampling_options_through_queue(monkeypatch):
+    service = _service(monkeypatch)
+    sent = []
+
+    async def fake_call(prompt, model, options, on_token=None, base_url=None):
+        sent.append(options)
+        return {"response": "ok"}
+
+    monkeypatch.setattr(service, "_execute_direct_call", fake_call)
+    result = service.generate_response("título", {"temperature": 0, "top_p": 0.5, "task_id": "t"}, use_tools=False)
+    assert result["response"] == "ok"
+    assert sent[0]["temperature"] == 0 and sent[0]["top_p"] == 0.5 and "task_id" not in sent[0]
@@ -0,0 +1,60 @@
+import asyncio
+
+from src.services.ollama_endpoint_pool import OllamaEndpointPool
+from src.services.ollama_queue_manager import OllamaQueueManager, OllamaRequest
+
+
+def test_prefers_warm_then_least_loaded_endpoint():
+    pool = OllamaEndpointPool(["http://a:11434", "http://b:11434/"], max_concurrent_per_endpoint=2)
+    pool.update_models("http://b:11434", loaded=["qwen3:32b"])
+
+    assert pool.acquire("qwen3:32b") == "http://b:11434"
+    assert pool.acquire("llama3.1:8b") == "http://a:11434"
+    assert {pool.acquire("llama3.1:8b"), pool.acquire("llama3.1:8b")} == {"http://a:11434", "http://b:11434"}
+    assert not pool.has_capacity("llama3.1:8b")
+
+
+def test_skips_endpoints_without_the_model_installed():
+    pool = OllamaEndpointPool(["http://a:11434", "http://b:11434"])
+    pool.update_models("http://a:11434", installed=["llama3.1:8b"])
+    pool.update_models("http://b:11434", installed=["qwen3:32b"])
+    assert pool.acquire("qwen3:32b") == "http://b:11434"
+
+
+def test_failover_moves_request_and_cools_down_failed_endpoint():
+    pool = OllamaEndpointPool(["http://a:11434", "http://b:11434"], max_concurrent_per_endpoint=1)
+    first = pool.acquire("llama3.1:8b")
+    pool.record_failure(first, "timeout", timed_out=True)
+    other = pool.failover(first, "llama3.1:8b", [first])
+
+    assert other is not None and other != first
+    status = {e["url"]: e for e in pool.get_status()["endpoints"]}
+    assert status[first]["in_flight"] == 0
+    assert not status[first]["available"]
+    assert pool.failovers == 1
+
+
+def test_queue_concurrency_is_per_endpoint():
+    pool = OllamaEndpointPool(["http://a:11434", "http://b:11434"], max_concurrent_per_endpoint=1)
+    manager = OllamaQueueManager(max_concurrent_requests=1, endpoint_pool=pool)
+    active = {"now": 0, "max": 0}
+    endpoints = []
+
+    async def callback(request):
+        endpoints.append(request.endpoint)
+        active["now"] += 1
+        active["max"] = max(active["max"], active["now"])
+        await asyncio.sleep(0.01)
+        active["now"] -= 1
+        return {"response": "ok"}
+
+    async def scenario():
+        await asyncio.gather(*[
+            manager.enqueue_request(OllamaRequest(prompt=f"p{i}", model="llama3.1:8b"), callback)
+            for i in range(4)
+        ])
+
+    asyncio.run(scenario())
+    assert active["max"] == 2
+    assert set(endpoints) == {"http://a:11434", "http://b:11434"}
+    assert all(e["in_flight"] == 0 for e in pool.get_status()["endpoints"])
@@ -0,0 +1,61 @@
+from src.services.ollama_health_monitor import CircuitState, OllamaHealthMonitor
+
+
+class FlakyProbe:
+    def __init__(self):
+        self.calls = 0
+        self.fail = False
+
+    def __call__(self):
+        self.calls += 1
+        if self.fail:
+            raise ConnectionError("ollama caído")
+        return ["llama3.1:8b"]
+
+
+def _monitor(probe, **kwargs):
+    params = dict(ttl=60, interval=3600, failure_threshold=2, reset_timeout=60)
+    params.update(kwargs)
+    return OllamaHealthMonitor("http://ollama:11434", probe, **params)
+
+
+def test_health_is_served_from_cache_within_ttl():
+    probe = FlakyProbe()
+    monitor = _monitor(probe)
+    try:
+        for _ in range(10):
+            assert monitor.is_healthy()
+        assert monitor.get_models() == ["llama3.1:8b"]
+        assert probe.calls == 1
+    finally:
+        monitor.stop()
+
+
+def test_circuit_opens_after_failures_and_skips_probes():
+    probe = FlakyProbe()
+    monitor = _monitor(probe)
+    try:
+        assert monitor.is_healthy()
+        monitor.report_failure("timeout")
+        monitor.report_failure("timeout")
+        assert monitor.state == CircuitState.OPEN
+        assert not monitor.is_healthy()
+        assert probe.calls == 1
+    finally:
+        monitor.stop()
+
+
+def test_half_open_probe_closes_circuit_on_success():
+    probe = FlakyProbe()
+    monitor = _monitor(probe, reset_timeout=0)
+    try:
+        probe.fail = True
+        monitor.refresh()
+        monitor.refresh()
+        assert monitor.state == CircuitState.OPEN
+
+        probe.fail = False
+        assert monitor.is_healthy()
+        assert monitor.state == CircuitState.CLOSED
+    finally:
+        monitor.stop()
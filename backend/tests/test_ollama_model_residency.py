@@ -0,0 +1,76 @@
+import threading
+
+from src.services.ollama_model_residency import ModelResidencyManager
+
+
+def _manager(running=None, fail=False):
+    calls = []
+    release = threading.Event()
+
+    def preload(endpoint, model, keep_alive):
+        calls.append((endpoint, model, keep_alive))
+        release.wait(5)
+        if fail:
+            raise RuntimeError("boom")
+
+    running_fn = (lambda endpoint: list(running)) if running is not None else None
+    return ModelResidencyManager(preload, running_fn, keep_alive="10m"), calls, release
+
+
+def test_preload_is_deduplicated_and_marks_model_resident():
+    manager, calls, release = _manager()
+    first = manager.preload("http://a:11434", "qwen3:32b")
+    second = manager.preload("http://a:11434", "qwen3:32b")
+    assert first is second
+
+    release.set()
+    assert first.result(5) is True
+    assert calls == [("http://a:11434", "qwen3:32b", "10m")]
+    assert manager.is_resident("http://a:11434", "qwen3:32b")
+    assert manager.preload("http://a:11434", "qwen3:32b") is None
+
+
+def test_models_reported_by_ps_are_not_preloaded():
+    manager, calls, release = _manager(running=["llama3.1:8b"])
+    release.set()
+    manager.refresh("http://a:11434").result(5)
+    assert manager.preload("http://a:11434", "llama3.1:8b") is None
+    assert calls == []
+
+
+def test_residency_queries_do_not_wait_for_ps():
+    ps_release = threading.Event()
+
+    def running(endpoint):
+        ps_release.wait(5)
+        return ["llama3.1:8b"]
+
+    manager = ModelResidencyManager(lambda *args: None, running)
+    assert not manager.is_resident("http://a:11434", "llama3.1:8b")  # responde desde la caché
+    pending = manager.refresh("http://a:11434")
+    assert pending is not None and not pending.done()
+    ps_release.set()
+    pending.result(5)
+    assert manager.is_resident("http://a:11434", "llama3.1:8b")
+
+
+def test_failed_preload_is_not_marked_resident():
+    manager, _, release = _manager(fail=True)
+    release.set()
+    assert manager.preload("http://a:11434", "qwen3:32b").result(5) is False
+    assert not manager.is_resident("http://a:11434", "qwen3:32b")
+    assert manager.get_status()["preloads_failed"] == 1
+
+
+def test_plan_preloads_current_model_only_while_steps_are_pending():
+    steps = [
+        {"id": "1", "tool": "web_search", "completed": True},
+        {"id": "2", "tool": "analysis", "status": "pending"},
+    ]
+    manager, calls, release = _manager()
+    release.set()
+    assert manager.prepare_for_plan(steps, "llama3.1:8b", "http://a:11434") == ["llama3.1:8b"]
+    assert calls[0][:2] == ("http://a:11434", "llama3.1:8b")
+
+    finished = [dict(step, completed=True) for step in steps]
+    assert manager.prepare_for_plan(finished, "qwen3:32b", "http://a:11434") == []
@@ -0,0 +1,403 @@
+import asyncio
+import threading
+
+import pytest
+
+from src.services.ollama_adaptive_limiter import AdaptiveConcurrencyLimiter
+from src.services.ollama_queue_manager import OllamaQueueManager, OllamaRequest, QueueOverloadedError, RequestPriority
+from src.services.ollama_dispatcher import OllamaQueueDispatcher
+
+
+def _request(prompt="hola", priority=RequestPriority.NORMAL, task_id="task", model="llama3.1:8b"):
+    return OllamaRequest(task_id=task_id, prompt=prompt, model=model, priority=priority)
+
+
+def test_dispatcher_reuses_single_loop_thread():
+    """Todas las llamadas síncronas se ejecutan en el mismo loop de background"""
+    # Gestor propio: stop() no debe cerrar el gestor global que usan otros tests
+    dispatcher = OllamaQueueDispatcher(io_workers=2, queue_manager=OllamaQueueManager())
+    try:
+        async def current_thread_name():
+            return threading.current_thread().name
+
+        names = {dispatcher.run(current_thread_name(), timeout=5) for _ in range(5)}
+        assert names == {"ollama_dispatcher"}
+        assert dispatcher.is_running
+    finally:
+        dispatcher.stop()
+
+
+def test_dispatcher_enforces_process_wide_concurrency():
+    """Llamadas desde varios threads comparten el mismo límite de concurrencia"""
+    dispatcher = OllamaQueueDispatcher(io_workers=4, queue_manager=OllamaQueueManager())
+    manager = OllamaQueueManager(max_concurrent_requests=1)
+    active = {"now": 0, "max": 0}
+
+    async def callback(request):
+        active["now"] += 1
+        active["max"] = max(active["max"], active["now"])
+        await asyncio.sleep(0.02)
+        active["now"] -= 1
+        return {"response": request.prompt}
+
+    try:
+        dispatcher.start()
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda i=i: results.append(
+                    dispatcher.run(manager.enqueue_request(_request(prompt=f"p{i}"), callback), timeout=5)
+                )
+            )
+            for i in range(4)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert len(results) == 4
+        assert active["max"] == 1
+    finally:
+        dispatcher.stop()
+
+
+def test_dispatcher_submit_from_own_loop_is_rejected():
+    dispatcher = OllamaQueueDispatcher(io_workers=1, queue_manager=OllamaQueueManager())
+    try:
+        async def nested():
+            with pytest.raises(RuntimeError):
+                dispatcher.submit(asyncio.sleep(0))
+            return True
+
+        assert dispatcher.run(nested(), timeout=5)
+    finally:
+        dispatcher.stop()
+
+
+def _run_in_order(manager, requests):
+    """Ocupa el único hueco, encola `requests` y devuelve el orden de ejecución"""
+    order = []
+    gate = asyncio.Event()
+
+    async def blocker(request):
+        await gate.wait()
+        return {"response": "blocker"}
+
+    async def record(request):
+        order.append(request.prompt)
+        return {"response": request.prompt}
+
+    async def scenario():
+        first = asyncio.ensure_future(manager.enqueue_request(_request(prompt="blocker", task_id="other"), blocker))
+        await asyncio.sleep(0)
+        waiters = []
+        for request in requests:
+            waiters.append(asyncio.ensure_future(manager.enqueue_request(request, record)))
+            await asyncio.sleep(0)
+        gate.set()
+        await asyncio.gather(first, *waiters)
+
+    asyncio.run(scenario())
+    return order
+
+
+def test_dispatcher_start_reraises_queue_manager_failure_and_retries():
+    class FailingOnce(OllamaQueueManager):
+        attempts = 0
+
+        async def start(self):
+            FailingOnce.attempts += 1
+            if FailingOnce.attempts == 1:
+                raise ValueError("sin cola")
+            await super().start()
+
+    dispatcher = OllamaQueueDispatcher(io_workers=1, queue_manager=FailingOnce())
+    with pytest.raises(ValueError, match="sin cola"):
+        dispatcher.start(timeout=5)
+    assert not dispatcher.is_running
+
+    try:
+        assert dispatcher.queue_manager is not None
+        assert dispatcher.run(asyncio.sleep(0, result="ok"), timeout=5) == "ok"
+    finally:
+        dispatcher.stop()
+
+
+def test_queue_dispatches_by_priority_not_wakeup_order():
+    manager = OllamaQueueManager(max_concurrent_requests=1)
+    order = _run_in_order(manager, [
+        _request(prompt="low", priority=RequestPriority.LOW, task_id="a"),
+        _request(prompt="normal", priority=RequestPriority.NORMAL, task_id="b"),
+        _request(prompt="critical", priority=RequestPriority.CRITICAL, task_id="c"),
+    ])
+    assert order == ["critical", "normal", "low"]
+
+
+def test_one_task_backlog_does_not_block_other_task():
+    manager = OllamaQueueManager(max_concurrent_requests=1, task_fairness_penalty=10.0)
+    backlog = [_request(prompt=f"research{i}", task_id="busy") for i in range(5)]
+    order = _run_in_order(manager, backlog + [_request(prompt="step", task_id="quiet")])
+    assert order.index("step") <= 1
+
+
+def test_aging_promotes_old_low_priority_requests():
+    manager = OllamaQueueManager(max_concurrent_requests=1, aging_seconds_per_level=30.0)
+
+    async def scenario():
+        old_low = manager._push(_request(prompt="old_low", priority=RequestPriority.LOW, task_id="a"))
+        old_low.sort_key -= 120  # encolado hace 2 minutos
+        fresh_high = manager._push(_request(prompt="fresh_high", priority=RequestPriority.HIGH, task_id="b"))
+        return sorted([fresh_high, old_low])[0].request.prompt
+
+    assert asyncio.run(scenario()) == "old_low"
+
+
+def test_cancelled_waiter_leaves_queue():
+    manager = OllamaQueueManager(max_concurrent_requests=1)
+    gate = asyncio.Event()
+
+    async def blocker(request):
+        await gate.wait()
+        return {}
+
+    async def scenario():
+        running = asyncio.ensure_future(manager.enqueue_request(_request(prompt="run"), blocker))
+        waiting = asyncio.ensure_future(manager.enqueue_request(_request(prompt="wait"), blocker))
+        await asyncio.sleep(0)
+        assert manager.get_queue_size() == 1
+        waiting.cancel()
+        await asyncio.sleep(0)
+        assert manager.get_queue_size() == 0
+        gate.set()
+        await running
+        assert manager.get_active_requests_count() == 0
+
+    asyncio.run(scenario())
+
+
+def test_identical_inflight_requests_share_one_execution():
+    manager = OllamaQueueManager(max_concurrent_requests=2)
+    calls = []
+
+    async def slow(request):
+        calls.append(request.request_id)
+        await asyncio.sleep(0.01)
+        return {"response": "compartida"}
+
+    async def scenario():
+        results = await asyncio.gather(*[
+            manager.enqueue_request(_request(prompt="mismo prompt", task_id=f"t{i}"), slow)
+            for i in range(4)
+        ])
+        status = await manager.get_queue_status()
+        return results, status
+
+    results, status = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert all(r == {"response": "compartida"} for r in results)
+    assert status["coalescing"]["coalesced_requests"] == 3
+    assert status["coalescing"]["inflight_groups"] == 0
+
+
+def test_follower_priority_promotes_queued_leader():
+    manager = OllamaQueueManager(max_concurrent_requests=1)
+    order = []
+    gate = asyncio.Event()
+
+    async def blocker(request):
+        await gate.wait()
+        return {}
+
+    async def record(request):
+        order.append(request.prompt)
+        return {"response": request.prompt}
+
+    async def scenario():
+        first = asyncio.ensure_future(manager.enqueue_request(_request(prompt="blocker", task_id="x"), blocker))
+        await asyncio.sleep(0)
+        shared_low = asyncio.ensure_future(manager.enqueue_request(
+            _request(prompt="shared", priority=RequestPriority.LOW, task_id="a"), record))
+        other = asyncio.ensure_future(manager.enqueue_request(
+            _request(prompt="other", priority=RequestPriority.HIGH, task_id="b"), record))
+        await asyncio.sleep(0)
+        shared_critical = asyncio.ensure_future(manager.enqueue_request(
+            _request(prompt="shared", priority=RequestPriority.CRITICAL, task_id="c"), record))
+        await asyncio.sleep(0)
+        gate.set()
+        await asyncio.gather(first, shared_low, other, shared_critical)
+
+    asyncio.run(scenario())
+    assert order == ["shared", "other"]
+
+
+def test_follower_takes_over_when_leader_is_cancelled():
+    manager = OllamaQueueManager(max_concurrent_requests=1)
+    calls = []
+    started = asyncio.Event()
+
+    async def run(request):
+        calls.append(request.task_id)
+        started.set()
+        await asyncio.sleep(0 if len(calls) > 1 else 10)
+        return {"response": request.task_id}
+
+    async def scenario():
+        leader = asyncio.ensure_future(manager.enqueue_request(_request(prompt="mismo", task_id="lider"), run))
+        await started.wait()
+        followers = [
+            asyncio.ensure_future(manager.enqueue_request(_request(prompt="mismo", task_id=f"s{i}"), run))
+            for i in range(3)
+        ]
+        await asyncio.sleep(0)
+        leader.cancel()
+        return await asyncio.gather(*followers)
+
+    results = asyncio.run(scenario())
+    assert calls == ["lider", "s0"]
+    assert results == [{"response": "s0"}] * 3
+    assert manager.stats.coalescing_handoffs == 1
+
+
+def test_follower_reruns_after_leader_timeout():
+    manager = OllamaQueueManager(max_concurrent_requests=1)
+    calls = []
+
+    async def run(request):
+        calls.append(request.task_id)
+        await asyncio.sleep(10 if request.task_id == "lider" else 0)
+        return {"response": request.task_id}
+
+    async def scenario():
+        impatient = _request(prompt="mismo", task_id="lider")
+        impatient.timeout = 0.05
+        leader = asyncio.ensure_future(manager.enqueue_request(impatient, run))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(manager.enqueue_request(_request(prompt="mismo", task_id="s"), run))
+        return await asyncio.gather(leader, follower)
+
+    leader_result, follower_result = asyncio.run(scenario())
+    assert leader_result["error_type"] == "timeout"
+    assert follower_result == {"response": "s"}
+    assert calls == ["lider", "s"]
+
+
+def test_adaptive_limiter_grows_when_fast_and_backs_off_on_timeout():
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=2, max_limit=4, decrease_cooldown=0)
+    for _ in range(20):
+        while limiter.has_capacity("llama3.1:8b"):
+            limiter.acquire("llama3.1:8b")
+        limiter.on_success("llama3.1:8b", 1.0)
+        limiter.release("llama3.1:8b")
+    assert limiter.limit_for("llama3.1:8b") == 4
+
+    limiter.on_timeout("llama3.1:8b")
+    assert limiter.limit_for("llama3.1:8b") == 2
+
+
+def test_adaptive_limiter_backs_off_on_latency_inflation():
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=4, latency_tolerance=2.0, decrease_cooldown=0)
+    for _ in range(10):
+        limiter.on_success("qwen3:32b", 0.02)
+    for _ in range(10):
+        limiter.on_success("qwen3:32b", 0.12)
+    assert limiter.limit_for("qwen3:32b") < 4
+
+
+def test_adaptive_limiter_ignores_mixed_response_lengths():
+    """Respuestas de 2s y 40s al mismo ritmo por token no son congestión"""
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=2, max_limit=4, latency_tolerance=2.0, decrease_cooldown=0)
+    manager = OllamaQueueManager(max_concurrent_requests=4, adaptive_limiter=limiter)
+    request = _request(model="qwen3:32b")
+    for number in range(40):
+        tokens = 2000 if number % 3 else 100
+        while limiter.has_capacity("qwen3:32b"):
+            limiter.acquire("qwen3:32b")
+        manager._record_outcome(request, {
+            "response": "...", "eval_count": tokens,
+            "eval_duration": int(tokens * 0.02 * (1 + 0.1 * (number % 4)) * 1e9),
+            "total_duration": int(tokens * 0.02 * 1e9 + 1e9)
+        })
+        limiter.release("qwen3:32b")
+    assert limiter.limit_for("qwen3:32b") == 4
+    assert limiter.get_status()["models"]["qwen3:32b"]["decreases"] == 0
+
+
+def test_low_priority_is_shed_with_retry_after_when_over_slo():
+    manager = OllamaQueueManager(max_concurrent_requests=1, shed_queue_size=2, shed_wait_seconds=5)
+    manager._wait_ewma = 30.0
+    gate = asyncio.Event()
+
+    async def blocker(request):
+        await gate.wait()
+        return {}
+
+    async def scenario():
+        running = [
+            asyncio.ensure_future(manager.enqueue_request(_request(prompt=f"p{i}"), blocker))
+            for i in range(3)
+        ]
+        await asyncio.sleep(0)
+        with pytest.raises(QueueOverloadedError) as shed:
+            await manager.enqueue_request(_request(prompt="low", priority=RequestPriority.LOW), blocker)
+        normal = asyncio.ensure_future(manager.enqueue_request(_request(prompt="normal"), blocker))
+        await asyncio.sleep(0)
+        gate.set()
+        await asyncio.gather(normal, *running)
+        return shed.value.retry_after
+
+    assert asyncio.run(scenario()) >= 5
+    assert manager.stats.shed_requests == 1
+
+
+def test_requests_for_loaded_model_are_batched_within_window():
+    """El bloqueador usa llama3.1:8b: otro request de ese modelo adelanta a qwen"""
+    manager = OllamaQueueManager(max_concurrent_requests=1, model_batch_window=20.0)
+    order = _run_in_order(manager, [
+        _request(prompt="qwen", task_id="a", model="qwen3:32b"),
+        _request(prompt="llama", task_id="b"),
+    ])
+    assert order == ["llama", "qwen"]
+    assert manager.stats.model_batched_requests == 1
+
+
+def test_model_batching_does_not_override_priority_beyond_window():
+    manager = OllamaQueueManager(max_concurrent_requests=1, model_batch_window=20.0)
+    order = _run_in_order(manager, [
+        _request(prompt="qwen", priority=RequestPriority.HIGH, task_id="a", model="qwen3:32b"),
+        _request(prompt="llama", task_id="b"),
+    ])
+    assert order == ["qwen", "llama"]
+
+
+def test_saturated_model_does_not_block_other_models():
+    """La cabeza del heap sin hueco para su modelo no frena a los de otros modelos"""
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=1, max_limit=1)
+    manager = OllamaQueueManager(max_concurrent_requests=4, adaptive_limiter=limiter)
+    gate = asyncio.Event()
+    started = []
+
+    async def run(request):
+        started.append(request.prompt)
+        await gate.wait()
+        return {"response": request.prompt}
+
+    async def scenario():
+        waiters = [
+            asyncio.ensure_future(manager.enqueue_request(
+                _request(prompt=prompt, priority=priority, task_id=prompt, model=model), run))
+            for prompt, priority, model in [
+                ("qwen-running", RequestPriority.CRITICAL, "qwen3:32b"),
+                ("qwen-waiting", RequestPriority.HIGH, "qwen3:32b"),
+                ("llama", RequestPriority.LOW, "llama3.1:8b"),
+            ]
+        ]
+        for _ in range(5):
+            await asyncio.sleep(0)
+        snapshot = list(started)
+        gate.set()
+        await asyncio.gather(*waiters)
+        return snapshot
+
+    assert asyncio.run(scenario()) == ["qwen-running", "llama"]
+    assert started[-1] == "qwen-waiting"
@@ -0,0 +1,25 @@
+from src.services.ollama_streaming import TokenStreamBatcher
+
+
+def test_batcher_flushes_first_token_then_in_batches():
+    deliveries = []
+    batcher = TokenStreamBatcher(lambda delta, full: deliveries.append((delta, full)),
+                                 flush_tokens=3, flush_interval_ms=60000)
+
+    for token in ["a", "b", "c", "d", "e"]:
+        batcher.add(token)
+    assert deliveries == [("a", "a"), ("bcd", "abcd")]
+
+    assert batcher.close() == "abcde"
+    assert deliveries[-1] == ("e", "abcde")
+    assert batcher.tokens_received == 5
+    assert batcher.time_to_first_token is not None
+
+
+def test_batcher_survives_failing_sink():
+    def broken_sink(delta, full):
+        raise RuntimeError("socket cerrado")
+
+    batcher = TokenStreamBatcher(broken_sink, flush_tokens=1)
+    batcher.add("hola")
+    assert batcher.close() == "hola"
@@ -0,0 +1,68 @@
+from src.services.prompt_budget import (
+    STRATEGY_MIDDLE, STRATEGY_TAIL, PromptAssembler, PromptSection,
+    estimate_tokens, format_previous_results, truncate_to_tokens
+)
+
+
+def _sections(history="", results="", prompt="hola"):
+    sections = [PromptSection('system', "Eres un asistente.", priority=100, footer="\n\n",
+                              required=True, cacheable=True)]
+    if results:
+        sections.append(PromptSection('previous_results', results, priority=10,
+                                      header="Resultados previos:\n", footer="\n"))
+    if history:
+        sections.append(PromptSection('previous_messages', history, priority=20,
+                                      header="Conversación anterior:\n", footer="\n", strategy=STRATEGY_TAIL))
+    sections.append(PromptSection('user_prompt', prompt, priority=50, header="Usuario: ",
+                                  footer="\nAsistente: ", strategy=STRATEGY_MIDDLE, required=True))
+    return sections
+
+
+def test_prompt_under_budget_is_unchanged():
+    history = "Usuario: hola\nAsistente: buenas\n"
+    assembled = PromptAssembler().assemble(_sections(history=history), budget=1000)
+    assert assembled.text == (
+        "Eres un asistente.\n\nConversación anterior:\n" + history + "\nUsuario: hola\nAsistente: "
+    )
+    assert assembled.compacted == [] and assembled.dropped == []
+
+
+def test_low_value_sections_are_compacted_first():
+    results = "\n".join(f"- Herramienta web_search: hallazgo número {i}. Detalle extenso {i}." for i in range(200))
+    history = "".join(f"Usuario: mensaje {i}\n" for i in range(50))
+    assembled = PromptAssembler().assemble(_sections(history=history, results=results, prompt="analiza"), budget=300)
+
+    assert assembled.tokens <= 300
+    assert "previous_results" in assembled.dropped + assembled.compacted
+    assert assembled.text.startswith("Eres un asistente.\n\n")
+    assert assembled.text.endswith("Usuario: analiza\nAsistente: ")
+    if "previous_messages" in assembled.compacted:
+        assert "mensaje 49" in assembled.text  # el historial conserva lo más reciente
+
+
+def test_oversized_user_prompt_keeps_head_and_tail():
+    prompt = "INICIO " + "relleno " * 2000 + "FINAL"
+    assembled = PromptAssembler().assemble(_sections(prompt=prompt), budget=200)
+    assert "INICIO" in assembled.text and "FINAL" in assembled.text
+    assert estimate_tokens(assembled.text) <= 210
+
+
+def test_call_site_metrics_and_system_prefix_cache():
+    assembler = PromptAssembler()
+    assembler.assemble(_sections(), budget=500, call_site="analysis")
+    assembler.assemble(_sections(prompt="otra"), budget=500, call_site="analysis")
+    stats = assembler.get_stats()
+    assert stats["call_sites"]["analysis"]["calls"] == 2
+    assert stats["system_prompt_cache_hits"] == 1
+
+
+def test_previous_results_are_formatted_and_compacted():
+    results = [
+        {"success": True, "tool": "web_search", "result": {"summary": "Primera frase. " + "x " * 500}},
+        {"success": False, "tool": "analysis", "result": {"summary": "fallo"}},
+    ]
+    text = format_previous_results(results, max_tokens=50)
+    assert text.startswith("- Herramienta web_search: Primera frase.")
+    assert "analysis" not in text
+    assert estimate_tokens(text) <= 50
+    assert truncate_to_tokens("uno dos tres", 2, STRATEGY_TAIL) == "dos tres"
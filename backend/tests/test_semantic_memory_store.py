@@ -0,0 +1,70 @@
+import pytest
+
+pytest.importorskip("src.memory", reason="src.memory necesita las dependencias de requirements.txt")
+
+from src.memory.semantic_memory_store import SemanticConcept, SemanticFact, SemanticMemoryStore  # noqa: E402
+
+
+def _fact(fact_id, subject, predicate, object, confidence=1.0):
+    return SemanticFact(id=fact_id, subject=subject, predicate=predicate, object=object,
+                        context={}, confidence=confidence)
+
+
+def _concept(concept_id, relations=None, confidence=1.0):
+    return SemanticConcept(id=concept_id, name=concept_id, description="", category="general",
+                           attributes={}, relations=relations or {}, confidence=confidence)
+
+
+def test_search_facts_uses_fragments_and_ranks_by_confidence():
+    store = SemanticMemoryStore()
+    store.store_fact(_fact("f1", "Python", "es_un", "Lenguaje interpretado", 0.6))
+    store.store_fact(_fact("f2", "Python", "creado_por", "Guido", 0.9))
+    store.store_fact(_fact("f3", "Rust", "es_un", "lenguaje compilado", 0.8))
+
+    assert [f.id for f in store.search_facts(subject="Python")] == ["f2", "f1"]
+    assert store.search_facts(subject="python") == []  # el sujeto es exacto
+    assert [f.id for f in store.search_facts(predicate="ES_UN")] == ["f3", "f1"]
+    assert [f.id for f in store.search_facts(object="lenguaje", limit=1)] == ["f3"]
+    assert [f.id for f in store.search_facts(subject="Python", object="lenguaje")] == ["f1"]
+
+    # Reemplazar un hecho lo reindexa con su nueva tripleta
+    store.store_fact(_fact("f3", "Rust", "es_un", "herramienta", 0.8))
+    assert [f.id for f in store.search_facts(object="lenguaje")] == ["f1"]
+
+
+def test_infer_knowledge_walks_chains_and_invalidates_memo():
+    store = SemanticMemoryStore()
+    store.store_fact(_fact("a", "perro", "es_un", "mamífero", 0.9))
+    store.store_fact(_fact("b", "mamífero", "es_un", "animal", 1.0))
+    store.store_fact(_fact("c", "animal", "es_un", "ser vivo", 1.0))
+    store.store_fact(_fact("d", "mamífero", "tiene", "pelo", 1.0))
+
+    two_hops = store.infer_knowledge("perro")
+    assert [(i['subject'], i['object'], i['supporting_facts']) for i in two_hops] == [
+        ("perro", "animal", ["a", "b"])
+    ]
+    assert two_hops[0]['confidence'] == pytest.approx(0.9 * 0.8)
+
+    three_hops = store.infer_knowledge("perro", max_hops=3)
+    assert [i['object'] for i in three_hops] == ["animal", "ser vivo"]
+    assert three_hops[1]['confidence'] == pytest.approx(0.9 * 0.8 ** 2)
+
+    # Cambiar un hecho invalida los caminos memorizados
+    store.update_fact_confidence("b", -0.5)
+    assert store.infer_knowledge("perro")[0]['confidence'] == pytest.approx(0.5 * 0.8)
+
+
+def test_related_concepts_follow_incoming_relation_index():
+    store = SemanticMemoryStore(max_concepts=3)
+    store.store_concept(_concept("python"))
+    store.store_concept(_concept("django", {'usa': ["python"]}, confidence=0.9))
+    store.store_concept(_concept("flask", {'usa': ["python"], 'similar': ["django"]}, confidence=0.8))
+
+    assert [c.id for c in store.get_related_concepts("python")] == ["django", "flask"]
+    assert [c.id for c in store.get_related_concepts("django", relation_type="similar")] == ["flask"]
+
+    # Reemplazo con otras relaciones y desalojo del concepto menos confiable
+    store.store_concept(_concept("django", {}, confidence=0.9))
+    store.update_concept_confidence("flask", -0.5)
+    store.store_concept(_concept("fastapi", {'usa': ["python"]}, confidence=0.7))
+    assert [c.id for c in store.get_related_concepts("python")] == ["fastapi"]
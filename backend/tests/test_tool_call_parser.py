@@ -0,0 +1,74 @@
+import json
+
+import pytest
+
+from src.services.tool_call_parser import REPLAY_BUDGET_FACTOR, REPLAY_BUDGET_MIN, ToolCallExtractor, parse_tool_calls
+
+FENCED = (
+    'Voy a buscar.\n```json\n'
+    '{"tool_call": {"tool": "web_search", "parameters": {"query": "ia {2025}", "opts": {"n": 3}}}}\n'
+    '```\nListo.'
+)
+
+
+def test_fenced_block_with_nested_parameters():
+    parsed = parse_tool_calls(FENCED)
+    assert parsed["tool_calls"] == [
+        {"tool": "web_search", "parameters": {"query": "ia {2025}", "opts": {"n": 3}}}
+    ]
+    assert parsed["text"] == "Voy a buscar.\nListo."
+
+
+def test_tool_calls_nested_inside_other_json():
+    text = '{"plan": [{"tool_call": {"tool": "a", "parameters": {}}}, {"tool_call": {"tool": "b", "parameters": {}}}]}'
+    assert [call["tool"] for call in parse_tool_calls(text)["tool_calls"]] == ["a", "b"]
+
+
+def test_code_fences_of_other_languages_are_literal():
+    text = 'Ejemplo:\n```python\nd = {"tool_call": {"tool": "x", "parameters": {}}}\n```\nfin'
+    parsed = parse_tool_calls(text)
+    assert parsed["tool_calls"] == []
+    assert 'd = {"tool_call"' in parsed["text"]
+
+
+def test_tolerates_stray_braces_single_quotes_and_truncation():
+    stray = parse_tool_calls('El conjunto {1, 2 sin cerrar.\n\nLuego {"tool_call": {"tool": "a", "parameters": {}}}')
+    assert [call["tool"] for call in stray["tool_calls"]] == ["a"]
+    assert stray["text"].startswith("El conjunto {1, 2")
+
+    quoted = parse_tool_calls("Uso {'tool_call': {'tool': 'shell', 'parameters': {'cmd': 'ls'}}}")
+    assert quoted["tool_calls"] == [{"tool": "shell", "parameters": {"cmd": "ls"}}]
+
+    truncated = parse_tool_calls('roto {"tool_call": {"tool": "web_search", "parameters": {"query": "x"}, }')
+    assert truncated["tool_calls"] == [{"tool": "web_search", "parameters": {"query": "x"}}]
+
+
+def test_plain_text_is_preserved():
+    text = "It's a {placeholder} y `code` aquí"
+    assert parse_tool_calls(text) == {"text": text, "tool_calls": []}
+
+
+def test_incremental_feed_matches_full_parse():
+    extractor = ToolCallExtractor()
+    completed = []
+    for i in range(0, len(FENCED), 3):
+        completed += extractor.feed(FENCED[i:i + 3])
+    assert completed == parse_tool_calls(FENCED)["tool_calls"]
+    assert extractor.finish() == parse_tool_calls(FENCED)
+
+
+@pytest.mark.parametrize("unit", ["{", "{a ", '{"k": ', "{it's "], ids=["llaves", "prosa", "claves", "apostrofos"])
+def test_unbalanced_brace_burst_is_rescanned_linearly(unit):
+    """Miles de llaves sin cerrar: el re-escaneo total es lineal, no uno completo por llave"""
+    burst = unit * 20000
+    text = burst + "\n\nLuego " + json.dumps({"tool_call": {"tool": "a", "parameters": {}}})
+    extractor = ToolCallExtractor()
+    extractor.feed(text)
+    parsed = extractor.finish()
+    assert [call["tool"] for call in parsed["tool_calls"]] == ["a"]
+    assert parsed["text"] == (burst + "\nLuego").strip()
+    if "'" in unit:
+        # Llaves dentro de cadenas: acotado por el presupuesto de re-escaneo
+        assert extractor.chars_replayed <= (REPLAY_BUDGET_FACTOR + 1) * len(text) + REPLAY_BUDGET_MIN
+    else:
+        assert extractor.chars_replayed <= len(text)
@@ -0,0 +1,111 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("faiss")
+
+from src.memory.vector_index import INDEX_FLAT, INDEX_HNSW, INDEX_IVF, VectorIndex  # noqa: E402
+
+
+def _vectors(count, dimension=16, seed=0):
+    return np.random.default_rng(seed).normal(size=(count, dimension)).astype(np.float32)
+
+
+def test_search_maps_hits_to_doc_ids_and_skips_tombstones():
+    vectors = _vectors(100)
+    index = VectorIndex(compact_min=1000)
+    index.add([f"doc-{i}" for i in range(100)], vectors)
+
+    assert index.search(vectors[7], top_k=1)[0][0] == "doc-7"
+    assert index.remove("doc-7")
+    assert not index.remove("doc-7")
+    assert "doc-7" not in [doc_id for doc_id, _ in index.search(vectors[7], top_k=5)]
+    assert len(index) == 99 and index.tombstones == 1
+
+
+def test_replacing_a_document_and_compaction_keep_ids_consistent():
+    vectors = _vectors(200)
+    index = VectorIndex(compact_ratio=0.1, compact_min=10)
+    index.add([f"doc-{i}" for i in range(200)], vectors)
+    index.add(["doc-0"], vectors[150])
+    for i in range(100, 120):
+        index.remove(f"doc-{i}")
+
+    assert index.tombstones == 0 and index.rebuilds >= 2
+    assert len(index) == 180
+    hits = [doc_id for doc_id, _ in index.search(vectors[150], top_k=2)]
+    assert set(hits) == {"doc-0", "doc-150"}
+    assert index.search(vectors[199], top_k=1)[0][0] == "doc-199"
+
+
+def test_auto_mode_switches_to_hnsw_and_ivf_trains_when_large_enough():
+    vectors = _vectors(600)
+    auto = VectorIndex(ann_threshold=500)
+    auto.add([f"a-{i}" for i in range(400)], vectors[:400])
+    assert auto.active_mode == INDEX_FLAT
+    auto.add([f"a-{i}" for i in range(400, 600)], vectors[400:])
+    assert auto.active_mode == INDEX_HNSW
+    assert auto.search(vectors[42], top_k=1)[0][0] == "a-42"
+
+    ivf = VectorIndex(mode=INDEX_IVF)
+    ivf.add([f"i-{i}" for i in range(600)], vectors)
+    assert ivf.active_mode == INDEX_IVF
+
+
+def test_save_and_load_round_trip(tmp_path):
+    vectors = _vectors(50)
+    index = VectorIndex(compact_min=1000)
+    index.add([f"doc-{i}" for i in range(50)], vectors)
+    index.remove("doc-3")
+    index.save(str(tmp_path))
+
+    loaded = VectorIndex.load(str(tmp_path))
+    assert len(loaded) == 49 and loaded.tombstones == 1
+    assert loaded.search(vectors[10], top_k=1)[0][0] == "doc-10"
+
+
+def test_mmap_load_searches_immediately_and_copies_on_first_add(tmp_path):
+    vectors = _vectors(300)
+    index = VectorIndex(mode=INDEX_HNSW)
+    index.add([f"doc-{i}" for i in range(300)], vectors)
+    index.save(str(tmp_path))
+
+    loaded = VectorIndex.load(str(tmp_path), mmap=True, mode=INDEX_HNSW)
+    assert loaded.get_stats()["mmap"]
+    # Exacta sobre la matriz mapeada o vía FAISS, según haya terminado la carga
+    assert loaded.search(vectors[10], top_k=1)[0][0] == "doc-10"
+
+    loaded.add(["new"], -vectors[0])
+    assert loaded.wait_ready(5) and loaded.active_mode == INDEX_HNSW
+    assert not loaded.get_stats()["mmap"]
+    assert loaded.search(-vectors[0], top_k=1)[0][0] == "new"
+
+
+def test_writes_during_background_load_do_not_wait_and_reach_faiss(tmp_path, monkeypatch):
+    import threading
+
+    vectors = _vectors(300)
+    index = VectorIndex(mode=INDEX_HNSW)
+    index.add([f"doc-{i}" for i in range(300)], vectors)
+    index.save(str(tmp_path))
+
+    release = threading.Event()
+    open_index = VectorIndex._open_index
+
+    def slow_open(self, *args):
+        release.wait(5)
+        return open_index(self, *args)
+
+    monkeypatch.setattr(VectorIndex, "_open_index", slow_open)
+    loaded = VectorIndex.load(str(tmp_path), mmap=True, mode=INDEX_HNSW)
+    # Reproducir el diario mientras FAISS carga: nada de esto espera a la carga
+    loaded.add(["new", "doc-5"], np.vstack([-vectors[0], vectors[6]]))
+    assert loaded.remove("doc-7")
+    assert not loaded.ready
+    assert loaded.search(-vectors[0], top_k=1)[0][0] == "new"
+
+    release.set()
+    assert loaded.wait_ready(5)
+    assert loaded.active_mode == INDEX_HNSW and loaded._index.ntotal == 302
+    assert loaded.search(-vectors[0], top_k=1)[0][0] == "new"
+    assert set(doc_id for doc_id, _ in loaded.search(vectors[6], top_k=2)) == {"doc-5", "doc-6"}
+    assert "doc-7" not in [doc_id for doc_id, _ in loaded.search(vectors[7], top_k=3)]
@@ -0,0 +1,39 @@
+import pytest
+
+pytest.importorskip("flask_socketio", reason="WebSocketManager necesita flask_socketio")
+
+from src.websocket.websocket_manager import WebSocketManager  # noqa: E402
+
+
+class _RecordingSocketIO:
+    def __init__(self):
+        self.emitted = []
+
+    def emit(self, event, data, room=None):
+        self.emitted.append((event, data, room))
+
+
+def _manager():
+    manager = WebSocketManager()
+    manager.socketio = _RecordingSocketIO()
+    manager.is_initialized = True
+    return manager
+
+
+def test_report_progress_sends_deltas_and_stores_one_entry_per_section():
+    manager = _manager()
+    manager.send_step_started("task", "s1", "Paso", "")
+    for delta in ["Intro ", "del ", "informe"]:
+        manager.send_report_progress("task", "Introducción", delta, "")
+    manager.send_report_progress("task", "Conclusión", "Fin", "")
+    for number in range(60):
+        manager.send_report_progress("task", "Conclusión", f" {number}", "")
+
+    emitted = [data['data'] for _, data, _ in manager.socketio.emitted if data['type'] == 'report_progress']
+    assert [data['content_delta'] for data in emitted[:3]] == ["Intro ", "del ", "informe"]
+    assert all(data['full_report_so_far'] == "" for data in emitted)
+
+    stored = manager.get_stored_messages("task")
+    assert [message['type'] for message in stored] == ['step_started', 'report_progress', 'report_progress']
+    assert stored[1]['data']['content_delta'] == "Intro del informe"
+    assert stored[2]['data']['content_delta'] == "Fin" + "".join(f" {number}" for number in range(60))